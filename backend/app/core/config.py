@@ -0,0 +1,157 @@
+"""Runtime settings, read from environment variables"""
+import os
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directory holding the trained artifacts (scaler.pkl, pca.pkl, ...)
+MODEL_DIR = os.getenv("CODON_MODEL_DIR", os.path.join(APP_DIR, "models"))
+
+# How per-upload features are computed:
+#   "frozen" - use the training-time reference_stats.pkl (rows scored independently)
+#   "batch"  - derive fill medians, cutoff and profiles from the upload itself
+#   "auto"   - frozen when reference_stats.pkl is available, batch otherwise
+FEATURE_MODE = os.getenv("CODON_FEATURE_MODE", "auto").lower()
+
+# Result cache for /analyze and /preprocess (0 disables the in-process tier)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("CODON_RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Optional on-disk tier that survives restarts (unset = disabled)
+RESULT_CACHE_DIR = os.getenv("CODON_RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("CODON_RESULT_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Analysis worker pool: CPU-bound work runs here instead of on the event loop.
+# POOL_WORKERS=0 uses one background thread in the API process instead of processes.
+POOL_WORKERS = int(os.getenv("CODON_POOL_WORKERS", "1"))
+# Analyses allowed to wait for a worker before new requests get 429
+POOL_QUEUE_DEPTH = int(os.getenv("CODON_POOL_QUEUE_DEPTH", "4"))
+POOL_START_METHOD = os.getenv("CODON_POOL_START_METHOD", "spawn")
+
+# Micro-batching: uploads up to BATCH_MAX_UPLOAD_BYTES skip the worker pool and have
+# their model pass merged with other concurrent small uploads (0 disables batching)
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("CODON_BATCH_MAX_UPLOAD_BYTES", str(256 * 1024)))
+# How long the first request of a batch waits for others to join
+BATCH_WINDOW_MS = float(os.getenv("CODON_BATCH_WINDOW_MS", "2"))
+# Dispatch early once this many rows are waiting
+BATCH_MAX_ROWS = int(os.getenv("CODON_BATCH_MAX_ROWS", "4096"))
+
+# Uploads are spooled to disk in blocks of this size instead of being read into memory
+UPLOAD_BLOCK_BYTES = int(os.getenv("CODON_UPLOAD_BLOCK_BYTES", str(1024 * 1024)))
+# Larger uploads are parsed and scored this many rows at a time (in batch feature mode after a
+# first pass over the upload for its statistics)
+STREAM_CHUNK_ROWS = int(os.getenv("CODON_STREAM_CHUNK_ROWS", "20000"))
+# Result tables of streamed analyses are written here, oldest removed beyond the size bound
+# (created with mode 0700; an existing directory must be owned by this user and not shared)
+RESULT_SPOOL_DIR = os.getenv("CODON_RESULT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "codon_results"))
+RESULT_SPOOL_MAX_BYTES = int(os.getenv("CODON_RESULT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024 * 1024)))
+
+# Startup: "eager" loads the models before the server accepts requests; "background"
+# answers /health/live immediately and loads + warms up in the background
+# (/health/ready turns 200 when done)
+STARTUP_MODE = os.getenv("CODON_STARTUP_MODE", "eager").lower()
+# Run one synthetic analysis after loading so the first real request is not the slow one
+WARMUP = os.getenv("CODON_WARMUP", "1") != "0"
+# Memory-map the arrays inside the joblib artifacts (read-only, shared through the page cache)
+MMAP_MODELS = os.getenv("CODON_MMAP_MODELS", "1") != "0"
+
+# Compiled model arrays (incl. flattened trees) are written once per model version to this
+# directory and memory-mapped read-only by every worker (0 = each process keeps its own copy).
+# The directory is created with mode 0700; a shared or foreign one is refused (private copies)
+SHARED_WEIGHTS = os.getenv("CODON_SHARED_WEIGHTS", "1") != "0"
+SHARED_WEIGHTS_DIR = os.getenv(
+    "CODON_SHARED_WEIGHTS_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "codon_weights"),
+)
+# Private model copies (no shared bundle) score batches up to this many rows with the flattened
+# trees, which have less per-call overhead, and larger ones with sklearn's predict_proba, which is
+# faster per row (crossover ~16-32k rows on one CPU, see benchmarks/forest_predictor.py).
+# A shared bundle only holds the flattened trees and uses them for every batch
+FLAT_FOREST_MAX_ROWS = int(os.getenv("CODON_FLAT_FOREST_MAX_ROWS", "16384"))
+
+# Training: clustering hyperparameter sweep (services.cluster_sweep). Fits run in this many
+# processes (0 = in the calling process) and fitted candidates are cached on disk, keyed by
+# the data and parameters, so repeated sweeps only fit what changed
+SWEEP_WORKERS = int(os.getenv("CODON_SWEEP_WORKERS", str(os.cpu_count() or 1)))
+SWEEP_CACHE_DIR = os.getenv("CODON_SWEEP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "codon_sweep")) or None
+SWEEP_CACHE_MAX_BYTES = int(os.getenv("CODON_SWEEP_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Cluster quality metrics (services.cluster_metrics). Silhouette mode: "exact" (all pairwise
+# distances, computed in chunks), "sample" (stratified sample with a confidence interval),
+# "simplified" (distances to centroids) or "auto" (exact up to METRICS_EXACT_MAX_ROWS rows)
+METRICS_SILHOUETTE_MODE = os.getenv("CODON_METRICS_SILHOUETTE_MODE", "auto").lower()
+METRICS_EXACT_MAX_ROWS = int(os.getenv("CODON_METRICS_EXACT_MAX_ROWS", "20000"))
+METRICS_SAMPLE_SIZE = int(os.getenv("CODON_METRICS_SAMPLE_SIZE", "5000"))
+# Peak memory of the distance blocks a metric holds at once
+METRICS_MAX_MEMORY_BYTES = int(os.getenv("CODON_METRICS_MAX_MEMORY_BYTES", str(256 * 1024 * 1024)))
+
+# Out-of-core training (services.incremental_training): rows read per chunk, size of the
+# uniform row sample behind the medians, robust scaler and k-means initialisation, and
+# MiniBatchKMeans passes over the data
+TRAIN_CHUNK_ROWS = int(os.getenv("CODON_TRAIN_CHUNK_ROWS", "50000"))
+TRAIN_SAMPLE_ROWS = int(os.getenv("CODON_TRAIN_SAMPLE_ROWS", "50000"))
+TRAIN_KMEANS_EPOCHS = int(os.getenv("CODON_TRAIN_KMEANS_EPOCHS", "3"))
+
+# Classifier bake-off and search (services.classifier_bakeoff): fits run in this many
+# single-threaded processes (0 = in the calling process), candidates are dropped by
+# successive halving with this factor, and XGBoost stops after this many rounds
+# without improvement on a validation share of each training fold
+TRAIN_CPU_BUDGET = int(os.getenv("CODON_TRAIN_CPU_BUDGET", str(os.cpu_count() or 1)))
+TRAIN_HALVING_ETA = int(os.getenv("CODON_TRAIN_HALVING_ETA", "3"))
+TRAIN_XGB_EARLY_STOPPING_ROUNDS = int(os.getenv("CODON_TRAIN_XGB_EARLY_STOPPING_ROUNDS", "20"))
+TRAIN_XGB_VALIDATION_FRACTION = float(os.getenv("CODON_TRAIN_XGB_VALIDATION_FRACTION", "0.1"))
+
+# Similar-species search (services.neighbor_index): metric the index is built with
+# ("cosine" or "euclidean" in PCA space), reference rows scanned per block, and the
+# largest k a /similar request may ask for
+NEIGHBORS_METRIC = os.getenv("CODON_NEIGHBORS_METRIC", "cosine").lower()
+NEIGHBORS_BLOCK_ROWS = int(os.getenv("CODON_NEIGHBORS_BLOCK_ROWS", "65536"))
+NEIGHBORS_MAX_K = int(os.getenv("CODON_NEIGHBORS_MAX_K", "100"))
+
+# 2D map of the reference species (services.embedding_map): level z of detail keeps at most
+# EMBEDDING_CELL_POINTS points per cell of an EMBEDDING_BASE_GRID * 2**z square grid
+EMBEDDING_CELL_POINTS = int(os.getenv("CODON_EMBEDDING_CELL_POINTS", "4"))
+EMBEDDING_BASE_GRID = int(os.getenv("CODON_EMBEDDING_BASE_GRID", "16"))
+EMBEDDING_MAX_LEVELS = int(os.getenv("CODON_EMBEDDING_MAX_LEVELS", "8"))
+
+# Asynchronous jobs (POST /jobs, services.jobs): the SQLite job table and the spooled
+# uploads/results live in JOBS_DIR; each API process runs at most JOBS_CONCURRENCY jobs
+# and POST /jobs answers 429 once JOBS_MAX_PENDING jobs are queued or running. JOBS_DIR and
+# the directory of JOBS_DB_PATH are created with mode 0700 and must not be shared
+JOBS_DIR = os.getenv("CODON_JOBS_DIR", os.path.join(tempfile.gettempdir(), "codon_jobs"))
+JOBS_DB_PATH = os.getenv("CODON_JOBS_DB_PATH", os.path.join(JOBS_DIR, "jobs.sqlite3"))
+JOBS_CONCURRENCY = int(os.getenv("CODON_JOBS_CONCURRENCY", "1"))
+JOBS_MAX_PENDING = int(os.getenv("CODON_JOBS_MAX_PENDING", "32"))
+JOBS_MAX_UPLOAD_BYTES = int(os.getenv("CODON_JOBS_MAX_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Finished results are kept this long, and expire oldest first beyond JOBS_RESULTS_MAX_BYTES
+JOBS_RESULT_TTL_SECONDS = float(os.getenv("CODON_JOBS_RESULT_TTL_SECONDS", str(24 * 3600)))
+JOBS_RESULTS_MAX_BYTES = int(os.getenv("CODON_JOBS_RESULTS_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+# How often the job runner looks for work queued by other API processes
+JOBS_POLL_SECONDS = float(os.getenv("CODON_JOBS_POLL_SECONDS", "2"))
+# Jobs interrupted by this many restarts are failed instead of requeued
+JOBS_MAX_ATTEMPTS = int(os.getenv("CODON_JOBS_MAX_ATTEMPTS", "3"))
+
+# FASTA input (services.fasta_ingest): reading frame counted ("0", "1", "2" or "auto" = the
+# frame with the fewest stop codons, per record), how records become species rows
+# ("record", "organism" = by [organism=...] header tag, "file"), bytes read per block and
+# sequence bytes counted per vectorized batch
+FASTA_FRAME = os.getenv("CODON_FASTA_FRAME", "0").lower()
+FASTA_GROUP_BY = os.getenv("CODON_FASTA_GROUP_BY", "organism").lower()
+FASTA_BLOCK_BYTES = int(os.getenv("CODON_FASTA_BLOCK_BYTES", str(4 * 1024 * 1024)))
+FASTA_BATCH_BYTES = int(os.getenv("CODON_FASTA_BATCH_BYTES", str(16 * 1024 * 1024)))
+# Uncompressed files from this size are split into byte ranges counted in FASTA_WORKERS processes.
+# Each analysis pool worker starts its own counting processes, so the default splits the CPUs
+# between the POOL_WORKERS; 1 counts in-process.
+FASTA_WORKERS = int(os.getenv("CODON_FASTA_WORKERS", str(max((os.cpu_count() or 1) // max(POOL_WORKERS, 1), 1))))
+FASTA_PARALLEL_MIN_BYTES = int(os.getenv("CODON_FASTA_PARALLEL_MIN_BYTES", str(64 * 1024 * 1024)))
+
+# Log level of the API and the analysis workers; every record carries the request id
+# (see core/logging.py)
+LOG_LEVEL = os.getenv("CODON_LOG_LEVEL", "INFO")
+
+# Admin token for request profiling (X-Admin-Token header); empty disables profiling
+ADMIN_TOKEN = os.getenv("CODON_ADMIN_TOKEN", "")
+# Profiled /analyze requests (X-Profile, services.profiling): stack sampling interval,
+# functions listed in the hot-spot report, and where "save" mode keeps its newest reports
+PROFILE_INTERVAL_SECONDS = float(os.getenv("CODON_PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("CODON_PROFILE_TOP_FUNCTIONS", "30"))
+PROFILE_DIR = os.getenv("CODON_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "codon_profiles"))
+PROFILE_MAX_REPORTS = int(os.getenv("CODON_PROFILE_MAX_REPORTS", "50"))
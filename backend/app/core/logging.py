@@ -0,0 +1,53 @@
+"""Logging set-up with the current request id on every record.
+
+The API assigns each request an id (the client's ``X-Request-ID`` when it
+sends a usable one) and keeps it in a context variable, which follows the
+request into ``asyncio.to_thread`` calls. Analyses in pool worker
+processes set it again from the id they are handed (see
+``services.metrics.traced``). Records logged outside a request show ``-``.
+"""
+import logging
+import re
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from core import config
+
+LOG_FORMAT = "%(levelname)s:%(name)s:[%(request_id)s] %(message)s"
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Ids from clients are echoed into logs and headers, so only plain tokens are kept
+_CLIENT_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+def new_request_id(client_id: Optional[str] = None) -> str:
+    if client_id and _CLIENT_ID.match(client_id):
+        return client_id
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> str:
+    return request_id_var.get()
+
+
+def _record_with_request_id(factory):
+    def make_record(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = request_id_var.get()
+        return record
+    make_record.adds_request_id = True
+    return make_record
+
+
+def configure_logging(level: Optional[str] = None):
+    """Root handler with the request id format (idempotent; also called in worker processes)
+
+    The id is set on every record when it is created, so any handler
+    (uvicorn's, pytest's) can format it.
+    """
+    factory = logging.getLogRecordFactory()
+    if not getattr(factory, "adds_request_id", False):
+        logging.setLogRecordFactory(_record_with_request_id(factory))
+    logging.basicConfig(level=(level or config.LOG_LEVEL).upper(), format=LOG_FORMAT)
@@ -0,0 +1,49 @@
+"""Admin-only request options and private storage directories.
+
+Profiling an /analyze request (``X-Profile``) costs far more than the
+analysis itself, so it needs the shared ``CODON_ADMIN_TOKEN`` in the
+``X-Admin-Token`` header. Without a configured token these options are
+off.
+
+Several stores unpickle what they find on disk, under the shared temp
+directory by default. ``private_directory`` makes sure nobody else can
+have put it there.
+"""
+import hmac
+import os
+import stat
+from typing import Optional
+
+from core import config
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+
+def admin_enabled() -> bool:
+    return bool(config.ADMIN_TOKEN)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Constant-time comparison against the configured admin token"""
+    if not admin_enabled() or not token:
+        return False
+    return hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode())
+
+
+def private_directory(path: str) -> str:
+    """Create ``path`` with mode 0700, or check that an existing one is private
+
+    An existing directory must be owned by this user and not writable by
+    group or others, otherwise PermissionError: a directory under /tmp
+    could have been created by another user to plant files. Ownership and
+    mode are not checked where the platform has no POSIX uids.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return path
+    info = os.stat(path)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by uid {info.st_uid}, not by this user (uid {os.getuid()})")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} is writable by other users (mode {stat.S_IMODE(info.st_mode):o})")
+    return path
@@ -0,0 +1,73 @@
+"""SQLite connections for the local job store.
+
+One database file is shared by the API processes and the analysis
+workers (which report progress), so connections use WAL mode and a busy
+timeout instead of failing on a concurrent writer. Connections are in
+autocommit mode; multi-statement updates take ``BEGIN IMMEDIATE``
+themselves. The schema is created on first connect.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,          -- queued, running, done, failed, expired
+    filename      TEXT,
+    upload_path   TEXT,
+    upload_bytes  INTEGER NOT NULL DEFAULT 0,
+    result_handle TEXT,                   -- result cache key (same as /analyze)
+    result_path   TEXT,
+    result_bytes  INTEGER NOT NULL DEFAULT 0,
+    progress      REAL NOT NULL DEFAULT 0,
+    status_code   INTEGER,
+    error         TEXT,
+    owner         TEXT,                   -- host:pid of the API process running it
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    expires_at    REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+BUSY_TIMEOUT_SECONDS = 30
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open (and if needed create) the job database"""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                                 check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@contextmanager
+def session(db_path: str) -> Iterator[sqlite3.Connection]:
+    """Short-lived connection, e.g. for a progress update from a worker process"""
+    connection = connect(db_path)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+@contextmanager
+def transaction(connection: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT`` (rolled back on error)"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
@@ -1,18 +1,32 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-import pandas as pd
-import joblib
-import numpy as np
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import functools
 import tempfile
+import time
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import logging
 from fastapi.middleware.cors import CORSMiddleware
 
+from core import config, security
+from core.logging import configure_logging, current_request_id, new_request_id, request_id_var
+from services import analysis, metrics, profiling
+from services.analysis import AnalysisError
+from services.batcher import MicroBatcher
+from services.jobs import DONE, EXPIRED, FAILED, QUEUED, RUNNING, JobRunner, JobStore, report_progress
+from services.fasta_ingest import is_fasta
+from services import response_formats
+from services.result_spool import SpooledTable
+from services.result_cache import ResultCache, cache_digest
+from services.process_memory import process_memory
+from services.shared_weights import bundle_bytes, bundle_path
+from services.worker_pool import AnalysisPool, PoolSaturated, PoolUnavailable
 
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+
+# Set up logging (every record carries the request id)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Codon Usage Analysis API", version="1.0.0")
@@ -42,157 +56,304 @@ class TrailingSlashMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(TrailingSlashMiddleware)
 
-# Global variables for models
-scaler = None
-pca = None
-kmeans = None
-classifier = None
-feature_names = None
-feature_description_full = None
-aa_full = None
-full_description_mapping = None
 
-def load_models():
-    """Load all required model components with error handling"""
-    global scaler, pca, kmeans, classifier, feature_names
-    global feature_description_full, aa_full, full_description_mapping
+class RequestContextMiddleware:
+    """Request id, per-stage trace and HTTP metrics for every request
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed response bodies
+    are counted (and timed) as they are sent. The id comes from the
+    client's X-Request-ID header when usable and is echoed back in it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def route_of(self, scope) -> str:
+        # Route templates (not raw paths) keep the label set bounded
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "other")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or ())
+        request_id = new_request_id(headers.get(b"x-request-id", b"").decode("latin-1"))
+        id_token = request_id_var.set(request_id)
+        trace, trace_token = metrics.start_trace(request_id)
+        status, sent = 500, 0
+
+        async def send_with_id(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = self.route_of(scope)
+            metrics.observe_request(route, scope["method"], status, time.perf_counter() - started, sent)
+            metrics.observe(trace, route)
+            metrics.end_trace(trace_token)
+            request_id_var.reset(id_token)
+
+app.add_middleware(RequestContextMiddleware)
+
+result_cache = ResultCache(
+    max_bytes=config.RESULT_CACHE_MAX_BYTES,
+    disk_dir=config.RESULT_CACHE_DIR,
+    disk_max_bytes=config.RESULT_CACHE_DISK_MAX_BYTES,
+)
 
-    # Path ke direktori models relatif terhadap main.py
-    model_dir = os.path.join(os.path.dirname(__file__), "models")
+analysis_pool = AnalysisPool(
+    max_workers=config.POOL_WORKERS,
+    queue_depth=config.POOL_QUEUE_DEPTH,
+    initializer=analysis.init_worker,
+    start_method=config.POOL_START_METHOD,
+)
 
-    try:
-        required_files = [
-            'scaler.pkl',
-            'pca.pkl', 
-            'kmeans_model.pkl',
-            'best_classification_model.pkl',
-            'feature_columns.pkl',
-            'feature_description_full.pkl',
-            'aa_full.pkl'
-        ]
-
-        missing_files = [f for f in required_files if not os.path.exists(os.path.join(model_dir, f))]
-        if missing_files:
-            logger.error(f"Missing required files: {missing_files}")
-            return False
-
-        scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
-        pca = joblib.load(os.path.join(model_dir, 'pca.pkl'))
-        kmeans = joblib.load(os.path.join(model_dir, 'kmeans_model.pkl'))
-        classifier = joblib.load(os.path.join(model_dir, 'best_classification_model.pkl'))
-        feature_names = joblib.load(os.path.join(model_dir, 'feature_columns.pkl'))
-        feature_description_full = joblib.load(os.path.join(model_dir, 'feature_description_full.pkl'))
-        aa_full = joblib.load(os.path.join(model_dir, 'aa_full.pkl'))
-
-        full_description_mapping = {**feature_description_full, **aa_full}
-
-        logger.info("All models loaded successfully")
-        return True
+job_store = JobStore(
+    db_path=config.JOBS_DB_PATH,
+    directory=config.JOBS_DIR,
+    result_ttl_seconds=config.JOBS_RESULT_TTL_SECONDS,
+    results_max_bytes=config.JOBS_RESULTS_MAX_BYTES,
+    max_attempts=config.JOBS_MAX_ATTEMPTS,
+)
 
-    except Exception as e:
-        logger.error(f"Error loading models: {str(e)}")
-        return False
+batcher = MicroBatcher(
+    batch_fn=analysis.predict_models,
+    split_fn=analysis.split_model_output,
+    window_ms=config.BATCH_WINDOW_MS,
+    max_rows=config.BATCH_MAX_ROWS,
+)
 
+# One reload at a time; requests that notice the change meanwhile wait for it
+model_reload_lock = asyncio.Lock()
 
-@app.on_event("startup")
-async def startup_event():
-    """Load models on startup"""
-    success = load_models()
+
+def models_changed() -> bool:
+    return analysis.model_version is not None and analysis.current_model_version() != analysis.model_version
+
+
+async def refresh_models_if_changed():
+    """Reload models, workers and drop cached results when the models/ artifacts change on disk
+
+    The reload (artifact loads, new pool workers) runs in a thread, so the
+    event loop keeps answering /health and requests that do not need it.
+    """
+    if not models_changed():
+        return
+    async with model_reload_lock:
+        if not models_changed():
+            return  # Reloaded while this request waited
+        logger.info("Model artifacts changed on disk - reloading")
+        await asyncio.to_thread(reload_models)
+
+
+def reload_models():
+    result_cache.clear()
+    analysis.load_models()
+    if analysis_pool.max_workers:
+        analysis_pool.restart()
+
+
+# Startup progress behind /health/ready (liveness only needs the event loop to answer)
+startup_status = {"state": "starting", "load_seconds": None, "warmup_seconds": None}
+
+
+def load_and_warm_up():
+    """Load models, start the analysis workers and run the warm-up analysis (blocking)"""
+    started = time.perf_counter()
+    startup_status["state"] = "loading"
+    success = analysis.load_models()
     if not success:
         logger.warning("Some models failed to load - running in demo mode")
+    # Process workers load (and warm up) their own copy in their initializer
+    analysis_pool.start()
+    startup_status["load_seconds"] = round(time.perf_counter() - started, 3)
 
-from scipy.stats import entropy
-from sklearn.metrics.pairwise import cosine_similarity
+    if success and config.WARMUP:
+        startup_status["state"] = "warming"
+        started = time.perf_counter()
+        try:
+            response_formats.encode_json(analysis.warm_up())
+        except Exception as e:
+            logger.warning(f"Warm-up analysis failed: {str(e)}")
+        startup_status["warmup_seconds"] = round(time.perf_counter() - started, 3)
 
-def preprocess_feature(raw_features: pd.DataFrame) -> pd.DataFrame:
-    """Preprocess codon usage features"""
-    df = raw_features.copy()
-    
-    # Convert to numeric and fill NA with median
-    df = df.apply(pd.to_numeric, errors='coerce')
-    df = df.fillna(df.median())
-    
-    # Remove rows with total 0 (corrupt data)
-    codon_sum = df.sum(axis=1)
-    df = df[codon_sum > 0]
-    
-    # Codon to amino acid mapping
-    codon_to_aa = {
-        'GCU': 'A', 'GCC': 'A', 'GCA': 'A', 'GCG': 'A',
-        'CGU': 'R', 'CGC': 'R', 'CGA': 'R', 'CGG': 'R', 'AGA': 'R', 'AGG': 'R',
-        'GGU': 'G', 'GGC': 'G', 'GGA': 'G', 'GGG': 'G',
-        'AAA': 'K', 'AAG': 'K',
-        'UUU': 'F', 'UUC': 'F',
-        'CCU': 'P', 'CCC': 'P', 'CCA': 'P', 'CCG': 'P',
-        'UCU': 'S', 'UCC': 'S', 'UCA': 'S', 'UCG': 'S', 'AGU': 'S', 'AGC': 'S',
-        'AUU': 'I', 'AUC': 'I', 'AUA': 'I',
-        'AUG': 'M',
-        'GUU': 'V', 'GUC': 'V', 'GUA': 'V', 'GUG': 'V',
-        'UUA': 'L', 'UUG': 'L', 'CUU': 'L', 'CUC': 'L', 'CUA': 'L', 'CUG': 'L',
-        'ACU': 'T', 'ACC': 'T', 'ACA': 'T', 'ACG': 'T',
-        'UAU': 'Y', 'UAC': 'Y',
-        'CAA': 'Q', 'CAG': 'Q',
-        'AAU': 'N', 'AAC': 'N',
-        'GAU': 'D', 'GAC': 'D',
-        'UGU': 'C', 'UGC': 'C',
-        'GAA': 'E', 'GAG': 'E',
-        'CAU': 'H', 'CAC': 'H',
-        'UGG': 'W'
-    }
+    startup_status["state"] = "ready" if success else "failed"
+    logger.info(f"Startup finished: {startup_status}")
+
+
+async def execute_job(job: dict) -> bytes:
+    """Run one queued job in the analysis pool; returns the result payload"""
+    if startup_status["state"] != "ready":
+        # Jobs recovered at start-up wait for the models instead of failing
+        while startup_status["state"] in ("starting", "loading", "warming"):
+            await asyncio.sleep(config.JOBS_POLL_SECONDS)
+    await refresh_models_if_changed()
+    if not analysis.models_loaded():
+        raise AnalysisError(503, "Models not loaded. Please ensure all .pkl files are present.")
+
+    progress = functools.partial(report_progress, job_store.db_path, job["id"])
+    while True:
+        try:
+            result, trace = await analysis_pool.run(metrics.traced, job["id"], analysis.run_analysis_streamed,
+                                                    job["upload_path"], None, progress, job["filename"])
+            break
+        except PoolSaturated:
+            # Interactive /analyze requests fill the pool; jobs wait their turn instead of failing
+            await asyncio.sleep(config.JOBS_POLL_SECONDS)
+        except PoolUnavailable as e:
+            raise AnalysisError(503, f"Analysis workers unavailable: {str(e)}")
 
-    # Aggregate codons to amino acids
-    aa_features = {}
-    for codon, aa in codon_to_aa.items():
-        if codon in df.columns:
-            aa_features.setdefault(aa, []).append(df[codon])
-
-    df_aa = pd.DataFrame()
-    for aa, cols in aa_features.items():
-        df_aa[aa] = np.sum(cols, axis=0)
-
-    # Normalize per row with pseudocount
-    pseudocount = 1e-8
-    row_sums = df_aa.sum(axis=1)
-    valid_rows = row_sums > row_sums.quantile(0.05)  # Filter bottom 5%
-    df_aa = df_aa[valid_rows]
-    df_aa_norm = (df_aa + pseudocount).div(row_sums[valid_rows] + pseudocount*len(df_aa.columns), axis=0)
-
-    # Statistical features
-    stats = pd.DataFrame(index=df_aa_norm.index)
-    stats['mean'] = df_aa_norm.mean(axis=1)
-    stats['median'] = df_aa_norm.median(axis=1)
-    stats['std'] = df_aa_norm.std(axis=1).fillna(0)
-    stats['skewness'] = df_aa_norm.skew(axis=1).fillna(0)
-    stats['kurtosis'] = df_aa_norm.kurtosis(axis=1).fillna(0)
-    stats['entropy'] = df_aa_norm.apply(lambda x: entropy(x + 1e-10, base=2), axis=1).fillna(0)
-
-    # Gini coefficient function
-    def gini_coefficient(x):
-        x = np.array(x)
-        x = x[~np.isnan(x)]
-        if len(x) == 0 or np.sum(x) == 0:
-            return 0
-        x = np.sort(x)
-        n = len(x)
-        index = np.arange(1, n+1)
-        return (2*np.sum(index*x))/(n*np.sum(x)) - (n+1)/n
-
-    stats['gini'] = df_aa_norm.apply(gini_coefficient, axis=1)
-
-    # Combine final features
-    features_final = pd.concat([df_aa_norm, stats], axis=1).fillna(0)
-
-    # Add cosine similarity to mean & median profile
-    mean_profile = df_aa_norm.mean(axis=0).values.reshape(1, -1)
-    median_profile = df_aa_norm.median(axis=0).values.reshape(1, -1)
-
-    cos_sim_mean = cosine_similarity(df_aa_norm.values, mean_profile).flatten()
-    cos_sim_median = cosine_similarity(df_aa_norm.values, median_profile).flatten()
-
-    features_final['cosine_similarity_to_mean'] = cos_sim_mean
-    features_final['cosine_similarity_to_median'] = cos_sim_median
-
-    return features_final
+    started = time.perf_counter()
+    payload = analysis.dump_result(result)
+    result_cache.put(job["result_handle"], payload)
+    trace.add("cache", time.perf_counter() - started)
+    trace.source = "computed"
+    metrics.observe(trace, "/jobs")
+    return payload
+
+
+job_runner = JobRunner(job_store, execute_job, config.JOBS_CONCURRENCY, config.JOBS_POLL_SECONDS)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load models on startup (or in the background with CODON_STARTUP_MODE=background)"""
+    batcher.start()
+    if config.STARTUP_MODE == "background":
+        app.state.startup_task = asyncio.get_running_loop().run_in_executor(None, load_and_warm_up)
+    else:
+        load_and_warm_up()
+    job_runner.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_runner.shutdown()
+    batcher.shutdown()
+    analysis_pool.shutdown()
+
+
+async def analyze_small_upload(temp_path: str, filename: Optional[str] = None,
+                               profile_parts: Optional[list] = None) -> analysis.AnalysisResult:
+    """Parse/assemble in a thread, model pass merged with other small uploads
+
+    Holds one of the analysis pool's admission slots, so small uploads are
+    bounded (and rejected with 429) together with the pool's jobs. With
+    ``profile_parts`` (a profiled request) the parse and assemble steps run
+    under the profiler and their parts are appended to it; the shared model
+    pass only contributes its wait time.
+    """
+    with analysis_pool.admitted():
+        prepared = await in_thread(profile_parts, analysis.prepare_upload, temp_path, filename)
+        # Includes the wait for the batch window; the model pass itself is timed under route "-"
+        started = time.perf_counter()
+        with metrics.stage("batched_model"):
+            output = await batcher.submit(prepared.X)
+        if profile_parts is not None:
+            profile_parts.append(profiling.waiting_part("batched_model", time.perf_counter() - started))
+        return await in_thread(profile_parts, analysis.assemble_result, prepared, output)
+
+
+async def in_thread(profile_parts: Optional[list], fn, *args):
+    """``asyncio.to_thread(fn, *args)``, under the profiler when ``profile_parts`` collects its parts"""
+    if profile_parts is None:
+        return await asyncio.to_thread(fn, *args)
+    result, part = await asyncio.to_thread(
+        profiling.profiled, current_request_id(), config.PROFILE_INTERVAL_SECONDS, fn, *args)
+    profile_parts.append(part)
+    return result
+
+
+async def run_in_pool(fn, *args):
+    """``analysis_pool.run`` that folds the worker's stage timings into the request's trace"""
+    result, trace = await analysis_pool.run(metrics.traced, current_request_id(), fn, *args)
+    current = metrics.current_trace()
+    if current is not None:
+        current.merge(trace)
+    return result
+
+
+async def upload_key(digest, path: str, filename: Optional[str]) -> str:
+    """Cache key of a spooled upload from the ``digest`` ``spool_upload`` fed
+
+    FASTA species without an organism tag are named after the uploaded
+    file, so for FASTA the file name is part of the key too.
+    """
+    if await asyncio.to_thread(is_fasta, path):
+        digest.update(b"\0" + (filename or "").encode())
+    return digest.hexdigest()
+
+
+async def spool_upload(file: UploadFile, digest=None, path: Optional[str] = None,
+                       max_bytes: Optional[int] = None):
+    """Copy the upload to a temp file (or ``path``) in fixed-size blocks; returns (path, size)
+
+    The upload is never held in memory as a whole. ``digest`` (if given) is
+    fed the same blocks, which yields the cache key without a second pass.
+    Uploads larger than ``max_bytes`` are removed and answered with 413.
+    """
+    size = 0
+    with metrics.stage("upload"), (open(path, 'wb') if path else tempfile.NamedTemporaryFile(delete=False, suffix='.csv')) as temp:
+        while True:
+            block = await file.read(config.UPLOAD_BLOCK_BYTES)
+            if not block:
+                break
+            size += len(block)
+            if max_bytes is not None and size > max_bytes:
+                temp.close()
+                os.unlink(temp.name)
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+            temp.write(block)
+            if digest is not None:
+                digest.update(block)
+    metrics.add_bytes_in(size)
+    return temp.name, size
+
+
+async def render_result(result: analysis.AnalysisResult, fmt: str, handle: str,
+                        offset: int = 0, limit: Optional[int] = None) -> Response:
+    """Encode a result in the negotiated format (off the event loop)"""
+    media_type = response_formats.MEDIA_TYPES[fmt]
+    # Spooled (streamed) results are encoded chunk by chunk while sending
+    streamed = isinstance(result.table, SpooledTable)
+    if fmt == "ndjson":
+        return StreamingResponse(metrics.timed_chunks(response_formats.iter_ndjson(result, handle, offset, limit),
+                                                      "serialize"), media_type=media_type)
+    if fmt in ("parquet", "arrow"):
+        extension = "parquet" if fmt == "parquet" else "arrows"
+        headers = {"Content-Disposition": f'attachment; filename="codon_analysis.{extension}"'}
+        if streamed:
+            return StreamingResponse(metrics.timed_chunks(response_formats.iter_arrow(result, fmt, handle, offset, limit),
+                                                          "serialize"), media_type=media_type, headers=headers)
+        body = await asyncio.to_thread(metrics.timed, "serialize", response_formats.encode_arrow,
+                                       result, fmt, handle, offset, limit)
+        return Response(content=body, media_type=media_type, headers=headers)
+    if streamed:
+        return StreamingResponse(metrics.timed_chunks(response_formats.iter_json(result, fmt, handle, offset, limit),
+                                                      "serialize"), media_type=media_type)
+    body = await asyncio.to_thread(metrics.timed, "serialize", response_formats.encode_json,
+                                   result, fmt, handle, offset, limit)
+    return Response(content=body, media_type=media_type)
+
+
+def cached_result(key: str) -> Optional[analysis.AnalysisResult]:
+    with metrics.stage("cache"):
+        payload = result_cache.get(key)
+        if payload is None:
+            return None
+        result = analysis.load_result(payload)
+    return result if analysis.result_available(result) else None
 
 @app.get("/")
 async def root():
@@ -201,409 +362,425 @@ async def root():
         "message": "Codon Usage Analysis API",
         "version": "1.0.0",
         "endpoints": {
-            "analyze": "POST /analyze - Analyze codon usage file",
+            "analyze": "POST /analyze - Analyze codon usage file (CSV, or FASTA coding sequences, optionally gzipped)",
             "preprocess": "POST /preprocess - Preprocess codon usage file (alias for /analyze)",
-            "health": "GET /health - Health check"
+            "results": "GET /results/{result_handle} - Page through the detailed results of a previous analysis",
+            "jobs": "POST /jobs - Queue an analysis of a large file; poll GET /jobs/{job_id}, "
+                    "then fetch GET /jobs/{job_id}/result",
+            "similar": "POST /similar - Closest reference species (codon usage profile) for every uploaded species",
+            "embedding": "GET /embedding - Reference species on the 2D PCA map, by zoom level; "
+                         "POST /embedding/project - the uploaded species on the same map",
+            "profiles": "GET /profiles/{request_id} - Saved profile of an /analyze request "
+                        "(X-Profile: save; admin token required)",
+            "metrics": "GET /metrics - Prometheus metrics: per-stage latency, rows, bytes and peak memory",
+            "health": "GET /health - Health check (GET /health/live, /health/ready for probes)"
         }
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and its event loop answers"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: models loaded, workers started and warm-up done"""
+    ready = startup_status["state"] == "ready"
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **startup_status})
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    models_loaded = all([
-        scaler is not None,
-        pca is not None, 
-        kmeans is not None,
-        classifier is not None,
-        feature_names is not None
-    ])
+    models_loaded = analysis.models_loaded()
     
     return {
         "status": "healthy" if models_loaded else "partial",
         "models_loaded": models_loaded,
-        "message": "All models loaded" if models_loaded else "Running in demo mode"
+        "message": "All models loaded" if models_loaded else "Running in demo mode",
+        "ready": startup_status["state"] == "ready",
+        "startup": startup_status,
+        "feature_mode": "frozen" if analysis.reference_stats is not None and config.FEATURE_MODE != "batch" else "batch",
+        "model_version": analysis.model_version,
+        "result_cache": result_cache.stats(),
+        "analysis_pool": analysis_pool.stats(),
+        "batcher": batcher.stats(),
+        "jobs": job_runner.stats(),
+        "neighbor_index": neighbor_index_report(),
+        "embedding_map": embedding_map_report(),
+        "memory": memory_report()
     }
 
+
+def neighbor_index_report() -> dict:
+    index = analysis.neighbor_index
+    if index is None:
+        return {"loaded": False}
+    return {"loaded": True, "metric": index.metric, "n_reference": index.n_reference,
+            "n_components": index.n_components}
+
+
+def embedding_map_report() -> dict:
+    embedding = analysis.embedding_map
+    if embedding is None:
+        return {"loaded": False}
+    return {"loaded": True, "method": embedding.meta["method"], "n_points": embedding.n_points,
+            "n_levels": embedding.n_levels}
+
+
+def memory_report() -> dict:
+    """Per-process resident memory plus the size of the shared weights bundle"""
+    bundle = bundle_path(config.SHARED_WEIGHTS_DIR, analysis.model_version) if analysis.model_version else None
+    return {
+        "api": process_memory(),
+        "workers": [process_memory(pid) for pid in analysis_pool.worker_pids()],
+        "shared_weights": {
+            "enabled": config.SHARED_WEIGHTS,
+            "path": bundle,
+            "bytes": bundle_bytes(bundle) if bundle else 0,
+        },
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format; gauges are read at scrape time, histograms/counters since start-up"""
+    metrics.POOL_IN_FLIGHT.set(analysis_pool.stats()["in_flight"])
+    metrics.RESULT_CACHE_BYTES.set(result_cache.stats()["bytes"])
+    jobs = job_store.stats()["jobs"]
+    for status in (QUEUED, RUNNING, DONE, FAILED, EXPIRED):
+        metrics.JOBS.set(jobs.get(status, 0), status=status)
+    memory = memory_report()
+    for usage in (memory["api"], *memory["workers"]):
+        rss = usage.get("rss_bytes", usage.get("max_rss_bytes"))
+        if rss is not None:
+            metrics.RESIDENT_MEMORY.set(rss, process="api" if usage is memory["api"] else str(usage["pid"]))
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/results/{result_handle}")
+async def get_results(
+    result_handle: str,
+    request: Request,
+    format: Optional[str] = Query(None, description=f"One of: {', '.join(response_formats.FORMATS)}"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """Detailed results of an earlier /analyze call, by its result_handle"""
+    try:
+        fmt = response_formats.negotiate(format, request.headers.get("accept"))
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    result = cached_result(result_handle)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle. Please upload the file again.")
+    try:
+        return await render_result(result, fmt, result_handle, offset, limit)
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
 @app.post("/preprocess")
-async def preprocess_codon_usage(file: UploadFile = File(...)):
+async def preprocess_codon_usage(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
     """Preprocess endpoint (alias for analyze)"""
-    return await analyze_codon_usage(file)
+    return await analyze_codon_usage(request, file, format, offset, limit)
+
+def job_status(job: dict) -> dict:
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "filename": job["filename"],
+        "upload_bytes": job["upload_bytes"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+        "status_url": f"/jobs/{job['id']}",
+    }
+    if job["status"] == DONE:
+        status["result_url"] = f"/jobs/{job['id']}/result"
+        status["result_handle"] = job["result_handle"]
+    elif job["status"] == FAILED:
+        status["error"] = {"status_code": job["status_code"], "detail": job["error"]}
+    else:
+        status["queue_position"] = job_store.queue_position(job)
+    return status
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Queue an analysis and return its job id right away
+
+    For uploads that take longer than an HTTP request may: the same
+    pipeline as /analyze runs in the background; poll ``status_url`` for
+    progress and fetch ``result_url`` (same formats and paging as /analyze)
+    once the job is done.
+    """
+    if startup_status["state"] == "failed" or (startup_status["state"] == "ready" and not analysis.models_loaded()):
+        raise HTTPException(status_code=503, detail="Models not loaded. Please ensure all .pkl files are present.")
+    if job_store.pending() >= config.JOBS_MAX_PENDING:
+        raise HTTPException(status_code=429, detail="Too many analysis jobs queued, please retry later.",
+                            headers={"Retry-After": "30"})
+
+    job_id = job_store.new_id()
+    # Same key as /analyze, so a finished job also serves /results/{result_handle}
+    digest = cache_digest(analysis.model_version or "", config.FEATURE_MODE,
+                          config.FASTA_FRAME, config.FASTA_GROUP_BY)
+    upload_path, upload_size = await spool_upload(file, digest, path=job_store.upload_path(job_id),
+                                                  max_bytes=config.JOBS_MAX_UPLOAD_BYTES)
+    key = await upload_key(digest, upload_path, file.filename)
+    job = job_store.create(job_id, file.filename, upload_path, upload_size, key)
+
+    cached = result_cache.get(key)
+    if cached is not None and analysis.result_available(analysis.load_result(cached)):
+        await asyncio.to_thread(job_store.complete, job_id, cached)
+        job = job_store.get(job_id)
+    else:
+        job_runner.wake()
+    return job_status(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a job"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, description=f"One of: {', '.join(response_formats.FORMATS)}"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """Result of a finished job, in the same formats as /analyze"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=job["status_code"] or 500, detail=job["error"])
+    if job["status"] != DONE:
+        if job["status"] == EXPIRED:
+            raise HTTPException(status_code=410, detail="The job result has expired. Please submit the file again.")
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}", headers={"Retry-After": "5"})
 
-@app.post("/debug")
-async def debug_analysis(file: UploadFile = File(...)):
-    """Debug endpoint untuk melihat step-by-step analysis"""
-    
-    debug_info = {"steps": []}
-    
     try:
-        # Step 1: File reading
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as temp:
-            content = await file.read()
-            temp.write(content)
-            temp_path = temp.name
-        
-        raw_df = pd.read_csv(temp_path)
-        debug_info["steps"].append({
-            "step": "file_reading",
-            "status": "success",
-            "data_shape": raw_df.shape,
-            "columns": list(raw_df.columns)
-        })
-        
-        # Step 2: Feature extraction
-        feature_cols = raw_df.columns[5:]
-        raw_features = raw_df[feature_cols]
-        debug_info["steps"].append({
-            "step": "feature_extraction", 
-            "status": "success",
-            "feature_columns": len(feature_cols),
-            "sample_features": list(feature_cols[:5])
-        })
-        
-        # Step 3: Preprocessing
-        processed_features = preprocess_feature(raw_features)
-        debug_info["steps"].append({
-            "step": "preprocessing",
-            "status": "success", 
-            "processed_shape": processed_features.shape,
-            "processed_columns": list(processed_features.columns)
-        })
-        
-        # Step 4: Feature alignment
-        if feature_names is not None:
-            missing_features = set(feature_names) - set(processed_features.columns)
-            extra_features = set(processed_features.columns) - set(feature_names)
-            processed_features_aligned = processed_features[feature_names]
-            
-            debug_info["steps"].append({
-                "step": "feature_alignment",
-                "status": "success",
-                "missing_features": list(missing_features),
-                "extra_features": list(extra_features),
-                "final_shape": processed_features_aligned.shape
-            })
-        else:
-            processed_features_aligned = processed_features
-            debug_info["steps"].append({
-                "step": "feature_alignment",
-                "status": "skipped - no feature_names available"
-            })
-        
-        # Step 5: Scaling and PCA
-        if scaler is not None and pca is not None:
-            X_scaled = scaler.transform(processed_features_aligned)
-            X_pca = pca.transform(X_scaled)
-            debug_info["steps"].append({
-                "step": "scaling_pca",
-                "status": "success",
-                "scaled_shape": X_scaled.shape,
-                "pca_shape": X_pca.shape
-            })
-        else:
-            debug_info["steps"].append({
-                "step": "scaling_pca", 
-                "status": "failed - models not loaded"
-            })
-            return debug_info
-        
-        # Step 6: Clustering
-        if kmeans is not None:
-            cluster_labels = kmeans.predict(X_pca)
-            debug_info["steps"].append({
-                "step": "clustering",
-                "status": "success",
-                "n_clusters": len(np.unique(cluster_labels)),
-                "cluster_distribution": dict(zip(*np.unique(cluster_labels, return_counts=True)))
-            })
-        else:
-            debug_info["steps"].append({
-                "step": "clustering",
-                "status": "failed - kmeans model not loaded"
-            })
-            return debug_info
-        
-        # Step 7: Classification
-        if classifier is not None:
-            try:
-                # Try different input configurations
-                configs_to_try = [
-                    ("scaled_features_only", X_scaled),
-                    ("scaled_features_plus_cluster", np.concatenate([X_scaled, cluster_labels.reshape(-1, 1)], axis=1))
-                ]
-                
-                classification_results = []
-                for config_name, X_input in configs_to_try:
-                    try:
-                        kingdom_pred = classifier.predict(X_input)
-                        classification_results.append({
-                            "config": config_name,
-                            "input_shape": X_input.shape,
-                            "status": "success",
-                            "kingdom_distribution": dict(zip(*np.unique(kingdom_pred, return_counts=True)))
-                        })
-                    except Exception as e:
-                        classification_results.append({
-                            "config": config_name,
-                            "input_shape": X_input.shape,
-                            "status": f"failed: {str(e)}"
-                        })
-                
-                debug_info["steps"].append({
-                    "step": "classification",
-                    "configurations_tested": classification_results
-                })
-                
-            except Exception as e:
-                debug_info["steps"].append({
-                    "step": "classification",
-                    "status": f"failed: {str(e)}"
-                })
-        else:
-            debug_info["steps"].append({
-                "step": "classification",
-                "status": "failed - classifier not loaded"
-            })
-        
-        # Model info
-        debug_info["model_info"] = {
-            "scaler_loaded": scaler is not None,
-            "pca_loaded": pca is not None,
-            "kmeans_loaded": kmeans is not None,
-            "classifier_loaded": classifier is not None,
-            "feature_names_loaded": feature_names is not None,
-            "classifier_expected_features": classifier.n_features_in_ if classifier and hasattr(classifier, 'n_features_in_') else "unknown"
-        }
-        
-        return debug_info
-        
+        fmt = response_formats.negotiate(format, request.headers.get("accept"))
+        payload = await asyncio.to_thread(job_store.read_result, job)
+        result = analysis.load_result(payload) if payload is not None else None
+        if result is None or not analysis.result_available(result):
+            raise HTTPException(status_code=410, detail="The job result has expired. Please submit the file again.")
+        return await render_result(result, fmt, job["result_handle"], offset, limit)
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/similar")
+async def similar_species(
+    file: UploadFile = File(...),
+    k: int = Query(10, ge=1, le=config.NEIGHBORS_MAX_K, description="Neighbours per uploaded species"),
+):
+    """Top-k reference species with the closest codon usage profile, for every row of the upload
+
+    Same CSV layout as /analyze; neighbours come from the index built next
+    to the models (see services/neighbor_index.py).
+    """
+    if startup_status["state"] in ("starting", "loading", "warming"):
+        raise HTTPException(status_code=503, detail="Models are still loading, please retry shortly.",
+                            headers={"Retry-After": "2"})
+
+    await refresh_models_if_changed()
+    if not analysis.models_loaded():
+        raise HTTPException(status_code=503, detail="Models not loaded. Please ensure all .pkl files are present.")
+
+    temp_path = None
+    try:
+        temp_path, _ = await spool_upload(file)
+        return await asyncio.to_thread(analysis.find_similar, temp_path, k, file.filename)
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
-        debug_info["steps"].append({
-            "step": "error",
-            "status": f"failed: {str(e)}"
-        })
-        return debug_info
-    
+        logger.error(f"Error in similar-species search: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     finally:
-        try:
-            if 'temp_path' in locals():
-                os.unlink(temp_path)
-        except:
-            pass
+        if temp_path is not None:
+            os.unlink(temp_path)
+
+@app.get("/embedding")
+async def embedding_points(
+    level: int = Query(0, ge=0, description="Level of detail; each level doubles the grid resolution"),
+    x_min: Optional[float] = Query(None),
+    x_max: Optional[float] = Query(None),
+    y_min: Optional[float] = Query(None),
+    y_max: Optional[float] = Query(None),
+):
+    """Precomputed 2D map of the reference species: density-thinned points in a viewport
+
+    Each point has a ``weight`` (the reference species it stands for at this
+    level); the finest level (``n_levels - 1``) has every species.
+    """
+    if analysis.embedding_map is None:
+        raise HTTPException(
+            status_code=503,
+            detail="2D map not built. Run `python -m services.embedding_map <reference.csv>` from backend/app.",
+        )
+    return analysis.embedding_map.view(level, x_min, x_max, y_min, y_max)
+
+@app.post("/embedding/project")
+async def embedding_project(file: UploadFile = File(...)):
+    """Coordinates (same plane as GET /embedding) and clusters of every uploaded species"""
+    if startup_status["state"] in ("starting", "loading", "warming"):
+        raise HTTPException(status_code=503, detail="Models are still loading, please retry shortly.",
+                            headers={"Retry-After": "2"})
+
+    await refresh_models_if_changed()
+    if not analysis.models_loaded():
+        raise HTTPException(status_code=503, detail="Models not loaded. Please ensure all .pkl files are present.")
+
+    temp_path = None
+    try:
+        temp_path, _ = await spool_upload(file)
+        return await asyncio.to_thread(analysis.project_upload, temp_path, file.filename)
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        logger.error(f"Error projecting upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if temp_path is not None:
+            os.unlink(temp_path)
+
+def requested_profile(request: Request) -> Optional[str]:
+    """Profile mode from the X-Profile header, if the caller may profile"""
+    mode = request.headers.get("x-profile")
+    if not mode:
+        return None
+    if not security.is_admin(request.headers.get(security.ADMIN_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Profiling needs a valid X-Admin-Token.")
+    mode = mode.lower()
+    if mode not in profiling.MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown X-Profile mode '{mode}'. Use one of: "
+                                                    f"{', '.join(profiling.MODES)}")
+    return mode
+
+
+async def profiled_response(result: analysis.AnalysisResult, analysis_parts: List[dict], mode: str, fmt: str,
+                            handle: str, offset: int, limit: Optional[int], filename: Optional[str],
+                            upload_size: int) -> Response:
+    """Encode the result under the profiler too, then answer with the report or save it"""
+    request_id = current_request_id()
+    body, serialize_part = await asyncio.to_thread(
+        profiling.profiled, request_id, config.PROFILE_INTERVAL_SECONDS,
+        metrics.timed, "serialize", response_formats.encode, result, fmt, handle, offset, limit)
+    report = profiling.build_report(
+        [*analysis_parts, serialize_part], config.PROFILE_INTERVAL_SECONDS, config.PROFILE_TOP_FUNCTIONS,
+        request_id=request_id, created_at=time.time(), result_handle=handle, format=fmt,
+        upload={"filename": filename, "bytes": upload_size}, response_bytes=len(body),
+    )
+    logger.info(f"Profiled analysis: {report['wall_seconds']:.3f}s, "
+                f"peak {report['peak_allocated_bytes']} bytes allocated, {report['sampler']['samples']} samples")
+    headers = {"X-Profile-Id": request_id}
+    if mode == "report":
+        return JSONResponse(content=report, headers=headers)
+    await asyncio.to_thread(profiling.save_report, config.PROFILE_DIR, report, config.PROFILE_MAX_REPORTS)
+    return Response(content=body, media_type=response_formats.MEDIA_TYPES[fmt], headers=headers)
+
+@app.get("/profiles/{request_id}")
+async def get_profile(request_id: str, request: Request):
+    """A profile report saved by an /analyze request with ``X-Profile: save``"""
+    if not security.is_admin(request.headers.get(security.ADMIN_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Profiles need a valid X-Admin-Token.")
+    report = await asyncio.to_thread(profiling.load_report, config.PROFILE_DIR, request_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired profile id")
+    return report
 
 @app.post("/analyze")
-async def analyze_codon_usage(file: UploadFile = File(...)):
-    """Main analysis endpoint"""
+async def analyze_codon_usage(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description=f"One of: {', '.join(response_formats.FORMATS)}"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """Main analysis endpoint
+
+    ``format`` (or the Accept header) picks the response layout, ``offset``
+    and ``limit`` page the detailed results; see services/response_formats.py.
+
+    ``X-Profile: report`` (answer with the profile instead of the result) or
+    ``X-Profile: save`` (normal answer, profile kept for GET /profiles/{id})
+    runs the analysis under the sampling profiler and tracemalloc; needs
+    ``X-Admin-Token``. See services/profiling.py.
+    """
+    profile_mode = requested_profile(request)
+
+    if startup_status["state"] in ("starting", "loading", "warming"):
+        raise HTTPException(status_code=503, detail="Models are still loading, please retry shortly.",
+                            headers={"Retry-After": "2"})
+
+    await refresh_models_if_changed()
     
     # Check if models are loaded
-    if not all([scaler, pca, kmeans, classifier, feature_names]):
+    if not analysis.models_loaded():
         raise HTTPException(
             status_code=503, 
             detail="Models not loaded. Please ensure all .pkl files are present."
         )
     
     try:
-        # Save temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as temp:
-            content = await file.read()
-            temp.write(content)
-            temp_path = temp.name
-
-        # Read CSV
+        fmt = response_formats.negotiate(format, request.headers.get("accept"))
+
+        # Spool to disk block by block, hashing as we go
+        # Same bytes + same models + same feature mode -> same result (the key is also the result handle)
+        digest = cache_digest(analysis.model_version, config.FEATURE_MODE,
+                              config.FASTA_FRAME, config.FASTA_GROUP_BY)
+        temp_path, upload_size = await spool_upload(file, digest)
+        key = await upload_key(digest, temp_path, file.filename)
+        # Profiled requests always run the analysis
+        cached = cached_result(key) if profile_mode is None else None
+        if cached is not None:
+            logger.info(f"Result cache hit for {key[:12]}")
+            metrics.set_source("cache")
+            return await render_result(cached, fmt, key, offset, limit)
+
+        # Small uploads share batched model calls; larger ones are parsed and
+        # scored chunk by chunk in a pool worker
         try:
-            raw_df = pd.read_csv(temp_path)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error reading CSV file: {str(e)}")
-        
-        # Check if file has enough columns
-        if len(raw_df.columns) < 6:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"CSV file must have at least 6 columns (5 metadata + features). Found {len(raw_df.columns)} columns."
-            )
-        
-        # Extract feature columns (assuming first 5 are metadata)
-        feature_cols = raw_df.columns[5:]
-        raw_features = raw_df[feature_cols]
-        
-        # Preprocess features
-        processed_features = preprocess_feature(raw_features)
-        
-        # Ensure feature order matches training
-        missing_features = set(feature_names) - set(processed_features.columns)
-        extra_features = set(processed_features.columns) - set(feature_names)
-        
-        if missing_features:
-            logger.warning(f"Adding missing features with zeros: {missing_features}")
-            for feat in missing_features:
-                processed_features[feat] = 0
-        
-        if extra_features:
-            logger.warning(f"Removing extra features: {extra_features}")
-            processed_features = processed_features.drop(columns=list(extra_features))
-        
-        # Reorder to match training exactly
-        processed_features = processed_features[feature_names]
-        
-        logger.info(f"Final processed features shape: {processed_features.shape}")
-        logger.info(f"Expected feature names length: {len(feature_names)}")
-        logger.info(f"Processed feature columns length: {len(processed_features.columns)}")
-        
-        # Verify column alignment
-        if not all(processed_features.columns == feature_names):
-            raise ValueError("Feature column order mismatch after reordering!")
-        
-        # Transform and predict clustering
-        X_scaled = scaler.transform(processed_features)
-        X_pca = pca.transform(X_scaled)
-        cluster_labels = kmeans.predict(X_pca)
-        
-        logger.info(f"Clustering completed. Found {len(np.unique(cluster_labels))} clusters")
-        
-        # Add cluster labels to original data
-        result_df = raw_df.iloc[:len(cluster_labels)].copy()
-        result_df['Cluster'] = cluster_labels
-        
-        # CLASSIFICATION STEP
-        try:
-            # Load training configuration if available
-            training_config = None
-            if os.path.exists('training_config.pkl'):
-                training_config = joblib.load('training_config.pkl')
-                logger.info(f"Loaded training config: {training_config}")
-            
-            # Prepare input for classification
-            if training_config and training_config.get('includes_cluster', False):
-                # Model was trained WITH cluster feature
-                X_with_cluster = np.concatenate([X_scaled, cluster_labels.reshape(-1, 1)], axis=1)
-                logger.info("Using scaled features + cluster for classification")
+            # Profiled requests take the same branch, with that branch's work under the profiler
+            profile_parts = [] if profile_mode is not None else None
+            if batcher.running and upload_size <= config.BATCH_MAX_UPLOAD_BYTES:
+                result = await analyze_small_upload(temp_path, file.filename, profile_parts)
+            elif profile_parts is not None:
+                result, profile_part = await run_in_pool(
+                    profiling.profiled, current_request_id(), config.PROFILE_INTERVAL_SECONDS,
+                    analysis.run_analysis_streamed, temp_path, None, None, file.filename)
+                profile_parts.append(profile_part)
             else:
-                # Model was trained WITHOUT cluster feature - try both options
-                logger.info("Training config suggests no cluster feature, trying without cluster first")
-                X_with_cluster = X_scaled
-            
-            # Check feature dimensions
-            expected_features = training_config['n_features'] if training_config else (
-                classifier.n_features_in_ if hasattr(classifier, 'n_features_in_') else X_with_cluster.shape[1]
-            )
-            actual_features = X_with_cluster.shape[1]
-            
-            logger.info(f"Classification input - Expected: {expected_features}, Actual: {actual_features}")
-            
-            # If mismatch and we didn't include cluster, try adding it
-            if actual_features != expected_features and not (training_config and training_config.get('includes_cluster', False)):
-                logger.info("Feature count mismatch, trying with cluster feature added")
-                X_with_cluster = np.concatenate([X_scaled, cluster_labels.reshape(-1, 1)], axis=1)
-                actual_features = X_with_cluster.shape[1]
-                logger.info(f"After adding cluster - Actual features: {actual_features}")
-            
-            # Final check
-            if actual_features != expected_features:
-                logger.error(f"Feature mismatch persists: expected {expected_features}, got {actual_features}")
-                # Try with just the expected number of features
-                if actual_features > expected_features:
-                    X_with_cluster = X_with_cluster[:, :expected_features]
-                    logger.warning(f"Truncated to {expected_features} features")
-                else:
-                    # Pad with zeros
-                    padding = np.zeros((X_with_cluster.shape[0], expected_features - actual_features))
-                    X_with_cluster = np.concatenate([X_with_cluster, padding], axis=1)
-                    logger.warning(f"Padded to {expected_features} features")
-            
-            # Perform classification
-            kingdom_pred = classifier.predict(X_with_cluster)
-            kingdom_proba = classifier.predict_proba(X_with_cluster) if hasattr(classifier, 'predict_proba') else None
-            
-            result_df['Kingdom'] = kingdom_pred
-            
-            if kingdom_proba is not None:
-                # Add prediction probabilities
-                class_labels = classifier.classes_ if hasattr(classifier, 'classes_') else None
-                if class_labels is not None:
-                    for i, class_label in enumerate(class_labels):
-                        result_df[f'Kingdom_{class_label}_prob'] = kingdom_proba[:, i]
-            
-            logger.info(f"Classification completed successfully")
-            logger.info(f"Kingdom distribution: {result_df['Kingdom'].value_counts().to_dict()}")
-            
-            classification_success = True
-            
-        except Exception as e:
-            logger.error(f"Classification failed: {str(e)}")
-            result_df['Kingdom'] = 'Classification_Failed'
-            result_df['Classification_Error'] = str(e)
-            classification_success = False
-        
-        # Generate response based on available results
-        response_data = {
-            "status": "success",
-            "clustering_completed": True,
-            "classification_completed": classification_success,
-            "total_samples": len(result_df),
-            "cluster_distribution": result_df['Cluster'].value_counts().to_dict()
-        }
-        
-        # Add classification results if successful
-        if classification_success and 'Kingdom' in result_df.columns:
-            response_data["kingdom_distribution"] = result_df['Kingdom'].value_counts().to_dict()
-            response_data["classification_summary"] = result_df.groupby(['Kingdom', 'Cluster']).size().reset_index(name='count').to_dict('records')
-        
-        # Try to load feature importance file for detailed analysis
-        importance_file = 'classification_results_BestModel_feature_importance.csv'
-        if os.path.exists(importance_file) and classification_success:
-            try:
-                importance_df = pd.read_csv(importance_file)
-                
-                # Create detailed summary with feature importance
-                top_features = importance_df.sort_values('Importance', ascending=False)['Feature'].unique()[:5]
-                
-                kingdom_clusters = result_df.groupby(['Kingdom', 'Cluster']).size().reset_index(name='n_species')
-                
-                # Add feature descriptions
-                summary_results = []
-                for _, row in kingdom_clusters.iterrows():
-                    for feat in top_features:
-                        importance_val = importance_df[importance_df['Feature'] == feat]['Importance'].mean()
-                        
-                        summary_results.append({
-                            'Kingdom': row['Kingdom'],
-                            'Cluster': row['Cluster'],
-                            'n_species': row['n_species'],
-                            'Feature': feat,
-                            'Importance': float(importance_val),
-                            'Feature_Description': full_description_mapping.get(feat, {}).get('description', feat) if full_description_mapping else feat,
-                            'Feature_Detail': full_description_mapping.get(feat, {}).get('detail', '') if full_description_mapping else ''
-                        })
-                
-                response_data["detailed_analysis"] = summary_results
-                response_data["top_features"] = top_features.tolist()
-                
-            except Exception as e:
-                logger.warning(f"Could not process feature importance file: {str(e)}")
-        
-        # Always include the detailed results
-        response_data["detailed_results"] = result_df.to_dict(orient='records')
-        
-        # Add metadata about the analysis
-        response_data["analysis_metadata"] = {
-            "n_clusters_found": len(result_df['Cluster'].unique()),
-            "features_used": len(feature_names),
-            "preprocessing_steps": [
-                "codon_to_amino_acid_aggregation",
-                "statistical_features_calculation", 
-                "pca_transformation",
-                "clustering",
-                "classification" if classification_success else "classification_failed"
-            ]
-        }
-        
-        if not classification_success:
-            response_data["warning"] = "Classification failed, only clustering results are available"
-            response_data["clustering_only"] = True
+                result = await run_in_pool(analysis.run_analysis_streamed, temp_path, None, None, file.filename)
+        except PoolSaturated as e:
+            logger.warning(f"Rejecting analysis: {str(e)}")
+            raise HTTPException(status_code=429, detail="Too many analyses in progress, please retry shortly.",
+                                headers={"Retry-After": "5"})
+        except PoolUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Analysis workers unavailable: {str(e)}")
         
-        return response_data
+        metrics.set_source("computed")
+        with metrics.stage("cache"):
+            result_cache.put(key, analysis.dump_result(result))
+        if profile_mode is not None:
+            return await profiled_response(result, profile_parts, profile_mode, fmt, key, offset, limit,
+                                           file.filename, upload_size)
+        return await render_result(result, fmt, key, offset, limit)
             
     except HTTPException:
         raise
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         logger.error(f"Error in analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -0,0 +1,662 @@
+"""Model state and the synchronous analysis pipeline behind /analyze.
+
+Lives outside main.py so the same code runs in the API process and in the
+analysis worker processes, which call ``load_models`` once at start-up.
+"""
+import logging
+import os
+import pickle
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from core import config
+from core.logging import configure_logging
+from core.security import private_directory
+from services.artifacts import ArtifactRegistry, external_signature, load_registry
+from services.embedding_map import AXES, EmbeddingMap, point_columns, project_points
+from services.fasta_ingest import is_fasta, read_fasta_table, species_name_from_path
+from services.feature_engine import CODON_TO_AA, REFERENCE_STATS_FILE, ReferenceStatsBuilder, compute_features
+from services.inference import CompiledPipeline
+from services.metrics import add_rows, stage
+from services.model_store import load_artifact
+from services.neighbor_index import METADATA_COLUMNS, NeighborIndex
+from services.profiling import note_input
+from services.result_cache import cache_digest, fingerprint_files
+from services.result_spool import SpooledTable, TableSpooler
+from services.shared_weights import SharedForest, bundle_path, compile_forest, export_bundle, flatten_forest, load_bundle
+
+logger = logging.getLogger(__name__)
+
+# Global variables for models
+scaler = None
+pca = None
+kmeans = None
+classifier = None
+feature_names = None
+feature_description_full = None
+aa_full = None
+full_description_mapping = None
+reference_stats = None
+training_config = None
+compiled_pipeline = None
+model_version = None
+artifact_registry: Optional[ArtifactRegistry] = None
+neighbor_index: Optional[NeighborIndex] = None
+embedding_map: Optional[EmbeddingMap] = None
+
+
+class AnalysisError(Exception):
+    """Analysis failure that maps onto an HTTP status code"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def load_models(model_dir: Optional[str] = None):
+    """Load all required model components with error handling"""
+    global scaler, pca, kmeans, classifier, feature_names
+    global feature_description_full, aa_full, full_description_mapping, reference_stats
+    global training_config, compiled_pipeline, model_version, artifact_registry, neighbor_index, embedding_map
+
+    # Path ke direktori models (default: app/models)
+    model_dir = model_dir or config.MODEL_DIR
+
+    try:
+        required_files = [
+            'scaler.pkl',
+            'pca.pkl', 
+            'kmeans_model.pkl',
+            'best_classification_model.pkl',
+            'feature_columns.pkl',
+            'feature_description_full.pkl',
+            'aa_full.pkl'
+        ]
+
+        missing_files = [f for f in required_files if not os.path.exists(os.path.join(model_dir, f))]
+        if missing_files:
+            logger.error(f"Missing required files: {missing_files}")
+            return False
+
+        version = current_model_version(model_dir)
+
+        # Arrays are memory-mapped when the artifact layout allows it (see services.model_store)
+        mmap = config.MMAP_MODELS
+        feature_names = load_artifact(os.path.join(model_dir, 'feature_columns.pkl'), mmap)
+
+        # Descriptions, training config and feature importance, indexed once per model version
+        registry = load_registry(model_dir, version, mmap)
+        feature_description_full = registry.feature_descriptions
+        aa_full = registry.amino_acid_descriptions
+        full_description_mapping = registry.description_mapping
+        training_config = registry.training_config
+
+        # Optional training-time statistics for frozen (per-row) feature computation
+        reference_path = os.path.join(model_dir, REFERENCE_STATS_FILE)
+        if os.path.exists(reference_path):
+            reference_stats = load_artifact(reference_path, mmap)
+            logger.info(f"Loaded reference statistics from {reference_stats.get('n_reference_rows')} training rows")
+        else:
+            reference_stats = None
+            logger.info(f"{REFERENCE_STATS_FILE} not found - features use upload-relative statistics, "
+                        f"so streamed uploads are read twice")
+
+        # Numeric state from the shared bundle when another worker already exported it
+        shared = load_shared_pipeline(version) if config.SHARED_WEIGHTS else None
+        if shared is not None:
+            compiled_pipeline = shared
+            scaler = pca = kmeans = None
+            classifier = compiled_pipeline.classifier
+        else:
+            scaler, pca, kmeans, classifier = load_estimators(model_dir)
+
+            # Compile the fitted artifacts into a fixed inference kernel
+            compiled_pipeline = CompiledPipeline(
+                scaler, pca, kmeans, classifier, feature_names, training_config
+            )
+            if config.SHARED_WEIGHTS:
+                shared = export_shared_pipeline(compiled_pipeline, version)
+            if shared is not None:
+                # Serve from the mapped bundle and let the private copies go
+                compiled_pipeline = shared
+                scaler = pca = kmeans = None
+                classifier = compiled_pipeline.classifier
+            else:
+                # Private copy: sklearn scores large batches faster, the flattened trees small ones
+                compiled_pipeline.use_small_batch_classifier(compile_forest(classifier), config.FLAT_FOREST_MAX_ROWS)
+        logger.info(
+            f"Compiled inference pipeline: {compiled_pipeline.n_features} features -> "
+            f"{compiled_pipeline.n_clusters} clusters, classifier input width "
+            f"{compiled_pipeline.n_classifier_features} (cluster column: {compiled_pipeline.includes_cluster})"
+        )
+
+        # Optional reference-species index for /similar (see services.neighbor_index)
+        neighbor_index = NeighborIndex.load(model_dir, mmap, compiled_pipeline)
+        if neighbor_index is not None:
+            logger.info(f"Mapped neighbour index of {neighbor_index.n_reference} reference species")
+        # Optional precomputed 2D map of the reference species for /embedding
+        embedding_map = EmbeddingMap.load(model_dir, mmap, compiled_pipeline)
+
+        model_version = version
+        artifact_registry = registry
+
+        logger.info(f"All models loaded successfully (version {model_version})")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error loading models: {str(e)}")
+        return False
+
+
+def current_model_version(model_dir: Optional[str] = None) -> str:
+    """Version id of the artifacts on disk: the model directory plus any artifacts found outside it"""
+    model_dir = model_dir or config.MODEL_DIR
+    version = fingerprint_files(model_dir)
+    external = external_signature(model_dir)
+    return version if external is None else cache_digest(version, external).hexdigest()[:16]
+
+
+def load_estimators(model_dir: Optional[str] = None):
+    """The fitted sklearn (scaler, pca, kmeans, classifier) from the pickles
+
+    With shared weights the serving path never holds these.
+    """
+    model_dir = model_dir or config.MODEL_DIR
+    return tuple(
+        load_artifact(os.path.join(model_dir, name), config.MMAP_MODELS)
+        for name in ('scaler.pkl', 'pca.pkl', 'kmeans_model.pkl', 'best_classification_model.pkl')
+    )
+
+
+def export_shared_pipeline(pipeline: CompiledPipeline, version: str) -> Optional[CompiledPipeline]:
+    """Write the compiled arrays (and flattened trees) to the shared bundle and map them back"""
+    arrays, meta = pipeline.to_arrays()
+    forest_arrays = flatten_forest(pipeline.classifier)
+    if forest_arrays is None:
+        logger.info(f"{type(pipeline.classifier).__name__} is not a tree ensemble - classifier stays per-process")
+    else:
+        arrays.update(forest_arrays)
+    meta.update(
+        has_forest=forest_arrays is not None,
+        classes=np.asarray(pipeline.classes).tolist() if pipeline.classes is not None else None,
+        n_features_in=int(getattr(pipeline.classifier, 'n_features_in_', pipeline.n_classifier_features)),
+    )
+    try:
+        export_bundle(config.SHARED_WEIGHTS_DIR, version, arrays, meta, owner=os.path.abspath(config.MODEL_DIR))
+    except OSError as e:
+        logger.warning(f"Could not export shared model weights: {str(e)}")
+        return None
+    return load_shared_pipeline(version)
+
+
+def load_shared_pipeline(version: str) -> Optional[CompiledPipeline]:
+    """CompiledPipeline over the memory-mapped bundle for this model version, if one exists"""
+    try:
+        bundle = load_bundle(bundle_path(config.SHARED_WEIGHTS_DIR, version))
+    except PermissionError as e:
+        logger.warning(f"Not mapping shared model weights: {str(e)}")
+        return None
+    if bundle is None:
+        return None
+    arrays, meta = bundle
+    if meta['has_forest']:
+        shared_classifier = SharedForest(arrays, np.asarray(meta['classes']), meta['n_features_in'])
+    else:
+        shared_classifier = load_artifact(os.path.join(config.MODEL_DIR, 'best_classification_model.pkl'), config.MMAP_MODELS)
+    logger.info(f"Mapped shared model weights from {bundle_path(config.SHARED_WEIGHTS_DIR, version)}")
+    return CompiledPipeline.from_arrays(arrays, meta, shared_classifier)
+
+
+def models_loaded() -> bool:
+    """True when everything /analyze needs is loaded"""
+    return feature_names is not None and compiled_pipeline is not None
+
+
+def init_worker():
+    """Process pool initializer: load the models/ artifacts once per worker"""
+    configure_logging()
+    if not load_models():
+        logger.error(f"Worker {os.getpid()} could not load models")
+    elif config.WARMUP:
+        warm_up()
+
+
+def feature_reference():
+    """Reference statistics to score rows against, or None for upload-relative mode"""
+    if config.FEATURE_MODE == "batch":
+        return None
+    if config.FEATURE_MODE == "frozen" and reference_stats is None:
+        raise AnalysisError(503, f"CODON_FEATURE_MODE=frozen but {REFERENCE_STATS_FILE} is not loaded.")
+    return reference_stats
+
+def preprocess_feature(raw_features: pd.DataFrame, dtype=np.float64, reference=None) -> pd.DataFrame:
+    """Preprocess codon usage features (see services.feature_engine)"""
+    return compute_features(raw_features, dtype=dtype, reference=reference)
+
+
+class PreparedUpload(NamedTuple):
+    raw_df: pd.DataFrame
+    processed_features: pd.DataFrame
+    X: np.ndarray
+    reference: Optional[dict]
+
+
+class AnalysisResult(NamedTuple):
+    # JSON-ready response fields (everything except detailed_results)
+    summary: dict
+    # One row per scored species: upload columns + Cluster/Kingdom/probabilities
+    # (a SpooledTable on disk for streamed analyses)
+    table: Union[pd.DataFrame, SpooledTable]
+
+
+def dump_result(result: AnalysisResult) -> bytes:
+    return pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_result(payload: bytes) -> AnalysisResult:
+    return pickle.loads(payload)
+
+
+def result_available(result: AnalysisResult) -> bool:
+    """False when a streamed result's spool file has since been evicted"""
+    return not isinstance(result.table, SpooledTable) or result.table.exists()
+
+
+class ModelOutput(NamedTuple):
+    clusters: np.ndarray
+    labels: Optional[np.ndarray]
+    proba: Optional[np.ndarray]
+    classification_error: Optional[str]
+
+
+def run_analysis(csv_path: str, filename: Optional[str] = None) -> AnalysisResult:
+    """Full /analyze pipeline on a spooled upload (``filename``: the name it was uploaded under)"""
+    prepared = prepare_upload(csv_path, filename)
+    return assemble_result(prepared, predict_models(prepared.X))
+
+
+def prepare_upload(csv_path: str, filename: Optional[str] = None) -> PreparedUpload:
+    """Parse the upload (CSV or FASTA) and build the aligned feature matrix"""
+    if not models_loaded():
+        raise AnalysisError(503, "Models not loaded. Please ensure all .pkl files are present.")
+
+    return prepare_frame(read_upload(csv_path, filename), feature_reference())
+
+
+def read_upload(csv_path: str, filename: Optional[str] = None) -> pd.DataFrame:
+    """Codon usage table of an upload: the CSV itself, or counted from (gzipped) FASTA
+
+    FASTA records without an organism tag are named after ``filename`` (the
+    name the file was uploaded under), else after ``csv_path``.
+    """
+    with stage("read"):
+        if is_fasta(csv_path):
+            default_name = species_name_from_path(filename) if filename else None
+            try:
+                return read_fasta_table(csv_path, default_name=default_name)
+            except (OSError, EOFError, ValueError) as e:
+                raise AnalysisError(400, f"Error reading FASTA file: {str(e)}")
+        try:
+            return pd.read_csv(csv_path)
+        except Exception as e:
+            raise AnalysisError(400, f"Error reading CSV file: {str(e)}")
+
+
+def codon_columns(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """The feature columns of an upload (everything after the 5 metadata columns)"""
+    # Check if file has enough columns
+    if len(raw_df.columns) < 6:
+        raise AnalysisError(
+            400,
+            f"CSV file must have at least 6 columns (5 metadata + features). Found {len(raw_df.columns)} columns."
+        )
+    return raw_df[raw_df.columns[5:]]
+
+
+def prepare_frame(raw_df: pd.DataFrame, reference: Optional[dict]) -> PreparedUpload:
+    """Features for an already parsed upload (or one chunk of it)"""
+    raw_features = codon_columns(raw_df)
+
+    # Preprocess features
+    with stage("features"):
+        processed_features = preprocess_feature(raw_features, reference=reference)
+
+    # Align to the training feature layout (fixed at load time)
+    with stage("transform"):
+        X = compiled_pipeline.align(processed_features)
+    note_input(raw_df.shape, processed_features.shape, X.shape)
+    logger.info(f"Final processed features shape: {X.shape}")
+    return PreparedUpload(raw_df, processed_features, X, reference)
+
+
+def run_analysis_streamed(csv_path: str, chunk_rows: Optional[int] = None,
+                          progress: Optional[Callable[[float], None]] = None,
+                          filename: Optional[str] = None) -> AnalysisResult:
+    """Chunked /analyze pipeline for large uploads
+
+    Parses ``chunk_rows`` rows at a time, scores each chunk and appends its
+    rows to an on-disk ``SpooledTable``; only the (Kingdom, Cluster) counts
+    stay in memory, so peak memory follows the chunk size, not the file.
+    Batch-mode features depend on the whole upload, so without frozen
+    reference stats a first pass collects the upload's own statistics
+    (``upload_reference``) and the chunks are then scored against those,
+    which gives the features of ``run_analysis``. FASTA uploads use
+    ``run_analysis``: they are read as a stream already and give one row
+    per species.
+
+    ``progress`` (if given) is called after every chunk with the fraction
+    of the work done so far (each pass counts for half in batch mode).
+    """
+    if not models_loaded():
+        raise AnalysisError(503, "Models not loaded. Please ensure all .pkl files are present.")
+    if is_fasta(csv_path):
+        logger.info("FASTA upload: not streamed, scoring the per-species table in one pass")
+        result = run_analysis(csv_path, filename)
+        if progress is not None:
+            progress(1.0)
+        return result
+
+    chunk_rows = chunk_rows or config.STREAM_CHUNK_ROWS
+    reference = feature_reference()
+    scoring_share = 1.0
+    if reference is None:
+        logger.info("No frozen reference stats: reading the upload twice, statistics first, then scoring")
+        reference = upload_reference(csv_path, chunk_rows, None if progress is None else lambda done: progress(done / 2))
+        scoring_share = 0.5
+
+    total_bytes = max(os.path.getsize(csv_path), 1)
+    upload, reader = open_csv_chunks(csv_path, chunk_rows)
+    spooler = TableSpooler(config.RESULT_SPOOL_DIR, config.RESULT_SPOOL_MAX_BYTES)
+    counts = empty_counts()
+    classification_success = True
+    try:
+        with upload, reader:
+            for raw_chunk in read_chunks(reader):
+                scored = score_frame(raw_chunk, reference)
+                if scored is not None:
+                    result_df, classified = scored
+                    classification_success &= classified
+                    counts = add_counts(counts, result_df)
+                    with stage("spool"):
+                        spooler.append(result_df)
+                if progress is not None:
+                    # The parser reads ahead in blocks, so this is approximate until the end
+                    progress(1.0 - scoring_share + scoring_share * min(upload.tell() / total_bytes, 1.0))
+    except Exception:
+        spooler.discard()
+        raise
+
+    with stage("spool"):
+        table = spooler.close()
+    logger.info(f"Streamed analysis scored {len(table)} rows in {len(table.chunk_rows)} chunks")
+    return AnalysisResult(summarize(counts, classification_success), table)
+
+
+def upload_reference(csv_path: str, chunk_rows: int,
+                     progress: Optional[Callable[[float], None]] = None) -> Optional[dict]:
+    """Batch-mode feature statistics of a CSV upload, read ``chunk_rows`` rows at a time"""
+    total_bytes = max(os.path.getsize(csv_path), 1)
+    upload, reader = open_csv_chunks(csv_path, chunk_rows)
+
+    def chunks():
+        for raw_chunk in read_chunks(reader):
+            yield raw_chunk
+            if progress is not None:
+                progress(min(upload.tell() / total_bytes, 1.0))
+
+    with upload, reader:
+        return reference_from_chunks(chunks())
+
+
+def reference_from_chunks(chunks: Iterable[pd.DataFrame]) -> Optional[dict]:
+    """Same statistics as ``fit_reference_stats`` on the concatenated upload chunks
+
+    The codon values are spilled to scratch files under ``RESULT_SPOOL_DIR``
+    instead of held in memory (``ReferenceStatsBuilder``). None for an
+    upload without rows.
+    """
+    private_directory(config.RESULT_SPOOL_DIR)
+    with ReferenceStatsBuilder(config.RESULT_SPOOL_DIR) as builder:
+        for raw_chunk in chunks:
+            with stage("reference"):
+                builder.add(codon_columns(raw_chunk))
+        if builder.n_rows == 0:
+            return None
+        with stage("reference"):
+            return builder.finish()
+
+
+def open_csv_chunks(csv_path: str, chunk_rows: int):
+    """(open upload, ``pd.read_csv`` chunk reader over it); a bad header is a 400"""
+    upload = open(csv_path, "rb")
+    try:
+        return upload, pd.read_csv(upload, chunksize=chunk_rows)
+    except Exception as e:
+        upload.close()
+        raise AnalysisError(400, f"Error reading CSV file: {str(e)}")
+
+
+def read_chunks(reader) -> Iterator[pd.DataFrame]:
+    """Chunks of a ``pd.read_csv(..., chunksize=...)`` reader; parse errors become 400s"""
+    while True:
+        with stage("read"):
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+            except Exception as e:
+                raise AnalysisError(400, f"Error reading CSV file: {str(e)}")
+        yield chunk
+
+
+def score_frame(raw_df: pd.DataFrame, reference: Optional[dict]):
+    """(result table, classification succeeded) for upload rows, or None if no row is usable"""
+    prepared = prepare_frame(raw_df, reference)
+    if len(prepared.X) == 0:
+        return None
+    output = predict_models(prepared.X)
+    return result_table(prepared, output), output.classification_error is None
+
+
+def empty_counts() -> pd.Series:
+    return pd.Series(dtype=np.int64, index=pd.MultiIndex.from_arrays([[], []], names=['Kingdom', 'Cluster']))
+
+
+def add_counts(counts: pd.Series, result_df: pd.DataFrame) -> pd.Series:
+    """Running rows per (Kingdom, Cluster), the input of ``summarize``"""
+    return counts.add(result_df.groupby(['Kingdom', 'Cluster']).size(), fill_value=0).astype(np.int64)
+
+
+def predict_models(X: np.ndarray) -> ModelOutput:
+    """Clustering and classification for a feature matrix (one or many uploads)"""
+    # Scaler + PCA (one affine map) and nearest-centroid clustering
+    with stage("transform"):
+        cluster_labels = compiled_pipeline.predict(X, classify=False).clusters
+
+    try:
+        with stage("classify"):
+            kingdom_pred, kingdom_proba = compiled_pipeline.classify(X, cluster_labels)
+    except Exception as e:
+        logger.error(f"Classification failed: {str(e)}")
+        return ModelOutput(cluster_labels, None, None, str(e))
+    return ModelOutput(cluster_labels, kingdom_pred, kingdom_proba, None)
+
+
+def split_model_output(output: ModelOutput, sizes) -> list:
+    """Split a batched ModelOutput back into per-upload pieces"""
+    bounds = np.cumsum([0] + list(sizes))
+    return [
+        ModelOutput(
+            output.clusters[start:end],
+            None if output.labels is None else output.labels[start:end],
+            None if output.proba is None else output.proba[start:end],
+            output.classification_error,
+        )
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def assemble_result(prepared: PreparedUpload, output: ModelOutput) -> AnalysisResult:
+    """Attach predictions to the upload and build the response summary
+
+    Encoding ``result_df`` is left to ``services.response_formats`` so the
+    caller can pick the layout (records, columnar, NDJSON, Arrow) and page.
+    """
+    result_df = result_table(prepared, output)
+    with stage("assemble"):
+        counts = result_df.groupby(['Kingdom', 'Cluster']).size()
+        summary = summarize(counts, output.classification_error is None)
+    return AnalysisResult(summary, result_df)
+
+
+def result_table(prepared: PreparedUpload, output: ModelOutput) -> pd.DataFrame:
+    """Upload rows with Cluster, Kingdom and Kingdom_*_prob columns attached"""
+    with stage("assemble"):
+        result_df = attach_predictions(prepared, output)
+    add_rows(len(result_df))
+    return result_df
+
+
+def attach_predictions(prepared: PreparedUpload, output: ModelOutput) -> pd.DataFrame:
+    cluster_labels = output.clusters
+
+    logger.info(f"Clustering completed. Found {len(np.unique(cluster_labels))} clusters")
+
+    # Add cluster labels to original data
+    result_df = scored_rows(prepared).copy()
+    result_df['Cluster'] = cluster_labels
+
+    # CLASSIFICATION STEP
+    if output.classification_error is None:
+        result_df['Kingdom'] = output.labels
+
+        if output.proba is not None:
+            # Add prediction probabilities
+            for i, class_label in enumerate(compiled_pipeline.classes):
+                result_df[f'Kingdom_{class_label}_prob'] = output.proba[:, i]
+
+        logger.info(f"Classification completed successfully")
+
+    else:
+        result_df['Kingdom'] = 'Classification_Failed'
+        result_df['Classification_Error'] = output.classification_error
+
+    return result_df
+
+
+def scored_rows(prepared: PreparedUpload) -> pd.DataFrame:
+    """Upload rows that made it into ``prepared.X``, in the same order"""
+    # Features keep the upload's row labels in both feature modes
+    return prepared.raw_df.loc[prepared.processed_features.index]
+
+
+def query_metadata(prepared: PreparedUpload) -> pd.DataFrame:
+    """Identifying columns (SpeciesName, SpeciesID, ...) of the scored upload rows"""
+    rows = scored_rows(prepared)
+    return rows[[col for col in METADATA_COLUMNS if col in rows.columns]]
+
+
+def find_similar(csv_path: str, k: int, filename: Optional[str] = None) -> dict:
+    """Top-k reference species for every row of a spooled upload (see services.neighbor_index)"""
+    if neighbor_index is None:
+        raise AnalysisError(
+            503,
+            "Similar-species index not built. Run `python -m services.neighbor_index <reference.csv>` from backend/app."
+        )
+    prepared = prepare_upload(csv_path, filename)
+    neighbors = neighbor_index.neighbors(compiled_pipeline.project(prepared.X), k)
+    queries = query_metadata(prepared).to_dict(orient='records')
+    return jsonable_encoder({
+        "metric": neighbor_index.metric,
+        "k": min(k, neighbor_index.n_reference),
+        "n_queries": len(queries),
+        "n_reference": neighbor_index.n_reference,
+        "results": [{"query": query, "neighbors": found} for query, found in zip(queries, neighbors)],
+    })
+
+
+def project_upload(csv_path: str, filename: Optional[str] = None) -> dict:
+    """Map coordinates and clusters of every row of a spooled upload (see services.embedding_map)"""
+    prepared = prepare_upload(csv_path, filename)
+    xy, clusters = project_points(compiled_pipeline, prepared.X)
+    metadata = query_metadata(prepared)
+    return jsonable_encoder({
+        "method": "pca",
+        "axes": list(AXES),
+        "n_points": len(xy),
+        "points": point_columns(xy, clusters, {col: metadata[col].tolist() for col in metadata.columns}),
+    })
+
+
+def summarize(counts: pd.Series, classification_success: bool) -> dict:
+    """Response summary from the number of rows per (Kingdom, Cluster)
+
+    Everything in the summary derives from these counts, so a chunked
+    analysis only has to add up per-chunk counts.
+    """
+    counts = counts[counts > 0].sort_index()
+    cluster_counts = counts.groupby(level='Cluster').sum().sort_values(ascending=False, kind='stable')
+    kingdom_counts = counts.groupby(level='Kingdom').sum().sort_values(ascending=False, kind='stable')
+
+    # Generate response based on available results
+    response_data = {
+        "status": "success",
+        "clustering_completed": True,
+        "classification_completed": classification_success,
+        "total_samples": int(counts.sum()),
+        "cluster_distribution": cluster_counts.to_dict()
+    }
+
+    # Add classification results if successful
+    if classification_success:
+        logger.info(f"Kingdom distribution: {kingdom_counts.to_dict()}")
+        response_data["kingdom_distribution"] = kingdom_counts.to_dict()
+        response_data["classification_summary"] = counts.reset_index(name='count').to_dict('records')
+
+    # Top features per (Kingdom, Cluster): a join against the precomputed explanation table
+    registry = artifact_registry
+    if registry is not None and registry.explanation is not None and classification_success:
+        detailed = counts.reset_index(name='n_species').merge(registry.explanation, how='cross')
+        response_data["detailed_analysis"] = detailed.to_dict('records')
+        response_data["top_features"] = registry.top_features
+
+    # Add metadata about the analysis
+    response_data["analysis_metadata"] = {
+        "n_clusters_found": len(cluster_counts),
+        "features_used": len(feature_names),
+        "preprocessing_steps": [
+            "codon_to_amino_acid_aggregation",
+            "statistical_features_calculation", 
+            "pca_transformation",
+            "clustering",
+            "classification" if classification_success else "classification_failed"
+        ]
+    }
+
+    if not classification_success:
+        response_data["warning"] = "Classification failed, only clustering results are available"
+        response_data["clustering_only"] = True
+
+    # The summary is small; encode it once to plain Python types here
+    return jsonable_encoder(response_data)
+
+
+def warm_up(n_rows: int = 32) -> AnalysisResult:
+    """Run a synthetic upload through the whole pipeline once
+
+    The first call of each path pays for lazy imports, sklearn/BLAS thread
+    pools and pandas code paths; doing it at start-up keeps that cost off the
+    first real request.
+    """
+    rng = np.random.default_rng(0)
+    codons = pd.DataFrame(rng.dirichlet(np.ones(len(CODON_TO_AA)), n_rows), columns=list(CODON_TO_AA))
+    metadata = pd.DataFrame({
+        'Kingdom': ['vrl'] * n_rows, 'DNAtype': 0, 'SpeciesID': np.arange(n_rows),
+        'Ncodons': 1000, 'SpeciesName': [f'warmup_{i}' for i in range(n_rows)],
+    })
+    prepared = prepare_frame(pd.concat([metadata, codons], axis=1), feature_reference())
+    return assemble_result(prepared, predict_models(prepared.X))
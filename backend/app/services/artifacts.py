@@ -0,0 +1,120 @@
+"""Registry of the auxiliary artifacts that shape the /analyze response.
+
+``load_models`` builds one ``ArtifactRegistry`` next to the models:
+feature descriptions, the training config and the best model's feature
+importances, each looked up in the model directory first and then in the
+working directory (where the notebook used to leave them). Everything the
+explanation section needs is precomputed into indexed tables here, so a
+request only joins its (Kingdom, Cluster) counts against ``explanation``.
+
+Files inside the model directory are already covered by its fingerprint;
+``external_signature`` adds the ones found in the working directory, so
+replacing any artifact triggers the same reload and cache invalidation as
+a new model.
+"""
+import hashlib
+import logging
+import os
+from typing import Dict, NamedTuple, Optional
+
+import pandas as pd
+
+from services.model_store import load_artifact
+
+logger = logging.getLogger(__name__)
+
+FEATURE_DESCRIPTION_FILE = 'feature_description_full.pkl'
+AMINO_ACID_DESCRIPTION_FILE = 'aa_full.pkl'
+TRAINING_CONFIG_FILE = 'training_config.pkl'
+IMPORTANCE_FILE = 'classification_results_BestModel_feature_importance.csv'
+AUXILIARY_FILES = (FEATURE_DESCRIPTION_FILE, AMINO_ACID_DESCRIPTION_FILE, TRAINING_CONFIG_FILE, IMPORTANCE_FILE)
+
+# Features listed per (Kingdom, Cluster) in detailed_analysis
+TOP_FEATURES = 5
+
+
+class ArtifactRegistry(NamedTuple):
+    # model version the registry was loaded for
+    version: str
+    # artifact file name -> path it was loaded from (None if absent)
+    sources: Dict[str, Optional[str]]
+    training_config: Optional[dict]
+    # {feature: {'description', 'detail'}} per description pickle, and both merged (amino acids win)
+    feature_descriptions: dict
+    amino_acid_descriptions: dict
+    description_mapping: dict
+    # index: Feature; columns: Importance (mean over the importance file), Feature_Description, Feature_Detail
+    feature_table: Optional[pd.DataFrame]
+    # the TOP_FEATURES rows of feature_table in detailed_analysis order, Feature as a column
+    explanation: Optional[pd.DataFrame]
+
+    @property
+    def top_features(self) -> list:
+        return [] if self.explanation is None else self.explanation['Feature'].tolist()
+
+
+def locate(name: str, model_dir: str) -> Optional[str]:
+    """Path of an artifact: the model directory first, then the working directory"""
+    for path in (os.path.join(model_dir, name), name):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def external_signature(model_dir: str) -> Optional[str]:
+    """(path, size, mtime) hash of the artifacts found outside ``model_dir``; None if there are none"""
+    digest = hashlib.sha256()
+    found = False
+    for name in AUXILIARY_FILES:
+        path = locate(name, model_dir)
+        if path is not None and path != os.path.join(model_dir, name):
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+            found = True
+    return digest.hexdigest()[:16] if found else None
+
+
+def load_registry(model_dir: str, version: str, mmap: bool = True) -> ArtifactRegistry:
+    sources = {name: locate(name, model_dir) for name in AUXILIARY_FILES}
+
+    feature_descriptions, amino_acid_descriptions = (
+        load_artifact(sources[name], mmap) if sources[name] is not None else {}
+        for name in (FEATURE_DESCRIPTION_FILE, AMINO_ACID_DESCRIPTION_FILE)
+    )
+    description_mapping = {**feature_descriptions, **amino_acid_descriptions}
+
+    training_config = None
+    if sources[TRAINING_CONFIG_FILE] is not None:
+        training_config = load_artifact(sources[TRAINING_CONFIG_FILE], mmap)
+        logger.info(f"Loaded training config: {training_config}")
+
+    feature_table, explanation = None, None
+    if sources[IMPORTANCE_FILE] is not None:
+        try:
+            feature_table, explanation = build_explanation_tables(pd.read_csv(sources[IMPORTANCE_FILE]), description_mapping)
+            logger.info(f"Loaded feature importance for {len(feature_table)} features from {sources[IMPORTANCE_FILE]}")
+        except Exception as e:
+            logger.warning(f"Could not process feature importance file: {str(e)}")
+
+    return ArtifactRegistry(version, sources, training_config, feature_descriptions, amino_acid_descriptions,
+                            description_mapping, feature_table, explanation)
+
+
+def build_explanation_tables(importance_df: pd.DataFrame, description_mapping: dict):
+    """(feature_table, explanation) from the raw Feature/Importance rows"""
+    mean_importance = importance_df.groupby('Feature', sort=False)['Importance'].mean().astype(float)
+    features = mean_importance.index
+    descriptions = pd.DataFrame.from_dict(description_mapping, orient='index').reindex(features) \
+        if description_mapping else pd.DataFrame(index=features)
+
+    feature_table = pd.DataFrame({
+        'Importance': mean_importance,
+        # Without any descriptions the feature name stands in (as the response always did)
+        'Feature_Description': descriptions.get('description', pd.Series(index=features, dtype=object)).fillna(pd.Series(features, index=features)),
+        'Feature_Detail': descriptions.get('detail', pd.Series(index=features, dtype=object)).fillna(''),
+    })
+    feature_table.index.name = 'Feature'
+
+    top = importance_df.sort_values('Importance', ascending=False)['Feature'].unique()[:TOP_FEATURES]
+    explanation = feature_table.loc[top].reset_index()
+    return feature_table, explanation
@@ -0,0 +1,366 @@
+"""Offline batch scoring of codon usage files, without the HTTP API.
+
+    python -m services.batch_scoring "data/**/*.csv" --output-dir scored --workers 4   (run from backend/app)
+
+Scores every CSV, Parquet or FASTA file in the given directories or globs
+with the same code as /analyze (``services.analysis``). The model
+artifacts are loaded once per pool worker, not once per file. Each input
+gets one output table next to its relative path under ``--output-dir``.
+The table holds the upload's metadata columns plus Cluster, Kingdom and
+the Kingdom_*_prob columns (``--keep-features`` also keeps the codon
+columns). Rows are read and written ``CODON_STREAM_CHUNK_ROWS`` at a time.
+In batch feature mode a first chunked pass over each file collects its
+own statistics (``analysis.reference_from_chunks``), which gives the same
+features as scoring the file as a whole, like /analyze. FASTA inputs are
+read as a whole.
+
+Resuming: every finished output is written atomically. Next to it goes a
+``.done.json`` manifest with the input's size and mtime, the model version
+and the row counts. A rerun skips inputs whose manifest still matches, so
+an interrupted run picks up where it stopped; ``--overwrite`` rescores
+everything. ``summary.json`` in the output directory merges the counts of
+every input (scored now or earlier) into the /analyze summary. It also
+reports throughput in rows per second and lists the inputs that failed.
+"""
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from core import config
+from services import analysis
+from services.fasta_ingest import is_fasta
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE = "summary.json"
+MANIFEST_SUFFIX = ".done.json"
+PARQUET_SUFFIXES = (".parquet", ".pq")
+FASTA_SUFFIXES = (".fasta", ".fa", ".fna", ".ffn")
+INPUT_SUFFIXES = (".csv", *PARQUET_SUFFIXES, *FASTA_SUFFIXES, *(f"{suffix}.gz" for suffix in FASTA_SUFFIXES))
+OUTPUT_FORMATS = ("parquet", "csv")
+
+
+def find_inputs(patterns: Iterable[str]) -> List[str]:
+    """Input files of directories (searched recursively) and globs, sorted and de-duplicated"""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                found.update(os.path.join(root, name) for name in names if name.lower().endswith(INPUT_SUFFIXES))
+        else:
+            found.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in found)
+
+
+def output_paths(inputs: List[str], output_dir: str, fmt: str) -> Dict[str, str]:
+    """Output table per input, keeping paths relative to the inputs' common directory"""
+    if not inputs:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path in inputs])
+    relatives = {path: os.path.relpath(path, root) for path in inputs}
+    stems = {path: strip_input_suffix(relative) for path, relative in relatives.items()}
+    taken = pd.Series(list(stems.values())).value_counts()
+    # a.csv and a.parquet side by side keep their suffix instead of sharing one output
+    return {path: os.path.join(output_dir, f"{stems[path] if taken[stems[path]] == 1 else relatives[path]}.{fmt}")
+            for path in inputs}
+
+
+def strip_input_suffix(name: str) -> str:
+    lowered = name.lower()
+    suffixes = [suffix for suffix in INPUT_SUFFIXES if lowered.endswith(suffix)]
+    return name[:-len(max(suffixes, key=len))] if suffixes else name
+
+
+def input_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def run_signature(fmt: str, keep_features: bool) -> dict:
+    """Everything besides the input an output depends on"""
+    return {
+        "model_version": analysis.model_version,
+        "feature_mode": config.FEATURE_MODE,
+        "fasta": [config.FASTA_FRAME, config.FASTA_GROUP_BY],
+        "format": fmt,
+        "keep_features": keep_features,
+    }
+
+
+def read_manifest(output_path: str) -> Optional[dict]:
+    try:
+        with open(f"{output_path}{MANIFEST_SUFFIX}") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_done(path: str, output_path: str, signature: dict) -> bool:
+    """Whether an earlier run already scored this exact input with the same models and options"""
+    manifest = read_manifest(output_path)
+    return (manifest is not None and os.path.exists(output_path)
+            and manifest.get("fingerprint") == input_fingerprint(path)
+            and manifest.get("signature") == signature)
+
+
+def iter_input_chunks(path: str, chunk_rows: int, whole: bool) -> Iterator[pd.DataFrame]:
+    """Upload rows of one input file, ``chunk_rows`` at a time unless ``whole``"""
+    if path.lower().endswith(PARQUET_SUFFIXES):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise analysis.AnalysisError(400, "Reading Parquet inputs needs pyarrow, which is not installed")
+        parquet = pq.ParquetFile(path)
+        if whole:
+            yield parquet.read().to_pandas()
+            return
+        for batch in parquet.iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    if whole or is_fasta(path):
+        yield analysis.read_upload(path)
+        return
+    try:
+        reader = pd.read_csv(path, chunksize=chunk_rows)
+    except Exception as e:
+        raise analysis.AnalysisError(400, f"Error reading CSV file: {str(e)}")
+    with reader:
+        yield from analysis.read_chunks(reader)
+
+
+class TableWriter:
+    """Appends result chunks to ``path`` (Parquet or CSV) through a temp file renamed on close"""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Left over from an interrupted run
+        self.discard()
+        self._writer = None
+        self._schema = None
+        self._columns = None
+
+    def write(self, table: pd.DataFrame):
+        if self._columns is None:
+            self._columns = list(table.columns)
+        elif list(table.columns) != self._columns:
+            # e.g. classification failed for a later chunk: keep the first chunk's layout
+            table = table.reindex(columns=self._columns)
+        if self.fmt == "csv":
+            table.to_csv(self.tmp_path, mode="a", header=self._writer is None, index=False)
+            self._writer = True
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        batch = pa.Table.from_pandas(table, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = batch.schema
+            self._writer = pq.ParquetWriter(self.tmp_path, self._schema)
+        self._writer.write_table(batch)
+
+    def close(self, columns: List[str]):
+        """Finish the file (an empty table with ``columns`` if nothing was written)"""
+        if self._writer is None:
+            self.write(pd.DataFrame(columns=columns))
+        if self.fmt == "parquet":
+            self._writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        if self.fmt == "parquet" and getattr(self, "_writer", None) is not None:
+            self._writer.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+
+def output_columns(result_df: pd.DataFrame, raw_df: pd.DataFrame, keep_features: bool) -> pd.DataFrame:
+    """Result rows without the upload's codon columns (unless ``keep_features``)"""
+    if keep_features:
+        return result_df
+    return result_df.drop(columns=[col for col in raw_df.columns[5:] if col in result_df.columns])
+
+
+def score_file(path: str, output_path: str, fmt: str, signature: dict,
+               chunk_rows: Optional[int] = None, keep_features: bool = False) -> dict:
+    """Score one input into ``output_path`` and write its manifest (pool worker entry point)"""
+    started = time.perf_counter()
+    fingerprint = input_fingerprint(path)
+    chunk_rows = chunk_rows or config.STREAM_CHUNK_ROWS
+    reference = analysis.feature_reference()
+    if reference is None and not is_fasta(path):
+        # Batch feature mode: the input's own statistics first, so it can still be scored in chunks
+        reference = analysis.reference_from_chunks(iter_input_chunks(path, chunk_rows, whole=False))
+    counts = analysis.empty_counts()
+    classification_success = True
+    rows = 0
+    columns = []
+    writer = TableWriter(output_path, fmt)
+    try:
+        for raw_df in iter_input_chunks(path, chunk_rows, whole=reference is None):
+            scored = analysis.score_frame(raw_df, reference)
+            if scored is None:
+                continue
+            result_df, classified = scored
+            classification_success &= classified
+            counts = analysis.add_counts(counts, result_df)
+            table = output_columns(result_df, raw_df, keep_features)
+            columns = columns or list(table.columns)
+            writer.write(table)
+            rows += len(table)
+        writer.close(columns)
+    except BaseException:
+        writer.discard()
+        raise
+
+    seconds = time.perf_counter() - started
+    manifest = {
+        "input": path,
+        "output": output_path,
+        "fingerprint": fingerprint,
+        "signature": signature,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+        "classification_completed": classification_success,
+        "counts": [[json_scalar(kingdom), int(cluster), int(n)] for (kingdom, cluster), n in counts.items()],
+    }
+    write_json(f"{output_path}{MANIFEST_SUFFIX}", manifest)
+    return manifest
+
+
+def json_scalar(value):
+    """Plain Python value of a NumPy scalar (class labels may be integers)"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_json(path: str, payload: dict):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def merged_summary(manifests: List[dict]) -> dict:
+    """The /analyze summary over all scored inputs"""
+    counts = analysis.empty_counts()
+    for manifest in manifests:
+        if manifest["counts"]:
+            frame = pd.DataFrame(manifest["counts"], columns=["Kingdom", "Cluster", "n"])
+            counts = counts.add(frame.set_index(["Kingdom", "Cluster"])["n"], fill_value=0).astype("int64")
+    classified = all(manifest["classification_completed"] for manifest in manifests)
+    return analysis.summarize(counts, classified)
+
+
+def run_batch(patterns: Iterable[str], output_dir: str, workers: int = 0, fmt: str = "parquet",
+              chunk_rows: Optional[int] = None, keep_features: bool = False, overwrite: bool = False) -> dict:
+    """Score every matching input (skipping finished ones) and write ``summary.json``"""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Output format must be one of {OUTPUT_FORMATS}, got {fmt!r}")
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow; install it or use --format csv")
+    if not analysis.load_models():
+        raise RuntimeError(f"Could not load the models in {config.MODEL_DIR}")
+
+    started = time.perf_counter()
+    inputs = find_inputs(patterns)
+    outputs = output_paths(inputs, output_dir, fmt)
+    signature = run_signature(fmt, keep_features)
+    pending = [path for path in inputs if overwrite or not is_done(path, outputs[path], signature)]
+    # Largest first, so one big file does not start last and hold up the end of the run
+    pending.sort(key=os.path.getsize, reverse=True)
+    logger.info(f"{len(inputs)} inputs, {len(inputs) - len(pending)} already scored, {len(pending)} to score")
+
+    scored, failed = [], []
+
+    def finished(path: str, manifest: Optional[dict], error: Optional[BaseException]):
+        done = len(scored) + len(failed) + 1
+        if error is not None:
+            detail = getattr(error, "detail", None) or str(error)
+            failed.append({"input": path, "error": detail})
+            logger.error(f"[{done}/{len(pending)}] {path} failed: {detail}")
+            return
+        scored.append(manifest)
+        logger.info(f"[{done}/{len(pending)}] {path}: {manifest['rows']} rows in {manifest['seconds']}s "
+                    f"({manifest['rows_per_second']} rows/s)")
+
+    if workers > 0 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context(config.POOL_START_METHOD),
+                                 initializer=analysis.init_worker) as executor:
+            futures = {
+                executor.submit(score_file, path, outputs[path], fmt, signature, chunk_rows, keep_features): path
+                for path in pending
+            }
+            for future in as_completed(futures):
+                error = future.exception()
+                finished(futures[future], None if error else future.result(), error)
+    else:
+        for path in pending:
+            try:
+                manifest = score_file(path, outputs[path], fmt, signature, chunk_rows, keep_features)
+            except Exception as e:
+                finished(path, None, e)
+                continue
+            finished(path, manifest, None)
+
+    seconds = time.perf_counter() - started
+    failed_inputs = {failure["input"] for failure in failed}
+    manifests = [read_manifest(outputs[path]) for path in inputs if path not in failed_inputs]
+    manifests = [manifest for manifest in manifests if manifest is not None]
+    rows_scored = sum(manifest["rows"] for manifest in scored)
+    summary = {
+        "signature": signature,
+        "inputs": len(inputs),
+        "scored": len(scored),
+        "skipped": len(inputs) - len(pending),
+        "failed": failed,
+        "rows": sum(manifest["rows"] for manifest in manifests),
+        "rows_scored": rows_scored,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows_scored / seconds, 1) if seconds > 0 else None,
+        "workers": workers,
+        "outputs": [{key: manifest[key] for key in ("input", "output", "rows", "rows_per_second")}
+                    for manifest in manifests],
+        "summary": merged_summary(manifests),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    write_json(os.path.join(output_dir, SUMMARY_FILE), summary)
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Score directories or globs of codon usage files offline")
+    parser.add_argument("inputs", nargs="+", help="directories (searched recursively) or glob patterns")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 = score in this process")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="parquet")
+    parser.add_argument("--chunk-rows", type=int, default=config.STREAM_CHUNK_ROWS)
+    parser.add_argument("--keep-features", action="store_true", help="also write the codon columns")
+    parser.add_argument("--overwrite", action="store_true", help="rescore inputs that already have outputs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_batch(args.inputs, args.output_dir, args.workers, args.format, args.chunk_rows,
+                       args.keep_features, args.overwrite)
+    print(f"Scored {result['scored']} files ({result['rows_scored']} rows, {result['rows_per_second']} rows/s), "
+          f"skipped {result['skipped']}, failed {len(result['failed'])}; summary in "
+          f"{os.path.join(args.output_dir, SUMMARY_FILE)}")
+    sys.exit(1 if result["failed"] else 0)
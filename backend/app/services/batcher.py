@@ -0,0 +1,126 @@
+"""Micro-batching scheduler for small analyses.
+
+Small uploads spend most of their model time in per-call overhead of the
+scaler/PCA/KMeans/classifier passes. Aligned feature matrices from
+concurrent requests are collected for a short window (or until the batch
+reaches ``max_rows``), run through the models in one call on a dedicated
+inference thread, and the result is split back to each caller by row
+offsets.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Merge concurrent ``submit(X)`` calls into one ``batch_fn`` call
+
+    ``batch_fn(X)`` runs the models on the stacked matrix and
+    ``split_fn(output, sizes)`` cuts its output back into one piece per
+    submitted matrix. ``window_ms=0`` dispatches every submit right away
+    (still serialized on the inference thread).
+    """
+
+    def __init__(self, batch_fn: Callable, split_fn: Callable[[object, Sequence[int]], List],
+                 window_ms: float = 2.0, max_rows: int = 4096):
+        self.batch_fn = batch_fn
+        self.split_fn = split_fn
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self._executor = None
+        self._pending = []
+        self._pending_rows = 0
+        self._timer = None
+        # The event loop only keeps weak references to tasks
+        self._tasks = set()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    def shutdown(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, future in self._pending:
+            if not future.done():
+                future.cancel()
+        self._pending, self._pending_rows = [], 0
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def submit(self, X: np.ndarray):
+        """Queue one aligned feature matrix and wait for its share of the batch output"""
+        if self._executor is None:
+            raise RuntimeError("Micro-batcher is not running")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((X, future))
+        self._pending_rows += len(X)
+
+        if self._pending_rows >= self.max_rows or self.window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        sizes = [len(X) for X, _ in batch]
+        X = batch[0][0] if len(batch) == 1 else np.concatenate([X for X, _ in batch])
+        self.batches += 1
+        self.requests += len(batch)
+        self.rows += len(X)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        try:
+            output = await asyncio.get_running_loop().run_in_executor(self._executor, self.batch_fn, X)
+            parts = self.split_fn(output, sizes)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Batched inference failed for {len(batch)} requests: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), part in zip(batch, parts):
+            if not future.done():
+                future.set_result(part)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "window_ms": self.window * 1000.0,
+            "max_rows": self.max_rows,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "largest_batch": self.largest_batch,
+            "failed": self.failed,
+        }
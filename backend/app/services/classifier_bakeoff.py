@@ -0,0 +1,378 @@
+"""Concurrent classifier bake-off and successive-halving search for training.
+
+``CodonClassificationPipeline.run_multiple_classifiers`` in the notebook
+trained RandomForest, XGBoost, SVC and LogisticRegression one after another
+(each with a 5-fold ``cross_val_score``), and ``optimize_best_classifier``
+then ran ``RandomizedSearchCV(n_jobs=-1)`` over multithreaded estimators.
+``ClassifierBakeoff`` runs the same work as independent fit tasks
+(model, parameters, fold, training rows) with:
+
+* one global CPU budget: ``n_workers`` single-threaded processes (BLAS and
+  estimator ``n_jobs`` pinned to 1), so concurrent models never
+  oversubscribe the cores
+* folds computed once per fold count and shared by every model and every
+  search candidate, so scores are compared on identical splits
+* successive halving instead of exhaustive random search: candidates are
+  scored on a stratified share of each training fold and the best 1/eta go
+  on to eta times more rows
+* XGBoost early stopping on a validation split carved out of each
+  training fold (``CODON_TRAIN_XGB_EARLY_STOPPING_ROUNDS``)
+
+Results come back in the notebook's ``classification_results`` format, so
+feature importances and the saved CSVs are produced as before. XGBoost is
+optional: without the package it is left out of the bake-off.
+"""
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core import config
+
+logger = logging.getLogger(__name__)
+
+RANDOM_STATE = 42
+BAKEOFF_FOLDS = 5
+# Smallest number of training rows per class a halving rung fits on
+HALVING_MIN_ROWS_PER_CLASS = 10
+
+MODEL_NAMES = ('Random Forest', 'XGBoost', 'SVM', 'Logistic Regression')
+
+PARAM_GRIDS = {
+    'Random Forest': {
+        'n_estimators': [100, 200],
+        'max_depth': [10, None],
+        'min_samples_split': [2, 5],
+        'min_samples_leaf': [1, 2]
+    },
+    'XGBoost': {
+        'n_estimators': [100, 200],
+        'max_depth': [3, 6],
+        'learning_rate': [0.01, 0.1],
+        'subsample': [0.8, 1.0]
+    },
+    'SVM': {
+        'C': [0.1, 1, 10],
+        'gamma': ['scale'],
+        'kernel': ['rbf']
+    },
+    'Logistic Regression': {
+        'C': [0.1, 1, 10],
+        'penalty': ['l2'],
+        'solver': ['liblinear']
+    }
+}
+
+
+def xgboost_available() -> bool:
+    try:
+        import xgboost  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_classifier(name: str, params: dict, random_state: int = RANDOM_STATE, probability: bool = True):
+    """The notebook's estimator for ``name``, single-threaded
+
+    ``probability=False`` skips SVC's internal Platt scaling where only
+    ``predict`` is needed (the predicted labels are the same).
+    """
+    if name == 'Random Forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=random_state, n_jobs=1, **params)
+    if name == 'XGBoost':
+        import xgboost as xgb
+        return xgb.XGBClassifier(random_state=random_state, eval_metric='mlogloss', n_jobs=1,
+                                 early_stopping_rounds=config.TRAIN_XGB_EARLY_STOPPING_ROUNDS, **params)
+    if name == 'SVM':
+        from sklearn.svm import SVC
+        return SVC(random_state=random_state, probability=probability, **params)
+    if name == 'Logistic Regression':
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(random_state=random_state, max_iter=1000, **params)
+    raise ValueError(f"Unknown classifier '{name}'")
+
+
+class Task(NamedTuple):
+    name: str
+    # sorted (name, value) pairs, so equal parameters give equal tasks
+    params: tuple
+    # positions (into the training rows) to fit on and to score on; score_rows=None keeps the model
+    fit_rows: np.ndarray
+    score_rows: Optional[np.ndarray]
+    probability: bool = False
+
+    @property
+    def param_dict(self) -> dict:
+        return dict(self.params)
+
+
+class TaskResult(NamedTuple):
+    # accuracy on score_rows (None for a keep-the-model task)
+    score: Optional[float]
+    model: Optional[object]
+    fit_seconds: float
+    # boosting rounds kept by early stopping (XGBoost only)
+    best_iteration: Optional[int] = None
+
+
+def fit_task(X: pd.DataFrame, y: np.ndarray, task: Task) -> TaskResult:
+    model = make_classifier(task.name, task.param_dict, probability=task.probability)
+    X_fit, y_fit = X.iloc[task.fit_rows], y[task.fit_rows]
+    started = time.perf_counter()
+    best_iteration = None
+    if task.name == 'XGBoost':
+        from sklearn.model_selection import train_test_split
+
+        fit_part, val_part = train_test_split(
+            np.arange(len(y_fit)), test_size=config.TRAIN_XGB_VALIDATION_FRACTION,
+            random_state=RANDOM_STATE, stratify=y_fit)
+        model.fit(X_fit.iloc[fit_part], y_fit[fit_part],
+                  eval_set=[(X_fit.iloc[val_part], y_fit[val_part])], verbose=False)
+        best_iteration = getattr(model, 'best_iteration', None)
+    else:
+        model.fit(X_fit, y_fit)
+    fit_seconds = time.perf_counter() - started
+
+    if task.score_rows is None:
+        return TaskResult(None, model, fit_seconds, best_iteration)
+    score = float(np.mean(model.predict(X.iloc[task.score_rows]) == y[task.score_rows]))
+    return TaskResult(score, None, fit_seconds, best_iteration)
+
+
+def stratified_subset(rows: np.ndarray, y: np.ndarray, n_rows: int, seed: int = RANDOM_STATE) -> np.ndarray:
+    """Seeded class-stratified subset of ``rows`` (all of them when ``n_rows`` covers them)"""
+    if n_rows >= len(rows):
+        return rows
+    from sklearn.model_selection import train_test_split
+
+    subset, _ = train_test_split(rows, train_size=n_rows, random_state=seed, stratify=y[rows])
+    return np.sort(subset)
+
+
+_worker_data = None
+
+
+def _init_worker(X: pd.DataFrame, y: np.ndarray):
+    global _worker_data
+    from threadpoolctl import threadpool_limits
+
+    _worker_data = (X, y)
+    # One core per fit; the pool is the CPU budget
+    threadpool_limits(1)
+
+
+def _fit_in_worker(task: Task) -> TaskResult:
+    return fit_task(*_worker_data, task)
+
+
+class ClassifierBakeoff:
+    """Trains classifiers on one hold-out split under one CPU budget; use as a context manager"""
+
+    def __init__(self, X: pd.DataFrame, y, test_size: float = 0.2, random_state: int = RANDOM_STATE,
+                 n_workers: Optional[int] = None,
+                 progress: Optional[Callable[[dict], None]] = None,
+                 start_method: str = config.POOL_START_METHOD):
+        from sklearn.model_selection import train_test_split
+
+        y = pd.Series(y, index=X.index) if not isinstance(y, pd.Series) else y
+        # Same partition as train_test_split on the frames themselves
+        train_pos, test_pos = train_test_split(np.arange(len(X)), test_size=test_size,
+                                               random_state=random_state, stratify=y)
+        self.X_train, self.X_test = X.iloc[train_pos], X.iloc[test_pos]
+        self.y_train, self.y_test = y.iloc[train_pos], y.iloc[test_pos]
+        self._y = self.y_train.to_numpy()
+        self.n_workers = config.TRAIN_CPU_BUDGET if n_workers is None else n_workers
+        self.progress = progress
+        self.start_method = start_method
+        self.records: List[dict] = []
+        self._folds: Dict[int, list] = {}
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def folds(self, n_splits: int) -> list:
+        """(train positions, validation positions) per fold, computed once per ``n_splits``
+
+        ``StratifiedKFold`` without shuffling, the splitter ``cross_val_score``
+        and ``RandomizedSearchCV`` use for a classifier with ``cv=n_splits``.
+        """
+        if n_splits not in self._folds:
+            from sklearn.model_selection import StratifiedKFold
+
+            self._folds[n_splits] = list(StratifiedKFold(n_splits=n_splits).split(np.zeros(len(self._y)), self._y))
+        return self._folds[n_splits]
+
+    def available_models(self, names: Optional[Sequence[str]] = None) -> List[str]:
+        names = list(MODEL_NAMES if names is None else names)
+        if 'XGBoost' in names and not xgboost_available():
+            logger.warning("xgboost is not installed - leaving XGBoost out of the bake-off")
+            names.remove('XGBoost')
+        return names
+
+    def run_models(self, names: Optional[Sequence[str]] = None, cv: int = BAKEOFF_FOLDS) -> dict:
+        """The notebook's ``run_multiple_classifiers``: every model's CV folds and hold-out fit at once"""
+        names = self.available_models(names)
+        all_rows = np.arange(len(self._y))
+        tasks = []
+        for name in names:
+            tasks += [Task(name, (), train, val) for train, val in self.folds(cv)]
+            tasks.append(Task(name, (), all_rows, None, probability=True))
+        outcomes = self.run(tasks, rung='bakeoff')
+
+        results = {}
+        for name in names:
+            mine = [outcome for task, outcome in zip(tasks, outcomes) if task.name == name]
+            if any(outcome is None for outcome in mine):
+                logger.warning(f"Error with {name}: see the failed tasks in records")
+                continue
+            cv_scores = np.array([outcome.score for outcome in mine[:-1]])
+            results[name] = self.holdout_result(mine[-1].model, cv_scores)
+            logger.info(f"{name} - Accuracy: {results[name]['accuracy']:.4f}, "
+                        f"CV: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
+        return results
+
+    def halving_search(self, name: str, param_grid: Optional[dict] = None, n_iter: int = 20, cv: int = 3,
+                       eta: Optional[int] = None, min_rows: Optional[int] = None):
+        """Successive halving over ``n_iter`` sampled parameter sets (``optimize_best_classifier``)
+
+        Returns (model refitted on all training rows, best parameters, its
+        hold-out result in the notebook's format).
+        """
+        from sklearn.model_selection import ParameterSampler
+
+        eta = eta or config.TRAIN_HALVING_ETA
+        param_grid = PARAM_GRIDS[name] if param_grid is None else param_grid
+        candidates = []
+        for params in ParameterSampler(param_grid, n_iter=min(n_iter, _grid_size(param_grid)), random_state=RANDOM_STATE):
+            params = tuple(sorted(params.items()))
+            if params not in candidates:
+                candidates.append(params)
+
+        folds = self.folds(cv)
+        fold_rows = min(len(train) for train, _ in folds)
+        n_classes = len(np.unique(self._y))
+        if min_rows is None:
+            rungs = max(0, math.ceil(math.log(len(candidates), eta)))
+            min_rows = max(HALVING_MIN_ROWS_PER_CLASS * n_classes, fold_rows // eta ** rungs)
+
+        survivors, n_rows, rung = candidates, min_rows, 0
+        while True:
+            tasks = [Task(name, params, stratified_subset(train, self._y, n_rows), val)
+                     for params in survivors for train, val in folds]
+            outcomes = self.run(tasks, rung=f"halving-{rung}")
+            scores = [_mean_score(outcomes[i * len(folds):(i + 1) * len(folds)]) for i in range(len(survivors))]
+            if len(survivors) == 1 or n_rows >= fold_rows:
+                break
+            n_keep = max(1, math.ceil(len(survivors) / eta))
+            ranked = sorted(range(len(survivors)), key=lambda i: -scores[i])  # stable: ties keep sampling order
+            survivors = [survivors[i] for i in sorted(ranked[:n_keep])]
+            n_rows *= eta
+            rung += 1
+
+        best = survivors[int(np.argmax(scores))]
+        refit, = self.run([Task(name, best, np.arange(len(self._y)), None, probability=True)], rung='refit')
+        if refit is None:
+            raise RuntimeError(f"Refitting {name} with {dict(best)} failed")
+        best_params = dict(best)
+        result = self.holdout_result(refit.model)
+        result['best_params'] = best_params
+        logger.info(f"Best parameters: {best_params}, optimized accuracy: {result['accuracy']:.4f}")
+        return refit.model, best_params, result
+
+    def holdout_result(self, model, cv_scores: Optional[np.ndarray] = None) -> dict:
+        y_pred = model.predict(self.X_test)
+        result = {
+            'model': model,
+            'accuracy': float(np.mean(y_pred == self.y_test.to_numpy())),
+            'y_test': self.y_test,
+            'y_pred': y_pred,
+            'y_pred_proba': model.predict_proba(self.X_test) if hasattr(model, 'predict_proba') else None,
+        }
+        if cv_scores is not None:
+            result.update(cv_mean=cv_scores.mean(), cv_std=cv_scores.std())
+        return result
+
+    def run(self, tasks: Sequence[Task], rung: Optional[str] = None) -> List[Optional[TaskResult]]:
+        """Run every task under the CPU budget; results in task order, None where a fit failed"""
+        results: List[Optional[TaskResult]] = [None] * len(tasks)
+        if self.n_workers == 0 or len(tasks) == 1:
+            for i, task in enumerate(tasks):
+                results[i], error = self._guarded(fit_task, self.X_train, self._y, task)
+                self._record(task, results[i], rung, error)
+            return results
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.X_train, self._y),
+            )
+        futures = {self._executor.submit(_fit_in_worker, task): i for i, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i], error = self._guarded(future.result)
+            self._record(tasks[i], results[i], rung, error)
+        return results
+
+    def timings(self) -> dict:
+        """Fits and summed fit seconds per (rung, model)"""
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(f"{record['rung']}/{record['model']}", {'fits': 0, 'fit_seconds': 0.0})
+            entry['fits'] += 1
+            entry['fit_seconds'] += record['fit_seconds'] or 0.0
+        return summary
+
+    @staticmethod
+    def _guarded(fn, *args):
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, str(e)
+
+    def _record(self, task: Task, result: Optional[TaskResult], rung: Optional[str], error: Optional[str]):
+        record = {
+            'model': task.name,
+            'params': task.param_dict,
+            'rung': rung,
+            'n_rows': len(task.fit_rows),
+            'score': None if result is None else result.score,
+            'fit_seconds': None if result is None else result.fit_seconds,
+            'best_iteration': None if result is None else result.best_iteration,
+            'error': error,
+        }
+        self.records.append(record)
+        if error:
+            logger.warning(f"[{rung}] {task.name} {record['params']} failed: {error}")
+        else:
+            logger.info(f"[{rung}] {task.name} {record['params']} on {record['n_rows']} rows: "
+                        f"score={record['score']} (fit {result.fit_seconds:.2f}s)")
+        if self.progress is not None:
+            self.progress(record)
+
+
+def _grid_size(param_grid: dict) -> int:
+    return math.prod(len(values) for values in param_grid.values())
+
+
+def _mean_score(outcomes: Sequence[Optional[TaskResult]]) -> float:
+    if any(outcome is None for outcome in outcomes):
+        return -math.inf
+    return float(np.mean([outcome.score for outcome in outcomes]))
@@ -0,0 +1,261 @@
+"""Cluster quality metrics that scale past the O(n^2) pairwise distance matrix.
+
+``sklearn.metrics.silhouette_score`` on all of ``X_pca`` needs every
+pairwise distance. The silhouette here comes in three modes:
+
+* ``exact`` - the same per-row silhouette, with distances computed one
+  block of rows at a time and reduced to per-cluster sums straight away, so
+  memory is bounded by ``max_memory_bytes`` (time is still O(n^2))
+* ``sample`` - exact silhouettes of a stratified sample of rows (against
+  all rows), with a confidence interval for the mean: O(m * n)
+* ``simplified`` - distances to cluster centroids instead of to every
+  member (a = own centroid, b = nearest other centroid): O(n * k)
+
+Davies-Bouldin and Calinski-Harabasz only need per-cluster sizes,
+centroids and distances to the centroids; ``cluster_statistics`` computes
+those in two chunked passes and every centroid-based metric reads from it.
+"""
+import math
+from statistics import NormalDist
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from core import config
+
+MODES = ("exact", "sample", "simplified", "auto")
+
+
+class ClusterStatistics(NamedTuple):
+    # distinct labels; row i of every per-cluster array belongs to labels[i]
+    labels: np.ndarray
+    counts: np.ndarray
+    centroids: np.ndarray
+    # mean of all rows
+    center: np.ndarray
+    # per cluster: sum of squared and mean of plain distances of its rows to its centroid
+    intra_sq: np.ndarray
+    intra_mean: np.ndarray
+    # sum over rows of the simplified (centroid) silhouette
+    simplified_sum: float
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.counts.sum())
+
+
+class SilhouetteEstimate(NamedTuple):
+    score: float
+    # confidence interval; equal to score unless mode == "sample"
+    low: float
+    high: float
+    mode: str
+    # rows whose silhouette was computed
+    n_evaluated: int
+
+
+def encode_labels(labels: np.ndarray):
+    """(distinct labels, 0..k-1 code per row)"""
+    return np.unique(np.asarray(labels), return_inverse=True)
+
+
+def check_labels(n_rows: int, n_labels: int):
+    if not 1 < n_labels < n_rows:
+        raise ValueError(f"Number of labels is {n_labels}. Valid values are 2 to n_samples - 1 (inclusive)")
+
+
+def chunk_rows(row_bytes: int, max_memory_bytes: Optional[int] = None) -> int:
+    """Rows per block so that blocks of ``row_bytes`` each stay within the memory budget"""
+    budget = config.METRICS_MAX_MEMORY_BYTES if max_memory_bytes is None else max_memory_bytes
+    return max(1, int(budget // max(row_bytes, 1)))
+
+
+def cluster_statistics(X: np.ndarray, labels: np.ndarray, max_memory_bytes: Optional[int] = None) -> ClusterStatistics:
+    X = np.asarray(X, dtype=np.float64)
+    distinct, codes = encode_labels(labels)
+    n_rows, n_features = X.shape
+    k = len(distinct)
+
+    counts = np.bincount(codes, minlength=k)
+    sums = np.column_stack([np.bincount(codes, weights=X[:, j], minlength=k) for j in range(n_features)])
+    centroids = sums / counts[:, None]
+    center = X.mean(axis=0)
+
+    # Second pass: distances of every row to every centroid, one block at a time
+    intra_sq = np.zeros(k)
+    intra_sum = np.zeros(k)
+    simplified_sum = 0.0
+    step = chunk_rows(8 * (n_features + 3 * k), max_memory_bytes)
+    for start in range(0, n_rows, step):
+        block, block_codes = X[start:start + step], codes[start:start + step]
+        dist = _euclidean(block, centroids)
+        own = dist[np.arange(len(block)), block_codes]
+        intra_sq += np.bincount(block_codes, weights=own ** 2, minlength=k)
+        intra_sum += np.bincount(block_codes, weights=own, minlength=k)
+        if k > 1:
+            dist[np.arange(len(block)), block_codes] = np.inf
+            nearest_other = dist.min(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                s = (nearest_other - own) / np.maximum(own, nearest_other)
+            # singleton clusters score 0, as in the full silhouette
+            s[counts[block_codes] == 1] = 0
+            simplified_sum += float(np.nan_to_num(s).sum())
+
+    return ClusterStatistics(distinct, counts, centroids, center, intra_sq, intra_sum / counts, simplified_sum)
+
+
+def davies_bouldin(stats: ClusterStatistics) -> float:
+    """Same definition and degenerate cases as ``sklearn.metrics.davies_bouldin_score``"""
+    check_labels(stats.n_rows, len(stats.labels))
+    centroid_distances = _euclidean(stats.centroids, stats.centroids)
+    np.fill_diagonal(centroid_distances, 0.0)
+    if np.allclose(stats.intra_mean, 0) or np.allclose(centroid_distances, 0):
+        return 0.0
+    centroid_distances[centroid_distances == 0] = np.inf
+    combined = (stats.intra_mean[:, None] + stats.intra_mean[None, :]) / centroid_distances
+    return float(np.mean(np.max(combined, axis=1)))
+
+
+def calinski_harabasz(stats: ClusterStatistics) -> float:
+    """Same definition and degenerate cases as ``sklearn.metrics.calinski_harabasz_score``"""
+    n_rows, k = stats.n_rows, len(stats.labels)
+    check_labels(n_rows, k)
+    extra_disp = float(np.sum(stats.counts * np.sum((stats.centroids - stats.center) ** 2, axis=1)))
+    intra_disp = float(stats.intra_sq.sum())
+    return 1.0 if intra_disp == 0.0 else extra_disp * (n_rows - k) / (intra_disp * (k - 1.0))
+
+
+def simplified_silhouette(stats: ClusterStatistics) -> SilhouetteEstimate:
+    check_labels(stats.n_rows, len(stats.labels))
+    score = stats.simplified_sum / stats.n_rows
+    return SilhouetteEstimate(score, score, score, "simplified", stats.n_rows)
+
+
+def silhouette_rows(X: np.ndarray, codes: np.ndarray, counts: np.ndarray, rows: Optional[np.ndarray] = None,
+                    max_memory_bytes: Optional[int] = None) -> np.ndarray:
+    """Exact silhouette of ``rows`` (default: all rows) against every row of ``X``
+
+    Each block of rows gets its distances to all rows, which are summed per
+    cluster right away: besides an n x k membership matrix, one block x n
+    distance matrix is the peak memory.
+    """
+    n_rows = len(X)
+    k = len(counts)
+    rows = np.arange(n_rows) if rows is None else np.asarray(rows)
+    membership = np.zeros((n_rows, k))
+    membership[np.arange(n_rows), codes] = 1.0
+    sq_norms = np.einsum('ij,ij->i', X, X)
+
+    out = np.empty(len(rows))
+    # distances, their squares and the product terms: ~3 floats per pair
+    step = chunk_rows(3 * 8 * n_rows, max_memory_bytes)
+    for start in range(0, len(rows), step):
+        block_rows = rows[start:start + step]
+        dist = _euclidean(X[block_rows], X, sq_norms[block_rows], sq_norms)
+        dist[np.arange(len(block_rows)), block_rows] = 0.0
+        cluster_dists = dist @ membership
+        del dist
+
+        own = codes[block_rows]
+        index = np.arange(len(block_rows))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a = cluster_dists[index, own] / (counts[own] - 1)
+            mean_dists = cluster_dists / counts
+            mean_dists[index, own] = np.inf
+            b = mean_dists.min(axis=1)
+            s = (b - a) / np.maximum(a, b)
+        out[start:start + len(block_rows)] = np.nan_to_num(s)
+    return out
+
+
+def exact_silhouette(X: np.ndarray, labels: np.ndarray, max_memory_bytes: Optional[int] = None) -> SilhouetteEstimate:
+    X = np.asarray(X, dtype=np.float64)
+    distinct, codes = encode_labels(labels)
+    check_labels(len(X), len(distinct))
+    counts = np.bincount(codes, minlength=len(distinct))
+    score = float(np.mean(silhouette_rows(X, codes, counts, max_memory_bytes=max_memory_bytes)))
+    return SilhouetteEstimate(score, score, score, "exact", len(X))
+
+
+def sampled_silhouette(X: np.ndarray, labels: np.ndarray, sample_size: Optional[int] = None,
+                       confidence: float = 0.95, seed: int = 0,
+                       max_memory_bytes: Optional[int] = None) -> SilhouetteEstimate:
+    """Stratified estimate of the mean silhouette with a normal confidence interval
+
+    Each cluster contributes rows in proportion to its size (at least two
+    where it has them); the estimate weights cluster means by cluster size and
+    the variance includes the finite population correction, so a sample that
+    covers every row has a zero-width interval.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    distinct, codes = encode_labels(labels)
+    n_rows = len(X)
+    check_labels(n_rows, len(distinct))
+    counts = np.bincount(codes, minlength=len(distinct))
+    sample_size = config.METRICS_SAMPLE_SIZE if sample_size is None else sample_size
+
+    rng = np.random.default_rng(seed)
+    allocation = np.minimum(counts, np.maximum(2, np.round(sample_size * counts / n_rows).astype(int)))
+    strata = [rng.choice(np.flatnonzero(codes == h), size=m, replace=False) for h, m in enumerate(allocation)]
+    rows = np.concatenate(strata)
+    values = silhouette_rows(X, codes, counts, rows, max_memory_bytes)
+
+    weights = counts / n_rows
+    estimate, variance, offset = 0.0, 0.0, 0
+    for h, m in enumerate(allocation):
+        stratum = values[offset:offset + m]
+        offset += m
+        estimate += weights[h] * stratum.mean()
+        if m > 1:
+            variance += weights[h] ** 2 * stratum.var(ddof=1) / m * (1 - m / counts[h])
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * math.sqrt(max(variance, 0.0))
+    return SilhouetteEstimate(float(estimate), float(estimate - half_width), float(estimate + half_width),
+                              "sample", len(rows))
+
+
+def silhouette(X: np.ndarray, labels: np.ndarray, mode: Optional[str] = None,
+               max_memory_bytes: Optional[int] = None, **sample_options) -> SilhouetteEstimate:
+    """Mean silhouette in the given mode (default ``CODON_METRICS_SILHOUETTE_MODE``)"""
+    mode = (mode or config.METRICS_SILHOUETTE_MODE).lower()
+    if mode == "auto":
+        mode = "exact" if len(X) <= config.METRICS_EXACT_MAX_ROWS else "sample"
+    if mode == "exact":
+        return exact_silhouette(X, labels, max_memory_bytes)
+    if mode == "sample":
+        return sampled_silhouette(X, labels, max_memory_bytes=max_memory_bytes, **sample_options)
+    if mode == "simplified":
+        return simplified_silhouette(cluster_statistics(X, labels, max_memory_bytes))
+    raise ValueError(f"Unknown silhouette mode '{mode}'. Use one of: {', '.join(MODES)}")
+
+
+def cluster_quality(X: np.ndarray, labels: np.ndarray, mode: Optional[str] = None,
+                    max_memory_bytes: Optional[int] = None, **sample_options) -> dict:
+    """Silhouette, Davies-Bouldin, Calinski-Harabasz and cluster sizes in one call"""
+    stats = cluster_statistics(X, labels, max_memory_bytes)
+    resolved = (mode or config.METRICS_SILHOUETTE_MODE).lower()
+    if resolved == "simplified":
+        estimate = simplified_silhouette(stats)
+    else:
+        estimate = silhouette(X, labels, resolved, max_memory_bytes, **sample_options)
+    return {
+        'silhouette_score': estimate.score,
+        'silhouette_interval': (estimate.low, estimate.high),
+        'silhouette_mode': estimate.mode,
+        'davies_bouldin_index': davies_bouldin(stats),
+        'calinski_harabasz_index': calinski_harabasz(stats),
+        'cluster_sizes': {label.item(): int(n) for label, n in zip(stats.labels, stats.counts)},
+    }
+
+
+def _euclidean(A: np.ndarray, B: np.ndarray, a_sq: Optional[np.ndarray] = None,
+               b_sq: Optional[np.ndarray] = None) -> np.ndarray:
+    """Pairwise distances via |a|^2 + |b|^2 - 2ab (as sklearn), clipped at 0"""
+    a_sq = np.einsum('ij,ij->i', A, A) if a_sq is None else a_sq
+    b_sq = np.einsum('ij,ij->i', B, B) if b_sq is None else b_sq
+    dist = A @ B.T
+    dist *= -2
+    dist += a_sq[:, None]
+    dist += b_sq[None, :]
+    np.maximum(dist, 0, out=dist)
+    return np.sqrt(dist, out=dist)
+
@@ -0,0 +1,361 @@
+"""Parallel, cached hyperparameter sweep for the clustering step of training.
+
+``optimize_clustering_parameters`` in the notebook fitted KMeans for
+k = 2..15 and then the init x n_init x max_iter grid for the three best k,
+one fit after another, each scored with a full silhouette. ``ClusterSweep``
+runs the same search with:
+
+* candidate fits spread over a process pool (the data is handed to each
+  worker once, in its initializer)
+* fitted candidates cached by (data digest, method, parameters, sample
+  size), in memory and on disk, so a repeated sweep only fits what changed
+* successive halving for the k scan: every k is scored on a subsample and
+  the better 1/eta go on to a sample eta times larger, until the last
+  ``keep`` are scored on all rows
+* one record per candidate (rung, rows, score, fit/score seconds, cache
+  hit) in ``ClusterSweep.records``, also passed to an optional callback
+
+Results are collected in the order the notebook's loops visit candidates and
+the winner is picked with the same strict ``score > best_score`` rule, so
+``best_labels, best_score, best_params`` do not depend on which worker
+finished first. Candidates are scored with ``services.cluster_metrics``
+(exact chunked silhouette up to ``CODON_METRICS_EXACT_MAX_ROWS`` rows,
+sampled beyond by default) instead of the full pairwise distance matrix.
+"""
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from core import config
+from services.cluster_metrics import silhouette
+from services.result_cache import ResultCache, cache_digest
+
+logger = logging.getLogger(__name__)
+
+RANDOM_STATE = 42
+# Subsample of the first halving rung
+HALVING_MIN_SAMPLES = 2000
+HALVING_ETA = 2
+
+
+class Candidate(NamedTuple):
+    method: str
+    # sorted (name, value) pairs, so equal parameters give equal candidates
+    params: tuple
+    # rows of the seeded subsample to fit and score on (None = all rows)
+    n_samples: Optional[int] = None
+
+    @classmethod
+    def of(cls, method: str, n_samples: Optional[int] = None, **params) -> "Candidate":
+        return cls(method, tuple(sorted(params.items())), n_samples)
+
+    @property
+    def param_dict(self) -> dict:
+        return dict(self.params)
+
+
+class Fit(NamedTuple):
+    labels: np.ndarray
+    # None when every row landed in the same cluster
+    score: Optional[float]
+    fit_seconds: float
+    score_seconds: float
+
+
+def make_model(method: str, params: dict):
+    from sklearn.cluster import KMeans
+    from sklearn.mixture import GaussianMixture
+
+    if method == 'kmeans':
+        return KMeans(random_state=RANDOM_STATE, **params)
+    if method == 'gmm':
+        return GaussianMixture(random_state=RANDOM_STATE, **params)
+    raise ValueError(f"Unknown clustering method '{method}'")
+
+
+def score_labels(X: np.ndarray, labels: np.ndarray, silhouette_mode: Optional[str] = None) -> float:
+    """Mean silhouette without the full pairwise distance matrix (see services.cluster_metrics)"""
+    return silhouette(X, labels, silhouette_mode).score
+
+
+def sample_rows(n_rows: int, n_samples: Optional[int]) -> Optional[np.ndarray]:
+    """Seeded subsample positions; every smaller sample is a subset of a larger one"""
+    if n_samples is None or n_samples >= n_rows:
+        return None
+    return np.sort(np.random.default_rng(RANDOM_STATE).permutation(n_rows)[:n_samples])
+
+
+def fit_candidate(X: np.ndarray, candidate: Candidate, silhouette_mode: Optional[str] = None) -> Fit:
+    rows = sample_rows(len(X), candidate.n_samples)
+    data = X if rows is None else X[rows]
+    started = time.perf_counter()
+    labels = make_model(candidate.method, candidate.param_dict).fit_predict(data).astype(np.int32)
+    fitted = time.perf_counter()
+    score = score_labels(data, labels, silhouette_mode) if len(np.unique(labels)) > 1 else None
+    return Fit(labels, score, fitted - started, time.perf_counter() - fitted)
+
+
+def data_digest(X: np.ndarray) -> str:
+    digest = hashlib.sha256(f"{X.shape}:{X.dtype};".encode())
+    digest.update(np.ascontiguousarray(X).data)
+    return digest.hexdigest()
+
+
+_worker_data = None
+
+
+def _init_worker(X: np.ndarray):
+    global _worker_data
+    from threadpoolctl import threadpool_limits
+
+    _worker_data = X
+    # One core per fit; the pool provides the parallelism
+    threadpool_limits(1)
+
+
+def _fit_in_worker(candidate: Candidate, silhouette_mode: Optional[str]) -> Fit:
+    return fit_candidate(_worker_data, candidate, silhouette_mode)
+
+
+class ClusterSweep:
+    """Evaluates clustering candidates on one data matrix; use as a context manager"""
+
+    def __init__(self, X: np.ndarray, n_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = config.SWEEP_CACHE_DIR,
+                 cache_max_bytes: int = config.SWEEP_CACHE_MAX_BYTES,
+                 progress: Optional[Callable[[dict], None]] = None,
+                 start_method: str = config.POOL_START_METHOD,
+                 silhouette_mode: Optional[str] = None):
+        from sklearn import __version__ as sklearn_version
+
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        self.n_workers = config.SWEEP_WORKERS if n_workers is None else n_workers
+        self.cache = ResultCache(max_bytes=cache_max_bytes, disk_dir=cache_dir, disk_max_bytes=cache_max_bytes)
+        self.progress = progress
+        self.start_method = start_method
+        self.silhouette_mode = (silhouette_mode or config.METRICS_SILHOUETTE_MODE).lower()
+        self.records: List[dict] = []
+        # Fits depend on the data, the sklearn release and how they are scored, besides the candidate itself
+        self._key_prefix = (data_digest(self.X), sklearn_version, self.silhouette_mode,
+                            str(config.METRICS_EXACT_MAX_ROWS), str(config.METRICS_SAMPLE_SIZE))
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def evaluate(self, candidates: Sequence[Candidate], rung: Optional[str] = None) -> List[Optional[Fit]]:
+        """Fit and score every candidate, reusing cached fits; None where a fit failed
+
+        Results are in the order of ``candidates``.
+        """
+        results: List[Optional[Fit]] = [None] * len(candidates)
+        pending: Dict[str, List[int]] = {}
+        for i, candidate in enumerate(candidates):
+            key = self._cache_key(candidate)
+            body = self.cache.get(key)
+            if body is not None:
+                results[i] = pickle.loads(body)
+                self._record(candidate, results[i], rung, cached=True)
+            else:
+                # Identical candidates in one call are fitted once
+                pending.setdefault(key, []).append(i)
+
+        for key, fit, error in self._fit_all({key: candidates[idx[0]] for key, idx in pending.items()}):
+            if fit is not None:
+                self.cache.put(key, pickle.dumps(fit, protocol=pickle.HIGHEST_PROTOCOL))
+            for i in pending[key]:
+                results[i] = fit
+                self._record(candidates[i], fit, rung, cached=False, error=error)
+        return results
+
+    def halve(self, method: str, k_values: Sequence[int], params: dict,
+              min_samples: int = HALVING_MIN_SAMPLES, eta: int = HALVING_ETA, keep: int = 3) -> Dict[int, Optional[float]]:
+        """Successive halving over k; full-data scores of the k values that survive
+
+        Each rung scores the remaining k on a seeded subsample and keeps the
+        best ``max(keep, ceil(n / eta))``; once ``keep`` or fewer are left,
+        or the sample reaches every row, they are scored on all rows.
+        """
+        k_param = 'n_components' if method == 'gmm' else 'n_clusters'
+        n_rows = len(self.X)
+        survivors = list(k_values)
+        n_samples = min_samples
+        rung = 0
+        while n_samples < n_rows and len(survivors) > keep:
+            candidates = [Candidate.of(method, n_samples, **{k_param: k}, **params) for k in survivors]
+            fits = self.evaluate(candidates, rung=f"halving-{rung}")
+            scores = [_score_or(fit, -math.inf) for fit in fits]
+            n_keep = max(keep, math.ceil(len(survivors) / eta))
+            ranked = sorted(range(len(survivors)), key=lambda i: -scores[i])  # stable: ties keep k order
+            survivors = [survivors[i] for i in sorted(ranked[:n_keep])]
+            n_samples *= eta
+            rung += 1
+
+        candidates = [Candidate.of(method, **{k_param: k}, **params) for k in survivors]
+        fits = self.evaluate(candidates, rung="full")
+        return {k: _score_or(fit, None) for k, fit in zip(survivors, fits)}
+
+    def optimize_kmeans(self, k_range: Optional[Sequence[int]] = None,
+                        init_methods: Sequence[str] = ('k-means++', 'random'),
+                        n_init_values: Sequence[int] = (20, 50),
+                        max_iter_values: Sequence[int] = (300, 500),
+                        top_k: int = 3, halving: bool = True,
+                        min_samples: int = HALVING_MIN_SAMPLES, eta: int = HALVING_ETA):
+        """The notebook's ``optimize_clustering_parameters``: returns (best_labels, best_score, best_params)
+
+        With ``halving=False`` the k scan fits every k on all rows, exactly as before.
+        """
+        if k_range is None:
+            k_range = range(2, min(16, len(self.X)))
+        k_range = list(k_range)
+
+        # Find rough optimal k first
+        if halving:
+            scores = self.halve('kmeans', k_range, {'n_init': 10}, min_samples=min_samples, eta=eta, keep=top_k)
+        else:
+            fits = self.evaluate([Candidate.of('kmeans', n_clusters=k, n_init=10) for k in k_range], rung="full")
+            scores = {k: _score_or(fit, None) for k, fit in zip(k_range, fits)}
+        silhouette_scores = [scores.get(k) if scores.get(k) is not None else -1 for k in k_range]
+
+        # Focus on top k values
+        top_k_indices = np.argsort(silhouette_scores)[-top_k:]
+        top_k_values = [k_range[i] for i in top_k_indices if silhouette_scores[i] > 0]
+        logger.info(f"Top K values to optimize: {top_k_values}")
+
+        grid = [
+            Candidate.of('kmeans', n_clusters=k, init=init_method, n_init=n_init, max_iter=max_iter)
+            for k in top_k_values
+            for init_method in init_methods
+            for n_init in n_init_values
+            for max_iter in max_iter_values
+        ]
+        best_score, best_params, best_labels = -1, None, None
+        for candidate, fit in zip(grid, self.evaluate(grid, rung="grid")):
+            if fit is not None and fit.score is not None and fit.score > best_score:
+                params = candidate.param_dict
+                best_score = fit.score
+                best_labels = fit.labels
+                best_params = {
+                    'n_clusters': params['n_clusters'],
+                    'init': params['init'],
+                    'n_init': params['n_init'],
+                    'max_iter': params['max_iter'],
+                    'score': fit.score,
+                }
+
+        logger.info(f"Best optimized parameters: {best_params}")
+        return best_labels, best_score, best_params
+
+    def compare_methods(self, min_clusters: int = 2, max_clusters: int = 15,
+                        methods: Sequence[str] = ('kmeans', 'gmm')):
+        """The notebook's ``run_advanced_clustering``
+
+        Returns (best_labels, best_score, best_k, best_method, results) with
+        ``results[method][k] = {'score', 'labels'}``.
+        """
+        method_params = {
+            'kmeans': lambda k: {'n_clusters': k, 'n_init': 20, 'max_iter': 500},
+            'gmm': lambda k: {'n_components': k, 'max_iter': 200},
+        }
+        ks = list(range(min_clusters, min(max_clusters + 1, len(self.X))))
+        grid = [(method, k) for method in methods if method in method_params for k in ks]
+        fits = self.evaluate([Candidate.of(method, **method_params[method](k)) for method, k in grid], rung="full")
+
+        best_score, best_labels, best_k, best_method = -1, None, None, None
+        results = {method: {} for method in methods}
+        for (method, k), fit in zip(grid, fits):
+            if fit is None or fit.score is None:
+                continue
+            results[method][k] = {'score': fit.score, 'labels': fit.labels}
+            if fit.score > best_score:
+                best_score, best_labels, best_k, best_method = fit.score, fit.labels, k, method
+
+        logger.info(f"Best clustering: method={best_method}, clusters={best_k}, score={best_score:.4f}")
+        return best_labels, best_score, best_k, best_method, results
+
+    def timings(self) -> dict:
+        """Fits, cache hits and summed fit/score seconds per rung"""
+        summary = {}
+        for record in self.records:
+            rung = summary.setdefault(record['rung'], {'candidates': 0, 'cached': 0, 'fit_seconds': 0.0, 'score_seconds': 0.0})
+            rung['candidates'] += 1
+            rung['cached'] += record['cached']
+            if not record['cached']:
+                rung['fit_seconds'] += record['fit_seconds'] or 0.0
+                rung['score_seconds'] += record['score_seconds'] or 0.0
+        return summary
+
+    def _cache_key(self, candidate: Candidate) -> str:
+        n_samples = candidate.n_samples if candidate.n_samples is not None and candidate.n_samples < len(self.X) else None
+        return cache_digest(*self._key_prefix, candidate.method, json.dumps(candidate.params), str(n_samples)).hexdigest()
+
+    def _fit_all(self, work: Dict[str, Candidate]):
+        """Yield (key, fit or None, error) as fits finish"""
+        if not work:
+            return
+        if self.n_workers == 0 or len(work) == 1:
+            for key, candidate in work.items():
+                yield (key, *self._guarded(fit_candidate, self.X, candidate, self.silhouette_mode))
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.X,),
+            )
+        futures = {
+            self._executor.submit(_fit_in_worker, candidate, self.silhouette_mode): key
+            for key, candidate in work.items()
+        }
+        for future in as_completed(futures):
+            yield (futures[future], *self._guarded(future.result))
+
+    @staticmethod
+    def _guarded(fn, *args):
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, str(e)
+
+    def _record(self, candidate: Candidate, fit: Optional[Fit], rung: Optional[str], cached: bool, error: Optional[str] = None):
+        record = {
+            'method': candidate.method,
+            'params': candidate.param_dict,
+            'rung': rung,
+            'n_samples': min(candidate.n_samples or len(self.X), len(self.X)),
+            'score': None if fit is None else fit.score,
+            'fit_seconds': None if fit is None else fit.fit_seconds,
+            'score_seconds': None if fit is None else fit.score_seconds,
+            'cached': cached,
+            'error': error,
+        }
+        self.records.append(record)
+        if error:
+            logger.warning(f"{candidate.method} {record['params']} failed: {error}")
+        else:
+            timing = "cached" if cached else f"fit {fit.fit_seconds:.2f}s, score {fit.score_seconds:.2f}s"
+            logger.info(f"[{rung}] {candidate.method} {record['params']} on {record['n_samples']} rows: "
+                        f"score={record['score']} ({timing})")
+        if self.progress is not None:
+            self.progress(record)
+
+
+def _score_or(fit: Optional[Fit], default):
+    return default if fit is None or fit.score is None else fit.score
@@ -0,0 +1,180 @@
+"""Training-time codon bias features of the clustering pipeline, as matrix operations.
+
+``ImprovedCodonClusteringPipeline`` in the notebook computed these with
+row-wise ``apply``, a ``for idx in df.index`` loop per index and a loop
+over kingdoms. The functions here take the normalized amino acid frequency
+table (``df_aa_norm``) and return the same columns, in the same order, with
+the per-row NaN / zero guards of the original expressed as masks:
+
+* ``advanced_features`` - row moments, entropy, Gini, per-property usage and
+  entropy, ``enc_approx`` and ``cai_approx`` (``pipeline.stats``)
+* ``similarity_features`` - cosine similarity to the mean, median and every
+  kingdom profile in one matrix product (``pipeline.cos_sim``)
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.feature_engine import row_entropy, row_gini, row_moments
+
+# Amino acids grouped by side-chain property
+AA_PROPERTIES = {
+    'hydrophobic': ['A', 'V', 'I', 'L', 'M', 'F', 'Y', 'W'],
+    'polar': ['S', 'T', 'N', 'Q', 'C'],
+    'charged_positive': ['K', 'R', 'H'],
+    'charged_negative': ['D', 'E'],
+    'special': ['G', 'P']
+}
+
+MIN_HOMOZYGOSITY = 1e-10
+CAI_EPS = 1e-10
+
+
+def property_groups(columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Column positions of each property group present in ``columns``"""
+    positions = {col: i for i, col in enumerate(columns)}
+    groups = {}
+    for name, aa_list in AA_PROPERTIES.items():
+        present = [positions[aa] for aa in aa_list if aa in positions]
+        if present:
+            groups[name] = np.array(present, dtype=np.intp)
+    return groups
+
+
+def frequency_entropy(x: np.ndarray) -> np.ndarray:
+    """Entropy (bits) of each row rescaled to sum to 1; NaN cells count as 0"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        freq = x / np.nansum(x, axis=1, keepdims=True)
+    return np.nan_to_num(row_entropy(np.nan_to_num(freq, nan=0.0)), nan=0.0)
+
+
+def property_usage_entropy(x: np.ndarray, group: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Summed usage and entropy of one property group (0 where the group is unused or has NaN)"""
+    sub = x[:, group]
+    usage = np.nansum(sub, axis=1)
+    defined = (usage > 0) & ~np.isnan(sub).any(axis=1)
+    return usage, np.where(defined, row_entropy(sub), 0.0)
+
+
+def enc_approx(x: np.ndarray, groups: Dict[str, np.ndarray]) -> np.ndarray:
+    """Effective number of codons, approximated over the property groups
+
+    Each group with a positive total adds ``1 / homozygosity`` of its
+    within-group frequencies; a group containing NaN is skipped.
+    """
+    nc = np.zeros(len(x), dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for group in groups.values():
+            sub = x[:, group]
+            total = sub.sum(axis=1)
+            used = total > 0  # NaN totals are False
+            homozygosity = ((sub / total[:, None]) ** 2).sum(axis=1)
+            nc += np.where(used, 1 / np.maximum(homozygosity, MIN_HOMOZYGOSITY), 0.0)
+    return np.where(np.isfinite(nc), nc, 0.0)
+
+
+def cai_approx(x: np.ndarray, reference_pattern: Optional[np.ndarray] = None) -> np.ndarray:
+    """Geometric mean of each row's usage relative to a reference profile (column means by default)
+
+    Non-finite log ratios are left out of the mean; rows with none left score 1.
+    """
+    if reference_pattern is None:
+        reference_pattern = column_means(x)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        log_ratio = np.log(x / (reference_pattern + CAI_EPS) + CAI_EPS)
+        finite = np.isfinite(log_ratio)
+        n_finite = finite.sum(axis=1)
+        cai = np.exp(np.where(finite, log_ratio, 0.0).sum(axis=1) / n_finite)
+    return np.where((n_finite > 0) & np.isfinite(cai), cai, 1.0)
+
+
+def column_means(x: np.ndarray) -> np.ndarray:
+    """NaN-skipping column means; all-NaN columns give NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(x, axis=0) / (~np.isnan(x)).sum(axis=0)
+
+
+def row_statistics(x: np.ndarray) -> Dict[str, np.ndarray]:
+    """Moments, entropy and Gini coefficient of every row (NaN where pandas gives NaN)"""
+    mean, median, std, skew, kurt = row_moments(x)
+    return {
+        'mean': mean,
+        'median': median,
+        'std': std,
+        'skewness': skew,
+        'kurtosis': kurt,
+        'entropy': frequency_entropy(x),
+        'gini': row_gini(x),
+    }
+
+
+def advanced_features(df_aa_norm: pd.DataFrame, cai_reference: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """The notebook's ``pipeline.stats`` table for a normalized amino acid frequency frame
+
+    ``cai_approx`` is relative to the column means of ``df_aa_norm`` unless a
+    fixed ``cai_reference`` profile is given (e.g. the means of a whole
+    training table that is processed in chunks).
+    """
+    columns = list(df_aa_norm.columns)
+    x = df_aa_norm.to_numpy(dtype=np.float64)
+
+    features = row_statistics(x)
+    groups = property_groups(columns)
+    for name, group in groups.items():
+        features[f'{name}_usage'], features[f'{name}_entropy'] = property_usage_entropy(x, group)
+
+    features['enc_approx'] = enc_approx(x, groups)
+    features['cai_approx'] = cai_approx(x, cai_reference)
+
+    stats = pd.DataFrame(features, index=df_aa_norm.index)
+    return stats.fillna(0)
+
+
+def cosine_similarity_matrix(x: np.ndarray, profiles: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row with every profile, shape (n_rows, n_profiles)
+
+    Rows and profiles are L2-normalized first (zero vectors stay zero), as
+    ``sklearn.metrics.pairwise.cosine_similarity`` does.
+    """
+    return _l2_normalize(x) @ _l2_normalize(profiles).T
+
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.sqrt(np.einsum('ij,ij->i', x, x))
+    norms[norms == 0] = 1
+    return x / norms[:, None]
+
+
+def kingdom_profiles(x: np.ndarray, kingdoms: Sequence) -> Tuple[List[str], np.ndarray]:
+    """Mean profile of every kingdom with more than one row, in order of first appearance"""
+    codes, uniques = pd.factorize(np.asarray(kingdoms, dtype=object))
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    keep = np.flatnonzero(counts > 1)
+
+    labelled = codes >= 0
+    sums = np.column_stack([
+        np.bincount(codes[labelled], weights=x[labelled, j], minlength=len(uniques))
+        for j in range(x.shape[1])
+    ]) if len(uniques) else np.zeros((0, x.shape[1]))
+    profiles = sums[keep] / counts[keep][:, None]
+    return [uniques[k] for k in keep], profiles
+
+
+def similarity_features(df_aa_norm: pd.DataFrame, kingdoms: Optional[Sequence] = None) -> pd.DataFrame:
+    """The notebook's ``pipeline.cos_sim`` table
+
+    ``kingdoms`` is aligned with the rows of ``df_aa_norm``; without it only
+    the mean and median similarities are returned.
+    """
+    x = df_aa_norm.to_numpy(dtype=np.float64)
+    names = ['cosine_similarity_to_mean', 'cosine_similarity_to_median']
+    profiles = [x.mean(axis=0), np.median(x, axis=0)]
+
+    if kingdoms is not None:
+        kingdom_names, kingdom_means = kingdom_profiles(x, kingdoms)
+        names += [f'cos_sim_{kingdom}' for kingdom in kingdom_names]
+        profiles += list(kingdom_means)
+
+    similarities = cosine_similarity_matrix(x, np.vstack(profiles))
+    return pd.DataFrame(similarities, index=df_aa_norm.index, columns=names)
@@ -0,0 +1,237 @@
+"""2D map of the reference species, computed once and served by zoom level.
+
+The map plane is the first two components of the serving PCA, so any
+uploaded species lands on it with the same affine map that /analyze
+already applies (``CompiledPipeline.project``): no t-SNE/UMAP fit per
+request, and no drift between the reference points and the user's.
+
+The reference points are thinned into nested levels of detail: level ``z``
+lays a ``EMBEDDING_BASE_GRID * 2**z`` square grid over the map and keeps at
+most ``EMBEDDING_CELL_POINTS`` points per cell, chosen by one fixed random
+priority so every point shown at a level is also shown at all finer ones.
+Each kept point carries a ``weight`` (reference points it stands for in its
+cell), so the overview still shows where the density is. Points are stored
+coarsest level first, which makes "all points of level z" a prefix of the
+arrays. The last level keeps every point.
+
+Files next to the models (memory-mapped at load time):
+
+* ``embedding_points.npy`` - float32 (x, y) per reference species
+* ``embedding_labels.npy`` - int32 (cluster, kingdom code) per species
+* ``embedding_weights.npy`` - float32 (n_levels, n) weight of each point per level
+* ``embedding.json`` - bounds, level sizes, kingdom names, PCA digest
+"""
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from core import config
+from services.feature_engine import compute_features, fit_reference_stats
+from services.neighbor_index import projection_digest
+
+logger = logging.getLogger(__name__)
+
+MAP_FILE = "embedding.json"
+POINTS_FILE = "embedding_points.npy"
+LABELS_FILE = "embedding_labels.npy"
+WEIGHTS_FILE = "embedding_weights.npy"
+MAP_FORMAT_VERSION = 1
+AXES = ("PC1", "PC2")
+
+
+def levels_of_detail(xy: np.ndarray, cell_points: int, base_grid: int, max_levels: int, seed: int = 0):
+    """(order, level_ends, weights): points coarsest level first, prefix length and weights per level"""
+    n = len(xy)
+    priority = np.random.default_rng(seed).permutation(n)
+    low = xy.min(axis=0) if n else np.zeros(2)
+    span = np.maximum(xy.max(axis=0) - low, 1e-12) if n else np.ones(2)
+    first_level = np.full(n, max_levels - 1, dtype=np.int64)
+    level_weights = []
+    for level in range(max_levels):
+        grid = base_grid << level
+        cells = np.clip(((xy - low) / span * grid).astype(np.int64), 0, grid - 1)
+        cell_id = cells[:, 0] * grid + cells[:, 1]
+        # Rank of every point inside its cell by priority
+        order = np.lexsort((priority, cell_id))
+        sorted_cells = cell_id[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        rank = np.arange(n) - np.repeat(starts, counts)
+        kept = rank < cell_points
+        weights = np.zeros(n, dtype=np.float32)
+        weights[order[kept]] = np.repeat(counts / np.minimum(counts, cell_points), counts)[kept]
+        level_weights.append(weights)
+        first_level[order[kept]] = np.minimum(first_level[order[kept]], level)
+        if counts.max(initial=0) <= cell_points:
+            # Every point is kept from here on
+            break
+    # The last level shows every point as itself
+    n_levels = len(level_weights)
+    level_weights[-1] = np.ones(n, dtype=np.float32)
+
+    order = np.lexsort((priority, first_level))
+    level_ends = np.searchsorted(first_level[order], np.arange(n_levels), side="right")
+    return order, level_ends, np.stack(level_weights)[:, order]
+
+
+class EmbeddingMap:
+    """Reference species on the PCA plane, with nested levels of detail"""
+
+    def __init__(self, points: np.ndarray, labels: np.ndarray, weights: np.ndarray, meta: dict):
+        self.points = points
+        self.labels = labels
+        self.weights = weights
+        self.meta = meta
+        self.level_ends = list(meta["level_ends"])
+        self.kingdoms = list(meta["kingdoms"])
+
+    @property
+    def n_levels(self) -> int:
+        return len(self.level_ends)
+
+    @property
+    def n_points(self) -> int:
+        return len(self.points)
+
+    @classmethod
+    def from_projection(cls, Z: np.ndarray, clusters: np.ndarray, kingdoms: np.ndarray,
+                        digest: Optional[str] = None) -> "EmbeddingMap":
+        xy = np.ascontiguousarray(np.asarray(Z, dtype=np.float32)[:, :2])
+        order, level_ends, weights = levels_of_detail(
+            xy, config.EMBEDDING_CELL_POINTS, config.EMBEDDING_BASE_GRID, config.EMBEDDING_MAX_LEVELS)
+        kingdom_names, kingdom_codes = np.unique(np.asarray(kingdoms).astype(str), return_inverse=True)
+        labels = np.stack([np.asarray(clusters), kingdom_codes], axis=1).astype(np.int32)
+        meta = {
+            "format": MAP_FORMAT_VERSION,
+            "method": "pca",
+            "axes": list(AXES),
+            "bounds": bounds(xy),
+            "level_ends": [int(end) for end in level_ends],
+            "base_grid": config.EMBEDDING_BASE_GRID,
+            "cell_points": config.EMBEDDING_CELL_POINTS,
+            "kingdoms": kingdom_names.tolist(),
+            "projection": digest,
+        }
+        return cls(xy[order], labels[order], weights, meta)
+
+    def view(self, level: int, x_min: Optional[float] = None, x_max: Optional[float] = None,
+             y_min: Optional[float] = None, y_max: Optional[float] = None) -> dict:
+        """Columnar points of one level of detail inside a viewport (None = unbounded)"""
+        level = min(max(level, 0), self.n_levels - 1)
+        end = self.level_ends[level]
+        xy = self.points[:end]
+        mask = np.ones(end, dtype=bool)
+        for column, low, high in ((0, x_min, x_max), (1, y_min, y_max)):
+            if low is not None:
+                mask &= xy[:, column] >= low
+            if high is not None:
+                mask &= xy[:, column] <= high
+        rows = np.flatnonzero(mask)
+        return {
+            "method": self.meta["method"],
+            "axes": self.meta["axes"],
+            "level": level,
+            "n_levels": self.n_levels,
+            "bounds": self.meta["bounds"],
+            "kingdoms": self.kingdoms,
+            "n_reference": self.n_points,
+            "points": point_columns(xy[rows], self.labels[rows, 0], {
+                "kingdom": self.labels[rows, 1].tolist(),
+                "weight": np.round(self.weights[level, rows], 3).tolist(),
+            }),
+        }
+
+    def save(self, model_dir: str) -> str:
+        """Write the map files into ``model_dir``; the JSON goes last"""
+        os.makedirs(model_dir, exist_ok=True)
+        np.save(os.path.join(model_dir, POINTS_FILE), np.ascontiguousarray(self.points))
+        np.save(os.path.join(model_dir, LABELS_FILE), np.ascontiguousarray(self.labels))
+        np.save(os.path.join(model_dir, WEIGHTS_FILE), np.ascontiguousarray(self.weights))
+        path = os.path.join(model_dir, MAP_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+        logger.info(f"Saved 2D map of {self.n_points} species ({self.n_levels} levels) to {model_dir}")
+        return path
+
+    @classmethod
+    def load(cls, model_dir: str, mmap: bool = True, pipeline=None) -> Optional["EmbeddingMap"]:
+        """Map the stored map; None if there is none or it belongs to another PCA"""
+        path = os.path.join(model_dir, MAP_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        if meta.get("format") != MAP_FORMAT_VERSION:
+            logger.warning(f"{MAP_FILE} has format {meta.get('format')}, expected {MAP_FORMAT_VERSION} - rebuild it")
+            return None
+        if pipeline is not None and meta.get("projection") != projection_digest(pipeline):
+            logger.warning(f"{MAP_FILE} was built for other PCA weights - rebuild it to serve /embedding")
+            return None
+        mmap_mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(model_dir, name), mmap_mode=mmap_mode)
+                  for name in (POINTS_FILE, LABELS_FILE, WEIGHTS_FILE)]
+        return cls(*arrays, meta)
+
+
+def bounds(xy: np.ndarray) -> dict:
+    if not len(xy):
+        return {"x_min": 0.0, "x_max": 0.0, "y_min": 0.0, "y_max": 0.0}
+    low, high = xy.min(axis=0), xy.max(axis=0)
+    return {"x_min": float(low[0]), "x_max": float(high[0]), "y_min": float(low[1]), "y_max": float(high[1])}
+
+
+def point_columns(xy: np.ndarray, clusters: np.ndarray, extra: Optional[dict] = None) -> dict:
+    """JSON-ready columnar points"""
+    return {
+        "x": np.round(xy[:, 0].astype(np.float64), 4).tolist(),
+        "y": np.round(xy[:, 1].astype(np.float64), 4).tolist(),
+        "cluster": np.asarray(clusters).tolist(),
+        **(extra or {}),
+    }
+
+
+def project_points(pipeline, X: np.ndarray):
+    """(map coordinates, clusters) of aligned feature rows"""
+    Z = pipeline.project(X)
+    return np.asarray(Z[:, :2], dtype=np.float32), pipeline.assign_clusters(Z)
+
+
+def build_map(codon_table: pd.DataFrame, pipeline, reference: Optional[dict] = None) -> EmbeddingMap:
+    """Map a reference codon table (5 metadata columns + codons) with ``pipeline``'s PCA and clusters"""
+    raw_features = codon_table[codon_table.columns[5:]]
+    reference = reference if reference is not None else fit_reference_stats(raw_features)
+    features = compute_features(raw_features, reference=reference)
+    Z = pipeline.project(pipeline.align(features))
+    kingdoms = codon_table.loc[features.index, "Kingdom"] if "Kingdom" in codon_table else np.full(len(Z), "")
+    return EmbeddingMap.from_projection(Z, pipeline.assign_clusters(Z), kingdoms, projection_digest(pipeline))
+
+
+def build_model_map(codon_table: pd.DataFrame, model_dir: Optional[str] = None) -> EmbeddingMap:
+    """Build the map with the models in ``model_dir`` and save it there"""
+    from services import analysis
+
+    model_dir = model_dir or config.MODEL_DIR
+    if not analysis.load_models(model_dir):
+        raise RuntimeError(f"Could not load the models in {model_dir}")
+    embedding = build_map(codon_table, analysis.compiled_pipeline, analysis.reference_stats)
+    embedding.save(model_dir)
+    return embedding
+
+
+if __name__ == "__main__":
+    # python -m services.embedding_map codon_usage.csv --model-dir models  (run from backend/app)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute the 2D map of the reference species for /embedding")
+    parser.add_argument("reference_csv")
+    parser.add_argument("--model-dir", default=config.MODEL_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    embedding = build_model_map(pd.read_csv(args.reference_csv, low_memory=False), args.model_dir)
+    print(f"Mapped {embedding.n_points} species; points per level: {embedding.level_ends}")
@@ -0,0 +1,343 @@
+"""Codon usage tables straight from FASTA coding sequences.
+
+Takes plain or gzipped FASTA (one CDS per record, or whole CDS sets) and
+returns the table ``/analyze`` expects, with the 5 metadata columns
+(``Kingdom, DNAtype, SpeciesID, Ncodons, SpeciesName``) followed by the 64
+codon frequencies. The table goes to ``preprocess_feature`` in memory; no
+CSV is written.
+
+Records are read in large blocks and split on ``"\\n>"``, and sequences are
+counted in batches. Each batch of sequences is turned into one uint8 array.
+Viewed as (codons, 3) bytes, one 256-entry lookup table per codon
+position turns each byte into its shifted nucleotide code (A/C/G/T/U in
+either case; any other byte sets an "invalid" bit). ORing the three gives
+the codon index. One ``np.bincount`` over ``species * 128 + index`` then
+counts the whole batch, and invalid codons fall into slots that are
+dropped. No Python code runs per codon or per nucleotide.
+
+Reading frame (``CODON_FASTA_FRAME``): ``0``, ``1`` or ``2`` counts that
+frame of every record. ``auto`` picks, per record, the frame with the
+fewest in-frame stop codons (ties go to the lower frame).
+
+Species (``CODON_FASTA_GROUP_BY``):
+
+* ``record`` - every record is its own row, named by its first header word
+* ``organism`` - records with the same ``[organism=...]`` (or
+  ``[species=...]``) header tag are summed into one row; records without a
+  tag are summed under the file's name
+* ``file`` - the whole file is one species (a CDS set)
+
+A ``[kingdom=...]`` header tag fills the Kingdom column; it is empty
+otherwise.
+
+Uncompressed files larger than ``CODON_FASTA_PARALLEL_MIN_BYTES`` are cut
+into byte ranges at record boundaries and counted in
+``CODON_FASTA_WORKERS`` processes. Gzip streams cannot be split without
+decompressing them first, so they are counted in one process.
+"""
+import gzip
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core import config
+
+CODONS = tuple(''.join(codon) for codon in product('UCAG', repeat=3))
+STOP_CODONS = ('UAA', 'UAG', 'UGA')
+GROUP_MODES = ('record', 'organism', 'file')
+GZIP_MAGIC = b'\x1f\x8b'
+WHITESPACE = b' \t\r\n'
+INVALID = 64
+# Codon indexes with the INVALID bit set (up to 127) are counted in a discarded slot
+CODON_SLOTS = 128
+
+
+def position_codes(shift: int) -> np.ndarray:
+    """Byte -> nucleotide code (CODONS order, U = T) shifted to its place in the codon index"""
+    codes = np.full(256, INVALID, dtype=np.uint8)
+    for code, bases in enumerate((b'TtUu', b'Cc', b'Aa', b'Gg')):
+        codes[np.frombuffer(bases, dtype=np.uint8)] = code << shift
+    codes.setflags(write=False)
+    return codes
+
+
+# ORing the three looked-up bytes gives the codon index, or >= INVALID if any base is not ACGTU
+POSITION_CODES = (position_codes(4), position_codes(2), position_codes(0))
+
+STOP_INDEX = np.array([CODONS.index(codon) for codon in STOP_CODONS])
+
+ORGANISM_TAG = re.compile(r'\[(?:organism|species)=([^\]]+)\]')
+KINGDOM_TAG = re.compile(r'\[kingdom=([^\]]+)\]')
+
+
+def is_fasta(path: str) -> bool:
+    """True when the file (gzipped or not) starts with a FASTA header"""
+    try:
+        with open_sequences(path) as f:
+            head = f.read(4096)
+    except (OSError, EOFError):
+        return False
+    return head.lstrip().startswith(b'>')
+
+
+def is_gzip(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_sequences(path: str):
+    return gzip.open(path, 'rb') if is_gzip(path) else open(path, 'rb')
+
+
+def iter_records(stream, position: int = 0, stop: Optional[int] = None,
+                 block_bytes: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """(header, sequence) of the records whose ``>`` lies before byte ``stop``
+
+    ``stream`` is positioned at byte ``position``. To start inside a file,
+    seek one byte before the range so a record starting exactly there is
+    recognised; the first ``>`` after a newline starts the first record.
+    """
+    block_bytes = block_bytes or config.FASTA_BLOCK_BYTES
+    buffer = bytearray(b'\n' if position == 0 else b'')
+    base = position - len(buffer)  # file offset of buffer[0]
+    start, search_from, eof = -1, 0, False
+    while True:
+        if start < 0:
+            start = buffer.find(b'\n>', search_from)
+            if start < 0:
+                if eof:
+                    return
+                # Keep the last byte: it may be the newline before a '>'
+                base += len(buffer) - 1
+                del buffer[:-1]
+                chunk = stream.read(block_bytes)
+                eof = not chunk
+                buffer += chunk
+                search_from = 0
+                continue
+            if stop is not None and base + start + 1 >= stop:
+                return
+            search_from = start + 1
+
+        end = buffer.find(b'\n>', search_from)
+        if end < 0 and not eof:
+            # The record continues past the buffer: drop what is done and read on
+            base += start
+            del buffer[:start]
+            search_from = max(len(buffer) - 1, 1)
+            start = 0
+            chunk = stream.read(block_bytes)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        yield parse_record(buffer[start + 2:end if end >= 0 else len(buffer)])
+        if end < 0:
+            return
+        start, search_from = end, end + 1
+        if stop is not None and base + start + 1 >= stop:
+            return
+
+
+def parse_record(record: bytes) -> Tuple[str, bytes]:
+    header, _, body = bytes(record).partition(b'\n')
+    return header.decode('utf-8', errors='replace').strip(), body.translate(None, WHITESPACE)
+
+
+class CodonCounter:
+    """Codon counts per species, filled one batch of records at a time"""
+
+    def __init__(self, group_by: str, frame, default_name: str):
+        if group_by not in GROUP_MODES:
+            raise ValueError(f"group_by must be one of {GROUP_MODES}, got {group_by!r}")
+        self.group_by = group_by
+        self.frame = frame
+        self.default_name = default_name
+        self.names: List[str] = []
+        self.kingdoms: List[str] = []
+        self.records: List[int] = []
+        self._groups = {}
+        self._total = np.zeros((0, len(CODONS)), dtype=np.int64)
+        self._batch, self._batch_groups, self._batch_bytes = [], [], 0
+
+    def add(self, header: str, sequence: bytes):
+        group = self._group(header)
+        self.records[group] += 1
+        self._batch.append(sequence)
+        self._batch_groups.append(group)
+        self._batch_bytes += len(sequence)
+        if self._batch_bytes >= config.FASTA_BATCH_BYTES:
+            self.flush()
+
+    def _group(self, header: str) -> int:
+        if self.group_by == 'record':
+            name = header.split(maxsplit=1)[0] if header else f'record_{sum(self.records) + 1}'
+            # Repeated ids still get one row per record
+            key = len(self.names)
+        else:
+            match = ORGANISM_TAG.search(header) if self.group_by == 'organism' else None
+            name = match.group(1).strip() if match else self.default_name
+            key = name
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = len(self.names)
+            kingdom = KINGDOM_TAG.search(header)
+            self.names.append(name)
+            self.kingdoms.append(kingdom.group(1).strip() if kingdom else '')
+            self.records.append(0)
+        return group
+
+    def flush(self):
+        if not self._batch:
+            return
+        groups = np.array(self._batch_groups, dtype=np.int64)
+        # A batch only touches the species between its lowest and highest group
+        low = int(groups.min())
+        counts = count_codons(self._batch, groups - low, int(groups.max()) - low + 1, self.frame)
+        if len(self._total) < len(self.names):
+            grown = np.zeros((max(len(self.names), 2 * len(self._total)), len(CODONS)), dtype=np.int64)
+            grown[:len(self._total)] = self._total
+            self._total = grown
+        self._total[low:low + len(counts)] += counts
+        self._batch, self._batch_groups, self._batch_bytes = [], [], 0
+
+    def counts(self) -> np.ndarray:
+        """(species, 64) int64 codon counts"""
+        self.flush()
+        total = np.zeros((len(self.names), len(CODONS)), dtype=np.int64)
+        total[:min(len(self._total), len(total))] = self._total[:len(total)]
+        return total
+
+
+def count_codons(sequences: List[bytes], groups: np.ndarray, n_groups: int, frame=0) -> np.ndarray:
+    """(n_groups, 64) codon counts of ``sequences``, each summed into its entry of ``groups``"""
+    if frame == 'auto':
+        passes = [frame_codons(sequences, f) for f in range(3)]
+        # Per record, the frame with the fewest stop codons
+        stops = np.stack([
+            np.bincount(records, weights=np.isin(codes, STOP_INDEX), minlength=len(sequences))
+            for codes, records in passes
+        ])
+        chosen = np.argmin(stops, axis=0)
+        total = np.zeros(n_groups * CODON_SLOTS, dtype=np.int64)
+        for f, (codes, records) in enumerate(passes):
+            keep = chosen[records] == f
+            total += np.bincount(groups[records[keep]] * CODON_SLOTS + codes[keep], minlength=len(total))
+    else:
+        codes, records = frame_codons(sequences, int(frame))
+        total = np.bincount(groups[records] * CODON_SLOTS + codes, minlength=n_groups * CODON_SLOTS)
+    return total.reshape(n_groups, CODON_SLOTS)[:, :len(CODONS)]
+
+
+def frame_codons(sequences: List[bytes], frame: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(codon index, record index) of every codon of one reading frame; invalid codons are >= INVALID"""
+    trimmed = [sequence[frame:frame + (len(sequence) - frame) // 3 * 3] for sequence in sequences]
+    lengths = np.fromiter((len(sequence) // 3 for sequence in trimmed), dtype=np.int64, count=len(trimmed))
+    bases = np.frombuffer(b''.join(trimmed), dtype=np.uint8).reshape(-1, 3)
+    codes = POSITION_CODES[0][bases[:, 0]]
+    codes |= POSITION_CODES[1][bases[:, 1]]
+    codes |= POSITION_CODES[2][bases[:, 2]]
+    return codes.astype(np.int64), np.repeat(np.arange(len(trimmed)), lengths)
+
+
+def count_range(path: str, start: int, stop: Optional[int], group_by: str, frame, default_name: str):
+    """Count the records starting in ``[start, stop)`` of an uncompressed file (worker entry point)"""
+    counter = CodonCounter(group_by, frame, default_name)
+    with open(path, 'rb') as f:
+        f.seek(max(start - 1, 0))
+        for header, sequence in iter_records(f, max(start - 1, 0), stop):
+            counter.add(header, sequence)
+    return counter.names, counter.kingdoms, counter.records, counter.counts()
+
+
+def byte_ranges(size: int, n_ranges: int) -> List[Tuple[int, int]]:
+    bounds = np.linspace(0, size, n_ranges + 1).astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def count_file(path: str, group_by: Optional[str] = None, frame=None, workers: Optional[int] = None,
+               default_name: Optional[str] = None):
+    """(names, kingdoms, record counts, (species, 64) codon counts) of a FASTA file"""
+    group_by = group_by or config.FASTA_GROUP_BY
+    frame = parse_frame(config.FASTA_FRAME if frame is None else frame)
+    workers = config.FASTA_WORKERS if workers is None else workers
+    default_name = default_name or species_name_from_path(path)
+
+    size = os.path.getsize(path)
+    if workers > 1 and size >= config.FASTA_PARALLEL_MIN_BYTES and not is_gzip(path):
+        ranges = byte_ranges(size, workers * 4)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(count_range, *zip(*[
+                (path, start, stop, group_by, frame, default_name) for start, stop in ranges])))
+        return merge_counts(parts, keep_records_apart=group_by == 'record')
+
+    counter = CodonCounter(group_by, frame, default_name)
+    with open_sequences(path) as f:
+        for header, sequence in iter_records(f):
+            counter.add(header, sequence)
+    return counter.names, counter.kingdoms, counter.records, counter.counts()
+
+
+def merge_counts(parts, keep_records_apart: bool = False):
+    """Combine per-range results, keeping species in order of first appearance
+
+    Species with the same name in different ranges are summed, except in
+    ``record`` mode where every record stays its own row.
+    """
+    names, kingdoms, records, rows, index = [], [], [], [], {}
+    for part_names, part_kingdoms, part_records, part_counts in parts:
+        for name, kingdom, n_records, counts in zip(part_names, part_kingdoms, part_records, part_counts):
+            row = None if keep_records_apart else index.get(name)
+            if row is None:
+                index[name] = len(names)
+                names.append(name)
+                kingdoms.append(kingdom)
+                records.append(n_records)
+                rows.append(counts.copy())
+            else:
+                records[row] += n_records
+                rows[row] += counts
+    counts = np.vstack(rows) if rows else np.zeros((0, len(CODONS)), dtype=np.int64)
+    return names, kingdoms, records, counts
+
+
+def parse_frame(frame):
+    if frame in ('auto', 'AUTO'):
+        return 'auto'
+    frame = int(frame)
+    if frame not in (0, 1, 2):
+        raise ValueError(f"Reading frame must be 0, 1, 2 or 'auto', got {frame}")
+    return frame
+
+
+def species_name_from_path(path: str) -> str:
+    name = os.path.basename(path)
+    for suffix in ('.gz', '.fasta', '.fas', '.fna', '.ffn', '.fa', '.cds', '.txt', '.csv'):
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return name or 'species'
+
+
+def codon_table(names: List[str], kingdoms: List[str], counts: np.ndarray) -> pd.DataFrame:
+    """Metadata columns + codon frequencies, the layout of the training CSV"""
+    totals = counts.sum(axis=1)
+    frequencies = counts / np.maximum(totals, 1)[:, None]
+    table = pd.DataFrame(frequencies, columns=list(CODONS))
+    table.insert(0, 'SpeciesName', names)
+    table.insert(0, 'Ncodons', totals)
+    table.insert(0, 'SpeciesID', np.arange(len(names)))
+    table.insert(0, 'DNAtype', 0)
+    table.insert(0, 'Kingdom', kingdoms)
+    return table
+
+
+def read_fasta_table(path: str, group_by: Optional[str] = None, frame=None, workers: Optional[int] = None,
+                     default_name: Optional[str] = None) -> pd.DataFrame:
+    """Per-species codon usage table of a (gzipped) FASTA file"""
+    names, kingdoms, _, counts = count_file(path, group_by, frame, workers, default_name)
+    return codon_table(names, kingdoms, counts)
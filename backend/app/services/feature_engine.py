@@ -0,0 +1,431 @@
+"""Vectorized codon usage feature engine.
+
+Produces the same columns as the original pandas implementation of
+``preprocess_feature`` but computes every feature as a whole-matrix NumPy
+operation instead of a Python function applied per row.
+"""
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Codon to amino acid mapping (stop codons are not aggregated)
+CODON_TO_AA = {
+    'GCU': 'A', 'GCC': 'A', 'GCA': 'A', 'GCG': 'A',
+    'CGU': 'R', 'CGC': 'R', 'CGA': 'R', 'CGG': 'R', 'AGA': 'R', 'AGG': 'R',
+    'GGU': 'G', 'GGC': 'G', 'GGA': 'G', 'GGG': 'G',
+    'AAA': 'K', 'AAG': 'K',
+    'UUU': 'F', 'UUC': 'F',
+    'CCU': 'P', 'CCC': 'P', 'CCA': 'P', 'CCG': 'P',
+    'UCU': 'S', 'UCC': 'S', 'UCA': 'S', 'UCG': 'S', 'AGU': 'S', 'AGC': 'S',
+    'AUU': 'I', 'AUC': 'I', 'AUA': 'I',
+    'AUG': 'M',
+    'GUU': 'V', 'GUC': 'V', 'GUA': 'V', 'GUG': 'V',
+    'UUA': 'L', 'UUG': 'L', 'CUU': 'L', 'CUC': 'L', 'CUA': 'L', 'CUG': 'L',
+    'ACU': 'T', 'ACC': 'T', 'ACA': 'T', 'ACG': 'T',
+    'UAU': 'Y', 'UAC': 'Y',
+    'CAA': 'Q', 'CAG': 'Q',
+    'AAU': 'N', 'AAC': 'N',
+    'GAU': 'D', 'GAC': 'D',
+    'UGU': 'C', 'UGC': 'C',
+    'GAA': 'E', 'GAG': 'E',
+    'CAU': 'H', 'CAC': 'H',
+    'UGG': 'W'
+}
+
+STAT_COLUMNS = ['mean', 'median', 'std', 'skewness', 'kurtosis', 'entropy', 'gini']
+SIMILARITY_COLUMNS = ['cosine_similarity_to_mean', 'cosine_similarity_to_median']
+
+PSEUDOCOUNT = 1e-8
+ENTROPY_EPS = 1e-10
+LOW_COUNT_QUANTILE = 0.05
+
+REFERENCE_STATS_FILE = 'reference_stats.pkl'
+REFERENCE_STATS_VERSION = 1
+
+
+@lru_cache(maxsize=32)
+def build_membership_matrix(columns: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray, Tuple[str, ...]]:
+    """Return (codon column positions, codon x amino acid 0/1 matrix, amino acid names)
+
+    Amino acids are ordered by first appearance in ``CODON_TO_AA`` so the
+    output matches the column order the models were trained with.
+    """
+    present = set(columns)
+    aa_order = []
+    for codon, aa in CODON_TO_AA.items():
+        if codon in present and aa not in aa_order:
+            aa_order.append(aa)
+
+    positions = np.array([i for i, col in enumerate(columns) if col in CODON_TO_AA], dtype=np.intp)
+    membership = np.zeros((len(positions), len(aa_order)))
+    for row, pos in enumerate(positions):
+        membership[row, aa_order.index(CODON_TO_AA[columns[pos]])] = 1.0
+
+    positions.setflags(write=False)
+    membership.setflags(write=False)
+    return positions, membership, tuple(aa_order)
+
+
+def to_numeric_matrix(raw_features: pd.DataFrame, dtype=np.float64) -> np.ndarray:
+    """Coerce every column to numbers (invalid values become NaN)"""
+    numeric_dtypes = raw_features.dtypes.map(pd.api.types.is_numeric_dtype)
+    if numeric_dtypes.all():
+        # The usual case: read_csv already parsed every codon column as numbers
+        return raw_features.to_numpy(dtype=dtype, na_value=np.nan, copy=True)
+    numeric = raw_features.apply(pd.to_numeric, errors='coerce')
+    return numeric.to_numpy(dtype=dtype, na_value=np.nan, copy=True)
+
+
+def fill_missing(values: np.ndarray, fill_values: np.ndarray) -> np.ndarray:
+    """Replace NaN cells with the per-column fill value (in place)"""
+    mask = np.isnan(values)
+    if mask.any():
+        values[mask] = np.broadcast_to(fill_values, values.shape)[mask]
+    return values
+
+
+def column_medians(values: np.ndarray) -> np.ndarray:
+    """NaN-aware per-column median; all-NaN columns stay NaN"""
+    medians = np.full(values.shape[1], np.nan, dtype=values.dtype)
+    has_data = ~np.isnan(values).all(axis=0)
+    if values.shape[0] and has_data.any():
+        medians[has_data] = np.nanmedian(values[:, has_data], axis=0)
+    return medians
+
+
+def aggregate_amino_acids(values: np.ndarray, positions: np.ndarray, membership: np.ndarray) -> np.ndarray:
+    """Sum synonymous codons into amino acid counts with one matrix product
+
+    A NaN codon only propagates to its own amino acid, as with the per-column sum.
+    """
+    codons = values[:, positions]
+    membership = membership.astype(values.dtype, copy=False)
+    nan_mask = np.isnan(codons)
+    if not nan_mask.any():
+        return codons @ membership
+    aa = np.where(nan_mask, 0, codons) @ membership
+    aa[(nan_mask.astype(values.dtype) @ membership) > 0] = np.nan
+    return aa
+
+
+def normalize_rows(aa_counts: np.ndarray, row_sums: np.ndarray) -> np.ndarray:
+    """Per-row frequencies with pseudocount"""
+    denom = row_sums + PSEUDOCOUNT * aa_counts.shape[1]
+    return (aa_counts + PSEUDOCOUNT) / denom[:, None]
+
+
+def row_moments(x: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Mean, median, sample std, bias-corrected skewness and excess kurtosis per row
+
+    Follows the pandas estimators (NaN skipped, degenerate rows give 0).
+    """
+    mask = np.isnan(x)
+    has_nan = mask.any()
+    filled = np.where(mask, 0, x) if has_nan else x
+    count = (x.shape[1] - mask.sum(axis=1)).astype(x.dtype)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=1) / count
+        adjusted = filled - mean[:, None]
+        if has_nan:
+            adjusted[mask] = 0
+        adjusted2 = adjusted ** 2
+        m2 = adjusted2.sum(axis=1)
+        m3 = (adjusted2 * adjusted).sum(axis=1)
+        m4 = (adjusted2 ** 2).sum(axis=1)
+
+        # Treat sums within floating point noise of zero as constant rows
+        max_abs = np.abs(filled).max(axis=1, initial=0.0)
+        eps = np.finfo(x.dtype).eps
+        m2 = np.where(np.abs(m2) < (eps * max_abs) ** 2 * count, 0, m2)
+        m3 = np.where(np.abs(m3) < (eps * max_abs) ** 3 * count, 0, m3)
+        m4 = np.where(np.abs(m4) < (eps * max_abs) ** 4 * count, 0, m4)
+
+        std = np.sqrt(m2 / (count - 1))
+
+        skew = (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2 ** 1.5)
+        skew = np.where(m2 == 0, 0, skew)
+        skew[count < 3] = np.nan
+
+        numerator = count * (count + 1) * (count - 1) * m4
+        denominator = (count - 2) * (count - 3) * m2 ** 2
+        kurt = numerator / denominator - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        kurt = np.where(denominator == 0, 0, kurt)
+        kurt[count < 4] = np.nan
+
+    median = np.nanmedian(x, axis=1) if has_nan else np.median(x, axis=1)
+    return mean, median, std, skew, kurt
+
+
+def row_entropy(x: np.ndarray, base: float = 2.0) -> np.ndarray:
+    """Shannon entropy of each row after adding ``ENTROPY_EPS`` (NaN rows give NaN)"""
+    p = x + ENTROPY_EPS
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = p / p.sum(axis=1, keepdims=True)
+        terms = np.where(p > 0, -p * np.log(np.where(p > 0, p, 1)), np.where(p == 0, 0, -np.inf))
+    return terms.sum(axis=1) / np.log(base)
+
+
+def row_gini(x: np.ndarray) -> np.ndarray:
+    """Gini coefficient of each row, ignoring NaN cells"""
+    ordered = np.sort(x, axis=1)  # NaN sorts last, so ranks of valid cells start at 1
+    valid = ~np.isnan(ordered)
+    ordered = np.where(valid, ordered, 0)
+    n = valid.sum(axis=1).astype(x.dtype)
+    index = np.arange(1, x.shape[1] + 1, dtype=x.dtype)
+    total = ordered.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gini = (2 * (ordered * index).sum(axis=1)) / (n * total) - (n + 1) / n
+    return np.where((n == 0) | (total == 0), 0, gini)
+
+
+def cosine_similarity_to(x: np.ndarray, profile: np.ndarray) -> np.ndarray:
+    """Cosine similarity between every row and a single profile (zero vectors give 0)"""
+    row_norms = np.sqrt(np.einsum('ij,ij->i', x, x))
+    row_norms[row_norms == 0] = 1
+    profile_norm = np.sqrt(profile @ profile)
+    if profile_norm == 0:
+        profile_norm = 1
+    return (x @ profile) / (row_norms * profile_norm)
+
+
+def compute_features(raw_features: pd.DataFrame, dtype=np.float64, reference: Optional[dict] = None) -> pd.DataFrame:
+    """Vectorized equivalent of ``preprocess_feature``
+
+    Without ``reference`` the fill medians, low-count cutoff and similarity
+    profiles come from the upload itself (the original behaviour). With a
+    ``reference`` from ``fit_reference_stats`` every row is scored on its
+    own, so the frame can be processed in chunks or in parallel. Either way
+    the result keeps the index labels of the ``raw_features`` rows that
+    survive the zero-sum and low-count filters.
+
+    ``dtype=np.float32`` halves memory and bandwidth at the cost of
+    float32 precision in the returned features.
+    """
+    columns = tuple(raw_features.columns)
+    values = to_numeric_matrix(raw_features, dtype=dtype)
+
+    if reference is None:
+        aa_norm, aa_columns, nonzero, valid_rows, _ = normalized_amino_acids(values, columns, column_medians(values))
+        return _assemble_features(
+            aa_norm,
+            aa_columns,
+            index=raw_features.index[nonzero][valid_rows],
+            mean_profile=np.nanmean(aa_norm, axis=0) if len(aa_norm) else np.zeros(len(aa_columns), dtype=dtype),
+            median_profile=column_medians(aa_norm) if len(aa_norm) else np.zeros(len(aa_columns), dtype=dtype),
+        )
+
+    fill_values = np.array([reference['fill_medians'].get(col, np.nan) for col in columns], dtype=dtype)
+    aa_norm, aa_columns, nonzero, valid_rows, _ = normalized_amino_acids(
+        values, columns, fill_values, cutoff=reference['row_sum_cutoff'])
+    profile_index = [reference['aa_columns'].index(aa) for aa in aa_columns]
+    return _assemble_features(
+        aa_norm,
+        aa_columns,
+        index=raw_features.index[nonzero][valid_rows],
+        mean_profile=np.asarray(reference['mean_profile'], dtype=dtype)[profile_index],
+        median_profile=np.asarray(reference['median_profile'], dtype=dtype)[profile_index],
+    )
+
+
+def fit_reference_stats(raw_features: pd.DataFrame) -> dict:
+    """Training-time statistics used by ``compute_features(..., reference=...)``
+
+    Fitted on the training table, frozen scoring reproduces the batch
+    features of that same table exactly.
+    """
+    columns = tuple(raw_features.columns)
+    values = to_numeric_matrix(raw_features)
+    fill_values = column_medians(values)
+    aa_norm, aa_columns, _, _, cutoff = normalized_amino_acids(values, columns, fill_values)
+
+    return {
+        'version': REFERENCE_STATS_VERSION,
+        'fill_medians': dict(zip(columns, fill_values.tolist())),
+        'row_sum_cutoff': float(cutoff),
+        'aa_columns': list(aa_columns),
+        'mean_profile': np.nanmean(aa_norm, axis=0),
+        'median_profile': column_medians(aa_norm),
+        'n_reference_rows': int(len(aa_norm)),
+    }
+
+
+class ReferenceStatsBuilder:
+    """``fit_reference_stats`` over a table that arrives in chunks
+
+    Medians and the low-count quantile need every value, so ``add`` appends
+    each chunk's codon values column by column to scratch files under
+    ``scratch_dir``. ``finish`` then reads them back ``block_rows`` rows at
+    a time: once for the fill medians (one column at a time), once for the
+    row sums behind the cutoff and once for the amino acid profiles. Only
+    the row sums (8 bytes per row) are held for the whole table. The
+    statistics equal ``fit_reference_stats`` on the concatenated chunks, up
+    to the summation order of the mean profile.
+    """
+
+    def __init__(self, scratch_dir: str, block_rows: int = 65536):
+        self.block_rows = block_rows
+        self.columns: Optional[Tuple[str, ...]] = None
+        self.n_rows = 0
+        self._dir = tempfile.mkdtemp(prefix='reference-', dir=scratch_dir)
+        self._files = []
+
+    def __enter__(self) -> 'ReferenceStatsBuilder':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Delete the scratch files"""
+        for f in self._files:
+            f.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def add(self, raw_features: pd.DataFrame):
+        columns = tuple(raw_features.columns)
+        if self.columns is None:
+            self.columns = columns
+            self._files = [open(self._path('codon', j), 'wb') for j in range(len(columns))]
+        elif columns != self.columns:
+            raise ValueError("Every chunk must have the same codon columns")
+        values = to_numeric_matrix(raw_features)
+        for f, column in zip(self._files, values.T):
+            f.write(np.ascontiguousarray(column).tobytes())
+        self.n_rows += len(values)
+
+    def finish(self) -> dict:
+        if self.columns is None:
+            raise ValueError("No chunks were added")
+        for f in self._files:
+            f.close()
+        codons = self._read_columns('codon', len(self.columns), self.n_rows)
+        fill_values = np.array([column_medians(column[:, None])[0] for column in codons])
+        positions, membership, aa_columns = build_membership_matrix(self.columns)
+
+        row_sums = [np.nansum(aggregate_amino_acids(values[np.nansum(values, axis=1) > 0], positions, membership),
+                              axis=1)
+                    for values in self._blocks(codons, fill_values)]
+        row_sums = np.concatenate(row_sums) if row_sums else np.empty(0)
+        cutoff = np.quantile(row_sums, LOW_COUNT_QUANTILE) if len(row_sums) else 0.0
+        del row_sums
+
+        totals = np.zeros(len(aa_columns))
+        counts = np.zeros(len(aa_columns))
+        n_valid = 0
+        aa_files = [open(self._path('aa', j), 'wb') for j in range(len(aa_columns))]
+        try:
+            for values in self._blocks(codons, fill_values):
+                aa_norm = normalized_amino_acids(values, self.columns, fill_values, cutoff=cutoff)[0]
+                totals += np.nansum(aa_norm, axis=0)
+                counts += (~np.isnan(aa_norm)).sum(axis=0)
+                n_valid += len(aa_norm)
+                for f, column in zip(aa_files, aa_norm.T):
+                    f.write(np.ascontiguousarray(column).tobytes())
+        finally:
+            for f in aa_files:
+                f.close()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_profile = totals / counts
+        aa_norm_columns = self._read_columns('aa', len(aa_columns), n_valid)
+
+        return {
+            'version': REFERENCE_STATS_VERSION,
+            'fill_medians': dict(zip(self.columns, fill_values.tolist())),
+            'row_sum_cutoff': float(cutoff),
+            'aa_columns': list(aa_columns),
+            'mean_profile': mean_profile,
+            'median_profile': np.array([column_medians(column[:, None])[0] for column in aa_norm_columns]),
+            'n_reference_rows': int(n_valid),
+        }
+
+    def _path(self, kind: str, j: int) -> str:
+        return os.path.join(self._dir, f'{kind}-{j}.f8')
+
+    def _read_columns(self, kind: str, n_columns: int, n_rows: int) -> List[np.ndarray]:
+        if n_rows == 0:
+            return [np.empty(0) for _ in range(n_columns)]
+        return [np.memmap(self._path(kind, j), dtype=np.float64, mode='r', shape=(n_rows,))
+                for j in range(n_columns)]
+
+    def _blocks(self, columns: List[np.ndarray], fill_values: np.ndarray) -> Iterator[np.ndarray]:
+        """Row blocks of the spilled codon columns, missing values filled"""
+        for start in range(0, self.n_rows, self.block_rows):
+            values = np.column_stack([column[start:start + self.block_rows] for column in columns])
+            yield fill_missing(values, fill_values)
+
+
+def normalized_amino_acids(values: np.ndarray,
+                            columns: Tuple[str, ...],
+                            fill_values: np.ndarray,
+                            cutoff: Optional[float] = None):
+    """Fill, drop zero-sum rows, aggregate to amino acids and normalize
+
+    Returns (normalized matrix, amino acid names, non-zero row mask over
+    ``values``, low-count mask over the non-zero rows, cutoff used). The
+    low-count cutoff defaults to the 5% quantile of the rows given.
+    """
+    # Fill NA and remove rows with total 0 (corrupt data)
+    fill_missing(values, fill_values)
+    nonzero = np.nansum(values, axis=1) > 0
+    values = values[nonzero]
+
+    positions, membership, aa_columns = build_membership_matrix(columns)
+    aa_counts = aggregate_amino_acids(values, positions, membership)
+
+    # Filter low-count rows, then normalize per row
+    row_sums = np.nansum(aa_counts, axis=1)
+    if cutoff is None:
+        cutoff = np.quantile(row_sums, LOW_COUNT_QUANTILE) if len(row_sums) else 0.0
+    valid_rows = row_sums > cutoff
+    aa_norm = normalize_rows(aa_counts[valid_rows], row_sums[valid_rows])
+    return aa_norm, aa_columns, nonzero, valid_rows, cutoff
+
+
+def _assemble_features(aa_norm: np.ndarray,
+                       aa_columns: Sequence[str],
+                       index: np.ndarray,
+                       mean_profile: np.ndarray,
+                       median_profile: np.ndarray) -> pd.DataFrame:
+    """Stack amino acid frequencies, row statistics and similarities into one frame"""
+    n_rows, n_aa = aa_norm.shape
+    out = np.empty((n_rows, n_aa + len(STAT_COLUMNS) + len(SIMILARITY_COLUMNS)), dtype=aa_norm.dtype)
+    out[:, :n_aa] = aa_norm
+
+    mean, median, std, skew, kurt = row_moments(aa_norm)
+    stats = out[:, n_aa:n_aa + len(STAT_COLUMNS)]
+    stats[:, 0] = mean
+    stats[:, 1] = median
+    stats[:, 2] = std
+    stats[:, 3] = skew
+    stats[:, 4] = kurt
+    stats[:, 5] = row_entropy(aa_norm)
+    stats[:, 6] = row_gini(aa_norm)
+    np.nan_to_num(out[:, :n_aa + len(STAT_COLUMNS)], copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+    out[:, -2] = cosine_similarity_to(aa_norm, mean_profile.astype(aa_norm.dtype, copy=False))
+    out[:, -1] = cosine_similarity_to(aa_norm, median_profile.astype(aa_norm.dtype, copy=False))
+
+    return pd.DataFrame(out, index=index, columns=list(aa_columns) + STAT_COLUMNS + SIMILARITY_COLUMNS)
+
+
+if __name__ == "__main__":
+    # python -m services.feature_engine training.csv  (run from backend/app)
+    import argparse
+    import os
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Fit frozen reference statistics from the training codon usage CSV")
+    parser.add_argument("training_csv")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", REFERENCE_STATS_FILE))
+    args = parser.parse_args()
+
+    training_df = pd.read_csv(args.training_csv, low_memory=False)
+    joblib.dump(fit_reference_stats(training_df[training_df.columns[5:]]), args.output)
+    print(f"Saved reference statistics to {args.output}")
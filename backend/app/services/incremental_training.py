@@ -0,0 +1,336 @@
+"""Out-of-core training of the scaler, PCA and clustering models.
+
+``ImprovedCodonClusteringPipeline.full_pipeline`` holds the codon table and
+several derived copies of it in memory. ``train_out_of_core`` fits the same
+models from a CSV read ``chunk_rows`` rows at a time, so memory follows the
+chunk size and the sample size, not the table:
+
+1. survey - a seeded uniform sample of rows (bottom-k of random keys) and
+   the set of kingdoms
+2. profiles - exact per-amino-acid means (the cosine mean profile and the
+   CAI reference) and per-kingdom profiles over all rows
+3. variances - the feature variances behind the ``VarianceThreshold`` step
+4. scaler - ``partial_fit`` for standard / minmax scaling; the robust
+   scaler's quantiles come from the sample instead
+5. PCA - ``IncrementalPCA.partial_fit`` over all components, truncated to
+   the ``variance_threshold`` afterwards
+6. clustering - ``MiniBatchKMeans`` initialised from KMeans on the sample
+   and refined with ``partial_fit`` over ``kmeans_epochs`` passes
+
+Statistics that need an order statistic of the whole table (fill medians,
+the low-count cutoff, the median profile, the robust scaler) are taken from
+the sample, so they are estimates; everything else is exact. Unlike
+``clean_data`` the stream does not drop duplicate rows. The fitted models
+are written as the ``scaler.pkl``, ``pca.pkl``, ``kmeans_model.pkl`` and
+``feature_columns.pkl`` the backend loads.
+"""
+import copy
+import logging
+import os
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from core import config
+from services.codon_bias import advanced_features, cosine_similarity_matrix
+from services.feature_engine import fit_reference_stats, normalized_amino_acids, to_numeric_matrix
+
+logger = logging.getLogger(__name__)
+
+RANDOM_STATE = 42
+METADATA_COLUMNS = 5
+VARIANCE_FLOOR = 1e-8
+MAX_PCA_COMPONENTS = 50
+SCALING_METHODS = ('robust', 'minmax', 'standard')
+
+
+class TrainingReference(NamedTuple):
+    """Whole-table statistics every chunk's features are computed against"""
+    codon_columns: List[str]
+    fill_values: np.ndarray
+    row_sum_cutoff: float
+    aa_columns: List[str]
+    # column means of the normalized amino acid table (cosine mean profile and CAI reference)
+    mean_profile: np.ndarray
+    # names and rows of the cosine similarity profiles (mean, median, then kingdoms)
+    profile_names: List[str]
+    profiles: np.ndarray
+    # sorted kingdom labels for ``kingdom_encoded`` (None without a Kingdom column)
+    kingdoms: Optional[np.ndarray]
+
+
+class OutOfCoreModels(NamedTuple):
+    scaler: object
+    pca: object
+    kmeans: object
+    feature_columns: List[str]
+    reference: TrainingReference
+    summary: dict
+
+
+def read_chunks(csv_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(csv_path, chunksize=chunk_rows, low_memory=False) as reader:
+        yield from reader
+
+
+def survey(csv_path: str, chunk_rows: int, sample_rows: int, seed: int = RANDOM_STATE):
+    """(uniform sample of rows, sorted kingdoms or None, total rows) in one pass
+
+    Every row draws a random key and the ``sample_rows`` smallest keys are
+    kept, so the sample does not depend on the chunk size.
+    """
+    rng = np.random.default_rng(seed)
+    sample, sample_keys = None, np.empty(0)
+    kingdoms, n_rows = set(), 0
+    for chunk in read_chunks(csv_path, chunk_rows):
+        keys = np.concatenate([sample_keys, rng.random(len(chunk))])
+        pool = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        keep = np.sort(np.argsort(keys, kind='stable')[:sample_rows])
+        sample, sample_keys = pool.iloc[keep].reset_index(drop=True), keys[keep]
+        if 'Kingdom' in chunk.columns:
+            kingdoms.update(chunk['Kingdom'].astype(str).unique())
+        n_rows += len(chunk)
+    if sample is None:
+        raise ValueError(f"{csv_path} has no rows")
+    return sample, (np.array(sorted(kingdoms)) if 'Kingdom' in sample.columns else None), n_rows
+
+
+def normalized_chunk(chunk: pd.DataFrame, codon_columns: List[str], fill_values: np.ndarray, cutoff: float):
+    """(normalized amino acid frame, kingdom per kept row or None) for one chunk"""
+    values = to_numeric_matrix(chunk[codon_columns])
+    aa_norm, aa_columns, nonzero, valid_rows, _ = normalized_amino_acids(
+        values, tuple(codon_columns), fill_values, cutoff=cutoff)
+    df_aa_norm = pd.DataFrame(aa_norm, index=chunk.index[nonzero][valid_rows], columns=list(aa_columns))
+    kingdoms = None
+    if 'Kingdom' in chunk.columns:
+        kingdoms = chunk['Kingdom'].astype(str).to_numpy()[nonzero][valid_rows]
+    return df_aa_norm, kingdoms
+
+
+def fit_reference(csv_path: str, sample: pd.DataFrame, kingdoms: Optional[np.ndarray], chunk_rows: int) -> TrainingReference:
+    """Fill medians, cutoff and median profile from the sample; exact mean and kingdom profiles from a pass"""
+    codon_columns = list(sample.columns[METADATA_COLUMNS:])
+    sampled = fit_reference_stats(sample[codon_columns])
+    fill_values = np.array([sampled['fill_medians'][col] for col in codon_columns])
+    cutoff = sampled['row_sum_cutoff']
+
+    total, n_total = None, 0
+    # kingdom -> [summed profile, rows], in order of first appearance like codon_bias.kingdom_profiles
+    kingdom_sums = {}
+    for chunk in read_chunks(csv_path, chunk_rows):
+        df_aa_norm, chunk_kingdoms = normalized_chunk(chunk, codon_columns, fill_values, cutoff)
+        x = df_aa_norm.to_numpy()
+        total = x.sum(axis=0) if total is None else total + x.sum(axis=0)
+        n_total += len(x)
+        if chunk_kingdoms is not None and len(x):
+            codes, uniques = pd.factorize(chunk_kingdoms)
+            for code, kingdom in enumerate(uniques):
+                rows = x[codes == code]
+                entry = kingdom_sums.setdefault(kingdom, [np.zeros(x.shape[1]), 0])
+                entry[0] += rows.sum(axis=0)
+                entry[1] += len(rows)
+    if not n_total:
+        raise ValueError("No rows left after removing empty and low-count rows")
+
+    mean_profile = total / n_total
+    profile_names = ['cosine_similarity_to_mean', 'cosine_similarity_to_median']
+    profiles = [mean_profile, np.asarray(sampled['median_profile'], dtype=np.float64)]
+    if kingdoms is not None:
+        for kingdom, (summed, n) in kingdom_sums.items():
+            if n > 1:
+                profile_names.append(f'cos_sim_{kingdom}')
+                profiles.append(summed / n)
+
+    return TrainingReference(codon_columns, fill_values, float(cutoff), list(sampled['aa_columns']),
+                             mean_profile, profile_names, np.vstack(profiles), kingdoms)
+
+
+def training_features(chunk: pd.DataFrame, reference: TrainingReference) -> pd.DataFrame:
+    """``combine_features`` (before the variance filter) for one chunk of the raw table"""
+    df_aa_norm, kingdoms = normalized_chunk(chunk, reference.codon_columns, reference.fill_values,
+                                            reference.row_sum_cutoff)
+    stats = advanced_features(df_aa_norm, cai_reference=reference.mean_profile)
+    similarities = pd.DataFrame(cosine_similarity_matrix(df_aa_norm.to_numpy(), reference.profiles),
+                                index=df_aa_norm.index, columns=reference.profile_names)
+    features = pd.concat([df_aa_norm, stats, similarities], axis=1)
+
+    if reference.kingdoms is not None:
+        features['kingdom_encoded'] = np.searchsorted(reference.kingdoms, kingdoms)
+    features['entropy_std_interaction'] = (features['entropy'] * features['std']).fillna(0)
+    features['mean_gini_interaction'] = (features['mean'] * features['gini']).fillna(0)
+    return features.fillna(0).replace([np.inf, -np.inf], 0)
+
+
+def log_features(features: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """``np.log1p`` of the non-negative part, as ``full_pipeline`` does before scaling"""
+    x = np.log1p(np.clip(features[columns].to_numpy(dtype=np.float64), 0, None))
+    return np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def make_scaler(method: str):
+    from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+
+    if method not in SCALING_METHODS:
+        raise ValueError(f"Unknown scaling method '{method}'. Use one of: {', '.join(SCALING_METHODS)}")
+    return {'robust': RobustScaler, 'minmax': MinMaxScaler, 'standard': StandardScaler}[method]()
+
+
+def truncate_pca(pca, n_components: int):
+    """Copy of a fitted (Incremental)PCA keeping its first ``n_components`` components"""
+    truncated = copy.deepcopy(pca)
+    dropped = pca.explained_variance_[n_components:]
+    for name in ('components_', 'explained_variance_', 'explained_variance_ratio_', 'singular_values_'):
+        setattr(truncated, name, getattr(pca, name)[:n_components].copy())
+    truncated.n_components = truncated.n_components_ = n_components
+    truncated.noise_variance_ = float(dropped.mean()) if len(dropped) else 0.0
+    return truncated
+
+
+def choose_n_components(pca, variance_threshold: float, n_rows: int) -> int:
+    """Smallest component count reaching ``variance_threshold`` (as ``apply_pca``)"""
+    cumulative = np.cumsum(pca.explained_variance_ratio_)
+    n_components = int(np.argmax(cumulative >= variance_threshold)) + 1
+    n_components = min(n_components, MAX_PCA_COMPONENTS, len(cumulative), max(n_rows - 1, 1))
+    return max(1, n_components)
+
+
+def train_out_of_core(csv_path: str,
+                      n_clusters: Optional[int] = None,
+                      scaling_method: str = 'robust',
+                      variance_threshold: float = 0.85,
+                      chunk_rows: Optional[int] = None,
+                      sample_rows: Optional[int] = None,
+                      kmeans_epochs: Optional[int] = None,
+                      seed: int = RANDOM_STATE,
+                      progress: Optional[Callable[[str], None]] = None) -> OutOfCoreModels:
+    """Fit scaler, PCA and clustering from a codon usage CSV without loading it
+
+    ``n_clusters=None`` picks k with ``services.cluster_sweep`` on the
+    sample's PCA coordinates.
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from sklearn.decomposition import IncrementalPCA
+
+    chunk_rows = chunk_rows or config.TRAIN_CHUNK_ROWS
+    sample_rows = sample_rows or config.TRAIN_SAMPLE_ROWS
+    kmeans_epochs = kmeans_epochs or config.TRAIN_KMEANS_EPOCHS
+    scaler = make_scaler(scaling_method)
+    report = progress or logger.info
+
+    def feature_chunks():
+        for chunk in read_chunks(csv_path, chunk_rows):
+            features = training_features(chunk, reference)
+            if len(features):
+                yield features
+
+    sample, kingdoms, n_raw_rows = survey(csv_path, chunk_rows, sample_rows, seed)
+    report(f"Surveyed {n_raw_rows} rows, sampled {len(sample)}")
+    reference = fit_reference(csv_path, sample, kingdoms, chunk_rows)
+    report(f"Fitted reference profiles ({len(reference.profile_names)} similarity profiles)")
+
+    # VarianceThreshold on the combined features, from running moments
+    from sklearn.preprocessing import StandardScaler
+    moments = StandardScaler()
+    candidate_columns = None
+    for features in feature_chunks():
+        candidate_columns = candidate_columns or list(features.columns)
+        moments.partial_fit(features[candidate_columns].to_numpy(dtype=np.float64))
+    if candidate_columns is None:
+        raise ValueError("No rows left after removing empty and low-count rows")
+    feature_columns = [col for col, var in zip(candidate_columns, moments.var_) if var > VARIANCE_FLOOR]
+    n_rows = int(moments.n_samples_seen_)
+    report(f"Kept {len(feature_columns)} of {len(candidate_columns)} features over {n_rows} rows")
+
+    sample_log = log_features(training_features(sample, reference), feature_columns)
+    if scaling_method == 'robust':
+        scaler.fit(sample_log)
+    else:
+        for features in feature_chunks():
+            scaler.partial_fit(log_features(features, feature_columns))
+    report(f"Fitted {scaling_method} scaler")
+
+    # Every partial_fit batch needs at least n_components rows: a short batch waits for the next one
+    full_pca = IncrementalPCA(n_components=min(len(feature_columns), n_rows))
+    held = None
+    for features in feature_chunks():
+        block = scaler.transform(log_features(features, feature_columns))
+        if held is not None and len(block) >= full_pca.n_components:
+            full_pca.partial_fit(held)
+            held = block
+        else:
+            held = block if held is None else np.vstack([held, block])
+    full_pca.partial_fit(held)
+    pca = truncate_pca(full_pca, choose_n_components(full_pca, variance_threshold, n_rows))
+    explained = float(np.sum(pca.explained_variance_ratio_))
+    report(f"PCA: {pca.n_components_} components explain {explained * 100:.2f}% of the variance")
+
+    sample_pca = pca.transform(scaler.transform(sample_log))
+    if n_clusters is None:
+        from services.cluster_sweep import ClusterSweep
+
+        with ClusterSweep(sample_pca) as sweep:
+            _, _, best_params = sweep.optimize_kmeans()
+        n_clusters = best_params['n_clusters']
+        report(f"Chose k={n_clusters} on the sample")
+
+    init = KMeans(n_clusters=n_clusters, n_init=10, random_state=seed).fit(sample_pca).cluster_centers_
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=seed)
+    for epoch in range(kmeans_epochs):
+        for features in feature_chunks():
+            kmeans.partial_fit(pca.transform(scaler.transform(log_features(features, feature_columns))))
+        report(f"MiniBatchKMeans epoch {epoch + 1}/{kmeans_epochs}")
+
+    summary = {
+        'rows_read': n_raw_rows,
+        'rows_used': n_rows,
+        'sample_rows': len(sample),
+        'features': len(feature_columns),
+        'scaling_method': scaling_method,
+        'pca_components': int(pca.n_components_),
+        'explained_variance': explained,
+        'n_clusters': int(n_clusters),
+        # survey + profiles + variances (+ scaler) + PCA + k-means epochs
+        'passes': 4 + (scaling_method != 'robust') + kmeans_epochs,
+    }
+    return OutOfCoreModels(scaler, pca, kmeans, feature_columns, reference, summary)
+
+
+def save_models(models: OutOfCoreModels, output_dir: str):
+    """Write the artifacts the backend loads (see services.analysis.load_models)"""
+    os.makedirs(output_dir, exist_ok=True)
+    for name, value in (('scaler.pkl', models.scaler), ('pca.pkl', models.pca),
+                        ('kmeans_model.pkl', models.kmeans), ('feature_columns.pkl', models.feature_columns)):
+        joblib.dump(value, os.path.join(output_dir, name))
+
+
+def predict_clusters(models: OutOfCoreModels, chunk: pd.DataFrame) -> pd.Series:
+    """Cluster of every kept row of a raw chunk, indexed like the chunk"""
+    features = training_features(chunk, models.reference)
+    X = models.scaler.transform(log_features(features, models.feature_columns))
+    return pd.Series(models.kmeans.predict(models.pca.transform(X)), index=features.index)
+
+
+if __name__ == "__main__":
+    # python -m services.incremental_training training.csv --output-dir models  (run from backend/app)
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Fit scaler, PCA and clustering from a codon usage CSV in chunks")
+    parser.add_argument("training_csv")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--n-clusters", type=int, help="default: chosen by the clustering sweep on the sample")
+    parser.add_argument("--scaling", choices=SCALING_METHODS, default='robust')
+    parser.add_argument("--variance-threshold", type=float, default=0.85)
+    parser.add_argument("--chunk-rows", type=int, default=config.TRAIN_CHUNK_ROWS)
+    parser.add_argument("--sample-rows", type=int, default=config.TRAIN_SAMPLE_ROWS)
+    parser.add_argument("--epochs", type=int, default=config.TRAIN_KMEANS_EPOCHS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    trained = train_out_of_core(args.training_csv, args.n_clusters, args.scaling, args.variance_threshold,
+                                args.chunk_rows, args.sample_rows, args.epochs)
+    save_models(trained, args.output_dir)
+    print(json.dumps(trained.summary, indent=2))
+    print(f"Saved scaler.pkl, pca.pkl, kmeans_model.pkl and feature_columns.pkl to {args.output_dir}")
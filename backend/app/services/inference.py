@@ -0,0 +1,245 @@
+"""Compiled single-pass inference kernel.
+
+``load_models`` compiles the fitted scaler, PCA, KMeans and classifier once
+into fixed arrays and a fixed classifier input layout, so a request only
+runs a few preallocated NumPy passes per batch:
+
+* scaler + PCA folded into one affine map ``X @ W + b``
+* nearest-centroid assignment from one BLAS product
+* classifier input written straight into a float32 buffer
+"""
+import logging
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceResult(NamedTuple):
+    clusters: np.ndarray
+    components: np.ndarray
+    labels: Optional[np.ndarray]
+    proba: Optional[np.ndarray]
+
+
+def scaler_affine(scaler, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(center, scale) such that ``scaler.transform(X) == (X - center) / scale``"""
+    if hasattr(scaler, 'center_') or hasattr(scaler, 'mean_'):
+        # RobustScaler / StandardScaler; with_mean/with_std=False keep mean_/scale_ but skip that step
+        center = getattr(scaler, 'center_', None) if hasattr(scaler, 'center_') else scaler.mean_
+        scale = getattr(scaler, 'scale_', None)
+        if not getattr(scaler, 'with_mean', True):
+            center = None
+        if not getattr(scaler, 'with_std', True):
+            scale = None
+    elif hasattr(scaler, 'min_'):
+        # MinMaxScaler: X * scale_ + min_
+        center = -scaler.min_ / scaler.scale_
+        scale = 1.0 / scaler.scale_
+    else:
+        raise TypeError(f"Unsupported scaler type: {type(scaler).__name__}")
+
+    center = np.zeros(n_features) if center is None else np.asarray(center, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+    return center, scale
+
+
+def resolve_classifier_layout(classifier, n_features: int, training_config: Optional[dict] = None) -> Tuple[int, bool]:
+    """Return (classifier input width, whether the cluster label is appended)
+
+    Same rules ``/analyze`` used to apply on every request: trust
+    ``training_config`` when present, otherwise add the cluster column only
+    if that is what makes the width match ``n_features_in_``. Any remaining
+    mismatch is truncated or zero-padded.
+    """
+    includes_cluster = bool(training_config and training_config.get('includes_cluster', False))
+    if training_config and 'n_features' in training_config:
+        expected = int(training_config['n_features'])
+    else:
+        expected = int(getattr(classifier, 'n_features_in_', n_features + includes_cluster))
+
+    if not includes_cluster and expected != n_features:
+        includes_cluster = True
+
+    actual = n_features + includes_cluster
+    if actual > expected:
+        logger.warning(f"Classifier expects {expected} features, got {actual}: truncating")
+    elif actual < expected:
+        logger.warning(f"Classifier expects {expected} features, got {actual}: zero-padding")
+    return expected, includes_cluster
+
+
+def labels_follow_proba(classifier) -> bool:
+    """Whether ``predict`` is the argmax of ``predict_proba`` (flattened forests and sklearn trees)
+
+    Not so in general: the Platt-scaled probabilities of ``SVC(probability=True)``
+    can disagree with its decision function, so such labels come from ``predict``.
+    """
+    return hasattr(classifier, 'predict_with_proba') or isinstance(
+        classifier, (RandomForestClassifier, ExtraTreesClassifier, DecisionTreeClassifier))
+
+
+class CompiledPipeline:
+    """scaler -> PCA -> KMeans -> classifier compiled into fixed arrays"""
+
+    def __init__(self, scaler, pca, kmeans, classifier, feature_names: Sequence[str], training_config: Optional[dict] = None):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.classifier = classifier
+        self.use_small_batch_classifier(None, 0)
+
+        # Scaler: X_scaled = (X - center) / scale
+        self.center, self.scale = scaler_affine(scaler, self.n_features)
+
+        # PCA on the scaled features, folded into one affine map of the raw features
+        components = np.asarray(pca.components_, dtype=np.float64)
+        projection = components.T.copy()
+        offset = -np.asarray(pca.mean_, dtype=np.float64) @ components.T
+        if getattr(pca, 'whiten', False):
+            std = np.sqrt(pca.explained_variance_)
+            projection /= std
+            offset /= std
+        self.weights = projection / self.scale[:, None]
+        self.bias = offset - (self.center / self.scale) @ projection
+
+        # KMeans: argmin ||z - c||^2 == argmin (||c||^2 - 2 z.c)
+        centers = np.asarray(kmeans.cluster_centers_, dtype=np.float64)
+        self.centroids_t = -2.0 * centers.T
+        self.centroid_sq_norms = np.einsum('ij,ij->i', centers, centers)
+        self.n_clusters = len(centers)
+
+        # Classifier input layout, fixed once
+        n_classifier_features, includes_cluster = resolve_classifier_layout(
+            classifier, self.n_features, training_config)
+        self._set_classifier_layout(n_classifier_features, includes_cluster)
+
+    # Arrays that fully describe the compiled scaler/PCA/KMeans (see services.shared_weights)
+    ARRAY_NAMES = ('center', 'scale', 'weights', 'bias', 'centroids_t', 'centroid_sq_norms')
+
+    def to_arrays(self) -> Tuple[dict, dict]:
+        """(arrays, JSON metadata) from which ``from_arrays`` rebuilds this pipeline"""
+        arrays = {name: getattr(self, name) for name in self.ARRAY_NAMES}
+        meta = {
+            'feature_names': self.feature_names,
+            'n_classifier_features': self.n_classifier_features,
+            'includes_cluster': self.includes_cluster,
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, meta: dict, classifier) -> 'CompiledPipeline':
+        """Rebuild from ``to_arrays`` output (e.g. read-only memory maps) without the sklearn objects"""
+        pipeline = cls.__new__(cls)
+        pipeline.feature_names = list(meta['feature_names'])
+        pipeline.n_features = len(pipeline.feature_names)
+        pipeline.classifier = classifier
+        pipeline.use_small_batch_classifier(None, 0)
+        for name in cls.ARRAY_NAMES:
+            setattr(pipeline, name, arrays[name])
+        pipeline.n_clusters = len(pipeline.centroid_sq_norms)
+        pipeline._set_classifier_layout(int(meta['n_classifier_features']), bool(meta['includes_cluster']))
+        return pipeline
+
+    def _set_classifier_layout(self, n_classifier_features: int, includes_cluster: bool):
+        self.n_classifier_features = n_classifier_features
+        self.includes_cluster = includes_cluster
+        self.n_copied = min(self.n_features, self.n_classifier_features)
+        self.cluster_column = self.n_features if self.includes_cluster and self.n_features < self.n_classifier_features else None
+        self.classes = getattr(self.classifier, 'classes_', None)
+        self.has_proba = hasattr(self.classifier, 'predict_proba') and self.classes is not None
+
+        # Cached per-layout alignment maps (feature_names -> input column positions)
+        self._alignment = lru_cache(maxsize=16)(self._build_alignment)
+
+    def _build_alignment(self, columns: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        position = {col: i for i, col in enumerate(columns)}
+        missing = [feat for feat in self.feature_names if feat not in position]
+        extra = sorted(set(columns) - set(self.feature_names))
+        if missing:
+            logger.warning(f"Adding missing features with zeros: {missing}")
+        if extra:
+            logger.warning(f"Removing extra features: {extra}")
+        dst = np.array([i for i, feat in enumerate(self.feature_names) if feat in position], dtype=np.intp)
+        src = np.array([position[self.feature_names[i]] for i in dst], dtype=np.intp)
+        return dst, src
+
+    def align(self, features: pd.DataFrame) -> np.ndarray:
+        """Feature matrix in training column order; missing features are zeros"""
+        values = features.to_numpy()
+        if tuple(features.columns) == tuple(self.feature_names):
+            return values
+        dst, src = self._alignment(tuple(features.columns))
+        aligned = np.zeros((len(values), self.n_features), dtype=values.dtype if values.dtype.kind == 'f' else np.float64)
+        aligned[:, dst] = values[:, src]
+        return aligned
+
+    def project(self, X: np.ndarray) -> np.ndarray:
+        """PCA coordinates of raw (unscaled) features"""
+        weights = self.weights.astype(X.dtype, copy=False)
+        Z = X @ weights
+        Z += self.bias.astype(X.dtype, copy=False)
+        return Z
+
+    def assign_clusters(self, Z: np.ndarray) -> np.ndarray:
+        """Nearest centroid in PCA space"""
+        distances = Z @ self.centroids_t.astype(Z.dtype, copy=False)
+        distances += self.centroid_sq_norms.astype(Z.dtype, copy=False)
+        return distances.argmin(axis=1)
+
+    def classifier_input(self, X: np.ndarray, clusters: np.ndarray) -> np.ndarray:
+        """Scaled features (+ cluster, + zero padding) in one float32 buffer"""
+        buffer = np.zeros((len(X), self.n_classifier_features), dtype=np.float32)
+        n = self.n_copied
+        # Scale in the input precision and round once into the buffer (matches scaler.transform)
+        np.divide(X[:, :n] - self.center[:n].astype(X.dtype, copy=False),
+                  self.scale[:n].astype(X.dtype, copy=False),
+                  out=buffer[:, :n], casting='same_kind')
+        if self.cluster_column is not None:
+            buffer[:, self.cluster_column] = clusters
+        return buffer
+
+    def predict(self, X: np.ndarray, classify: bool = True) -> InferenceResult:
+        """Run the whole pipeline on an aligned feature matrix
+
+        float32 input runs every step in float32; float64 input keeps the
+        projection and cluster assignment in float64.
+        """
+        if X.dtype not in (np.float32, np.float64):
+            X = X.astype(np.float64)
+        Z = self.project(X)
+        clusters = self.assign_clusters(Z)
+        if not classify:
+            return InferenceResult(clusters, Z, None, None)
+
+        labels, proba = self.classify(X, clusters)
+        return InferenceResult(clusters, Z, labels, proba)
+
+    def use_small_batch_classifier(self, classifier, max_rows: int):
+        """Score batches of up to ``max_rows`` rows with ``classifier`` instead
+
+        Meant for an equivalent model with less per-call overhead but slower
+        per-row scoring, such as the flattened trees of ``services.shared_weights``.
+        """
+        self.small_batch_classifier = classifier if max_rows > 0 else None
+        self.small_batch_max_rows = max_rows
+
+    def classifier_for(self, n_rows: int):
+        if self.small_batch_classifier is not None and n_rows <= self.small_batch_max_rows:
+            return self.small_batch_classifier
+        return self.classifier
+
+    def classify(self, X: np.ndarray, clusters: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Labels and probabilities, from a single pass over the classifier where its labels allow"""
+        X_cls = self.classifier_input(X, clusters)
+        classifier = self.classifier_for(len(X_cls))
+        if not self.has_proba:
+            return classifier.predict(X_cls), None
+        proba = classifier.predict_proba(X_cls)
+        if labels_follow_proba(classifier):
+            return self.classes[proba.argmax(axis=1)], proba
+        return classifier.predict(X_cls), proba
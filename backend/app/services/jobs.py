@@ -0,0 +1,310 @@
+"""Asynchronous analysis jobs backed by the local SQLite job store.
+
+``POST /jobs`` spools the upload into the job directory, records a queued
+job and returns right away; a ``JobRunner`` in every API process claims
+queued jobs (at most ``concurrency`` at a time per process) and runs them
+through the analysis pool. Because the job table and the spooled uploads
+are on disk, queued work survives a restart: jobs that were running in a
+process that is gone are put back in the queue (up to ``max_attempts``).
+
+Finished results are stored as ``analysis.dump_result`` payloads next to
+the uploads and expire after a TTL; beyond ``results_max_bytes`` the oldest
+results expire early. Expired jobs keep their row (status ``expired``) for
+another TTL so clients get a clear answer instead of an unknown id.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from core.security import private_directory
+from db.session import connect, session, transaction
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = "queued", "running", "done", "failed", "expired"
+FINISHED = (DONE, FAILED)
+RESULT_SUFFIX = ".result"
+
+
+def process_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """Whether the API process that claimed a job still runs (other hosts are assumed alive)"""
+    if not owner or owner == process_owner():
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def report_progress(db_path: str, job_id: str, fraction: float):
+    """Progress callback for the analysis worker (module level so it pickles)"""
+    with session(db_path) as connection:
+        connection.execute("UPDATE jobs SET progress = ? WHERE id = ? AND status = ?",
+                           (round(float(fraction), 4), job_id, RUNNING))
+
+
+class JobStore:
+    """Job rows in SQLite plus the spooled uploads and result payloads on disk"""
+
+    def __init__(self, db_path: str, directory: str, result_ttl_seconds: float,
+                 results_max_bytes: int, max_attempts: int = 3):
+        self.db_path = db_path
+        self.directory = directory
+        self.result_ttl_seconds = result_ttl_seconds
+        self.results_max_bytes = results_max_bytes
+        self.max_attempts = max_attempts
+        # Results are unpickled from the paths the job table points at, so both must be private
+        private_directory(directory)
+        private_directory(os.path.dirname(os.path.abspath(db_path)))
+        self._connection = connect(db_path)
+        self._lock = threading.Lock()
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def upload_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.csv")
+
+    def create(self, job_id: str, filename: Optional[str], upload_path: str, upload_bytes: int,
+               result_handle: str) -> dict:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, filename, upload_path, upload_bytes, result_handle, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, upload_path, upload_bytes, result_handle, time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def queue_position(self, job: dict) -> Optional[int]:
+        """Jobs ahead of a queued job (0 = next)"""
+        if job["status"] != QUEUED:
+            return None
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, job["created_at"])
+            ).fetchone()[0]
+
+    def pending(self) -> int:
+        """Queued and running jobs across all processes"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+
+    def claim(self, owner: str) -> Optional[dict]:
+        """Move the oldest queued job to running for ``owner``"""
+        with self._lock, transaction(self._connection) as connection:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, progress = 0, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (RUNNING, owner, time.time(), row["id"]),
+            )
+        return self.get(row["id"])
+
+    def complete(self, job_id: str, payload: bytes):
+        """Store the result payload and mark the job done"""
+        path = os.path.join(self.directory, f"{job_id}{RESULT_SUFFIX}")
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(payload)
+        os.replace(f"{path}.tmp", path)
+        now = time.time()
+        self._finish(job_id, "UPDATE jobs SET status = ?, result_path = ?, result_bytes = ?, progress = 1, "
+                             "finished_at = ?, expires_at = ? WHERE id = ?",
+                     (DONE, path, len(payload), now, now + self.result_ttl_seconds, job_id))
+        self.purge()
+
+    def fail(self, job_id: str, status_code: int, detail: str):
+        now = time.time()
+        self._finish(job_id, "UPDATE jobs SET status = ?, status_code = ?, error = ?, finished_at = ?, "
+                             "expires_at = ? WHERE id = ?",
+                     (FAILED, status_code, detail, now, now + self.result_ttl_seconds, job_id))
+
+    def _finish(self, job_id: str, statement: str, parameters: tuple):
+        job = self.get(job_id)
+        with self._lock:
+            self._connection.execute(statement, parameters)
+        # The upload is no longer needed once a job has an outcome
+        if job is not None and job["upload_path"]:
+            remove_file(job["upload_path"])
+
+    def read_result(self, job: dict) -> Optional[bytes]:
+        try:
+            with open(job["result_path"], "rb") as f:
+                return f.read()
+        except (OSError, TypeError):
+            return None
+
+    def recover(self):
+        """Requeue jobs left running by a process that is gone (called once at start-up)"""
+        with self._lock:
+            rows = self._connection.execute("SELECT id, owner, attempts FROM jobs WHERE status = ?",
+                                            (RUNNING,)).fetchall()
+        for row in rows:
+            if owner_alive(row["owner"]):
+                continue
+            if row["attempts"] >= self.max_attempts:
+                logger.warning(f"Job {row['id']} interrupted {row['attempts']} times - giving up")
+                self.fail(row["id"], 500, "The analysis was interrupted too many times")
+                continue
+            logger.info(f"Requeueing job {row['id']} interrupted by a restart")
+            with self._lock:
+                self._connection.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, progress = 0 WHERE id = ? AND status = ?",
+                    (QUEUED, row["id"], RUNNING))
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Expire results past their TTL or beyond the size bound; returns the number expired"""
+        now = time.time() if now is None else now
+        with self._lock:
+            finished = self._connection.execute(
+                "SELECT id, status, result_path, result_bytes, expires_at FROM jobs "
+                "WHERE status IN (?, ?) ORDER BY finished_at DESC", FINISHED).fetchall()
+            # Keep the newest results that fit; everything past the TTL goes regardless
+            expired, kept_bytes = [], 0
+            for row in finished:
+                if row["expires_at"] <= now:
+                    expired.append(row)
+                    continue
+                kept_bytes += row["result_bytes"]
+                if row["result_bytes"] and kept_bytes > self.results_max_bytes:
+                    expired.append(row)
+            self._connection.executemany(
+                "UPDATE jobs SET status = ?, result_path = NULL, expires_at = ? WHERE id = ?",
+                [(EXPIRED, now + self.result_ttl_seconds, row["id"]) for row in expired])
+            self._connection.execute("DELETE FROM jobs WHERE status = ? AND expires_at <= ?", (EXPIRED, now))
+        for row in expired:
+            if row["result_path"]:
+                remove_file(row["result_path"])
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) AS n, SUM(result_bytes) AS bytes FROM jobs GROUP BY status").fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        return {
+            "jobs": counts,
+            "result_bytes": sum(row["bytes"] or 0 for row in rows if row["status"] == DONE),
+            "results_max_bytes": self.results_max_bytes,
+            "result_ttl_seconds": self.result_ttl_seconds,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def remove_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class JobRunner:
+    """Claims queued jobs and runs at most ``concurrency`` of them at once in this process
+
+    ``execute(job)`` runs one job and returns the result payload; an
+    exception fails the job with its ``status_code``/``detail`` if it has
+    them (``AnalysisError``), 500 otherwise. The store is polled every
+    ``poll_seconds`` so jobs submitted to other API processes are picked up
+    too; ``wake()`` skips the wait after a local submit.
+    """
+
+    def __init__(self, store: JobStore, execute: Callable[[dict], Awaitable[bytes]],
+                 concurrency: int, poll_seconds: float):
+        self.store = store
+        self.execute = execute
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.owner = process_owner()
+        self._running = set()
+        self._task = None
+        self._wake = None
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self.store.recover()
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def shutdown(self):
+        """Stop claiming; running jobs are abandoned and requeued by the next start-up"""
+        tasks = [task for task in (self._task, *self._running) if task is not None]
+        self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _dispatch(self):
+        while True:
+            try:
+                self.store.purge()
+                while len(self._running) < self.concurrency:
+                    job = self.store.claim(self.owner)
+                    if job is None:
+                        break
+                    task = asyncio.get_running_loop().create_task(self._run(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._job_done)
+            except Exception as e:
+                logger.error(f"Job dispatch failed: {str(e)}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _job_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        self.wake()
+
+    async def _run(self, job: dict):
+        started = time.perf_counter()
+        try:
+            payload = await self.execute(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status_code = getattr(e, "status_code", 500)
+            detail = getattr(e, "detail", None) or str(e)
+            logger.error(f"Job {job['id']} failed: {detail}")
+            await asyncio.to_thread(self.store.fail, job["id"], status_code, detail)
+            return
+        await asyncio.to_thread(self.store.complete, job["id"], payload)
+        logger.info(f"Job {job['id']} done in {time.perf_counter() - started:.1f}s")
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "running": self.running, **self.store.stats()}
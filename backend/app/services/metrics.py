@@ -0,0 +1,316 @@
+"""Per-stage latency, throughput and memory metrics in the Prometheus text format.
+
+``stage(name)`` times one step of an analysis (parsing, features,
+transforms, classification, serialization, ...). Timings add up in the
+``Trace`` of the current request, a context variable that follows the
+request into ``asyncio.to_thread`` calls. Analyses in pool workers run
+under ``traced``, which gives them a trace of their own and ships it back
+with the result. When the request ends, its trace is turned into one
+histogram observation per stage. Work done outside any request is
+observed right away under the route ``-``. This is mostly the batched
+model passes on the micro-batcher thread, shared by several requests.
+
+Peak memory is the rise of the process's peak RSS over an analysis,
+not traced allocations. ``reset_peak_rss`` makes that cheap enough to
+leave on. It is exact in a process worker, which runs one analysis at a
+time. In thread mode, concurrent analyses share the process and see each
+other's allocations.
+
+Metrics live in the process that serves ``/metrics``. With several API
+processes, scrape each one.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from core.logging import request_id_var
+from services.process_memory import peak_rss, reset_peak_rss
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+BYTES_BUCKETS = tuple(float(64 * 1024 * 4 ** i) for i in range(10))  # 64 KiB .. 16 GiB
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """One metric family; samples are keyed by their label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            yield from self._samples(key, value)
+
+    def _samples(self, key, value) -> Iterator[str]:
+        yield f"{self.name}{_label_text(self.label_names, key)} {_number(value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = SECONDS_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (+Inf last), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key, state) -> Iterator[str]:
+        counts, total, count = state
+        cumulative = 0
+        for bound, n in zip((*self.buckets, float("inf")), counts):
+            cumulative += n
+            labels = _label_text(self.label_names, key, f'le="{_number(bound)}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _label_text(self.label_names, key)
+        yield f"{self.name}_sum{labels} {_number(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "codon_http_request_duration_seconds", "Wall time of HTTP requests, body sent included",
+    ("route", "method", "status")))
+HTTP_REQUEST_BYTES = REGISTRY.register(Counter(
+    "codon_http_request_bytes_total", "Uploaded bytes spooled by the API", ("route",)))
+HTTP_RESPONSE_BYTES = REGISTRY.register(Counter(
+    "codon_http_response_bytes_total", "Response body bytes sent", ("route",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "codon_analysis_stage_seconds", "Wall time per analysis stage and request", ("route", "stage")))
+ANALYSIS_ROWS = REGISTRY.register(Counter(
+    "codon_analysis_rows_total", "Species rows scored", ("route",)))
+ANALYSIS_PEAK_MEMORY = REGISTRY.register(Histogram(
+    "codon_analysis_peak_memory_bytes", "Rise of the peak RSS over one analysis", ("route",), BYTES_BUCKETS))
+ANALYSES = REGISTRY.register(Counter(
+    "codon_analyses_total", "Analyses answered, by where the result came from (cache or computed)",
+    ("route", "source")))
+
+# Filled in by /metrics at scrape time
+POOL_IN_FLIGHT = REGISTRY.register(Gauge(
+    "codon_analysis_pool_in_flight", "Analyses running or waiting in the analysis pool"))
+JOBS = REGISTRY.register(Gauge("codon_jobs", "Jobs in the job store by status", ("status",)))
+RESULT_CACHE_BYTES = REGISTRY.register(Gauge("codon_result_cache_bytes", "Bytes held by the in-process result cache"))
+RESIDENT_MEMORY = REGISTRY.register(Gauge(
+    "codon_process_resident_memory_bytes", "Resident memory of the API process and its analysis workers",
+    ("process",)))
+
+# Work outside a request (batched model passes, background jobs without a trace)
+NO_ROUTE = "-"
+
+
+class Trace:
+    """What one request (or one pool call) spent, added up per stage"""
+
+    __slots__ = ("request_id", "stages", "rows", "bytes_in", "peak_memory_bytes", "source", "profile")
+
+    def __init__(self, request_id: str = NO_ROUTE):
+        self.request_id = request_id
+        self.stages: Dict[str, float] = {}
+        self.rows = 0
+        self.bytes_in = 0
+        self.peak_memory_bytes: Optional[int] = None
+        self.source: Optional[str] = None
+        # services.profiling.Profile while a request is profiled (stage enter/exit hooks)
+        self.profile = None
+
+    def add(self, stage_name: str, seconds: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def merge(self, other: "Trace"):
+        """Fold in the trace of a pool call made for this request"""
+        for stage_name, seconds in other.stages.items():
+            self.add(stage_name, seconds)
+        self.rows += other.rows
+        self.bytes_in += other.bytes_in
+        if other.peak_memory_bytes is not None:
+            self.peak_memory_bytes = max(self.peak_memory_bytes or 0, other.peak_memory_bytes)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("analysis_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def start_trace(request_id: str):
+    """Make a new trace current; returns ``(trace, token)`` for ``end_trace``"""
+    trace = Trace(request_id)
+    return trace, _trace.set(trace)
+
+
+def end_trace(token):
+    _trace.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as analysis stage ``name``"""
+    trace = _trace.get()
+    profile = trace.profile if trace is not None else None
+    if profile is not None:
+        profile.enter(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if profile is not None:
+            profile.exit(name)
+        if trace is None:
+            STAGE_SECONDS.observe(elapsed, route=NO_ROUTE, stage=name)
+        else:
+            trace.add(name, elapsed)
+
+
+def add_rows(n_rows: int):
+    trace = _trace.get()
+    if trace is not None:
+        trace.rows += n_rows
+    else:
+        ANALYSIS_ROWS.inc(n_rows, route=NO_ROUTE)
+
+
+def add_bytes_in(n_bytes: int):
+    trace = _trace.get()
+    if trace is not None:
+        trace.bytes_in += n_bytes
+
+
+def set_source(source: str):
+    """Where the request's result came from (``cache``/``computed``), for ``codon_analyses_total``"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.source = source
+
+
+def traced(request_id: str, fn: Callable, *args):
+    """Run ``fn(*args)`` under a trace of its own and its peak memory; returns ``(result, trace)``
+
+    Entry point for pool workers (module level so it pickles): the trace
+    travels back with the result and is merged into the request's.
+    """
+    trace, token = start_trace(request_id)
+    id_token = request_id_var.set(request_id)
+    baseline = reset_peak_rss()
+    try:
+        result = fn(*args)
+    finally:
+        request_id_var.reset(id_token)
+        end_trace(token)
+    if baseline is not None:
+        peak = peak_rss()
+        if peak is not None:
+            trace.peak_memory_bytes = max(peak - baseline, 0)
+    return result, trace
+
+
+def observe(trace: Trace, route: str):
+    """Turn a finished trace into histogram observations"""
+    for stage_name, seconds in trace.stages.items():
+        STAGE_SECONDS.observe(seconds, route=route, stage=stage_name)
+    if trace.rows:
+        ANALYSIS_ROWS.inc(trace.rows, route=route)
+    if trace.bytes_in:
+        HTTP_REQUEST_BYTES.inc(trace.bytes_in, route=route)
+    if trace.peak_memory_bytes is not None:
+        ANALYSIS_PEAK_MEMORY.observe(trace.peak_memory_bytes, route=route)
+    if trace.source is not None:
+        ANALYSES.inc(route=route, source=trace.source)
+
+
+def timed(stage_name: str, fn: Callable, *args):
+    """``fn(*args)`` timed as ``stage_name`` (for ``asyncio.to_thread``)"""
+    with stage(stage_name):
+        return fn(*args)
+
+
+def timed_chunks(chunks: Iterable, stage_name: str) -> Iterator:
+    """Yield from ``chunks``, timing each step as ``stage_name`` (lazily encoded responses)"""
+    iterator = iter(chunks)
+    while True:
+        with stage(stage_name):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def observe_request(route: str, method: str, status: int, seconds: float, response_bytes: int):
+    HTTP_REQUEST_SECONDS.observe(seconds, route=route, method=method, status=str(status))
+    if response_bytes:
+        HTTP_RESPONSE_BYTES.inc(response_bytes, route=route)
@@ -0,0 +1,54 @@
+"""Loading and re-saving the ``models/`` artifacts.
+
+Artifacts written by ``joblib.dump`` without compression keep their NumPy
+arrays as raw buffers inside the file, so ``joblib.load(mmap_mode='r')``
+maps them read-only instead of copying: loading is cheaper and every
+process that maps the same file shares the pages through the OS cache.
+Compressed artifacts still load, just without the mapping; re-save them
+once with::
+
+    python -m services.model_store --model-dir models
+"""
+import argparse
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def load_artifact(path: str, mmap: bool = True):
+    """joblib.load with arrays memory-mapped when the file allows it"""
+    import joblib  # deferred: only needed while (re)loading models
+
+    return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+def save_artifact(obj, path: str):
+    """Uncompressed joblib dump (the mmap-able layout), written atomically"""
+    import joblib
+
+    tmp_path = f"{path}.tmp"
+    joblib.dump(obj, tmp_path, compress=0)
+    os.replace(tmp_path, path)
+
+
+def resave_artifacts(model_dir: str) -> list:
+    """Rewrite every .pkl in ``model_dir`` in the mmap-able layout"""
+    saved = []
+    for name in sorted(os.listdir(model_dir)):
+        if not name.endswith(".pkl"):
+            continue
+        path = os.path.join(model_dir, name)
+        save_artifact(load_artifact(path, mmap=False), path)
+        saved.append(name)
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-save model artifacts so they can be memory-mapped")
+    parser.add_argument("--model-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for name in resave_artifacts(args.model_dir):
+        logger.info(f"Re-saved {name}")
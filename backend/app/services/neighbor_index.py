@@ -0,0 +1,255 @@
+"""Nearest reference species in PCA space, from an index stored next to the models.
+
+The reference table (the training species) is scored through the serving
+pipeline once, when training finishes, and its PCA coordinates are written
+into the model directory:
+
+* ``neighbor_vectors.npy`` - float32 coordinates, one row per reference
+  species; L2-normalized for the ``cosine`` metric
+* ``neighbor_metadata.npy`` - structured array with the species' metadata
+  (SpeciesName, SpeciesID, Kingdom and Phylum/DNAtype where present)
+* ``neighbor_index.json`` - metric, dimensions and a digest of the PCA
+  projection the vectors were made with
+
+Both arrays are memory-mapped at load time. With at most a few dozen PCA
+components an exact scan is one matrix product per block of reference rows
+(``NEIGHBORS_BLOCK_ROWS``), which answers a query against tens of
+thousands of species in about a millisecond, so there is no approximate
+structure to tune or to drift from the exact answer.
+
+Since the files sit in the model directory they are part of the model
+version: rebuilding the index makes the API reload like any other
+artifact change, and an index built for another PCA is not loaded.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core import config
+from services.feature_engine import compute_features, fit_reference_stats
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "neighbor_index.json"
+VECTORS_FILE = "neighbor_vectors.npy"
+METADATA_FILE = "neighbor_metadata.npy"
+INDEX_FORMAT_VERSION = 1
+METRICS = ("cosine", "euclidean")
+# Reference metadata returned with every neighbour, when the table has the column
+METADATA_COLUMNS = ("SpeciesName", "SpeciesID", "Kingdom", "Phylum", "DNAtype")
+
+
+def projection_digest(pipeline) -> str:
+    """Identifies the PCA space of a CompiledPipeline (its folded scaler+PCA map)"""
+    digest = hashlib.sha256()
+    for array in (pipeline.weights, pipeline.bias):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def metadata_records(table: pd.DataFrame) -> np.ndarray:
+    """Structured array of the ``METADATA_COLUMNS`` present in ``table`` (no objects, so it maps)"""
+    columns = [col for col in METADATA_COLUMNS if col in table.columns]
+    fields = []
+    for col in columns:
+        values = table[col].to_numpy()
+        if values.dtype.kind in "iub":
+            fields.append(values.astype(np.int64))
+        elif values.dtype.kind == "f":
+            fields.append(values.astype(np.float64))
+        else:
+            fields.append(values.astype(str))
+    if not fields:
+        # No metadata at all: neighbours are identified by their row in the reference table
+        columns, fields = ["row"], [np.arange(len(table), dtype=np.int64)]
+    return np.rec.fromarrays(fields, names=columns).view(np.ndarray)
+
+
+class NeighborIndex:
+    """Exact top-k search over reference vectors (cosine similarity or euclidean distance)"""
+
+    def __init__(self, vectors: np.ndarray, metadata: np.ndarray, metric: str = "cosine",
+                 digest: Optional[str] = None, block_rows: Optional[int] = None):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+        self.vectors = vectors
+        self.metadata = metadata
+        self.metric = metric
+        self.digest = digest
+        self.block_rows = block_rows or config.NEIGHBORS_BLOCK_ROWS
+        # ||v||^2 per reference row for euclidean distances (cosine vectors are unit length)
+        self.sq_norms = np.einsum("ij,ij->i", vectors, vectors) if metric == "euclidean" else None
+
+    @classmethod
+    def from_vectors(cls, Z: np.ndarray, metadata: np.ndarray, metric: str = "cosine",
+                     digest: Optional[str] = None) -> "NeighborIndex":
+        vectors = np.asarray(Z, dtype=np.float32)
+        if metric == "cosine":
+            vectors = normalize_rows(vectors)
+        return cls(np.ascontiguousarray(vectors), metadata, metric, digest)
+
+    @property
+    def n_reference(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def n_components(self) -> int:
+        return self.vectors.shape[1]
+
+    def query(self, Z: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(reference row ids, scores), each (n_queries, k), best first
+
+        Scores are cosine similarities (higher is closer) or euclidean
+        distances (lower is closer); ties go to the lower reference row.
+        """
+        Z = np.asarray(Z, dtype=np.float32)
+        if Z.ndim != 2 or Z.shape[1] != self.n_components:
+            raise ValueError(f"Queries must have {self.n_components} components, got shape {Z.shape}")
+        k = min(k, self.n_reference)
+        if self.metric == "cosine":
+            Z = normalize_rows(Z)
+        else:
+            query_sq = np.einsum("ij,ij->i", Z, Z)[:, None]
+
+        # Running top-k as "smaller is better" keys, merged block by block
+        best_keys = np.zeros((len(Z), 0), dtype=np.float32)
+        best_ids = np.zeros((len(Z), 0), dtype=np.int64)
+        for start in range(0, self.n_reference, self.block_rows):
+            block = self.vectors[start:start + self.block_rows]
+            keys = Z @ block.T
+            if self.metric == "cosine":
+                np.negative(keys, out=keys)
+            else:
+                keys *= -2
+                keys += query_sq
+                keys += self.sq_norms[start:start + len(block)]
+            keys, ids = smallest(keys, np.arange(start, start + len(block)), k)
+            best_keys, best_ids = smallest(np.concatenate([best_keys, keys], axis=1),
+                                           np.concatenate([best_ids, ids], axis=1), k)
+
+        # Best first, then lower row id (lexsort: last key is primary)
+        order = np.lexsort((best_ids, best_keys), axis=1)
+        best_keys = np.take_along_axis(best_keys, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        if self.metric == "cosine":
+            scores = -best_keys
+        else:
+            scores = np.sqrt(np.maximum(best_keys, 0))
+        return best_ids, scores
+
+    def neighbors(self, Z: np.ndarray, k: int) -> List[List[dict]]:
+        """Top-k neighbours of every query row as JSON-ready dicts with the reference metadata"""
+        ids, scores = self.query(Z, k)
+        score_name = "similarity" if self.metric == "cosine" else "distance"
+        names = self.metadata.dtype.names
+        results = []
+        for row_ids, row_scores in zip(ids, scores):
+            rows = self.metadata[row_ids]
+            results.append([
+                {"rank": rank + 1, score_name: float(score), **{name: row[name].item() for name in names}}
+                for rank, (row, score) in enumerate(zip(rows, row_scores))
+            ])
+        return results
+
+    def save(self, model_dir: str) -> str:
+        """Write the index files into ``model_dir``; the JSON goes last, so readers never see half an index"""
+        os.makedirs(model_dir, exist_ok=True)
+        np.save(os.path.join(model_dir, VECTORS_FILE), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        np.save(os.path.join(model_dir, METADATA_FILE), self.metadata, allow_pickle=False)
+        meta = {
+            "format": INDEX_FORMAT_VERSION,
+            "metric": self.metric,
+            "n_reference": self.n_reference,
+            "n_components": self.n_components,
+            "projection": self.digest,
+        }
+        path = os.path.join(model_dir, INDEX_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+        logger.info(f"Saved neighbour index of {self.n_reference} species ({self.metric}) to {model_dir}")
+        return path
+
+    @classmethod
+    def load(cls, model_dir: str, mmap: bool = True, pipeline=None) -> Optional["NeighborIndex"]:
+        """Map the index stored in ``model_dir``; None if there is none or it belongs to another PCA"""
+        path = os.path.join(model_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT_VERSION:
+            logger.warning(f"{INDEX_FILE} has format {meta.get('format')}, expected {INDEX_FORMAT_VERSION} - rebuild it")
+            return None
+        if pipeline is not None and meta.get("projection") != projection_digest(pipeline):
+            logger.warning(f"{INDEX_FILE} was built for other PCA weights - rebuild it to serve /similar")
+            return None
+        mmap_mode = "r" if mmap else None
+        vectors = np.load(os.path.join(model_dir, VECTORS_FILE), mmap_mode=mmap_mode)
+        metadata = np.load(os.path.join(model_dir, METADATA_FILE), mmap_mode=mmap_mode, allow_pickle=False)
+        return cls(vectors, metadata, meta["metric"], meta.get("projection"))
+
+
+def smallest(keys: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k smallest keys of every row and their ids (``ids`` per row, or one row for all), unordered"""
+    ids = np.broadcast_to(ids, keys.shape)
+    if keys.shape[1] <= k:
+        return keys, ids
+    keep = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(keys, keep, axis=1), np.take_along_axis(ids, keep, axis=1)
+
+
+def normalize_rows(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return X / norms
+
+
+def build_index(codon_table: pd.DataFrame, pipeline, reference: Optional[dict] = None,
+                metric: Optional[str] = None) -> NeighborIndex:
+    """Index a reference codon table (5 metadata columns + codons) in ``pipeline``'s PCA space
+
+    Without ``reference`` the table's own statistics are used, which gives
+    the same features as scoring the whole table in batch mode.
+    """
+    raw_features = codon_table[codon_table.columns[5:]]
+    reference = reference if reference is not None else fit_reference_stats(raw_features)
+    features = compute_features(raw_features, reference=reference)
+    Z = pipeline.project(pipeline.align(features))
+    return NeighborIndex.from_vectors(
+        Z, metadata_records(codon_table.loc[features.index]),
+        metric or config.NEIGHBORS_METRIC, projection_digest(pipeline),
+    )
+
+
+def build_model_index(codon_table: pd.DataFrame, model_dir: Optional[str] = None,
+                      metric: Optional[str] = None) -> NeighborIndex:
+    """Build the index with the models in ``model_dir`` and save it there"""
+    from services import analysis
+
+    model_dir = model_dir or config.MODEL_DIR
+    if not analysis.load_models(model_dir):
+        raise RuntimeError(f"Could not load the models in {model_dir}")
+    index = build_index(codon_table, analysis.compiled_pipeline, analysis.reference_stats, metric)
+    index.save(model_dir)
+    return index
+
+
+if __name__ == "__main__":
+    # python -m services.neighbor_index codon_usage.csv --model-dir models  (run from backend/app)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index the reference species for /similar")
+    parser.add_argument("reference_csv")
+    parser.add_argument("--model-dir", default=config.MODEL_DIR)
+    parser.add_argument("--metric", choices=METRICS, default=config.NEIGHBORS_METRIC)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    index = build_model_index(pd.read_csv(args.reference_csv, low_memory=False), args.model_dir, args.metric)
+    print(f"Indexed {index.n_reference} species in {index.n_components} PCA dimensions ({index.metric})")
@@ -0,0 +1,67 @@
+"""Resident memory of the API process and its analysis workers.
+
+Reads ``/proc/<pid>/smaps_rollup`` (Linux): ``rss`` counts every resident
+page, ``pss`` splits shared pages between the processes mapping them, so
+summing ``pss`` over workers shows what the shared model weights save.
+Elsewhere only the peak RSS of the current process is available.
+
+``reset_peak_rss``/``peak_rss`` bracket one analysis to get its peak memory
+(the metrics in ``services.metrics``) without tracing allocations.
+"""
+import os
+import resource
+import sys
+from typing import Optional
+
+_FIELDS = {"Rss": "rss_bytes", "Pss": "pss_bytes", "Shared_Clean": "shared_bytes", "Shared_Dirty": "shared_bytes"}
+
+
+def process_memory(pid: Optional[int] = None) -> dict:
+    pid = pid or os.getpid()
+    usage = {"pid": pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                key = _FIELDS.get(name)
+                if key:
+                    usage[key] = usage.get(key, 0) + int(rest.split()[0]) * 1024
+        return usage
+    except (OSError, ValueError):
+        pass
+    if pid == os.getpid():
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["max_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return usage
+
+
+def _status_bytes(field: str) -> Optional[int]:
+    """A ``kB`` field of /proc/self/status (Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_peak_rss() -> Optional[int]:
+    """Reset this process's peak RSS to the current RSS and return it
+
+    None when the kernel does not allow it (not Linux, or no
+    /proc/self/clear_refs); ``peak_rss()`` is then meaningless per call.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    return _status_bytes("VmRSS:")
+
+
+def peak_rss() -> Optional[int]:
+    """Peak RSS of this process since start-up or the last ``reset_peak_rss()``"""
+    return _status_bytes("VmHWM:")
@@ -0,0 +1,279 @@
+"""On-demand profiling of one /analyze request.
+
+Admins send ``X-Profile: report`` or ``X-Profile: save`` together with
+``X-Admin-Token``. The request then runs the normal analysis code under
+``profiled``, which does two things:
+
+* A sampling profiler: a background thread reads the analysing thread's
+  stack every ``PROFILE_INTERVAL_SECONDS``. Each function gets self
+  samples (it was running) and total samples (it was on the stack), and
+  each stage gets its share of the samples. The sampler needs the GIL,
+  so C calls that hold it (pandas' JSON writer, for one) get fewer
+  samples than their wall time. Stage seconds are exact.
+* ``tracemalloc``: the peak of traced allocations inside each
+  ``metrics.stage``, plus the overall peak.
+
+A profiled request takes the same path as an unprofiled one. Large
+uploads are analysed in a pool worker; small ones are parsed and
+assembled in API threads around a model pass shared with other requests,
+which only counts its wait (``waiting_part``). Serialization is profiled
+in an API thread, and ``build_report`` merges the parts. The report also
+lists the input shapes: rows and columns read, the feature matrix, and
+the number of chunks.
+
+tracemalloc makes allocations several times slower and traces every
+thread of the process. It is only switched on for the profiled call, and
+in thread mode concurrent requests show up in the allocation figures.
+Nothing here runs unless a request asks for it.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from core.logging import request_id_var
+from core.security import private_directory
+from services import metrics
+
+MODES = ("report", "save")
+REPORT_SUFFIX = ".profile.json"
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float, profile: Optional["Profile"] = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.profile = profile
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame):
+        self.samples += 1
+        if self.profile is not None:
+            self.profile.stage_samples[self.profile.current_stage or "other"] += 1
+        seen = set()
+        leaf = True
+        while frame is not None:
+            code = frame.f_code
+            key = f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+            if leaf:
+                self.self_counts[key] += 1
+                leaf = False
+            # Recursive functions count once per sample
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key] += 1
+            frame = frame.f_back
+
+
+def short_path(filename: str) -> str:
+    """Path after the last site-packages or app directory (enough to tell modules apart)"""
+    parts = filename.replace("\\", "/").split("/")
+    for marker in ("site-packages", "app"):
+        if marker in parts:
+            return "/".join(parts[len(parts) - 1 - parts[::-1].index(marker) + 1:])
+    return "/".join(parts[-2:])
+
+
+class Profile:
+    """Per-stage allocation peaks and input shapes of one profiled call (``metrics.stage`` hooks)"""
+
+    def __init__(self):
+        self.current_stage: Optional[str] = None
+        self.stage_samples: Counter = Counter()
+        self.stage_peaks: Dict[str, int] = {}
+        self.peak = 0
+        self.baseline = 0
+        self.input = {"chunks": 0, "rows": 0, "columns": 0, "feature_columns": 0, "scored_rows": 0,
+                      "model_input_width": 0}
+        self._stack: List[tuple] = []
+
+    def enter(self, name: str):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        tracemalloc.reset_peak()
+        self._stack.append((self.current_stage, current))
+        self.current_stage = name
+
+    def exit(self, name: str):
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        outer, base = self._stack.pop()
+        self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak - base)
+        self.current_stage = outer
+
+    def note_input(self, raw_shape, feature_shape, model_input_shape):
+        self.input["chunks"] += 1
+        self.input["rows"] += int(raw_shape[0])
+        self.input["columns"] = int(raw_shape[1])
+        self.input["feature_columns"] = int(feature_shape[1])
+        self.input["scored_rows"] += int(model_input_shape[0])
+        self.input["model_input_width"] = int(model_input_shape[1])
+
+
+def note_input(raw_shape, feature_shape, model_input_shape):
+    """Record the shapes of one parsed upload (or chunk) when the request is profiled"""
+    trace = metrics.current_trace()
+    if trace is not None and trace.profile is not None:
+        trace.profile.note_input(raw_shape, feature_shape, model_input_shape)
+
+
+def profiled(request_id: str, interval: float, fn: Callable, *args):
+    """Run ``fn(*args)`` under the sampler and tracemalloc; returns ``(result, profile part)``
+
+    Module level so it pickles into a pool worker. The part holds raw
+    counts; ``build_report`` merges the parts of one request. The stage
+    timings are also folded into the trace that was current (the request's,
+    or ``metrics.traced``'s in a pool worker), so they reach /metrics.
+    """
+    profile = Profile()
+    outer = metrics.current_trace()
+    trace, token = metrics.start_trace(request_id)
+    trace.profile = profile
+    id_token = request_id_var.set(request_id)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profile.baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    sampler = StackSampler(threading.get_ident(), interval, profile)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        wall = time.perf_counter() - started
+        sampler.stop()
+        profile.peak = max(profile.peak, tracemalloc.get_traced_memory()[1])
+        if started_tracing:
+            tracemalloc.stop()
+        request_id_var.reset(id_token)
+        metrics.end_trace(token)
+        if outer is not None:
+            outer.merge(trace)
+
+    part = {
+        "pid": os.getpid(),
+        "wall_seconds": wall,
+        "samples": sampler.samples,
+        "self": dict(sampler.self_counts),
+        "total": dict(sampler.total_counts),
+        "stage_seconds": dict(trace.stages),
+        "stage_samples": dict(profile.stage_samples),
+        "stage_peaks": profile.stage_peaks,
+        "peak_allocated_bytes": max(profile.peak - profile.baseline, 0),
+        "input": profile.input,
+    }
+    return result, part
+
+
+def waiting_part(stage: str, seconds: float) -> dict:
+    """A part for time spent waiting on work that is not sampled, such as a batched model pass"""
+    return {
+        "pid": os.getpid(),
+        "wall_seconds": seconds,
+        "samples": 0,
+        "self": {},
+        "total": {},
+        "stage_seconds": {stage: seconds},
+        "stage_samples": {},
+        "stage_peaks": {},
+        "peak_allocated_bytes": 0,
+        "input": Profile().input,
+    }
+
+
+def build_report(parts: List[dict], interval: float, top: int, **fields) -> dict:
+    """Merge the profile parts of one request into the JSON report"""
+    self_counts, total_counts = Counter(), Counter()
+    stages: Dict[str, dict] = {}
+    samples = 0
+    for part in parts:
+        samples += part["samples"]
+        self_counts.update(part["self"])
+        total_counts.update(part["total"])
+        for name, seconds in part["stage_seconds"].items():
+            entry = stages.setdefault(name, {"seconds": 0.0, "samples": 0, "peak_allocated_bytes": 0})
+            entry["seconds"] = round(entry["seconds"] + seconds, 6)
+            entry["samples"] += part["stage_samples"].get(name, 0)
+            entry["peak_allocated_bytes"] = max(entry["peak_allocated_bytes"], part["stage_peaks"].get(name, 0))
+    input_shapes = next((part["input"] for part in parts if part["input"]["chunks"]), parts[0]["input"])
+
+    def hot(counts: Counter) -> List[dict]:
+        return [
+            {
+                "function": key,
+                "self_samples": self_counts.get(key, 0),
+                "total_samples": total_counts.get(key, 0),
+                "self_percent": round(100.0 * self_counts.get(key, 0) / max(samples, 1), 1),
+                "total_percent": round(100.0 * total_counts.get(key, 0) / max(samples, 1), 1),
+            }
+            for key, _ in counts.most_common(top)
+        ]
+
+    return {
+        **fields,
+        "wall_seconds": round(sum(part["wall_seconds"] for part in parts), 6),
+        "peak_allocated_bytes": max(part["peak_allocated_bytes"] for part in parts),
+        "input": input_shapes,
+        "stages": stages,
+        "sampler": {"interval_seconds": interval, "samples": samples,
+                    "samples_outside_stages": sum(part["stage_samples"].get("other", 0) for part in parts),
+                    "processes": sorted({part["pid"] for part in parts})},
+        "hot_spots": hot(self_counts),
+        "cumulative": hot(total_counts),
+    }
+
+
+def save_report(directory: str, report: dict, max_reports: int) -> str:
+    """Write ``<request id>.profile.json``, keeping the newest ``max_reports`` reports"""
+    private_directory(directory)
+    path = report_path(directory, report["request_id"])
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+    reports = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(REPORT_SUFFIX)),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in reports[max_reports:]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+    return path
+
+
+def report_path(directory: str, request_id: str) -> str:
+    return os.path.join(directory, f"{request_id}{REPORT_SUFFIX}")
+
+
+def load_report(directory: str, request_id: str) -> Optional[dict]:
+    try:
+        with open(report_path(directory, request_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,210 @@
+"""Encoders for the /analyze result in the layouts clients can ask for.
+
+``records`` (default) keeps the original response shape. The per-row
+table is serialized by pandas' C JSON writer and spliced into the summary
+instead of going through ``to_dict('records')`` + ``jsonable_encoder``.
+
+* ``records``  - JSON, ``detailed_results`` as a list of row objects
+* ``columnar`` - JSON, ``detailed_results`` as ``{"columns": [...], "data": {column: [values]}}``
+* ``summary``  - JSON, distributions only (no ``detailed_results``)
+* ``ndjson``   - summary line, then one JSON object per row, streamed
+* ``parquet`` / ``arrow`` - binary table (Arrow IPC stream); needs pyarrow
+
+Streamed analyses keep their rows in a ``SpooledTable`` on disk; those are
+encoded chunk by chunk so the response never holds the full table.
+
+Every JSON summary carries a ``result_handle`` that ``GET /results/{handle}``
+accepts to fetch further pages of the detailed results.
+"""
+import io
+import json
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from services.analysis import AnalysisError, AnalysisResult
+from services.result_spool import SpooledTable
+
+FORMATS = ("records", "columnar", "summary", "ndjson", "parquet", "arrow")
+
+MEDIA_TYPES = {
+    "records": "application/json",
+    "columnar": "application/json",
+    "summary": "application/json",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Accept header values that select a format when no ?format= is given
+_ACCEPT_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonlines": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+# pandas.to_json maximum; keeps probabilities exact to ~1e-15
+DOUBLE_PRECISION = 15
+NDJSON_CHUNK_ROWS = 2000
+
+
+def negotiate(format_param: Optional[str], accept: Optional[str]) -> str:
+    """Response format from ?format= (wins) or the Accept header"""
+    if format_param:
+        fmt = format_param.lower()
+        if fmt not in FORMATS:
+            raise AnalysisError(400, f"Unknown format '{format_param}'. Use one of: {', '.join(FORMATS)}")
+        return fmt
+    for media_range in (accept or "").split(","):
+        fmt = _ACCEPT_FORMATS.get(media_range.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    return "records"
+
+
+def page(table, offset: int = 0, limit: Optional[int] = None) -> pd.DataFrame:
+    """Rows ``[offset, offset + limit)`` as one DataFrame"""
+    if isinstance(table, SpooledTable):
+        return table.to_frame(offset, limit)
+    if offset == 0 and limit is None:
+        return table
+    stop = None if limit is None else offset + limit
+    return table.iloc[offset:stop]
+
+
+def iter_rows(table, offset: int = 0, limit: Optional[int] = None,
+              chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """The same rows as ``page`` in consecutive chunks (spooled tables are never fully loaded)"""
+    if isinstance(table, SpooledTable):
+        yield from table.iter_chunks(offset, limit)
+        return
+    rows = page(table, offset, limit)
+    if chunk_rows is None:
+        yield rows
+        return
+    for start in range(0, len(rows), chunk_rows):
+        yield rows.iloc[start:start + chunk_rows]
+
+
+def summary_fields(result: AnalysisResult, handle: Optional[str], offset: int = 0,
+                   limit: Optional[int] = None, fmt: str = "records") -> dict:
+    """Summary dict plus the handle and, when paging, the page bounds"""
+    summary = dict(result.summary)
+    summary["result_handle"] = handle
+    if fmt != "summary" and (offset or limit is not None):
+        total = len(result.table)
+        stop = total if limit is None else min(total, offset + limit)
+        returned = max(stop - offset, 0)
+        summary["page"] = {
+            "offset": offset,
+            "limit": limit,
+            "returned": returned,
+            "total": total,
+            "next_offset": offset + returned if offset + returned < total else None,
+        }
+    return summary
+
+
+def _columnar_json(table: pd.DataFrame) -> str:
+    columns = [str(col) for col in table.columns]
+    data = ", ".join(
+        f"{json.dumps(name)}: {table.iloc[:, i].to_json(orient='values', double_precision=DOUBLE_PRECISION)}"
+        for i, name in enumerate(columns)
+    )
+    return f'{{"columns": {json.dumps(columns)}, "data": {{{data}}}}}'
+
+
+def iter_json(result: AnalysisResult, fmt: str = "records", handle: Optional[str] = None,
+              offset: int = 0, limit: Optional[int] = None) -> Iterator[bytes]:
+    """JSON body for the records / columnar / summary layouts, in pieces"""
+    summary = json.dumps(summary_fields(result, handle, offset, limit, fmt))
+    if fmt == "summary":
+        yield summary.encode()
+        return
+
+    if fmt == "columnar":
+        # Column-major output needs the whole page; use limit to bound it
+        yield f'{summary[:-1]}, "detailed_results": {_columnar_json(page(result.table, offset, limit))}}}'.encode()
+        return
+
+    yield f'{summary[:-1]}, "detailed_results": ['.encode()
+    separator = ""
+    for rows in iter_rows(result.table, offset, limit):
+        records = rows.to_json(orient="records", double_precision=DOUBLE_PRECISION)[1:-1] if len(rows) else ""
+        if records:
+            yield (separator + records).encode()
+            separator = ","
+    yield b"]}"
+
+
+def encode_json(result: AnalysisResult, fmt: str = "records", handle: Optional[str] = None,
+                offset: int = 0, limit: Optional[int] = None) -> bytes:
+    return b"".join(iter_json(result, fmt, handle, offset, limit))
+
+
+def iter_ndjson(result: AnalysisResult, handle: Optional[str] = None, offset: int = 0,
+                limit: Optional[int] = None, chunk_rows: int = NDJSON_CHUNK_ROWS) -> Iterator[bytes]:
+    """Summary object on the first line, then one row object per line"""
+    yield (json.dumps(summary_fields(result, handle, offset, limit, "ndjson")) + "\n").encode()
+    for chunk in iter_rows(result.table, offset, limit, chunk_rows):
+        if not len(chunk):
+            continue
+        lines = chunk.to_json(orient="records", lines=True, double_precision=DOUBLE_PRECISION)
+        yield (lines if lines.endswith("\n") else lines + "\n").encode()
+
+
+def iter_arrow(result: AnalysisResult, fmt: str, handle: Optional[str] = None,
+               offset: int = 0, limit: Optional[int] = None) -> Iterator[bytes]:
+    """Parquet file or Arrow IPC stream written chunk by chunk
+
+    The JSON summary rides in the schema metadata. pyarrow is checked here,
+    before the first byte, so a missing install is a clean 406.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise AnalysisError(406, f"Format '{fmt}' needs pyarrow, which is not installed on this server")
+
+    summary = json.dumps(summary_fields(result, handle, offset, limit, fmt)).encode()
+
+    def generate():
+        sink = io.BytesIO()
+        writer = None
+        for rows in iter_rows(result.table, offset, limit):
+            batch = pa.Table.from_pandas(rows, preserve_index=False)
+            if writer is None:
+                schema = batch.schema.with_metadata({**(batch.schema.metadata or {}), b"codon_analysis_summary": summary})
+                writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+            writer.write_table(batch.cast(schema))
+            yield _drain(sink)
+        if writer is None:
+            schema = pa.schema([], metadata={b"codon_analysis_summary": summary})
+            writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+        writer.close()
+        yield _drain(sink)
+
+    return generate()
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def encode_arrow(result: AnalysisResult, fmt: str, handle: Optional[str] = None,
+                 offset: int = 0, limit: Optional[int] = None) -> bytes:
+    return b"".join(iter_arrow(result, fmt, handle, offset, limit))
+
+
+def encode(result: AnalysisResult, fmt: str, handle: Optional[str] = None,
+           offset: int = 0, limit: Optional[int] = None) -> bytes:
+    """Whole response body in any format (streamed layouts joined)"""
+    if fmt == "ndjson":
+        return b"".join(iter_ndjson(result, handle, offset, limit))
+    if fmt in ("parquet", "arrow"):
+        return encode_arrow(result, fmt, handle, offset, limit)
+    return encode_json(result, fmt, handle, offset, limit)
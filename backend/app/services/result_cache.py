@@ -0,0 +1,180 @@
+"""Content-addressed cache for analysis results.
+
+Keys hash the uploaded bytes together with the loaded model version, so a
+re-upload of the same file is answered without parsing it again and any
+change to the ``models/`` artifacts makes old entries unreachable.
+
+Entries are stored as serialized bytes (``analysis.dump_result``), so one
+entry serves every response format and page. The in-process tier
+is an LRU bounded by total bytes; the optional on-disk tier keeps entries
+across restarts and is bounded the same way.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from core.security import private_directory
+
+logger = logging.getLogger(__name__)
+
+DISK_SUFFIX = ".result"
+
+
+def fingerprint_files(directory: str, names: Optional[Iterable[str]] = None) -> str:
+    """Cheap version id for a directory: hash of (name, size, mtime) of its files"""
+    digest = hashlib.sha256()
+    if not os.path.isdir(directory):
+        return digest.hexdigest()[:16]
+    for name in sorted(names if names is not None else os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_digest(*parts: str):
+    """sha256 seeded with everything besides the upload that the response depends on
+
+    Feed the upload with ``update()`` (all at once or block by block) and use
+    ``hexdigest()`` as the key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest
+
+
+def cache_key(content: bytes, *parts: str) -> str:
+    """sha256 of the uploaded bytes and everything else the response depends on"""
+    digest = cache_digest(*parts)
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Byte-bounded LRU with an optional on-disk tier"""
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            # Entries are unpickled on a hit
+            private_directory(self.disk_dir)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+
+        body = self._disk_get(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, body)
+        return body
+
+    def put(self, key: str, body: bytes):
+        with self._lock:
+            self._insert(key, body)
+        self._disk_put(key, body)
+
+    def clear(self):
+        """Drop the in-process tier (disk entries are keyed by model version and age out)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.disk_dir),
+            }
+
+    def _insert(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = body
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}{DISK_SUFFIX}")
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)  # mtime doubles as the LRU clock for the disk tier
+            return body
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, body: bytes):
+        if not self.disk_dir or len(body) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self._disk_evict()
+        except OSError as e:
+            logger.warning(f"Could not write cache entry to disk: {str(e)}")
+
+    def _disk_evict(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(DISK_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.disk_dir, name))
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
@@ -0,0 +1,129 @@
+"""On-disk result tables for uploads that are analyzed chunk by chunk.
+
+A streamed analysis appends each scored chunk to a spool file instead of
+keeping the full result table in memory. The ``SpooledTable`` handle that
+points at the file is small, so it can be pickled across the worker pool
+and kept in the result cache; rows are read back one chunk at a time when a
+response is encoded.
+
+Spool files live in one private directory (``core.security.private_directory``,
+they are unpickled when read) bounded by total size; the oldest files are
+removed first, after which their handles report ``exists() == False``.
+"""
+import logging
+import os
+import pickle
+import tempfile
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from core.security import private_directory
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = ".spool"
+
+
+class SpooledTable:
+    """Read-only handle to a result table stored as a sequence of pickled chunks
+
+    ``columns`` is the union of the chunks' columns; chunks without some of
+    them (e.g. classification failed for that chunk) read back with NaN there.
+    """
+
+    def __init__(self, path: str, columns: List[str], chunk_offsets: List[int], chunk_rows: List[int]):
+        self.path = path
+        self.columns = columns
+        self.chunk_offsets = chunk_offsets
+        self.chunk_rows = chunk_rows
+
+    def __len__(self) -> int:
+        return sum(self.chunk_rows)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def iter_chunks(self, offset: int = 0, limit: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Rows ``[offset, offset + limit)`` as consecutive DataFrames, one stored chunk at a time"""
+        stop = len(self) if limit is None else min(len(self), offset + limit)
+        start_row = 0
+        with open(self.path, "rb") as f:
+            for byte_offset, n_rows in zip(self.chunk_offsets, self.chunk_rows):
+                end_row = start_row + n_rows
+                if end_row > offset and start_row < stop:
+                    f.seek(byte_offset)
+                    chunk = pickle.load(f)
+                    if list(chunk.columns) != self.columns:
+                        chunk = chunk.reindex(columns=self.columns)
+                    yield chunk.iloc[max(offset - start_row, 0):stop - start_row]
+                start_row = end_row
+                if start_row >= stop:
+                    break
+
+    def to_frame(self, offset: int = 0, limit: Optional[int] = None) -> pd.DataFrame:
+        chunks = list(self.iter_chunks(offset, limit))
+        if not chunks:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(chunks)
+
+
+class TableSpooler:
+    """Append DataFrame chunks to a new spool file, then ``close()`` into a SpooledTable"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        private_directory(directory)
+        fd, self.path = tempfile.mkstemp(suffix=SPOOL_SUFFIX, dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._columns = None
+        self._offsets = []
+        self._rows = []
+
+    def append(self, chunk: pd.DataFrame):
+        if self._columns is None:
+            self._columns = list(chunk.columns)
+        else:
+            # Chunks are stored as they are; the table has every column any chunk had
+            self._columns += [col for col in chunk.columns if col not in self._columns]
+        self._offsets.append(self._file.tell())
+        self._rows.append(len(chunk))
+        pickle.dump(chunk, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self) -> SpooledTable:
+        self._file.close()
+        evict_spool_files(self.directory, self.max_bytes, keep=self.path)
+        return SpooledTable(self.path, self._columns or [], self._offsets, self._rows)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def evict_spool_files(directory: str, max_bytes: int, keep: Optional[str] = None):
+    """Delete the oldest spool files until the directory fits in ``max_bytes``"""
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(SPOOL_SUFFIX) or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+        except OSError:
+            pass
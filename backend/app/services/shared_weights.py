@@ -0,0 +1,330 @@
+"""Numeric model state in one read-only, memory-mapped bundle shared by all workers.
+
+Every uvicorn worker and analysis pool process used to unpickle its own
+scaler, PCA, KMeans and tree ensemble. Instead, the first process to load a
+model version writes the compiled arrays (folded scaler+PCA map, centroids,
+classifier scaling and the flattened trees) as ``.npy`` files into
+``<CODON_SHARED_WEIGHTS_DIR>/<model_version>/``; every process then maps
+those files with ``np.load(mmap_mode='r')``, so the pages exist once in
+the OS page cache (``/dev/shm`` by default) no matter how many workers run.
+
+Tree ensembles are flattened so that prediction needs only the arrays:
+
+* ``tree_children`` - ``[left, right]`` child ids per node, interleaved, in
+  the concatenated node table; leaves point at themselves so every row can
+  take ``max_depth`` steps without branching
+* ``tree_feature`` / ``tree_threshold`` - go right when ``x[feature] > threshold``;
+  thresholds are float32 rounded down, which gives exactly sklearn's
+  float32-feature vs float64-threshold test
+* ``tree_value`` - per-node class probabilities (rows sum to 1)
+* ``tree_roots`` - root node id of each tree
+
+When every tree padded to a complete binary tree of ``max_depth`` levels
+fits in ``COMPLETE_MAX_NODES`` slots, the export also holds that layout
+(``tree_complete_*``: per-tree heap-ordered split features/thresholds and
+leaf values). Children are then ``2i``/``2i+1`` and need no lookup, and
+``SharedForest`` walks one small tree at a time over a column-major copy of
+the rows, which keeps each tree's tables in cache.
+"""
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.security import private_directory
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+BUNDLE_FORMAT_VERSION = 3
+# Largest complete-tree layout (trees x leaf slots) exported next to the node table
+COMPLETE_MAX_NODES = 1 << 22
+# Rows per pass of the complete-tree traversal (column-major float32 copy + index buffers);
+# below COMPLETE_MIN_ROWS the per-tree loop costs more than walking all trees at once
+COMPLETE_CHUNK_ROWS = 8192
+COMPLETE_MIN_ROWS = 2048
+
+
+class SharedForest:
+    """``predict_proba`` of a tree ensemble from flattened, read-only arrays"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], classes: np.ndarray, n_features_in: int):
+        self.children = arrays["tree_children"]
+        self.feature = arrays["tree_feature"]
+        self.threshold = arrays["tree_threshold"]
+        self.value = arrays["tree_value"]
+        self.roots = arrays["tree_roots"]
+        self.max_depth = int(arrays["tree_max_depth"][0])
+        self.complete_feature = arrays.get("tree_complete_feature")
+        self.complete_threshold = arrays.get("tree_complete_threshold")
+        self.complete_value = arrays.get("tree_complete_value")
+        self.classes_ = classes
+        self.n_features_in_ = n_features_in
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.complete_value is not None
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node id reached in every tree, shape (n_rows, n_trees)"""
+        n_rows, n_features = X.shape
+        nodes = np.tile(self.roots, n_rows)
+        # Flat offset of each (row, tree) slot's row in X
+        row_base = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        flat = np.ascontiguousarray(X).ravel()
+        for _ in range(self.max_depth):
+            go_right = flat.take(row_base + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(nodes * 2 + go_right)
+        return nodes.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X: np.ndarray, chunk_rows: Optional[int] = None) -> np.ndarray:
+        # Features are compared in float32, as sklearn's trees do
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float64)
+        if self.is_complete and len(X) >= COMPLETE_MIN_ROWS:
+            chunk_rows = chunk_rows or COMPLETE_CHUNK_ROWS
+            for start in range(0, len(X), chunk_rows):
+                self._accumulate_complete(X[start:start + chunk_rows], proba[start:start + chunk_rows])
+            return proba
+        chunk_rows = chunk_rows or 1024
+        for start in range(0, len(X), chunk_rows):
+            leaves = self.apply(X[start:start + chunk_rows])
+            proba[start:start + chunk_rows] = self.value.take(leaves, axis=0).sum(axis=1) / self.n_trees
+        return proba
+
+    def _accumulate_complete(self, X: np.ndarray, out: np.ndarray):
+        """Mean leaf values of the complete-tree layout, one tree at a time, into ``out``"""
+        n_rows = len(X)
+        n_leaves = self.complete_feature.shape[1]
+        depth = n_leaves.bit_length() - 1
+        # Column-major rows: feature f of row r sits at f * n_rows + r
+        flat = np.ascontiguousarray(X.T).ravel()
+        row_offsets = np.arange(n_rows, dtype=np.intp)
+        nodes, index = np.empty(n_rows, dtype=np.intp), np.empty(n_rows, dtype=np.intp)
+        values = np.empty(n_rows, dtype=np.float32)
+        thresholds = np.empty(n_rows, dtype=self.complete_threshold.dtype)
+        go_right = np.empty(n_rows, dtype=bool)
+        # Offset of each split feature's column, for all trees at once
+        column_offsets = self.complete_feature * n_rows
+        out[:] = 0.0
+        # Trees are added in order, so the sum rounds exactly like sklearn's
+        for columns, threshold, value in zip(column_offsets, self.complete_threshold, self.complete_value):
+            nodes[:] = 1
+            for _ in range(depth):
+                np.take(columns, nodes, out=index)
+                index += row_offsets
+                np.take(flat, index, out=values)
+                np.take(threshold, nodes, out=thresholds)
+                np.greater(values, thresholds, out=go_right)
+                nodes += nodes
+                nodes += go_right
+            nodes -= n_leaves
+            out += value.take(nodes, axis=0)
+        out /= self.n_trees
+
+    def predict_with_proba(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(labels, probabilities) from one traversal"""
+        proba = self.predict_proba(X)
+        return self.classes_[proba.argmax(axis=1)], proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.predict_with_proba(X)[0]
+
+
+def compile_forest(classifier):
+    """``SharedForest`` over in-memory flattened arrays, or the classifier itself if it is not a tree ensemble"""
+    arrays = flatten_forest(classifier)
+    if arrays is None:
+        return classifier
+    return SharedForest(arrays, classifier.classes_, classifier.n_features_in_)
+
+
+def flatten_forest(classifier, threshold_dtype=np.float32,
+                   complete_max_nodes: int = COMPLETE_MAX_NODES) -> Optional[Dict[str, np.ndarray]]:
+    """Flattened tree arrays of a single-output sklearn tree classifier/ensemble, else None
+
+    ``threshold_dtype=np.float64`` keeps sklearn's thresholds as they are
+    instead of rounding them down to float32; predictions are the same.
+    """
+    estimators = getattr(classifier, "estimators_", None)
+    if estimators is None and hasattr(classifier, "tree_"):
+        estimators = [classifier]
+    if not estimators or getattr(classifier, "n_outputs_", 1) != 1:
+        return None
+    if not all(hasattr(est, "tree_") and hasattr(est, "predict_proba") for est in estimators):
+        return None
+
+    children, feature, threshold, value, roots = [], [], [], [], []
+    offset, max_depth = 0, 0
+    for est in estimators:
+        tree = est.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes)
+        is_leaf = tree.children_left == -1
+        children.append(np.stack([
+            np.where(is_leaf, node_ids, tree.children_left + offset),
+            np.where(is_leaf, node_ids, tree.children_right + offset),
+        ], axis=1).ravel())
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        # Recent sklearn stores class fractions per node (dividing those again would move
+        # the last bit); older versions store weighted counts, normalized at predict time
+        node_value = np.array(tree.value[:, 0, :], dtype=np.float64)
+        normalizer = node_value.sum(axis=1, keepdims=True)
+        if not np.allclose(normalizer, 1.0):
+            normalizer[normalizer == 0.0] = 1.0
+            node_value /= normalizer
+        value.append(node_value)
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    threshold = np.concatenate(threshold)
+    arrays = {
+        "tree_children": np.concatenate(children).astype(np.int32),
+        "tree_feature": np.concatenate(feature).astype(np.int32),
+        "tree_threshold": float32_floor(threshold) if threshold_dtype == np.float32 else threshold,
+        "tree_value": np.concatenate(value),
+        "tree_roots": np.asarray(roots, dtype=np.int32),
+        "tree_max_depth": np.asarray([max_depth], dtype=np.int32),
+    }
+    if len(roots) << max_depth <= complete_max_nodes:
+        arrays.update(complete_layout(arrays))
+    return arrays
+
+
+def complete_layout(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Every tree of a flattened forest padded to a complete binary tree of ``max_depth`` levels
+
+    Slot ``i`` of a tree has children ``2i`` and ``2i+1`` (the root is slot
+    1). A leaf above the last level becomes a chain of always-left splits
+    (threshold +inf) whose slots all carry the leaf's value, exactly as the
+    self-looping leaves of the node table behave.
+    """
+    children, feature, threshold = arrays["tree_children"], arrays["tree_feature"], arrays["tree_threshold"]
+    # Node id held by each slot of the current level, shape (n_trees, 2**level)
+    nodes = arrays["tree_roots"].astype(np.intp)[:, None]
+    # Heap order from slot 1 (children 2i and 2i+1); slot 0 is unused
+    level_features = [np.zeros((len(nodes), 1), dtype=np.intp)]
+    level_thresholds = [np.full((len(nodes), 1), np.inf, dtype=threshold.dtype)]
+    for _ in range(int(arrays["tree_max_depth"][0])):
+        level_features.append(feature[nodes])
+        level_thresholds.append(threshold[nodes])
+        nodes = children[(nodes * 2)[:, :, None] + np.arange(2)].reshape(len(nodes), -1)
+    return {
+        # intp, so the traversal's column offsets gather into its index buffer without a cast
+        "tree_complete_feature": np.concatenate(level_features, axis=1).astype(np.intp),
+        "tree_complete_threshold": np.concatenate(level_thresholds, axis=1),
+        "tree_complete_value": arrays["tree_value"][nodes],
+    }
+
+
+def float32_floor(values: np.ndarray) -> np.ndarray:
+    """Largest float32 <= each value, so ``x32 <= t`` iff ``x32 <= float32_floor(t)``"""
+    rounded = values.astype(np.float32)
+    over = rounded.astype(np.float64) > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+def bundle_path(weights_dir: str, model_version: str) -> str:
+    return os.path.join(weights_dir, model_version)
+
+
+def export_bundle(weights_dir: str, model_version: str, arrays: Dict[str, np.ndarray], meta: dict,
+                  owner: Optional[str] = None) -> str:
+    """Write the bundle once; concurrent writers race on an atomic rename and the loser discards its copy
+
+    A bundle left by an older format (an upgrade on a host that keeps
+    ``/dev/shm``) is moved aside and replaced, or no worker could map it.
+    ``owner`` names the deployment (its model directory) in the metadata;
+    once the new bundle is in place, that deployment's other bundles are
+    removed, and bundles of other deployments sharing the directory stay.
+    """
+    # Workers serve whatever is mapped from here, so nobody else may write to it
+    private_directory(weights_dir)
+    final = bundle_path(weights_dir, model_version)
+    existing = bundle_format(final)
+    if existing == BUNDLE_FORMAT_VERSION:
+        return final
+    tmp = f"{final}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp, META_FILE), "w") as f:
+        json.dump({"format": BUNDLE_FORMAT_VERSION, **meta, "owner": owner}, f)
+    if os.path.isdir(final):
+        logger.warning(f"Replacing shared model weights in {final} (format {existing}, expected {BUNDLE_FORMAT_VERSION})")
+        stale = f"{final}.stale-{os.getpid()}"
+        try:
+            # Processes still mapping the old files keep their pages
+            os.rename(final, stale)
+        except OSError:
+            pass  # Another process moved it aside first
+        shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.rename(tmp, final)
+        logger.info(f"Exported shared model weights to {final}")
+        if owner is not None:
+            _remove_other_bundles(weights_dir, keep=model_version, owner=owner)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return final
+
+
+def bundle_format(path: str) -> Optional[int]:
+    """Format version recorded in a bundle's metadata; None if there is no readable bundle"""
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f).get("format")
+    except (OSError, ValueError):
+        return None
+
+
+def load_bundle(path: str) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """Memory-map every array of a bundle; None if it does not exist or is from another format
+
+    Raises PermissionError when the weights directory is not private to this user.
+    """
+    private_directory(os.path.dirname(os.path.abspath(path)))
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format") != BUNDLE_FORMAT_VERSION:
+        logger.info(f"Shared model weights in {path} have format {meta.get('format')}, "
+                    f"expected {BUNDLE_FORMAT_VERSION} - they will be re-exported")
+        return None
+    arrays = {
+        name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r")
+        for name in os.listdir(path) if name.endswith(".npy")
+    }
+    return arrays, meta
+
+
+def bundle_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) if os.path.isdir(path) else 0
+
+
+def _remove_other_bundles(weights_dir: str, keep: str, owner: str):
+    """Old versions written by ``owner`` can go; processes still mapping them keep their pages until they reload"""
+    for name in os.listdir(weights_dir):
+        path = os.path.join(weights_dir, name)
+        if name == keep or ".tmp-" in name or ".stale-" in name:
+            continue
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                written_by = json.load(f).get("owner")
+        except (OSError, ValueError):
+            continue
+        if written_by == owner:
+            shutil.rmtree(path, ignore_errors=True)
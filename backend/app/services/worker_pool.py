@@ -0,0 +1,129 @@
+"""Bounded pool that keeps CPU-bound analysis off the event loop.
+
+Workers are separate processes that load the model artifacts once in their
+initializer. Admission is bounded: at most ``max_workers`` jobs run and
+``queue_depth`` more may wait; anything beyond that is rejected right away
+instead of piling up latency. Analyses that run in the API process (small
+uploads) are admitted against the same bound with ``admitted``.
+"""
+import asyncio
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """All workers are busy and the wait queue is full"""
+
+
+class PoolUnavailable(Exception):
+    """The pool is not running (not started, shutting down or a worker died)"""
+
+
+def _noop():
+    return None
+
+
+class AnalysisPool:
+    """Process pool with bounded admission
+
+    ``max_workers=0`` runs jobs on a single background thread of the API
+    process instead (no extra processes, still off the event loop).
+    """
+
+    def __init__(self, max_workers: int, queue_depth: int,
+                 initializer: Optional[Callable] = None, start_method: str = "spawn"):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.initializer = initializer
+        self.start_method = start_method
+        self._executor = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.max_workers, 1) + self.queue_depth
+
+    def start(self):
+        """Create the executor and warm every worker (runs the initializer now)"""
+        if self._executor is not None:
+            return
+        if self.max_workers == 0:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=self.initializer,
+        )
+        # ProcessPoolExecutor spawns workers lazily; submit one no-op per worker
+        for future in [self._executor.submit(_noop) for _ in range(self.max_workers)]:
+            future.result()
+        logger.info(f"Analysis pool started with {self.max_workers} {self.start_method} workers")
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def restart(self):
+        """Replace the workers (e.g. after the model artifacts changed)
+
+        Jobs already submitted finish on the old workers, which exit afterwards.
+        """
+        self.shutdown(wait=False, cancel_futures=False)
+        self.start()
+
+    @contextmanager
+    def admitted(self):
+        """Hold one admission slot for work done outside the pool; raises PoolSaturated when full"""
+        if self._executor is None:
+            raise PoolUnavailable("Analysis pool is not running")
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise PoolSaturated(f"{self._pending} analyses in flight (capacity {self.capacity})")
+
+        self._pending += 1
+        try:
+            yield
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Run ``fn(*args)`` in the pool; raises PoolSaturated when full"""
+        with self.admitted():
+            try:
+                return await asyncio.wrap_future(self._executor.submit(fn, *args))
+            except BrokenProcessPool:
+                logger.error("Analysis worker died - restarting pool")
+                self.restart()
+                raise PoolUnavailable("Analysis worker died")
+
+    def worker_pids(self) -> list:
+        """PIDs of the live worker processes (empty in thread mode)"""
+        processes = getattr(self._executor, "_processes", None) or {}
+        return sorted(processes)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "process" if self.max_workers else "thread",
+            "workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._pending,
+            "running": self._executor is not None,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
@@ -0,0 +1,89 @@
+"""Batch scoring throughput: services.batch_scoring vs one /analyze call per file.
+
+Writes ``--files`` seeded codon tables of ``--rows`` rows each and scores
+the directory three ways: ``run_analysis`` per file plus a CSV dump of the
+result table (what a client looping over /analyze gets), ``run_batch`` in
+this process and ``run_batch`` across ``--workers`` processes. Reports
+rows per second for each.
+
+Run from backend/:
+
+    python benchmarks/batch_scoring.py --files 8 --rows 20000 --workers 4 --output batch_scoring.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services import analysis  # noqa: E402
+from services.batch_scoring import run_batch  # noqa: E402
+from services.fasta_ingest import CODONS  # noqa: E402
+
+
+def write_table(path: str, n_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    frequencies = rng.dirichlet(np.ones(len(list(CODONS))), n_rows)
+    table = pd.DataFrame(np.round(frequencies, 5), columns=list(CODONS))
+    table.insert(0, "Kingdom", rng.choice(["bct", "vrl", "pln"], n_rows))
+    table.insert(1, "DNAtype", 0)
+    table.insert(2, "SpeciesID", np.arange(n_rows))
+    table.insert(3, "Ncodons", rng.integers(1000, 100000, n_rows))
+    table.insert(4, "SpeciesName", [f"species {i}" for i in range(n_rows)])
+    table.to_csv(path, index=False)
+
+
+def run(n_files: int = 8, n_rows: int = 20000, workers: int = 2, seed: int = 0) -> dict:
+    analysis.load_models()
+    directory = tempfile.mkdtemp(prefix="batch_scoring_")
+    try:
+        inputs = os.path.join(directory, "inputs")
+        os.makedirs(inputs)
+        for i in range(n_files):
+            write_table(os.path.join(inputs, f"part_{i}.csv"), n_rows, seed + i)
+        total = n_files * n_rows
+
+        started = time.perf_counter()
+        rows = 0
+        for name in sorted(os.listdir(inputs)):
+            table = analysis.run_analysis(os.path.join(inputs, name)).table
+            table.to_csv(os.path.join(directory, f"{name}.out"), index=False)
+            rows += len(table)
+        per_file = time.perf_counter() - started
+
+        results = {"files": n_files, "rows_per_file": n_rows, "rows": total,
+                   "per_file_analyze": {"seconds": round(per_file, 3), "rows_per_second": round(rows / per_file, 1)}}
+        for label, n_workers in (("batch_serial", 0), ("batch_pool", workers)):
+            summary = run_batch([inputs], os.path.join(directory, label), workers=n_workers, fmt="csv")
+            results[label] = {"workers": n_workers, "seconds": summary["seconds"],
+                              "rows_per_second": summary["rows_per_second"]}
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.files, args.rows, args.workers, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Classifier bake-off and search: notebook loops vs services.classifier_bakeoff.
+
+``legacy_run_multiple_classifiers`` and ``legacy_optimize_best_classifier``
+are ``CodonClassificationPipeline.run_multiple_classifiers`` and
+``optimize_best_classifier`` from the notebook (minus the printing). On a
+seeded multi-class feature table they are timed against
+``ClassifierBakeoff.run_models`` and ``halving_search``; the bake-off must
+reproduce the notebook's CV and hold-out accuracies.
+
+Run from backend/:
+
+    python benchmarks/classifier_bakeoff.py --rows 13000 --workers 4 --output classifier_bakeoff.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services.classifier_bakeoff import PARAM_GRIDS, ClassifierBakeoff, make_classifier  # noqa: E402
+
+
+def make_feature_table(n_rows: int, n_features: int = 24, n_classes: int = 3, seed: int = 0):
+    """(features, cluster labels) shaped like ``features_log`` and the clustering output"""
+    from sklearn.datasets import make_classification
+
+    X, y = make_classification(n_samples=n_rows, n_features=n_features, n_informative=8, n_redundant=6,
+                               n_classes=n_classes, class_sep=0.8, random_state=seed)
+    return pd.DataFrame(X, columns=[f"f{i}" for i in range(n_features)]), pd.Series(y, name="Cluster")
+
+
+def legacy_run_multiple_classifiers(X, y, names, test_size=0.2, random_state=42):
+    from sklearn.metrics import accuracy_score
+    from sklearn.model_selection import cross_val_score, train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state, stratify=y
+    )
+    results = {}
+    for name in names:
+        # The notebook's estimators, with their default thread use
+        clf = make_classifier(name, {}, random_state=random_state)
+        if hasattr(clf, 'n_jobs'):
+            clf.set_params(n_jobs=None)
+        clf.fit(X_train, y_train)
+        y_pred = clf.predict(X_test)
+        cv_scores = cross_val_score(clf, X_train, y_train, cv=5, scoring='accuracy')
+        results[name] = {'accuracy': accuracy_score(y_test, y_pred), 'cv_mean': cv_scores.mean(), 'cv_std': cv_scores.std()}
+    return results
+
+
+def legacy_optimize_best_classifier(X, y, best_name, n_iter=20, cv=3):
+    from sklearn.metrics import accuracy_score
+    from sklearn.model_selection import RandomizedSearchCV, train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    base_model = make_classifier(best_name, {}, random_state=42)
+    if hasattr(base_model, 'n_jobs'):
+        base_model.set_params(n_jobs=None)
+    random_search = RandomizedSearchCV(
+        base_model,
+        param_distributions=PARAM_GRIDS[best_name],
+        n_iter=n_iter,
+        cv=cv,
+        scoring='accuracy',
+        n_jobs=-1,
+        random_state=42
+    )
+    random_search.fit(X_train, y_train)
+    accuracy = accuracy_score(y_test, random_search.best_estimator_.predict(X_test))
+    return random_search.best_params_, accuracy
+
+
+def run(n_rows: int, workers: int, seed: int, search_model: str) -> dict:
+    X, y = make_feature_table(n_rows, seed=seed)
+    names = ['Random Forest', 'SVM', 'Logistic Regression']
+    results = {"rows": n_rows, "workers": workers, "scenarios": {}}
+
+    started = time.perf_counter()
+    expected = legacy_run_multiple_classifiers(X, y, names)
+    results["scenarios"]["legacy_bakeoff"] = {"seconds": round(time.perf_counter() - started, 3), "models": expected}
+    started = time.perf_counter()
+    best_params, accuracy = legacy_optimize_best_classifier(X, y, search_model)
+    results["scenarios"]["legacy_search"] = {"seconds": round(time.perf_counter() - started, 3),
+                                             "best_params": best_params, "accuracy": accuracy}
+
+    with ClassifierBakeoff(X, y, n_workers=workers) as bakeoff:
+        started = time.perf_counter()
+        models = bakeoff.run_models(names)
+        results["scenarios"]["bakeoff"] = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "models": {name: {k: models[name][k] for k in ('accuracy', 'cv_mean', 'cv_std')} for name in models},
+            "same_as_legacy": all(
+                np.isclose(models[name]['cv_mean'], expected[name]['cv_mean'])
+                and np.isclose(models[name]['accuracy'], expected[name]['accuracy'])
+                for name in names
+            ),
+        }
+        started = time.perf_counter()
+        _, best_params, result = bakeoff.halving_search(search_model)
+        results["scenarios"]["halving_search"] = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "best_params": best_params,
+            "accuracy": result['accuracy'],
+            "fits": sum(record['rung'].startswith('halving') for record in bakeoff.records),
+        }
+        results["timings"] = bakeoff.timings()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=13000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-model", default="Random Forest", choices=sorted(PARAM_GRIDS))
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.workers, args.seed, args.search_model)
+    print(json.dumps(results, indent=2, default=str))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
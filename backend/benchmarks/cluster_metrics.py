@@ -0,0 +1,75 @@
+"""Cluster quality metrics: sklearn vs services.cluster_metrics.
+
+Times each silhouette mode and the centroid metrics on a seeded blob matrix
+and records the peak traced memory of each (``tracemalloc`` sees NumPy
+buffers). sklearn's silhouette is skipped above ``--sklearn-max-rows``, as
+its pairwise distances are what this replaces.
+
+Run from backend/:
+
+    python benchmarks/cluster_metrics.py --rows 20000 --memory-mb 64 --output cluster_metrics.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services.cluster_metrics import cluster_quality, silhouette  # noqa: E402
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, {"seconds": round(seconds, 4), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def run(n_rows: int, memory_mb: int, sample_size: int, sklearn_max_rows: int, seed: int) -> dict:
+    from sklearn.datasets import make_blobs
+    from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+
+    X, labels = make_blobs(n_samples=n_rows, n_features=8, centers=6, cluster_std=2.0, random_state=seed)
+    budget = memory_mb * 2 ** 20
+    results = {"rows": n_rows, "memory_mb": memory_mb, "scenarios": {}}
+
+    if n_rows <= sklearn_max_rows:
+        score, timing = measure(lambda: silhouette_score(X, labels))
+        results["scenarios"]["sklearn_silhouette"] = {**timing, "score": float(score)}
+    _, timing = measure(lambda: (davies_bouldin_score(X, labels), calinski_harabasz_score(X, labels)))
+    results["scenarios"]["sklearn_db_ch"] = timing
+
+    for mode in ("exact", "sample", "simplified"):
+        options = {"sample_size": sample_size} if mode == "sample" else {}
+        estimate, timing = measure(lambda: silhouette(X, labels, mode, budget, **options))
+        results["scenarios"][f"silhouette_{mode}"] = {
+            **timing, "score": estimate.score, "interval": [estimate.low, estimate.high],
+        }
+    _, timing = measure(lambda: cluster_quality(X, labels, "simplified", budget))
+    results["scenarios"]["cluster_quality_simplified"] = timing
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--memory-mb", type=int, default=64)
+    parser.add_argument("--sample-size", type=int, default=5000)
+    parser.add_argument("--sklearn-max-rows", type=int, default=30000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.memory_mb, args.sample_size, args.sklearn_max_rows, args.seed)
+    print(json.dumps(results, indent=2, default=float))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=float)
@@ -0,0 +1,134 @@
+"""Clustering hyperparameter sweep: notebook loop vs services.cluster_sweep.
+
+``legacy_optimize_clustering_parameters`` is the sequential search from
+``ImprovedCodonClusteringPipeline.optimize_clustering_parameters``. On a
+seeded PCA-shaped blob matrix it is timed against ``ClusterSweep`` with
+every k on all rows (same result), with successive halving, and again with
+a warm cache.
+
+Run from backend/:
+
+    python benchmarks/cluster_sweep.py --rows 13000 --workers 4 --output cluster_sweep.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services.cluster_sweep import ClusterSweep  # noqa: E402
+
+
+def make_pca_matrix(n_rows: int, n_components: int = 8, n_blobs: int = 4, seed: int = 0) -> np.ndarray:
+    from sklearn.datasets import make_blobs
+
+    X, _ = make_blobs(n_samples=n_rows, n_features=n_components, centers=n_blobs, cluster_std=2.0, random_state=seed)
+    return X
+
+
+def legacy_optimize_clustering_parameters(X_pca: np.ndarray):
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    best_score = -1
+    best_params = None
+    best_labels = None
+
+    init_methods = ['k-means++', 'random']
+    n_init_values = [20, 50]
+    max_iter_values = [300, 500]
+
+    silhouette_scores = []
+    k_range = range(2, min(16, X_pca.shape[0]))
+
+    for k in k_range:
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+        labels = kmeans.fit_predict(X_pca)
+        if len(set(labels)) > 1:
+            score = silhouette_score(X_pca, labels)
+            silhouette_scores.append(score)
+        else:
+            silhouette_scores.append(-1)
+
+    top_k_indices = np.argsort(silhouette_scores)[-3:]
+    top_k_values = [k_range[i] for i in top_k_indices if silhouette_scores[i] > 0]
+
+    for k in top_k_values:
+        for init_method in init_methods:
+            for n_init in n_init_values:
+                for max_iter in max_iter_values:
+                    try:
+                        kmeans = KMeans(
+                            n_clusters=k,
+                            init=init_method,
+                            n_init=n_init,
+                            max_iter=max_iter,
+                            random_state=42
+                        )
+                        labels = kmeans.fit_predict(X_pca)
+
+                        if len(set(labels)) > 1:
+                            score = silhouette_score(X_pca, labels)
+
+                            if score > best_score:
+                                best_score = score
+                                best_labels = labels
+                                best_params = {
+                                    'n_clusters': k,
+                                    'init': init_method,
+                                    'n_init': n_init,
+                                    'max_iter': max_iter,
+                                    'score': score
+                                }
+                    except Exception:
+                        continue
+
+    return best_labels, best_score, best_params
+
+
+def run(n_rows: int, workers: int, seed: int) -> dict:
+    X = make_pca_matrix(n_rows, seed=seed)
+    results = {"rows": n_rows, "workers": workers, "scenarios": {}}
+
+    started = time.perf_counter()
+    _, _, expected = legacy_optimize_clustering_parameters(X)
+    results["scenarios"]["legacy"] = {"seconds": round(time.perf_counter() - started, 3), "best_params": expected}
+
+    with tempfile.TemporaryDirectory() as all_k_cache, tempfile.TemporaryDirectory() as halving_cache:
+        scenarios = (
+            ("sweep_all_k", False, all_k_cache),
+            ("sweep_halving", True, halving_cache),
+            ("sweep_halving_cached", True, halving_cache),  # same cache: nothing left to fit
+        )
+        for name, halving, cache_dir in scenarios:
+            with ClusterSweep(X, n_workers=workers, cache_dir=cache_dir) as sweep:
+                started = time.perf_counter()
+                _, _, best_params = sweep.optimize_kmeans(halving=halving)
+                results["scenarios"][name] = {
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "best_params": best_params,
+                    "same_as_legacy": {k: v for k, v in best_params.items() if k != "score"}
+                    == {k: v for k, v in expected.items() if k != "score"},
+                    "rungs": sweep.timings(),
+                }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=13000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.workers, args.seed)
+    print(json.dumps(results, indent=2, default=float))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=float)
@@ -0,0 +1,226 @@
+"""Per-stage benchmark of the training features: notebook loops vs services.codon_bias.
+
+The ``legacy_*`` functions are the row-wise implementations from
+``ImprovedCodonClusteringPipeline`` (``add_advanced_features``,
+``calculate_codon_bias_indices``, ``add_cosine_similarity_feature``), kept
+here as the reference the vectorized module must reproduce. Each stage is
+timed both ways on a seeded synthetic table shaped like the codon usage
+dataset, and the largest absolute difference is reported with the speedup.
+
+Run from backend/:
+
+    python benchmarks/codon_bias.py --rows 13028 --output codon_bias.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from scipy.stats import entropy
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services import codon_bias  # noqa: E402
+from services.feature_engine import CODON_TO_AA, normalize_rows  # noqa: E402
+
+KINGDOMS = ["bct", "vrl", "pln", "inv", "vrt", "mam", "phg", "rod", "pri", "arc", "plm"]
+CODONS = ["".join(c) for c in product("UCAG", repeat=3)]
+
+
+def make_codon_table(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Seeded codon frequencies with per-kingdom profiles, like the Kaggle codon usage table"""
+    rng = np.random.default_rng(seed)
+    profiles = rng.dirichlet(np.ones(len(CODONS)) * 2, size=len(KINGDOMS))
+    kingdom_idx = rng.integers(0, len(KINGDOMS), n_rows)
+    freqs = rng.gamma(profiles[kingdom_idx] * 200)
+    freqs /= freqs.sum(axis=1, keepdims=True)
+    df = pd.DataFrame(freqs, columns=CODONS)
+    df.insert(0, "Kingdom", np.array(KINGDOMS)[kingdom_idx])
+    return df
+
+
+def amino_acid_frequencies(df: pd.DataFrame) -> pd.DataFrame:
+    """``df_aa_norm`` as the notebook builds it (aggregate, drop the low-count 5%, normalize)"""
+    aa_order = list(dict.fromkeys(CODON_TO_AA.values()))
+    aa = pd.DataFrame({a: df[[c for c, v in CODON_TO_AA.items() if v == a]].sum(axis=1) for a in aa_order})
+    row_sums = aa.sum(axis=1)
+    aa = aa[row_sums > row_sums.quantile(0.05)]
+    norm = normalize_rows(aa.to_numpy(), aa.sum(axis=1).to_numpy())
+    return pd.DataFrame(norm, index=aa.index, columns=aa_order)
+
+
+# --- notebook implementations -------------------------------------------------
+
+def legacy_row_statistics(df: pd.DataFrame) -> pd.DataFrame:
+    stats = pd.DataFrame(index=df.index)
+    stats['mean'] = df.mean(axis=1)
+    stats['median'] = df.median(axis=1)
+    stats['std'] = df.std(axis=1).fillna(0)
+    stats['skewness'] = df.skew(axis=1).fillna(0)
+    stats['kurtosis'] = df.kurtosis(axis=1).fillna(0)
+    freq_norm = df.div(df.sum(axis=1), axis=0).fillna(0)
+    stats['entropy'] = freq_norm.apply(lambda x: entropy(x + 1e-10, base=2), axis=1).fillna(0)
+
+    def gini_coefficient(x):
+        try:
+            x = np.array(x)
+            x = x[~np.isnan(x)]
+            if len(x) == 0 or np.sum(x) == 0:
+                return 0
+            x = np.sort(x)
+            n = len(x)
+            index = np.arange(1, n + 1)
+            return (2 * np.sum(index * x)) / (n * np.sum(x)) - (n + 1) / n
+        except Exception:
+            return 0
+
+    stats['gini'] = df.apply(gini_coefficient, axis=1)
+    return stats
+
+
+def legacy_property_features(df: pd.DataFrame) -> pd.DataFrame:
+    stats = pd.DataFrame(index=df.index)
+    for prop_name, aa_list in codon_bias.AA_PROPERTIES.items():
+        prop_cols = [aa for aa in aa_list if aa in df.columns]
+        if prop_cols:
+            stats[f'{prop_name}_usage'] = df[prop_cols].sum(axis=1)
+            prop_entropy = df[prop_cols].apply(
+                lambda x: entropy(x + 1e-10, base=2) if len(x) > 0 and np.sum(x) > 0 else 0, axis=1
+            )
+            stats[f'{prop_name}_entropy'] = prop_entropy.fillna(0)
+    return stats
+
+
+def legacy_enc_approx(df: pd.DataFrame) -> np.ndarray:
+    nc_values = []
+    for idx in df.index:
+        try:
+            aa_usage = df.loc[idx]
+            nc = 0
+            for aa_group in codon_bias.AA_PROPERTIES.values():
+                group_usage = [aa_usage.get(aa, 0) for aa in aa_group if aa in aa_usage.index]
+                if group_usage and sum(group_usage) > 0:
+                    group_usage = np.array(group_usage)
+                    group_usage = group_usage[~np.isnan(group_usage)]
+                    if len(group_usage) > 0 and np.sum(group_usage) > 0:
+                        group_usage = group_usage / group_usage.sum()
+                        nc += 1 / max(np.sum(group_usage ** 2), 1e-10)
+            nc_values.append(nc if not np.isnan(nc) and np.isfinite(nc) else 0)
+        except Exception:
+            nc_values.append(0)
+    return np.asarray(nc_values, dtype=float)
+
+
+def legacy_cai_approx(df: pd.DataFrame) -> np.ndarray:
+    reference_pattern = df.mean()
+    cai_values = []
+    for idx in df.index:
+        try:
+            aa_usage = df.loc[idx]
+            ratio = aa_usage / (reference_pattern + 1e-10)
+            ratio = ratio[~np.isnan(ratio)]
+            if len(ratio) > 0:
+                log_ratio = np.log(ratio + 1e-10)
+                log_ratio = log_ratio[np.isfinite(log_ratio)]
+                if len(log_ratio) > 0:
+                    cai = np.exp(np.mean(log_ratio))
+                    cai_values.append(cai if not np.isnan(cai) and np.isfinite(cai) else 1.0)
+                else:
+                    cai_values.append(1.0)
+            else:
+                cai_values.append(1.0)
+        except Exception:
+            cai_values.append(1.0)
+    return np.asarray(cai_values, dtype=float)
+
+
+def legacy_similarity_features(df: pd.DataFrame, kingdoms: pd.Series) -> pd.DataFrame:
+    mean_profile = df.mean(axis=0).values.reshape(1, -1)
+    median_profile = df.median(axis=0).values.reshape(1, -1)
+    features = pd.DataFrame({
+        'cosine_similarity_to_mean': cosine_similarity(df.values, mean_profile).flatten(),
+        'cosine_similarity_to_median': cosine_similarity(df.values, median_profile).flatten(),
+    }, index=df.index)
+    for kingdom in kingdoms.unique():
+        kingdom_mask = kingdoms == kingdom
+        if kingdom_mask.sum() > 1:
+            kingdom_profile = df[kingdom_mask].mean(axis=0).values.reshape(1, -1)
+            features[f'cos_sim_{kingdom}'] = cosine_similarity(df.values, kingdom_profile).flatten()
+    return features
+
+
+# --- benchmark ------------------------------------------------------------------
+
+def stages(df_aa_norm: pd.DataFrame, kingdoms: pd.Series) -> dict:
+    """stage -> (legacy callable, vectorized callable), both returning comparable arrays"""
+    x = df_aa_norm.to_numpy()
+    groups = codon_bias.property_groups(list(df_aa_norm.columns))
+    return {
+        "row_statistics": (
+            lambda: legacy_row_statistics(df_aa_norm).to_numpy(),
+            lambda: np.nan_to_num(np.column_stack(list(codon_bias.row_statistics(x).values()))),
+        ),
+        "property_features": (
+            lambda: legacy_property_features(df_aa_norm).to_numpy(),
+            lambda: np.column_stack([a for g in groups.values() for a in codon_bias.property_usage_entropy(x, g)]),
+        ),
+        "enc_approx": (
+            lambda: legacy_enc_approx(df_aa_norm),
+            lambda: codon_bias.enc_approx(x, groups),
+        ),
+        "cai_approx": (
+            lambda: legacy_cai_approx(df_aa_norm),
+            lambda: codon_bias.cai_approx(x),
+        ),
+        "similarities": (
+            lambda: legacy_similarity_features(df_aa_norm, kingdoms).to_numpy(),
+            lambda: codon_bias.similarity_features(df_aa_norm, kingdoms.to_numpy()).to_numpy(),
+        ),
+    }
+
+
+def timed(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(n_rows: int, seed: int, repeat: int) -> dict:
+    table = make_codon_table(n_rows, seed)
+    df_aa_norm = amino_acid_frequencies(table[CODONS])
+    kingdoms = table.loc[df_aa_norm.index, "Kingdom"]
+
+    results = {"rows": len(df_aa_norm), "stages": {}}
+    for name, (legacy, vectorized) in stages(df_aa_norm, kingdoms).items():
+        legacy_seconds, expected = timed(legacy, 1)
+        vectorized_seconds, actual = timed(vectorized, repeat)
+        results["stages"][name] = {
+            "legacy_seconds": round(legacy_seconds, 4),
+            "vectorized_seconds": round(vectorized_seconds, 6),
+            "speedup": round(legacy_seconds / vectorized_seconds, 1),
+            "max_abs_diff": float(np.max(np.abs(np.asarray(expected, dtype=float) - actual))),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=13028, help="synthetic rows (the full dataset has 13028)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="vectorized runs per stage (best is kept)")
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.seed, args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,109 @@
+"""FASTA codon counting: services.fasta_ingest vs a codon-by-codon Python count.
+
+Writes seeded CDS sets (about 1 kb per gene, 60-column lines) as plain
+and gzipped FASTA and times the full file -> per-species table path:
+serial, split into byte ranges across ``--workers`` processes, and from
+gzip. The Python baseline reads the same file line by line and counts
+``collections.Counter`` codons per record, the way small standalone
+scripts do it. ``same_counts`` checks both agree.
+
+Run from backend/:
+
+    python benchmarks/fasta_ingest.py --genes 20000 200000 --output fasta_ingest.json
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from core import config  # noqa: E402
+from services.fasta_ingest import CODONS, count_file  # noqa: E402
+
+
+def write_cds_set(path: str, n_genes: int, n_species: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    codons = np.array([codon.replace("U", "T") for codon in CODONS])
+    profiles = rng.dirichlet(np.ones(len(CODONS)), n_species)
+    with open(path, "w") as f:
+        for gene in range(n_genes):
+            species = gene % n_species
+            sequence = "".join(codons[rng.choice(len(CODONS), int(rng.integers(200, 500)), p=profiles[species])])
+            f.write(f">gene_{gene} [organism=species {species}]\n")
+            f.write("\n".join(sequence[i:i + 60] for i in range(0, len(sequence), 60)) + "\n")
+
+
+def python_counts(path: str):
+    """Codon-by-codon baseline"""
+    counts, header, parts = {}, None, []
+
+    def finish():
+        if header is not None:
+            sequence = "".join(parts).upper().replace("T", "U")
+            name = header.split("[organism=", 1)[1].split("]", 1)[0]
+            counts.setdefault(name, Counter()).update(sequence[i:i + 3] for i in range(0, len(sequence) - 2, 3))
+
+    with open(path) as f:
+        for line in f:
+            if line.startswith(">"):
+                finish()
+                header, parts = line, []
+            else:
+                parts.append(line.strip())
+    finish()
+    return {name: np.array([c[codon] for codon in CODONS]) for name, c in counts.items()}
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return round(time.perf_counter() - started, 3), result
+
+
+def run(gene_counts, n_species: int, workers: int, seed: int) -> dict:
+    config.FASTA_PARALLEL_MIN_BYTES = 0
+    results = {"workers": workers, "sizes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_genes in gene_counts:
+            path = os.path.join(tmp, "cds.fasta")
+            write_cds_set(path, n_genes, n_species, seed)
+            with open(path, "rb") as f, gzip.open(f"{path}.gz", "wb", compresslevel=6) as packed:
+                shutil.copyfileobj(f, packed)
+
+            size = {"megabytes": round(os.path.getsize(path) / 1e6, 1)}
+            size["python_seconds"], expected = timed(lambda: python_counts(path))
+            size["serial_seconds"], serial = timed(lambda: count_file(path, "organism", 0, 0))
+            size["parallel_seconds"], parallel = timed(lambda: count_file(path, "organism", 0, workers))
+            size["gzip_seconds"], packed = timed(lambda: count_file(f"{path}.gz", "organism", 0, 0))
+            size["megabytes_per_second_serial"] = round(size["megabytes"] / max(size["serial_seconds"], 1e-9), 1)
+            names, _, _, counts = serial
+            size["same_counts"] = bool(
+                all(np.array_equal(counts[i], expected[name]) for i, name in enumerate(names))
+                and all(np.array_equal(counts, other[3]) for other in (parallel, packed))
+            )
+            results["sizes"][str(n_genes)] = size
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--genes", type=int, nargs="+", default=[20000, 200000])
+    parser.add_argument("--species", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.genes, args.species, args.workers, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
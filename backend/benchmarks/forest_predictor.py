@@ -0,0 +1,138 @@
+"""Serving classifier: sklearn vs the flattened tree arrays of services.shared_weights.
+
+The shipped ``best_classification_model.pkl`` scores seeded rows shaped like
+the classifier input (scaled features, float32) four ways:
+
+* ``sklearn_two_calls``  - ``predict`` then ``predict_proba`` (every tree walked twice)
+* ``sklearn_proba``      - ``predict_proba`` once, labels by argmax
+* ``node_table``         - ``SharedForest`` over the node table only (all trees per step)
+* ``complete``           - ``SharedForest`` over the complete-tree layout (one tree at a time)
+* ``serving``            - what a private (non-shared) ``load_models`` scores with at that
+  size: the flattened trees up to ``CODON_FLAT_FOREST_MAX_ROWS`` rows, sklearn above
+
+Every compiled scenario must return sklearn's labels and probabilities
+bit for bit (``same_as_sklearn``). ``serving`` must not be slower than
+``sklearn_proba`` (``not_slower_than_sklearn``, 10% allowed for noise);
+a false there at 100k rows or more means large uploads lost throughput.
+
+Run from backend/:
+
+    python benchmarks/forest_predictor.py --rows 1000 100000 1000000 --output forest_predictor.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+from core import config  # noqa: E402
+from services.inference import CompiledPipeline  # noqa: E402
+from services.shared_weights import SharedForest, compile_forest, flatten_forest  # noqa: E402
+
+# Timing noise tolerated before ``serving`` counts as slower than sklearn
+SERVING_TOLERANCE = 0.10
+
+
+def load_classifier(model_dir: str):
+    import joblib
+
+    return joblib.load(os.path.join(model_dir, "best_classification_model.pkl"))
+
+
+def serving_pipeline(model_dir: str, classifier) -> CompiledPipeline:
+    """CompiledPipeline set up like a private ``load_models``"""
+    import joblib
+
+    scaler, pca, kmeans, feature_names = (
+        joblib.load(os.path.join(model_dir, name))
+        for name in ("scaler.pkl", "pca.pkl", "kmeans_model.pkl", "feature_columns.pkl")
+    )
+    pipeline = CompiledPipeline(scaler, pca, kmeans, classifier, feature_names)
+    pipeline.use_small_batch_classifier(compile_forest(classifier), config.FLAT_FOREST_MAX_ROWS)
+    return pipeline
+
+
+def make_inputs(n_rows: int, n_features: int, seed: int = 0) -> np.ndarray:
+    """Scaled-feature-like rows: mostly within a few units of 0"""
+    rng = np.random.default_rng(seed)
+    return (2 * rng.standard_normal((n_rows, n_features))).astype(np.float32)
+
+
+def timed(fn, repeat: int):
+    best, value = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - started)
+    return value, best
+
+
+def run(rows, model_dir: str, threshold_dtype: str, repeat: int, seed: int) -> dict:
+    classifier = load_classifier(model_dir)
+    arrays = flatten_forest(classifier, threshold_dtype=np.dtype(threshold_dtype).type)
+    node_arrays = {name: array for name, array in arrays.items() if not name.startswith("tree_complete_")}
+    forests = {
+        "node_table": SharedForest(node_arrays, classifier.classes_, classifier.n_features_in_),
+        "complete": SharedForest(arrays, classifier.classes_, classifier.n_features_in_),
+    }
+    pipeline = serving_pipeline(model_dir, classifier)
+    results = {
+        "model": type(classifier).__name__,
+        "trees": forests["node_table"].n_trees,
+        "max_depth": forests["node_table"].max_depth,
+        "threshold_dtype": threshold_dtype,
+        "flat_forest_max_rows": config.FLAT_FOREST_MAX_ROWS,
+        "complete_layout": forests["complete"].is_complete,
+        "array_bytes": {"node_table": sum(a.nbytes for a in node_arrays.values()),
+                        "complete": sum(a.nbytes for a in arrays.values())},
+        "sizes": {},
+    }
+
+    for n_rows in rows:
+        X = make_inputs(n_rows, classifier.n_features_in_, seed)
+        size = {}
+        (labels, proba), seconds = timed(lambda: (classifier.predict(X), classifier.predict_proba(X)), repeat)
+        size["sklearn_two_calls"] = {"seconds": round(seconds, 4), "rows_per_second": round(n_rows / seconds)}
+        _, seconds = timed(lambda: classifier.classes_[classifier.predict_proba(X).argmax(axis=1)], repeat)
+        size["sklearn_proba"] = {"seconds": round(seconds, 4), "rows_per_second": round(n_rows / seconds)}
+        for name, forest in forests.items():
+            (forest_labels, forest_proba), seconds = timed(lambda: forest.predict_with_proba(X), repeat)
+            size[name] = {
+                "seconds": round(seconds, 4),
+                "rows_per_second": round(n_rows / seconds),
+                "speedup": round(size["sklearn_two_calls"]["seconds"] / seconds, 2),
+                "same_as_sklearn": bool(np.array_equal(forest_labels, labels) and np.array_equal(forest_proba, proba)),
+            }
+        serving = pipeline.classifier_for(n_rows)
+        serving_proba, seconds = timed(lambda: serving.predict_proba(X), repeat)
+        size["serving"] = {
+            "uses": "sklearn" if serving is classifier else "flattened",
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(n_rows / seconds),
+            "same_as_sklearn": bool(np.array_equal(serving_proba, proba)),
+            "not_slower_than_sklearn": seconds <= size["sklearn_proba"]["seconds"] * (1 + SERVING_TOLERANCE),
+        }
+        results["sizes"][str(n_rows)] = size
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--model-dir", default=os.path.join(APP_DIR, "models"))
+    parser.add_argument("--threshold-dtype", choices=["float32", "float64"], default="float32")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.model_dir, args.threshold_dtype, args.repeat, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,149 @@
+"""Out-of-core training vs the in-memory notebook pipeline.
+
+``in_memory_pipeline`` follows ``ImprovedCodonClusteringPipeline.full_pipeline``
+(clean, aggregate, normalize, codon bias and similarity features, variance
+filter, log, scaling, PCA) with a fixed k in place of the parameter search.
+On a seeded codon table written to CSV it is compared with
+``services.incremental_training.train_out_of_core``: time, peak traced
+memory and the agreement (ARI) of the two clusterings on the same rows.
+
+Run from backend/:
+
+    python benchmarks/incremental_training.py --rows 200000 --chunk-rows 20000 --output incremental_training.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services.codon_bias import advanced_features, similarity_features  # noqa: E402
+from services.feature_engine import CODON_TO_AA  # noqa: E402
+from services.incremental_training import predict_clusters, train_out_of_core  # noqa: E402
+
+KINGDOMS = ["bct", "vrl", "pln", "inv", "vrt"]
+CODONS = ["".join(c) for c in product("UCAG", repeat=3)]
+
+
+def make_training_table(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Seeded codon usage table: 5 metadata columns, then per-kingdom codon frequencies"""
+    rng = np.random.default_rng(seed)
+    profiles = rng.dirichlet(np.ones(len(CODONS)) * 2, size=len(KINGDOMS))
+    kingdom_idx = rng.integers(0, len(KINGDOMS), n_rows)
+    freqs = rng.gamma(profiles[kingdom_idx] * 200)
+    freqs /= freqs.sum(axis=1, keepdims=True)
+    freqs[rng.random(freqs.shape) < 0.001] = np.nan
+    df = pd.DataFrame(freqs, columns=CODONS)
+    df.insert(0, "SpeciesName", [f"species_{i}" for i in range(n_rows)])
+    df.insert(0, "Ncodons", rng.integers(1000, 100000, n_rows))
+    df.insert(0, "SpeciesID", np.arange(n_rows))
+    df.insert(0, "DNAtype", 0)
+    df.insert(0, "Kingdom", np.array(KINGDOMS)[kingdom_idx])
+    return df
+
+
+def in_memory_pipeline(codon_data: pd.DataFrame, n_clusters: int, scaling_method: str = 'robust',
+                       variance_threshold: float = 0.85):
+    """(cluster labels indexed like ``codon_data``, scaled features) the notebook's way"""
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import PCA
+    from sklearn.feature_selection import VarianceThreshold
+    from sklearn.preprocessing import LabelEncoder, MinMaxScaler, RobustScaler, StandardScaler
+
+    data = codon_data.copy()
+    codon_cols = data.columns[5:]
+    for col in codon_cols:
+        data[col] = pd.to_numeric(data[col], errors='coerce')
+    numeric_cols = data.select_dtypes(include=np.number).columns
+    data[numeric_cols] = data[numeric_cols].fillna(data[numeric_cols].median())
+    data = data[data[codon_cols].sum(axis=1) > 0]
+
+    df_aa = pd.DataFrame(index=data.index)
+    for codon, aa in CODON_TO_AA.items():
+        if codon in codon_cols:
+            df_aa[aa] = df_aa[aa] + data[codon] if aa in df_aa else data[codon]
+
+    row_sums = df_aa.sum(axis=1)
+    valid_rows = row_sums > row_sums.quantile(0.05)
+    df_aa, data = df_aa[valid_rows], data[valid_rows]
+    row_sums = df_aa.sum(axis=1)
+    df_aa_norm = (df_aa + 1e-8).div(row_sums + 1e-8 * len(df_aa.columns), axis=0)
+
+    stats = advanced_features(df_aa_norm)
+    cos_sim = similarity_features(df_aa_norm, data['Kingdom'].to_numpy())
+    features = pd.concat([df_aa_norm, stats, cos_sim], axis=1)
+    features['kingdom_encoded'] = LabelEncoder().fit_transform(data['Kingdom'])
+    features['entropy_std_interaction'] = (features['entropy'] * features['std']).fillna(0)
+    features['mean_gini_interaction'] = (features['mean'] * features['gini']).fillna(0)
+    features = features.fillna(0).replace([np.inf, -np.inf], 0)
+    selector = VarianceThreshold(threshold=1e-8).fit(features)
+    features = features.loc[:, selector.get_support()]
+
+    features_log = np.log1p(features.clip(lower=0)).fillna(0).replace([np.inf, -np.inf], 0)
+    scaler = {'robust': RobustScaler, 'minmax': MinMaxScaler, 'standard': StandardScaler}[scaling_method]()
+    X_scaled = scaler.fit_transform(features_log)
+
+    cumulative = np.cumsum(PCA().fit(X_scaled).explained_variance_ratio_)
+    n_components = int(np.argmax(cumulative >= variance_threshold)) + 1
+    n_components = max(1, min(n_components, 50, X_scaled.shape[1], X_scaled.shape[0] - 1))
+    X_pca = PCA(n_components=n_components).fit_transform(X_scaled)
+    labels = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit_predict(X_pca)
+    return pd.Series(labels, index=features.index), features_log
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, {"seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def run(n_rows: int, chunk_rows: int, sample_rows: int, n_clusters: int, seed: int) -> dict:
+    from sklearn.metrics import adjusted_rand_score
+
+    table = make_training_table(n_rows, seed=seed)
+    results = {"rows": n_rows, "chunk_rows": chunk_rows, "sample_rows": sample_rows, "scenarios": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "codon_usage.csv")
+        table.to_csv(csv_path, index=False)
+
+        (expected, _), timing = measure(lambda: in_memory_pipeline(pd.read_csv(csv_path), n_clusters))
+        results["scenarios"]["in_memory"] = timing
+        models, timing = measure(lambda: train_out_of_core(
+            csv_path, n_clusters, chunk_rows=chunk_rows, sample_rows=sample_rows))
+        results["scenarios"]["out_of_core"] = {**timing, **models.summary}
+
+    labels = pd.concat([predict_clusters(models, table.iloc[start:start + chunk_rows])
+                        for start in range(0, n_rows, chunk_rows)])
+    common = expected.index.intersection(labels.index)
+    results["ari"] = float(adjusted_rand_score(expected[common], labels[common]))
+    results["rows_compared"] = len(common)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-rows", type=int, default=20000)
+    parser.add_argument("--sample-rows", type=int, default=20000)
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.chunk_rows, args.sample_rows, args.clusters, args.seed)
+    print(json.dumps(results, indent=2, default=float))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=float)
@@ -0,0 +1,97 @@
+"""Similar-species lookup: services.neighbor_index vs sklearn's BallTree and brute-force search.
+
+Seeded PCA-like reference vectors (the codon usage dataset has ~13k
+species; larger sizes show how the exact scan grows) are queried one
+species at a time and in batches. Latencies are medians over ``--repeat``
+queries; ``same_as_sklearn`` checks the returned neighbour ids.
+
+Run from backend/:
+
+    python benchmarks/neighbor_index.py --references 13000 100000 --output neighbor_index.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from services.neighbor_index import NeighborIndex  # noqa: E402
+
+
+def make_vectors(n_rows: int, n_components: int, seed: int = 0) -> np.ndarray:
+    """Clustered rows with decaying variance per component, like PCA scores"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((8, n_components)) * 3
+    scale = 1 / np.sqrt(np.arange(1, n_components + 1))
+    return ((centers[rng.integers(0, 8, n_rows)] + rng.standard_normal((n_rows, n_components))) * scale).astype(np.float32)
+
+
+def median_ms(fn, queries, batch: int, repeat: int):
+    times, result = [], None
+    for i in range(repeat):
+        start = (i * batch) % (len(queries) - batch + 1)
+        started = time.perf_counter()
+        result = fn(queries[start:start + batch])
+        times.append(time.perf_counter() - started)
+    return round(1000 * statistics.median(times), 3), result
+
+
+def run(references, n_components: int, k: int, batches, repeat: int, seed: int) -> dict:
+    from sklearn.neighbors import BallTree, NearestNeighbors
+
+    results = {"n_components": n_components, "k": k, "sizes": {}}
+    for n_reference in references:
+        vectors = make_vectors(n_reference, n_components, seed)
+        queries = make_vectors(max(batches) * 4, n_components, seed + 1)
+        metadata = np.rec.fromarrays([np.arange(n_reference)], names=["SpeciesID"]).view(np.ndarray)
+        size = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            NeighborIndex.from_vectors(vectors, metadata, "cosine").save(tmp)
+            index = NeighborIndex.load(tmp)
+            size["build_seconds"] = round(time.perf_counter() - started, 3)
+
+            started = time.perf_counter()
+            ball_tree = BallTree(vectors)
+            size["ball_tree_build_seconds"] = round(time.perf_counter() - started, 3)
+            brute = NearestNeighbors(n_neighbors=k, metric="cosine", algorithm="brute").fit(vectors)
+            euclidean = NeighborIndex.from_vectors(vectors, metadata, "euclidean")
+
+            for batch in batches:
+                ms, (ids, _) = median_ms(lambda q: index.query(q, k), queries, batch, repeat)
+                ref_ms, (_, ref_ids) = median_ms(lambda q: brute.kneighbors(q), queries, batch, repeat)
+                euclidean_ms, (euclidean_ids, _) = median_ms(lambda q: euclidean.query(q, k), queries, batch, repeat)
+                tree_ms, (_, tree_ids) = median_ms(lambda q: ball_tree.query(q, k=k), queries, batch, repeat)
+                size[f"batch_{batch}"] = {
+                    "cosine_index_ms": ms,
+                    "sklearn_brute_cosine_ms": ref_ms,
+                    "euclidean_index_ms": euclidean_ms,
+                    "ball_tree_ms": tree_ms,
+                    "same_as_sklearn": bool(np.array_equal(ids, ref_ids) and np.array_equal(euclidean_ids, tree_ids)),
+                }
+        results["sizes"][str(n_reference)] = size
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--references", type=int, nargs="+", default=[13000, 100000])
+    parser.add_argument("--components", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    results = run(args.references, args.components, args.k, args.batches, args.repeat, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,86 @@
+"""Cold-start benchmark for the API process.
+
+Each measurement runs in a fresh interpreter so import and load costs are
+real cold-start numbers:
+
+* ``import_seconds``       - ``import main``
+* ``live_seconds``         - process start until /health/live answers
+* ``ready_seconds``        - process start until /health/ready answers 200
+* ``first_request_seconds``- latency of the first /analyze after ready
+
+Run from backend/:
+
+    python benchmarks/startup.py --repeat 3 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+SAMPLE_CSV = os.path.join(BACKEND_DIR, "tests", "fixtures", "codon_usage_sample.csv")
+
+SCENARIOS = {
+    "eager": {"CODON_STARTUP_MODE": "eager", "CODON_WARMUP": "0"},
+    "eager_warmup": {"CODON_STARTUP_MODE": "eager", "CODON_WARMUP": "1"},
+    "background_warmup": {"CODON_STARTUP_MODE": "background", "CODON_WARMUP": "1"},
+}
+
+
+def child():
+    """One cold start, timed from interpreter start; prints a JSON line"""
+    started = time.perf_counter()
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    import main
+    from fastapi.testclient import TestClient
+
+    timings = {"import_seconds": time.perf_counter() - started}
+    with TestClient(main.app) as client:
+        client.get("/health/live").raise_for_status()
+        timings["live_seconds"] = time.perf_counter() - started
+        while client.get("/health/ready").status_code != 200:
+            time.sleep(0.01)
+        timings["ready_seconds"] = time.perf_counter() - started
+
+        with open(SAMPLE_CSV, "rb") as f:
+            body = f.read()
+        request_started = time.perf_counter()
+        client.post("/analyze", files={"file": ("sample.csv", body, "text/csv")}).raise_for_status()
+        timings["first_request_seconds"] = time.perf_counter() - request_started
+    print(json.dumps(timings))
+
+
+def run(repeat: int) -> dict:
+    results = {}
+    for name, overrides in SCENARIOS.items():
+        env = {**os.environ, "CODON_POOL_WORKERS": "0", "CODON_RESULT_CACHE_DIR": "", **overrides}
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, __file__, "--child"], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[name] = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON results here as well")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit(0)
+
+    results = run(args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
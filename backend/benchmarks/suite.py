@@ -0,0 +1,243 @@
+"""Benchmark suite on synthetic codon tables, with a stored baseline and regression check.
+
+Serving cases run on ``synthetic.make_codon_table`` tables at ``--sizes`` rows
+(1k, 100k and 1M by default) against the shipped models:
+
+* ``preprocess``: codon table to feature frame, batch mode
+* ``preprocess_frozen``: the same against frozen reference stats
+* ``transform``: align, then scaler + PCA + nearest-centroid clusters
+* ``classify``: the kingdom classifier on the clustered matrix
+* ``assemble``: predictions attached to the upload rows, plus the summary
+* ``serialize``: the NDJSON response body, counted but not kept
+* ``analyze``: ``run_analysis`` on the table written to CSV (up to
+  ``ANALYZE_MAX_ROWS`` rows; the CSV is written outside the timing)
+
+Each case gets the previous case's output, so their times add up to one
+/analyze call. Training cases run the notebook's pipelines at the smaller
+``--training-sizes``, before the serving cases. ``notebook_clustering`` is
+``incremental_training.in_memory_pipeline``. ``notebook_classification``
+is ``ClassifierBakeoff.run_models`` on its features and clusters, serial.
+
+Every case is timed ``--repeat`` times (best and median seconds; tables of
+``SINGLE_RUN_ROWS`` rows or more run once). A separate run under
+tracemalloc records the peak traced allocation. ``--write-baseline``
+stores the results. ``--baseline`` compares against stored results and
+exits with status 1 when a case got slower or bigger than the
+thresholds allow. Differences below ``MIN_SECONDS`` or ``MIN_PEAK_MB``
+are noise and never flagged. Baselines only compare on the machine that
+wrote them: the environment is stored with them, and a mismatch is
+reported.
+
+Run from backend/:
+
+    python benchmarks/suite.py --write-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --output suite.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from incremental_training import in_memory_pipeline  # noqa: E402
+from services import analysis  # noqa: E402
+from services.classifier_bakeoff import ClassifierBakeoff  # noqa: E402
+from services.feature_engine import fit_reference_stats  # noqa: E402
+from services.response_formats import iter_ndjson  # noqa: E402
+from synthetic import make_codon_table  # noqa: E402
+
+FORMAT_VERSION = 1
+SIZES = (1000, 100_000, 1_000_000)
+TRAINING_SIZES = (1000, 5000)
+# Writing and re-parsing a 1M-row CSV takes minutes; the stage cases cover that size
+ANALYZE_MAX_ROWS = 100_000
+SINGLE_RUN_ROWS = 1_000_000
+REFERENCE_ROWS = 20_000
+N_CLUSTERS = 4
+MIN_SECONDS = 0.025
+MIN_PEAK_MB = 1.0
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def measure(fn: Callable, repeat: int, memory: bool = True):
+    """``(value, stats)``: best and median of ``repeat`` runs, then one traced run for the peak"""
+    times = []
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - started)
+        del value
+    stats = {"seconds": round(min(times), 6), "median_seconds": round(statistics.median(times), 6),
+             "repeat": repeat}
+    if memory:
+        tracemalloc.start()
+        try:
+            value = fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        stats["peak_mb"] = round(peak / 2 ** 20, 1)
+    else:
+        value = fn()
+    return value, stats
+
+
+def serving_cases(table: pd.DataFrame, reference: dict, tmp: str, repeat: int, memory: bool) -> Dict[str, dict]:
+    raw_features = table.iloc[:, 5:]
+    pipeline = analysis.compiled_pipeline
+    cases = {}
+
+    features, cases["preprocess"] = measure(lambda: analysis.preprocess_feature(raw_features), repeat, memory)
+    _, cases["preprocess_frozen"] = measure(
+        lambda: analysis.preprocess_feature(raw_features, reference=reference), repeat, memory)
+
+    def transform():
+        X = pipeline.align(features)
+        return X, pipeline.predict(X, classify=False).clusters
+
+    (X, clusters), cases["transform"] = measure(transform, repeat, memory)
+    (labels, proba), cases["classify"] = measure(lambda: pipeline.classify(X, clusters), repeat, memory)
+
+    prepared = analysis.PreparedUpload(table, features, X, None)
+    output = analysis.ModelOutput(clusters, labels, proba, None)
+    result, cases["assemble"] = measure(lambda: analysis.assemble_result(prepared, output), repeat, memory)
+    n_bytes, cases["serialize"] = measure(lambda: sum(len(chunk) for chunk in iter_ndjson(result)),
+                                          repeat, memory)
+    cases["serialize"]["bytes"] = n_bytes
+
+    if len(table) <= ANALYZE_MAX_ROWS:
+        csv_path = os.path.join(tmp, f"codon_usage_{len(table)}.csv")
+        table.to_csv(csv_path, index=False)
+        _, cases["analyze"] = measure(lambda: analysis.run_analysis(csv_path), repeat, memory)
+        os.unlink(csv_path)
+    for stats in cases.values():
+        stats["scored_rows"] = len(X)
+    return cases
+
+
+def training_cases(table: pd.DataFrame, repeat: int, memory: bool) -> Dict[str, dict]:
+    cases = {}
+    (clusters, features_log), cases["notebook_clustering"] = measure(
+        lambda: in_memory_pipeline(table, N_CLUSTERS), repeat, memory)
+
+    def classification():
+        with ClassifierBakeoff(features_log, clusters.to_numpy(), n_workers=0) as bakeoff:
+            return bakeoff.run_models()
+
+    _, cases["notebook_classification"] = measure(classification, repeat, memory)
+    return cases
+
+
+def run(sizes: Sequence[int] = SIZES, training_sizes: Sequence[int] = TRAINING_SIZES, repeat: int = 3,
+        seed: int = 0, memory: bool = True) -> dict:
+    analysis.load_models()
+    reference = fit_reference_stats(make_codon_table(REFERENCE_ROWS, seed=seed + 1).iloc[:, 5:])
+    results = {"format": FORMAT_VERSION, "environment": environment(), "seed": seed, "cases": {}}
+
+    # Before the large tables grow the heap, which speeds small cases up (~30%) and would tie them to --sizes
+    for n_rows in training_sizes:
+        table = make_codon_table(n_rows, seed=seed)
+        for name, stats in training_cases(table, repeat, memory).items():
+            results["cases"][f"{name}/{n_rows}"] = {"case": name, "rows": n_rows, **stats}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            table = make_codon_table(n_rows, seed=seed)
+            n_repeat = 1 if n_rows >= SINGLE_RUN_ROWS else repeat
+            for name, stats in serving_cases(table, reference, tmp, n_repeat, memory).items():
+                results["cases"][f"{name}/{n_rows}"] = {"case": name, "rows": n_rows, **stats}
+            del table
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.25,
+            memory_threshold: Optional[float] = 0.25) -> List[dict]:
+    """Cases slower (best time) or bigger (traced peak) than the baseline by more than the thresholds"""
+    regressions = []
+    for key, current in results["cases"].items():
+        before = baseline["cases"].get(key)
+        if before is None:
+            continue
+        checks = [("seconds", threshold, MIN_SECONDS)]
+        if memory_threshold is not None:
+            checks.append(("peak_mb", memory_threshold, MIN_PEAK_MB))
+        for field, limit, noise in checks:
+            if field not in current or field not in before:
+                continue
+            old, new = before[field], current[field]
+            if new - old > noise and new > old * (1 + limit):
+                regressions.append({"case": key, "metric": field, "baseline": old, "current": new,
+                                    "ratio": round(new / old, 3) if old else None})
+    return regressions
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("format") != FORMAT_VERSION:
+        raise SystemExit(f"{path}: baseline format {baseline.get('format')}, expected {FORMAT_VERSION}")
+    return baseline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SIZES))
+    parser.add_argument("--training-sizes", type=int, nargs="*", default=list(TRAINING_SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--baseline", help="compare with this baseline; exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed peak memory growth")
+    parser.add_argument("--write-baseline", help="store the results as a baseline")
+    parser.add_argument("--output", help="write the JSON results here as well")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    results = run(args.sizes, args.training_sizes, args.repeat, args.seed, memory=not args.no_memory)
+    if baseline is not None:
+        results["regressions"] = compare(results, baseline, args.threshold,
+                                         None if args.no_memory else args.memory_threshold)
+        if baseline["environment"] != results["environment"]:
+            results["environment_mismatch"] = baseline["environment"]
+
+    print(json.dumps(results, indent=2, default=float))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=float)
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            stored = {key: results[key] for key in ("format", "environment", "seed", "cases")}
+            json.dump(stored, f, indent=2, default=float)
+
+    if baseline is not None:
+        for regression in results["regressions"]:
+            print(f"REGRESSION {regression['case']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+        if results.get("environment_mismatch"):
+            print("warning: baseline was written in a different environment", file=sys.stderr)
+        sys.exit(1 if results["regressions"] else 0)
@@ -0,0 +1,74 @@
+"""Seeded synthetic codon usage tables shaped like the training data.
+
+Same layout as the upload CSVs: Kingdom, DNAtype, SpeciesID, Ncodons and
+SpeciesName, then the 64 RNA codons as frequencies. Rows come from
+kingdom-like mixtures:
+
+* each kingdom has its own codon profile
+* kingdoms appear in the proportions of the original data set
+* each species blends a GC-rich and an AT-rich variant of its kingdom's
+  profile, then varies around that blend
+
+Frequencies are rounded to 5 decimals like the original CSV. A fraction
+of the cells is NaN and some rows sum to zero, so the cleaning paths are
+exercised too. Tables are built in blocks, so a 1M-row table needs little
+memory beyond the table itself.
+
+    from synthetic import make_codon_table   (with backend/benchmarks on sys.path)
+"""
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+# All 64 codons, stop codons included, like the original CSV
+CODONS = ["".join(c) for c in product("UCAG", repeat=3)]
+METADATA_COLUMNS = ["Kingdom", "DNAtype", "SpeciesID", "Ncodons", "SpeciesName"]
+
+# Species per kingdom in the original codon usage data set
+KINGDOM_COUNTS = {"bct": 2920, "vrl": 2832, "pln": 2523, "vrt": 2077, "inv": 1345, "mam": 572,
+                  "phg": 220, "rod": 215, "pri": 180, "arc": 126, "plm": 18}
+# Genomic, mitochondrial, chloroplast
+DNATYPE_SHARES = (0.75, 0.2, 0.05)
+# Spread of species around their kingdom blend (larger = closer)
+SPECIES_CONCENTRATION = 300.0
+GC_TILT = 0.6
+BLOCK_ROWS = 100_000
+
+
+def kingdom_profiles(rng: np.random.Generator):
+    """(GC-rich, AT-rich) codon profiles per kingdom, rows summing to 1"""
+    base = rng.dirichlet(np.full(len(CODONS), 2.0), len(KINGDOM_COUNTS))
+    gc = np.array([sum(base_ in "GC" for base_ in codon) for codon in CODONS])
+    tilt = np.exp(GC_TILT * (gc - 1.5))
+    rich, poor = base * tilt, base / tilt
+    return rich / rich.sum(axis=1, keepdims=True), poor / poor.sum(axis=1, keepdims=True)
+
+
+def make_codon_table(n_rows: int, seed: int = 0, nan_fraction: float = 0.001,
+                     zero_fraction: float = 0.001) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    kingdoms = np.array(list(KINGDOM_COUNTS))
+    shares = np.array(list(KINGDOM_COUNTS.values()), dtype=float)
+    rich, poor = kingdom_profiles(rng)
+
+    kingdom_idx = rng.choice(len(kingdoms), n_rows, p=shares / shares.sum())
+    freqs = np.empty((n_rows, len(CODONS)))
+    for start in range(0, n_rows, BLOCK_ROWS):
+        idx = kingdom_idx[start:start + BLOCK_ROWS]
+        weight = rng.beta(2.0, 2.0, len(idx))[:, None]
+        blend = weight * rich[idx] + (1.0 - weight) * poor[idx]
+        block = rng.gamma(blend * SPECIES_CONCENTRATION)
+        block /= block.sum(axis=1, keepdims=True)
+        freqs[start:start + len(idx)] = np.round(block, 5)
+
+    freqs[rng.random(freqs.shape) < nan_fraction] = np.nan
+    freqs[rng.random(n_rows) < zero_fraction] = 0.0
+
+    table = pd.DataFrame(freqs, columns=CODONS)
+    table.insert(0, "SpeciesName", [f"synthetic species {i}" for i in range(n_rows)])
+    table.insert(0, "Ncodons", np.maximum(1000, rng.lognormal(np.log(5000), 1.2, n_rows)).astype(np.int64))
+    table.insert(0, "SpeciesID", np.arange(n_rows))
+    table.insert(0, "DNAtype", rng.choice(len(DNATYPE_SHARES), n_rows, p=DNATYPE_SHARES))
+    table.insert(0, "Kingdom", kingdoms[kingdom_idx])
+    return table
@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import tempfile
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Run analyses on a background thread unless a test builds its own process pool
+os.environ.setdefault("CODON_POOL_WORKERS", "0")
+os.environ.setdefault("CODON_JOBS_POLL_SECONDS", "0.05")
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MODEL_DIR = os.path.join(APP_DIR, "models")
+
+CODONS = [''.join(c) for c in product('UCAG', repeat=3)]
+METADATA_COLUMNS = ['Kingdom', 'DNAtype', 'SpeciesID', 'Ncodons', 'SpeciesName']
+
+
+def make_codon_table(n_rows=200, seed=0, nan_fraction=0.01, zero_rows=2):
+    """Seeded codon usage table: 5 metadata columns followed by the 64 codons"""
+    rng = np.random.default_rng(seed)
+    kingdoms = np.array(['bct', 'vrl', 'pln', 'vrt', 'inv'])
+    profiles = rng.dirichlet(np.ones(len(CODONS)) * 2, size=len(kingdoms))
+    kingdom_idx = rng.integers(0, len(kingdoms), n_rows)
+    freqs = np.vstack([rng.dirichlet(profiles[k] * 200) for k in kingdom_idx])
+    freqs[rng.random(freqs.shape) < nan_fraction] = np.nan
+    freqs[:zero_rows] = 0
+
+    df = pd.DataFrame(freqs, columns=CODONS)
+    df.insert(0, 'SpeciesName', [f'species_{i}' for i in range(n_rows)])
+    df.insert(0, 'Ncodons', rng.integers(1000, 100000, n_rows))
+    df.insert(0, 'SpeciesID', np.arange(n_rows))
+    df.insert(0, 'DNAtype', 0)
+    df.insert(0, 'Kingdom', kingdoms[kingdom_idx])
+    return df
+
+
+@pytest.fixture
+def codon_table():
+    return make_codon_table()
+
+
+@pytest.fixture(scope="session")
+def models():
+    """The shipped model artifacts, keyed by file name without extension"""
+    import warnings
+
+    import joblib
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return {
+            name: joblib.load(os.path.join(MODEL_DIR, f"{name}.pkl"))
+            for name in ("scaler", "pca", "kmeans_model", "best_classification_model", "feature_columns")
+        }
+
+
+@pytest.fixture
+def sample_csv_path():
+    return os.path.join(FIXTURE_DIR, "codon_usage_sample.csv")
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+
+def metric_sample(text, name, **labels):
+    """Value of one sample in the Prometheus text output (None if absent)"""
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = '^' + re.escape(f'{name}{{{label_text}}}' if labels else name) + r' (\S+)$'
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def state_dirs():
+    """Job store and shared model weights of the test run in a temp directory removed at the end
+
+    ``main`` is only imported inside tests, so its job store is created here
+    too; process workers read the environment.
+    """
+    from core import config
+
+    with tempfile.TemporaryDirectory(prefix="codon_tests_") as root, pytest.MonkeyPatch.context() as patch:
+        jobs_dir = os.path.join(root, "jobs")
+        weights_dir = os.path.join(root, "weights")
+        for env_name, name, value in [
+            ("CODON_JOBS_DIR", "JOBS_DIR", jobs_dir),
+            ("CODON_JOBS_DB_PATH", "JOBS_DB_PATH", os.path.join(jobs_dir, "jobs.sqlite3")),
+            ("CODON_SHARED_WEIGHTS_DIR", "SHARED_WEIGHTS_DIR", weights_dir),
+        ]:
+            patch.setenv(env_name, value)
+            patch.setattr(config, name, value)
+        yield root
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,92 @@
+import os
+import shutil
+
+import joblib
+import pandas as pd
+import pytest
+
+from conftest import MODEL_DIR, csv_bytes, make_codon_table
+from services.artifacts import IMPORTANCE_FILE, TRAINING_CONFIG_FILE
+
+
+@pytest.fixture
+def model_copy(client, tmp_path, monkeypatch):
+    """Models plus an importance file (with repeated features) and a training config"""
+    import main
+    from services import analysis
+
+    model_dir = tmp_path / 'models'
+    shutil.copytree(MODEL_DIR, model_dir)
+    feature_names = list(joblib.load(model_dir / 'feature_columns.pkl'))
+    importance = pd.DataFrame({
+        'Feature': feature_names[:8] + feature_names[:3],
+        'Importance': [0.30, 0.01, 0.22, 0.05, 0.18, 0.02, 0.11, 0.07, 0.10, 0.40, 0.02],
+    })
+    importance.to_csv(model_dir / IMPORTANCE_FILE, index=False)
+    joblib.dump({'includes_cluster': False, 'n_features': len(feature_names)}, model_dir / TRAINING_CONFIG_FILE)
+
+    monkeypatch.setattr(main.config, 'MODEL_DIR', str(model_dir))
+    monkeypatch.setattr(main.config, 'SHARED_WEIGHTS_DIR', str(tmp_path / 'weights'))
+    assert analysis.load_models()
+    yield model_dir, importance
+    monkeypatch.undo()
+    analysis.load_models()
+
+
+def legacy_detailed_analysis(summary, importance_df, mapping):
+    """The per-request nested loop the registry replaced"""
+    top_features = importance_df.sort_values('Importance', ascending=False)['Feature'].unique()[:5]
+    rows = []
+    for row in summary['classification_summary']:
+        for feat in top_features:
+            rows.append({
+                'Kingdom': row['Kingdom'],
+                'Cluster': row['Cluster'],
+                'n_species': row['count'],
+                'Feature': feat,
+                'Importance': float(importance_df[importance_df['Feature'] == feat]['Importance'].mean()),
+                'Feature_Description': mapping.get(feat, {}).get('description', feat),
+                'Feature_Detail': mapping.get(feat, {}).get('detail', ''),
+            })
+    return rows, top_features.tolist()
+
+
+def test_detailed_analysis_matches_legacy_loop(client, model_copy):
+    from services import analysis
+
+    _, importance = model_copy
+    body = csv_bytes(make_codon_table(n_rows=80, seed=5, nan_fraction=0))
+    summary = client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).json()
+
+    expected, top_features = legacy_detailed_analysis(summary, importance, analysis.full_description_mapping)
+    assert summary['top_features'] == top_features
+    assert summary['detailed_analysis'] == pytest.approx(expected)
+    assert analysis.training_config == analysis.artifact_registry.training_config
+
+
+def test_registry_is_loaded_once_and_reloaded_on_change(client, model_copy, monkeypatch):
+    from services import analysis
+
+    model_dir, importance = model_copy
+    registry = analysis.artifact_registry
+    assert registry.version == analysis.model_version
+
+    # Requests use the loaded tables; the registry is only rebuilt by load_models
+    loads = []
+    load_registry = analysis.load_registry
+    monkeypatch.setattr(analysis, 'load_registry', lambda *a, **kw: loads.append(a) or load_registry(*a, **kw))
+    body = csv_bytes(make_codon_table(n_rows=40, seed=6, nan_fraction=0))
+    client.post('/analyze', files={'file': ('b.csv', body, 'text/csv')})
+    client.post('/analyze', files={'file': ('c.csv', body + b'\n', 'text/csv')})
+    assert not loads and analysis.artifact_registry is registry
+
+    # A new importance file is a new model version: registry reloaded, cached result dropped
+    changed = importance.assign(Importance=importance['Importance'][::-1].to_numpy())
+    changed.to_csv(model_dir / IMPORTANCE_FILE, index=False)
+    path = model_dir / IMPORTANCE_FILE
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    summary = client.post('/analyze', files={'file': ('b.csv', body, 'text/csv')}).json()
+
+    assert len(loads) == 1 and analysis.artifact_registry is not registry
+    assert analysis.model_version != registry.version
+    assert summary['top_features'] == legacy_detailed_analysis(summary, changed, analysis.full_description_mapping)[1]
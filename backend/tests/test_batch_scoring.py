@@ -0,0 +1,69 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_codon_table
+from services import analysis
+from services.batch_scoring import SUMMARY_FILE, run_batch
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    directory = tmp_path / 'inputs'
+    (directory / 'nested').mkdir(parents=True)
+    for name, n_rows, seed in (('a.csv', 120, 80), ('b.csv', 60, 81), ('nested/c.csv', 90, 82)):
+        make_codon_table(n_rows=n_rows, seed=seed).to_csv(directory / name, index=False)
+    (directory / 'notes.txt').write_text('not an input')
+    return directory
+
+
+def scored(path):
+    return pd.read_csv(path)
+
+
+@pytest.mark.parametrize('workers', [0, 1])
+def test_outputs_match_the_analyze_pipeline(client, input_dir, tmp_path, workers):
+    output_dir = tmp_path / 'scored'
+    summary = run_batch([str(input_dir)], str(output_dir), workers=workers, fmt='csv', chunk_rows=50)
+
+    assert summary['scored'] == 3 and summary['failed'] == [] and summary['rows_per_second'] > 0
+    total = 0
+    for name in ('a', 'b', 'nested/c'):
+        expected = analysis.run_analysis(str(input_dir / f'{name}.csv')).table
+        output = scored(output_dir / f'{name}.csv')
+        assert 'UUU' not in output.columns and {'Cluster', 'Kingdom'} <= set(output.columns)
+        pd.testing.assert_frame_equal(output, expected[output.columns].reset_index(drop=True), check_dtype=False)
+        total += len(output)
+    assert summary['rows'] == total == summary['summary']['total_samples']
+    with open(output_dir / SUMMARY_FILE) as f:
+        assert json.load(f)['summary'] == json.loads(json.dumps(summary['summary']))
+
+
+def test_rerun_resumes_and_reports_failures(client, input_dir, tmp_path):
+    output_dir = tmp_path / 'scored'
+    first = run_batch([str(input_dir / '*.csv'), str(input_dir / 'nested')], str(output_dir), fmt='csv')
+    assert first['scored'] == 3
+    stamp = os.stat(output_dir / 'a.csv').st_mtime_ns
+
+    # An interrupted run leaves no manifest for its file; changed inputs are rescored too
+    os.unlink(output_dir / 'b.csv.done.json')
+    make_codon_table(n_rows=30, seed=83).to_csv(input_dir / 'nested' / 'c.csv', index=False)
+    (input_dir / 'broken.csv').write_text('a,b\n1,2\n')
+    second = run_batch([str(input_dir)], str(output_dir), fmt='csv')
+
+    assert second['skipped'] == 1 and second['scored'] == 2
+    assert [failure['input'] for failure in second['failed']] == [str(input_dir / 'broken.csv')]
+    assert os.stat(output_dir / 'a.csv').st_mtime_ns == stamp
+    assert len(scored(output_dir / 'nested' / 'c.csv')) <= 30
+    assert second['rows'] == sum(len(scored(output_dir / name)) for name in ('a.csv', 'b.csv', 'nested/c.csv'))
+    assert not (output_dir / 'broken.csv').exists()
+
+
+def test_parquet_in_and_out(client, tmp_path):
+    pytest.importorskip('pyarrow')
+    make_codon_table(n_rows=80, seed=84).to_parquet(tmp_path / 'in.parquet')
+    summary = run_batch([str(tmp_path / '*.parquet')], str(tmp_path / 'out'), fmt='parquet', chunk_rows=30)
+    output = pd.read_parquet(tmp_path / 'out' / 'in.parquet')
+    assert len(output) == summary['rows'] and {'Cluster', 'Kingdom'} <= set(output.columns)
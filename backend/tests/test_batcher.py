@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.batcher import MicroBatcher
+from services.response_formats import encode_json
+
+
+def test_concurrent_submits_share_one_model_call(client):
+    calls = []
+
+    def batch_fn(X):
+        calls.append(len(X))
+        return analysis.predict_models(X)
+
+    batcher = MicroBatcher(batch_fn, analysis.split_model_output, window_ms=50, max_rows=10_000)
+    rng = np.random.default_rng(5)
+    center = analysis.compiled_pipeline.center
+    scale = analysis.compiled_pipeline.scale
+    matrices = [center + 2 * scale * rng.standard_normal((n, len(center))) for n in (3, 7, 1, 12)]
+
+    async def submit_all():
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(X) for X in matrices))
+        finally:
+            batcher.shutdown()
+
+    outputs = asyncio.run(submit_all())
+
+    assert calls == [sum(len(X) for X in matrices)]
+    for X, output in zip(matrices, outputs):
+        expected = analysis.predict_models(X)
+        np.testing.assert_array_equal(output.clusters, expected.clusters)
+        np.testing.assert_array_equal(output.labels, expected.labels)
+        np.testing.assert_allclose(output.proba, expected.proba)
+    assert batcher.stats()['largest_batch'] == len(matrices)
+
+
+def test_max_rows_dispatches_before_window(client):
+    batcher = MicroBatcher(analysis.predict_models, analysis.split_model_output, window_ms=60_000, max_rows=4)
+    X = np.tile(analysis.compiled_pipeline.center, (4, 1))
+
+    async def submit():
+        batcher.start()
+        try:
+            return await asyncio.wait_for(batcher.submit(X), timeout=5)
+        finally:
+            batcher.shutdown()
+
+    assert len(asyncio.run(submit()).clusters) == 4
+
+
+def test_batch_tasks_are_held_until_done():
+    release = threading.Event()
+    batcher = MicroBatcher(lambda X: release.wait(5) and X, lambda output, sizes: [output], window_ms=0)
+
+    async def submit():
+        batcher.start()
+        try:
+            pending = asyncio.ensure_future(batcher.submit(np.zeros((2, 3))))
+            await asyncio.sleep(0.05)
+            held = len(batcher._tasks)
+            release.set()
+            await pending
+            await asyncio.sleep(0)
+            return held, len(batcher._tasks)
+        finally:
+            batcher.shutdown()
+
+    assert asyncio.run(submit()) == (1, 0)
+
+
+def test_small_uploads_match_unbatched_analysis(client, tmp_path):
+    import main
+
+    main.result_cache.clear()
+    uploads = [csv_bytes(make_codon_table(n_rows=n, seed=seed, nan_fraction=0, zero_rows=0))
+               for seed, n in ((21, 5), (22, 9), (23, 4))]
+    before = client.get('/health').json()['batcher']['requests']
+
+    responses = [None] * len(uploads)
+
+    def post(i):
+        responses[i] = client.post('/analyze', files={'file': ('s.csv', uploads[i], 'text/csv')})
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(uploads))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, body in enumerate(uploads):
+        path = tmp_path / f'{i}.csv'
+        path.write_bytes(body)
+        assert responses[i].status_code == 200
+        batched = responses[i].json()
+        expected = json.loads(encode_json(analysis.run_analysis(str(path)), handle=batched['result_handle']))
+        assert batched == expected
+    assert client.get('/health').json()['batcher']['requests'] == before + len(uploads)
@@ -0,0 +1,63 @@
+import copy
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(f"{name}_benchmark", os.path.join(BENCHMARKS, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def suite():
+    return load("suite")
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    return load("synthetic")
+
+
+def test_synthetic_tables_are_seeded_and_realistic(synthetic):
+    table = synthetic.make_codon_table(5000, seed=3, nan_fraction=0.01, zero_fraction=0.01)
+    assert list(table.columns) == synthetic.METADATA_COLUMNS + synthetic.CODONS and len(synthetic.CODONS) == 64
+    assert table.equals(synthetic.make_codon_table(5000, seed=3, nan_fraction=0.01, zero_fraction=0.01))
+
+    freqs = table[synthetic.CODONS].to_numpy()
+    assert np.isnan(freqs).any()
+    row_sums = np.nansum(freqs, axis=1)
+    assert (row_sums == 0).any()
+    assert np.allclose(row_sums[~np.isnan(freqs).any(axis=1) & (row_sums > 0)], 1, atol=1e-3)
+    # Kingdom mixture follows the original data set's proportions
+    shares = table["Kingdom"].value_counts(normalize=True)
+    assert set(shares.index) <= set(synthetic.KINGDOM_COUNTS) and shares.index[0] in ("bct", "vrl")
+    assert (table["Ncodons"] >= 1000).all()
+
+
+def test_suite_runs_and_flags_regressions(client, suite):
+    results = suite.run(sizes=[300], training_sizes=[300], repeat=1)
+
+    expected = {f"{name}/300" for name in ("preprocess", "preprocess_frozen", "transform", "classify", "assemble",
+                                            "serialize", "analyze", "notebook_clustering", "notebook_classification")}
+    assert set(results["cases"]) == expected
+    for case in results["cases"].values():
+        assert case["seconds"] > 0 and case["peak_mb"] >= 0
+    assert results["cases"]["serialize/300"]["bytes"] > 0
+    assert suite.compare(results, results) == []
+
+    baseline = copy.deepcopy(results)
+    baseline["cases"]["classify/300"]["seconds"], results["cases"]["classify/300"]["seconds"] = 0.1, 0.2
+    baseline["cases"]["transform/300"]["seconds"], results["cases"]["transform/300"]["seconds"] = 0.001, 0.004
+    baseline["cases"]["analyze/300"]["peak_mb"], results["cases"]["analyze/300"]["peak_mb"] = 10.0, 30.0
+    regressions = suite.compare(results, baseline)
+    # transform is 4x slower, but by less than MIN_SECONDS
+    assert [(r["case"], r["metric"], r["ratio"]) for r in regressions] == [
+        ("classify/300", "seconds", 2.0), ("analyze/300", "peak_mb", 3.0)]
+    assert suite.compare(results, baseline, threshold=1.5, memory_threshold=None) == []
@@ -0,0 +1,96 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from services.classifier_bakeoff import PARAM_GRIDS, ClassifierBakeoff, Task, xgboost_available
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "classifier_bakeoff.py")
+NAMES = ['Random Forest', 'SVM', 'Logistic Regression']
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("classifier_bakeoff_benchmark", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def data(benchmark):
+    return benchmark.make_feature_table(600, n_features=16, seed=2)
+
+
+def test_bakeoff_matches_notebook_loop(benchmark, data):
+    X, y = data
+    expected = benchmark.legacy_run_multiple_classifiers(X, y, NAMES)
+    with ClassifierBakeoff(X, y, n_workers=0) as bakeoff:
+        results = bakeoff.run_models(NAMES)
+        # One fold split for every model
+        assert len(bakeoff._folds) == 1
+
+    assert list(results) == NAMES
+    for name in NAMES:
+        assert results[name]['cv_mean'] == pytest.approx(expected[name]['cv_mean'])
+        assert results[name]['cv_std'] == pytest.approx(expected[name]['cv_std'])
+        assert results[name]['accuracy'] == pytest.approx(expected[name]['accuracy'])
+        assert results[name]['y_pred_proba'].shape == (len(results[name]['y_test']), 3)
+    assert results['Random Forest']['model'].n_jobs == 1
+    assert list(results['SVM']['y_test'].index) == list(bakeoff.y_test.index)
+
+
+def test_halving_search_drops_candidates_on_shared_folds(data):
+    X, y = data
+    # The notebook's Random Forest grid with smaller forests
+    grid = {**PARAM_GRIDS['Random Forest'], 'n_estimators': [10, 20]}
+    with ClassifierBakeoff(X, y, n_workers=0) as bakeoff:
+        model, best_params, result = bakeoff.halving_search('Random Forest', grid, n_iter=20, cv=3, eta=2)
+
+    rungs = {}
+    for record in bakeoff.records:
+        rungs.setdefault(record['rung'], []).append(record)
+    # 16 grid points on 3 folds, halved each rung on twice the rows
+    sizes = [len(rungs[f'halving-{i}']) // 3 for i in range(len(rungs) - 1)]
+    assert sizes[0] == 16
+    assert all(later == -(-earlier // 2) for earlier, later in zip(sizes, sizes[1:]))
+    rows = [rungs[f'halving-{i}'][0]['n_rows'] for i in range(len(sizes))]
+    assert rows == sorted(rows)
+    assert sum(sizes) * 3 < 16 * 3 * 2
+
+    assert best_params.keys() == grid.keys()
+    assert model.get_params()['n_estimators'] == best_params['n_estimators']
+    assert result['best_params'] == best_params
+    assert 0 <= result['accuracy'] <= 1
+    assert len(rungs['refit']) == 1 and rungs['refit'][0]['n_rows'] == len(bakeoff.X_train)
+
+
+def test_process_pool_gives_the_same_scores(data):
+    X, y = data
+    with ClassifierBakeoff(X, y, n_workers=0) as inline:
+        tasks = [Task(name, (), train, val) for name in NAMES for train, val in inline.folds(3)]
+        expected = inline.run(tasks)
+    with ClassifierBakeoff(X, y, n_workers=2) as pooled:
+        results = pooled.run(tasks)
+
+    assert [r.score for r in results] == [r.score for r in expected]
+
+
+@pytest.mark.skipif(xgboost_available(), reason="xgboost is installed")
+def test_xgboost_is_left_out_without_the_package(data):
+    X, y = data
+    with ClassifierBakeoff(X, y, n_workers=0) as bakeoff:
+        assert bakeoff.available_models() == NAMES
+
+
+def test_xgboost_stops_early_on_a_validation_split(data):
+    pytest.importorskip("xgboost")
+    X, y = data
+    with ClassifierBakeoff(X, y, n_workers=0) as bakeoff:
+        results = bakeoff.run_models(['XGBoost'])
+
+    assert 'XGBoost' in results
+    iterations = [record['best_iteration'] for record in bakeoff.records]
+    assert all(iteration is not None and iteration < 100 for iteration in iterations)
+    assert np.isfinite(results['XGBoost']['cv_mean'])
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_samples, silhouette_score
+
+from services.cluster_metrics import (
+    cluster_quality,
+    cluster_statistics,
+    sampled_silhouette,
+    silhouette,
+    simplified_silhouette,
+)
+
+
+@pytest.fixture(scope="module")
+def blobs():
+    X, labels = make_blobs(n_samples=1500, n_features=6, centers=4, cluster_std=2.5, random_state=3)
+    return X, labels
+
+
+def test_exact_silhouette_matches_sklearn_within_a_small_memory_budget(blobs):
+    X, labels = blobs
+    # 64 KiB forces a few rows per distance block
+    estimate = silhouette(X, labels, "exact", max_memory_bytes=64 * 1024)
+
+    assert estimate.score == pytest.approx(silhouette_score(X, labels), abs=1e-12)
+    assert estimate.low == estimate.high == estimate.score
+    assert estimate.n_evaluated == len(X)
+
+
+def test_centroid_metrics_match_sklearn(blobs):
+    X, labels = blobs
+    quality = cluster_quality(X, labels, "exact", max_memory_bytes=64 * 1024)
+
+    assert quality['davies_bouldin_index'] == pytest.approx(davies_bouldin_score(X, labels), rel=1e-10)
+    assert quality['calinski_harabasz_index'] == pytest.approx(calinski_harabasz_score(X, labels), rel=1e-10)
+    assert quality['cluster_sizes'] == {k: int(n) for k, n in zip(*np.unique(labels, return_counts=True))}
+
+
+def test_sampled_interval_covers_the_exact_score(blobs):
+    X, labels = blobs
+    exact = silhouette_score(X, labels)
+    estimates = [sampled_silhouette(X, labels, sample_size=300, seed=seed) for seed in range(40)]
+
+    assert all(estimate.mode == "sample" for estimate in estimates)
+    assert all(estimate.n_evaluated == pytest.approx(300, abs=8) for estimate in estimates)
+    # A 95% interval: most seeds cover the exact score, and every estimate is close
+    assert sum(estimate.low <= exact <= estimate.high for estimate in estimates) >= 34
+    assert all(abs(estimate.score - exact) < 0.05 for estimate in estimates)
+
+    # A sample of every row is the exact score with no uncertainty left
+    full = sampled_silhouette(X, labels, sample_size=len(X))
+    assert full.score == pytest.approx(exact, abs=1e-12)
+    assert full.high - full.low == pytest.approx(0.0, abs=1e-12)
+
+
+def test_auto_mode_switches_to_sampling_above_the_row_limit(blobs, monkeypatch):
+    from core import config
+
+    X, labels = blobs
+    assert silhouette(X, labels, "auto").mode == "exact"
+    monkeypatch.setattr(config, "METRICS_EXACT_MAX_ROWS", 1000)
+    monkeypatch.setattr(config, "METRICS_SAMPLE_SIZE", 200)
+    assert silhouette(X, labels, "auto").mode == "sample"
+
+
+def test_simplified_silhouette_uses_centroids(blobs):
+    X, labels = blobs
+    stats = cluster_statistics(X, labels)
+    centroids = np.vstack([X[labels == k].mean(axis=0) for k in range(4)])
+    distances = np.linalg.norm(X[:, None, :] - centroids[None, :, :], axis=2)
+    a = distances[np.arange(len(X)), labels]
+    distances[np.arange(len(X)), labels] = np.inf
+    b = distances.min(axis=1)
+
+    assert simplified_silhouette(stats).score == pytest.approx(np.mean((b - a) / np.maximum(a, b)), abs=1e-12)
+
+
+def test_singleton_clusters_score_zero_like_sklearn():
+    X = np.array([[0.0, 0.0], [0.1, 0.0], [5.0, 5.0], [5.1, 5.0], [20.0, 0.0]])
+    labels = np.array([0, 0, 1, 1, 2])
+
+    assert silhouette(X, labels, "exact").score == pytest.approx(silhouette_score(X, labels), abs=1e-12)
+    assert silhouette_samples(X, labels)[-1] == 0.0
+
+
+def test_invalid_labels_raise_like_sklearn():
+    X = np.zeros((4, 2))
+    with pytest.raises(ValueError, match="Number of labels"):
+        silhouette(X, np.zeros(4), "exact")
+    with pytest.raises(ValueError, match="Number of labels"):
+        silhouette(X, np.arange(4), "exact")
+    with pytest.raises(ValueError, match="Unknown silhouette mode"):
+        silhouette(X, np.array([0, 0, 1, 1]), "pairwise")
@@ -0,0 +1,81 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from services.cluster_sweep import Candidate, ClusterSweep
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "cluster_sweep.py")
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("cluster_sweep_benchmark", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def X(benchmark):
+    return benchmark.make_pca_matrix(400, n_blobs=3, seed=1)
+
+
+@pytest.fixture(scope="module")
+def expected(benchmark, X):
+    return benchmark.legacy_optimize_clustering_parameters(X)
+
+
+def without_score(params):
+    # Scores come from the chunked silhouette and may differ from sklearn's in the last bits
+    return {k: v for k, v in params.items() if k != 'score'}
+
+
+def test_sweep_matches_notebook_search(X, expected, tmp_path):
+    with ClusterSweep(X, n_workers=0, cache_dir=str(tmp_path)) as sweep:
+        best_labels, best_score, best_params = sweep.optimize_kmeans(halving=False)
+
+    legacy_labels, legacy_score, legacy_params = expected
+    assert without_score(best_params) == without_score(legacy_params)
+    assert best_score == pytest.approx(legacy_score, rel=1e-12)
+    np.testing.assert_array_equal(best_labels, legacy_labels)
+    assert {record['rung'] for record in sweep.records} == {'full', 'grid'}
+    assert all(record['fit_seconds'] is not None for record in sweep.records)
+
+
+def test_halving_drops_k_early_and_cache_is_reused(X, expected, tmp_path):
+    with ClusterSweep(X, n_workers=0, cache_dir=str(tmp_path)) as sweep:
+        result = sweep.optimize_kmeans(min_samples=100, eta=2)
+    assert without_score(result[2]) == without_score(expected[2])
+
+    rungs = {}
+    for record in sweep.records:
+        rungs.setdefault(record['rung'], []).append(record['n_samples'])
+    # 14 k values on 100 rows, 7 on 200, the best 4 on all rows
+    assert rungs['halving-0'] == [100] * 14
+    assert rungs['halving-1'] == [200] * 7
+    assert rungs['full'] == [400] * 4
+    assert not any(record['cached'] for record in sweep.records)
+
+    # A new sweep over the same data and parameters fits nothing
+    progress = []
+    with ClusterSweep(X, n_workers=0, cache_dir=str(tmp_path), progress=progress.append) as again:
+        cached_result = again.optimize_kmeans(min_samples=100, eta=2)
+    assert all(record['cached'] for record in progress)
+    assert len(progress) == len(sweep.records)
+    assert cached_result[2] == result[2]
+    np.testing.assert_array_equal(cached_result[0], result[0])
+
+
+def test_process_pool_gives_the_same_results(X, tmp_path):
+    candidates = [Candidate.of('kmeans', n_clusters=k, n_init=5) for k in (2, 3, 4)]
+    candidates.append(Candidate.of('gmm', n_components=3, max_iter=100))
+    with ClusterSweep(X, n_workers=0, cache_dir=None) as inline:
+        expected = inline.evaluate(candidates)
+    with ClusterSweep(X, n_workers=2, cache_dir=None) as pooled:
+        fits = pooled.evaluate(candidates + candidates[:1])
+
+    assert [fit.score for fit in fits] == [fit.score for fit in expected + expected[:1]]
+    for fit, reference in zip(fits, expected):
+        np.testing.assert_array_equal(fit.labels, reference.labels)
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import CODONS, make_codon_table
+from services import codon_bias
+from services.feature_engine import CODON_TO_AA, compute_features
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "codon_bias.py")
+
+
+@pytest.fixture(scope="module")
+def legacy():
+    """The notebook implementations kept in the benchmark"""
+    spec = importlib.util.spec_from_file_location("codon_bias_benchmark", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def amino_acid_frame(n_rows=120, seed=0, nan_cells=0):
+    table = make_codon_table(n_rows=n_rows, seed=seed, nan_fraction=0.02)
+    aa_columns = list(dict.fromkeys(CODON_TO_AA.values()))
+    df_aa_norm = compute_features(table[CODONS])[aa_columns]
+    kingdoms = table['Kingdom'].iloc[df_aa_norm.index].to_numpy()
+    if nan_cells:
+        rng = np.random.default_rng(seed)
+        values = df_aa_norm.to_numpy(copy=True)
+        values[rng.integers(0, len(values), nan_cells), rng.integers(0, values.shape[1], nan_cells)] = np.nan
+        df_aa_norm = pd.DataFrame(values, index=df_aa_norm.index, columns=aa_columns)
+    return df_aa_norm, kingdoms
+
+
+@pytest.mark.parametrize("nan_cells", [0, 25])
+def test_advanced_features_match_notebook(legacy, nan_cells):
+    df_aa_norm, _ = amino_acid_frame(seed=3, nan_cells=nan_cells)
+    # A row with an unused property group and a row without any data
+    df_aa_norm.loc[df_aa_norm.index[0], ['D', 'E']] = 0.0
+    df_aa_norm.loc[df_aa_norm.index[1]] = np.nan
+
+    expected = pd.concat([legacy.legacy_row_statistics(df_aa_norm), legacy.legacy_property_features(df_aa_norm)], axis=1)
+    expected['enc_approx'] = legacy.legacy_enc_approx(df_aa_norm)
+    expected['cai_approx'] = legacy.legacy_cai_approx(df_aa_norm)
+    expected = expected.fillna(0)
+
+    stats = codon_bias.advanced_features(df_aa_norm)
+    assert list(stats.columns) == list(expected.columns)
+    assert stats.index.equals(expected.index)
+    np.testing.assert_allclose(stats.to_numpy(), expected.to_numpy(dtype=float), rtol=1e-12, atol=1e-13)
+
+
+def test_similarity_features_match_notebook(legacy):
+    df_aa_norm, kingdoms = amino_acid_frame(seed=4)
+    kingdoms[:1] = 'singleton'  # kingdoms with a single row get no column
+
+    expected = legacy.legacy_similarity_features(df_aa_norm, pd.Series(kingdoms, index=df_aa_norm.index))
+    similarities = codon_bias.similarity_features(df_aa_norm, kingdoms)
+
+    assert list(similarities.columns) == list(expected.columns)
+    assert 'cos_sim_singleton' not in similarities.columns
+    np.testing.assert_allclose(similarities.to_numpy(), expected.to_numpy(), rtol=1e-12, atol=1e-14)
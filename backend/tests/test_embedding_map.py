@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.embedding_map import EmbeddingMap, build_map, levels_of_detail
+
+
+def test_levels_are_nested_and_keep_the_density():
+    rng = np.random.default_rng(0)
+    # A wide cloud and a dense knot
+    xy = np.vstack([rng.standard_normal((3000, 2)), 0.05 * rng.standard_normal((2000, 2)) + 4]).astype(np.float32)
+    order, level_ends, weights = levels_of_detail(xy, cell_points=3, base_grid=8, max_levels=6)
+
+    assert sorted(order) == list(range(len(xy)))
+    assert list(level_ends) == sorted(level_ends) and level_ends[-1] == len(xy)
+    for level, end in enumerate(level_ends):
+        # Points of a level are a prefix, and every level accounts for all points
+        assert (weights[level, :end] >= 1).all() and (weights[level, end:] == 0).all()
+        assert weights[level].sum() == pytest.approx(len(xy))
+    # The knot is thinned hardest in the overview
+    knot = order >= 3000
+    assert knot[:level_ends[0]].mean() < 0.4
+    assert weights[0, :level_ends[0]][knot[:level_ends[0]]].mean() > weights[0, :level_ends[0]][~knot[:level_ends[0]]].mean()
+
+
+def test_saved_map_serves_viewports(tmp_path):
+    rng = np.random.default_rng(1)
+    Z = rng.standard_normal((800, 5))
+    built = EmbeddingMap.from_projection(Z, rng.integers(0, 4, 800), rng.choice(['bct', 'vrl'], 800), digest='abc')
+    built.save(str(tmp_path))
+    loaded = EmbeddingMap.load(str(tmp_path))
+    assert isinstance(loaded.points, np.memmap)
+
+    overview = loaded.view(0)
+    assert len(overview['points']['x']) == loaded.level_ends[0] < 800
+    assert sum(overview['points']['weight']) == pytest.approx(800, abs=1)
+    full = loaded.view(99)
+    assert full['level'] == loaded.n_levels - 1 and len(full['points']['x']) == 800
+    expected = np.round(Z[:, :2].astype(np.float32).astype(np.float64), 4)
+    assert sorted(zip(full['points']['x'], full['points']['y'])) == sorted(map(tuple, expected.tolist()))
+
+    window = loaded.view(loaded.n_levels - 1, x_min=0, x_max=1, y_min=-0.5)
+    assert all(0 <= x <= 1 for x in window['points']['x']) and all(y >= -0.5 for y in window['points']['y'])
+    assert len(window['points']['x']) == int(((Z[:, 0] >= 0) & (Z[:, 0] <= 1) & (Z[:, 1] >= -0.5)).sum())
+    assert set(window['kingdoms']) == {'bct', 'vrl'}
+
+
+def test_uploads_land_on_the_reference_map(client, monkeypatch):
+    table = make_codon_table(n_rows=300, seed=9, nan_fraction=0.0, zero_rows=0)
+    monkeypatch.setattr(analysis, 'embedding_map', build_map(table, analysis.compiled_pipeline))
+
+    reference = client.get('/embedding', params={'level': 99}).json()
+    projected = client.post('/embedding/project', files={'file': ('t.csv', csv_bytes(table), 'text/csv')}).json()
+
+    # The whole reference table projects exactly onto its own points
+    assert projected['n_points'] == len(reference['points']['x'])
+    placed = sorted(zip(projected['points']['x'], projected['points']['y'], projected['points']['cluster']))
+    assert placed == sorted(zip(reference['points']['x'], reference['points']['y'], reference['points']['cluster']))
+    assert projected['points']['SpeciesName'][0].startswith('species_')
+    assert client.get('/health').json()['embedding_map']['n_points'] == analysis.embedding_map.n_points
@@ -0,0 +1,126 @@
+import gzip
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_codon_table
+from services import analysis, fasta_ingest
+from services.fasta_ingest import CODONS, count_codons, read_fasta_table
+
+BASES = np.array(list('ACGT'))
+
+
+def random_cds(rng, n_codons):
+    return ''.join(rng.choice(BASES, 3 * n_codons)) + ''.join(rng.choice(list('acgtNRY'), rng.integers(0, 5)))
+
+
+def write_fasta(path, records, width=60):
+    lines = []
+    for header, sequence in records:
+        lines.append(f'>{header}')
+        lines += [sequence[i:i + width] for i in range(0, len(sequence), width)]
+    text = '\n'.join(lines) + '\n'
+    if str(path).endswith('.gz'):
+        path.write_bytes(gzip.compress(text.encode()))
+    else:
+        path.write_text(text)
+    return str(path)
+
+
+def naive_counts(sequence, frame):
+    sequence = sequence.upper().replace('T', 'U')
+    codons = Counter(sequence[i:i + 3] for i in range(frame, len(sequence) - 2, 3))
+    return np.array([codons[codon] for codon in CODONS])
+
+
+@pytest.mark.parametrize('frame', [0, 1, 2, 'auto'])
+def test_counts_match_a_codon_by_codon_count(frame):
+    rng = np.random.default_rng(70)
+    sequences = [random_cds(rng, n) for n in rng.integers(0, 400, 50)]
+    groups = rng.integers(0, 4, len(sequences))
+    counts = count_codons([s.encode() for s in sequences], groups, 4, frame)
+
+    expected = np.zeros((4, 64), dtype=np.int64)
+    for sequence, group in zip(sequences, groups):
+        if frame == 'auto':
+            per_frame = [naive_counts(sequence, f) for f in range(3)]
+            stops = [sum(c[CODONS.index(stop)] for stop in ('UAA', 'UAG', 'UGA')) for c in per_frame]
+            expected[group] += per_frame[int(np.argmin(stops))]
+        else:
+            expected[group] += naive_counts(sequence, frame)
+    np.testing.assert_array_equal(counts, expected)
+
+
+def test_species_rows_from_plain_gzip_and_split_files(tmp_path, monkeypatch):
+    rng = np.random.default_rng(71)
+    records = [(f'cds_{i} [organism=species {i % 3}] [kingdom=bct]', random_cds(rng, int(n)))
+               for i, n in enumerate(rng.integers(10, 300, 120))]
+    plain = write_fasta(tmp_path / 'set.fasta', records)
+    packed = write_fasta(tmp_path / 'set.fasta.gz', records)
+
+    table = read_fasta_table(plain, group_by='organism', workers=0)
+    assert list(table.columns) == ['Kingdom', 'DNAtype', 'SpeciesID', 'Ncodons', 'SpeciesName', *CODONS]
+    assert list(table['SpeciesName']) == ['species 0', 'species 1', 'species 2']
+    assert (table['Kingdom'] == 'bct').all()
+    np.testing.assert_allclose(table[list(CODONS)].sum(axis=1), 1)
+    expected = sum(naive_counts(s, 0) for header, s in records if 'species 1]' in header)
+    assert table.loc[1, 'Ncodons'] == expected.sum()
+    np.testing.assert_allclose(table.loc[1, list(CODONS)].to_numpy(float), expected / expected.sum())
+
+    pd.testing.assert_frame_equal(read_fasta_table(packed, group_by='organism', workers=0), table)
+    # Byte ranges in worker processes, cut mid-record
+    monkeypatch.setattr(fasta_ingest.config, 'FASTA_PARALLEL_MIN_BYTES', 0)
+    pd.testing.assert_frame_equal(read_fasta_table(plain, group_by='organism', workers=2), table)
+    by_record = read_fasta_table(plain, group_by='record', workers=2)
+    assert list(by_record['SpeciesName']) == [f'cds_{i}' for i in range(len(records))]
+    whole = read_fasta_table(plain, group_by='file', workers=0)
+    assert list(whole['SpeciesName']) == ['set'] and whole.loc[0, 'Ncodons'] == table['Ncodons'].sum()
+
+
+def test_analyze_accepts_fasta(client, tmp_path):
+    # Sequences drawn from the codon usage of synthetic species
+    rng = np.random.default_rng(72)
+    profiles = make_codon_table(n_rows=12, seed=73, nan_fraction=0, zero_rows=0)
+    records = []
+    for species, row in profiles.iterrows():
+        frequencies = row[list(CODONS)].to_numpy(float)
+        for gene in range(5):
+            codons = rng.choice(list(CODONS), 400, p=frequencies / frequencies.sum())
+            records.append((f'gene_{gene} [organism={row.SpeciesName}]', ''.join(codons).replace('U', 'T')))
+    path = write_fasta(tmp_path / 'cds.fna.gz', records)
+
+    with open(path, 'rb') as f:
+        response = client.post('/analyze', files={'file': ('cds.fna.gz', f.read(), 'application/gzip')})
+    assert response.status_code == 200
+    result = response.json()
+    # One row per organism (batch-mode features may drop the lowest-count rows)
+    names = [row['SpeciesName'] for row in result['detailed_results']]
+    assert len(names) == len(set(names)) >= 10 and set(names) <= set(profiles['SpeciesName'])
+
+    table = analysis.read_upload(path)
+    csv_result = client.post('/analyze', files={'file': ('t.csv', table.to_csv(index=False).encode(), 'text/csv')})
+    assert csv_result.json()['detailed_results'] == result['detailed_results']
+
+
+def test_untagged_records_are_named_after_the_uploaded_file(client, tmp_path):
+    rng = np.random.default_rng(74)
+    profiles = make_codon_table(n_rows=10, seed=75, nan_fraction=0, zero_rows=0)
+    records = []
+    for species, row in profiles.iterrows():
+        frequencies = row[list(CODONS)].to_numpy(float)
+        # The last profile's genes carry no organism tag
+        tag = '' if species == len(profiles) - 1 else f' [organism={row.SpeciesName}]'
+        for gene in range(5):
+            codons = rng.choice(list(CODONS), 400, p=frequencies / frequencies.sum())
+            records.append((f'gene_{gene}{tag}', ''.join(codons).replace('U', 'T')))
+    path = write_fasta(tmp_path / 'upload.fasta', records)
+
+    with open(path, 'rb') as f:
+        body = f.read()
+    for filename, species in [('E_coli_K12.fasta', 'E_coli_K12'), ('B_subtilis.fna.gz', 'B_subtilis')]:
+        response = client.post('/analyze', files={'file': (filename, body, 'text/plain')})
+        assert response.status_code == 200
+        names = [row['SpeciesName'] for row in response.json()['detailed_results']]
+        assert species in names and not any(name.startswith('tmp') for name in names)
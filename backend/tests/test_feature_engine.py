@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import entropy
+from sklearn.metrics.pairwise import cosine_similarity
+
+from conftest import make_codon_table
+from services.feature_engine import (CODON_TO_AA, ReferenceStatsBuilder, build_membership_matrix, compute_features,
+                                     fit_reference_stats)
+
+
+def legacy_preprocess_feature(raw_features: pd.DataFrame) -> pd.DataFrame:
+    """Original row-wise pandas implementation, kept as the parity reference"""
+    df = raw_features.copy()
+    df = df.apply(pd.to_numeric, errors='coerce')
+    df = df.fillna(df.median())
+    codon_sum = df.sum(axis=1)
+    df = df[codon_sum > 0]
+
+    aa_features = {}
+    for codon, aa in CODON_TO_AA.items():
+        if codon in df.columns:
+            aa_features.setdefault(aa, []).append(df[codon])
+
+    df_aa = pd.DataFrame()
+    for aa, cols in aa_features.items():
+        df_aa[aa] = np.sum(cols, axis=0)
+
+    pseudocount = 1e-8
+    row_sums = df_aa.sum(axis=1)
+    valid_rows = row_sums > row_sums.quantile(0.05)
+    df_aa = df_aa[valid_rows]
+    df_aa_norm = (df_aa + pseudocount).div(row_sums[valid_rows] + pseudocount*len(df_aa.columns), axis=0)
+
+    stats = pd.DataFrame(index=df_aa_norm.index)
+    stats['mean'] = df_aa_norm.mean(axis=1)
+    stats['median'] = df_aa_norm.median(axis=1)
+    stats['std'] = df_aa_norm.std(axis=1).fillna(0)
+    stats['skewness'] = df_aa_norm.skew(axis=1).fillna(0)
+    stats['kurtosis'] = df_aa_norm.kurtosis(axis=1).fillna(0)
+    stats['entropy'] = df_aa_norm.apply(lambda x: entropy(x + 1e-10, base=2), axis=1).fillna(0)
+
+    def gini_coefficient(x):
+        x = np.array(x)
+        x = x[~np.isnan(x)]
+        if len(x) == 0 or np.sum(x) == 0:
+            return 0
+        x = np.sort(x)
+        n = len(x)
+        index = np.arange(1, n+1)
+        return (2*np.sum(index*x))/(n*np.sum(x)) - (n+1)/n
+
+    stats['gini'] = df_aa_norm.apply(gini_coefficient, axis=1)
+    features_final = pd.concat([df_aa_norm, stats], axis=1).fillna(0)
+
+    mean_profile = df_aa_norm.mean(axis=0).values.reshape(1, -1)
+    median_profile = df_aa_norm.median(axis=0).values.reshape(1, -1)
+    features_final['cosine_similarity_to_mean'] = cosine_similarity(df_aa_norm.values, mean_profile).flatten()
+    features_final['cosine_similarity_to_median'] = cosine_similarity(df_aa_norm.values, median_profile).flatten()
+    return features_final
+
+
+def upload_labels(raw: pd.DataFrame, legacy: pd.DataFrame) -> list:
+    """Labels in ``raw`` of the legacy rows (the legacy code renumbered rows after the zero-sum filter)"""
+    numeric = raw.apply(pd.to_numeric, errors='coerce')
+    nonzero = raw.index[numeric.fillna(numeric.median()).sum(axis=1) > 0]
+    return list(nonzero[legacy.index])
+
+
+def test_membership_matrix_matches_codon_table():
+    columns = tuple(CODON_TO_AA) + ('UAA', 'UAG', 'UGA')
+    positions, membership, aa_columns = build_membership_matrix(columns)
+    assert membership.shape == (61, 20)
+    assert aa_columns[:4] == ('A', 'R', 'G', 'K')
+    assert (membership.sum(axis=1) == 1).all()
+    assert positions.max() == 60
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_parity_with_legacy_preprocess(seed):
+    raw = make_codon_table(n_rows=300, seed=seed).iloc[:, 5:]
+    expected = legacy_preprocess_feature(raw)
+    actual = compute_features(raw)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.index) == upload_labels(raw, expected)
+    assert 0 not in actual.index  # zero-sum row
+    np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-12)
+
+
+def test_float32_within_tolerance():
+    raw = make_codon_table(n_rows=300, seed=3).iloc[:, 5:]
+    expected = legacy_preprocess_feature(raw)
+    actual = compute_features(raw, dtype=np.float32)
+
+    assert actual.dtypes.eq(np.float32).all()
+    assert list(actual.index) == upload_labels(raw, expected)
+    np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-3, atol=1e-5)
+
+
+def test_non_numeric_cells_and_extra_columns():
+    raw = make_codon_table(n_rows=50, seed=4).iloc[:, 5:].astype(object)
+    raw.iloc[5, 3] = 'n/a'
+    raw['note'] = 1.0
+    pd.testing.assert_frame_equal(compute_features(raw), legacy_preprocess_feature(raw), check_exact=False, rtol=1e-9)
+
+
+def test_empty_input():
+    raw = make_codon_table(n_rows=5, seed=5, zero_rows=5).iloc[:, 5:]
+    assert compute_features(raw).empty
+
+
+def test_frozen_reference_reproduces_training_features():
+    raw = make_codon_table(n_rows=300, seed=6).iloc[:, 5:]
+    batch = compute_features(raw)
+    frozen = compute_features(raw, reference=fit_reference_stats(raw))
+
+    assert len(frozen) == len(batch)
+    np.testing.assert_allclose(frozen.to_numpy(), batch.to_numpy(), rtol=1e-9, atol=1e-12)
+
+
+def test_frozen_rows_are_independent_of_the_upload():
+    reference = fit_reference_stats(make_codon_table(n_rows=300, seed=7).iloc[:, 5:])
+    upload = make_codon_table(n_rows=120, seed=8).iloc[:, 5:]
+
+    whole = compute_features(upload, reference=reference)
+    chunked = pd.concat([compute_features(upload.iloc[i:i + 25], reference=reference) for i in range(0, len(upload), 25)])
+    pd.testing.assert_frame_equal(chunked, whole)
+
+    # Row labels refer back to the upload, zero-sum rows are dropped
+    assert set(whole.index) <= set(upload.index)
+    assert 0 not in whole.index
+
+
+def test_chunked_reference_stats_match_the_whole_table(tmp_path):
+    raw = make_codon_table(n_rows=400, seed=9, nan_fraction=0.05, zero_rows=6).iloc[:, 5:]
+    expected = fit_reference_stats(raw)
+
+    with ReferenceStatsBuilder(str(tmp_path), block_rows=64) as builder:
+        for start in range(0, len(raw), 90):
+            builder.add(raw.iloc[start:start + 90])
+        reference = builder.finish()
+
+    assert reference['fill_medians'] == expected['fill_medians']
+    assert reference['row_sum_cutoff'] == expected['row_sum_cutoff']
+    assert reference['n_reference_rows'] == expected['n_reference_rows']
+    np.testing.assert_allclose(reference['mean_profile'], expected['mean_profile'], rtol=1e-12)
+    np.testing.assert_array_equal(reference['median_profile'], expected['median_profile'])
+    assert list(tmp_path.iterdir()) == []
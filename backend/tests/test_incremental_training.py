@@ -0,0 +1,75 @@
+import importlib.util
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_codon_table
+from services import incremental_training
+from services.incremental_training import log_features, predict_clusters, save_models, train_out_of_core
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "incremental_training.py")
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("incremental_training_benchmark", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def table():
+    return make_codon_table(n_rows=2000, seed=4, nan_fraction=0.002, zero_rows=3)
+
+
+@pytest.fixture(scope="module")
+def csv_path(table, tmp_path_factory):
+    path = tmp_path_factory.mktemp("training") / "codon_usage.csv"
+    table.to_csv(path, index=False)
+    return str(path)
+
+
+def test_clusters_agree_with_in_memory_pipeline(benchmark, table, csv_path):
+    expected, _ = benchmark.in_memory_pipeline(table, n_clusters=5)
+    models = train_out_of_core(csv_path, n_clusters=5, chunk_rows=300, sample_rows=800, kmeans_epochs=2)
+    labels = predict_clusters(models, table)
+
+    from sklearn.metrics import adjusted_rand_score
+
+    common = expected.index.intersection(labels.index)
+    assert len(common) >= 0.98 * len(expected)
+    assert adjusted_rand_score(expected[common], labels[common]) > 0.95
+    assert models.summary['rows_read'] == len(table)
+    assert models.summary['passes'] == 6
+
+
+def test_sample_does_not_depend_on_chunk_size(csv_path):
+    small, kingdoms, n_rows = incremental_training.survey(csv_path, chunk_rows=70, sample_rows=150)
+    large, _, _ = incremental_training.survey(csv_path, chunk_rows=1500, sample_rows=150)
+
+    pd.testing.assert_frame_equal(small, large)
+    assert n_rows == 2000
+    assert list(kingdoms) == ['bct', 'inv', 'pln', 'vrl', 'vrt']
+
+
+def test_streamed_scaler_is_exact_and_artifacts_round_trip(benchmark, table, csv_path, tmp_path):
+    from sklearn.preprocessing import StandardScaler
+
+    models = train_out_of_core(csv_path, n_clusters=3, scaling_method='standard', chunk_rows=450,
+                               sample_rows=500, kmeans_epochs=1)
+    features = incremental_training.training_features(table, models.reference)
+    X_log = log_features(features, models.feature_columns)
+    reference = StandardScaler().fit(X_log)
+    np.testing.assert_allclose(models.scaler.mean_, reference.mean_, rtol=1e-10)
+    np.testing.assert_allclose(models.scaler.scale_, reference.scale_, rtol=1e-10)
+
+    save_models(models, str(tmp_path))
+    loaded = {name: joblib.load(tmp_path / f"{name}.pkl") for name in ('scaler', 'pca', 'kmeans_model', 'feature_columns')}
+    assert loaded['feature_columns'] == models.feature_columns
+    Z = loaded['pca'].transform(loaded['scaler'].transform(X_log))
+    assert Z.shape[1] == loaded['kmeans_model'].cluster_centers_.shape[1] == models.summary['pca_components']
+    np.testing.assert_array_equal(loaded['kmeans_model'].predict(Z), predict_clusters(models, table).to_numpy())
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from services.feature_engine import compute_features
+from services.inference import CompiledPipeline
+
+
+def sklearn_reference(scaler, pca, kmeans, classifier, X, includes_cluster=False):
+    X_scaled = scaler.transform(X)
+    clusters = kmeans.predict(pca.transform(X_scaled))
+    X_cls = np.concatenate([X_scaled, clusters.reshape(-1, 1)], axis=1) if includes_cluster else X_scaled
+    return clusters, classifier.predict(X_cls), classifier.predict_proba(X_cls)
+
+
+@pytest.fixture
+def compiled(models):
+    return CompiledPipeline(models['scaler'], models['pca'], models['kmeans_model'],
+                            models['best_classification_model'], models['feature_columns'])
+
+
+@pytest.fixture
+def fixture_matrix(compiled, sample_csv_path):
+    raw_df = pd.read_csv(sample_csv_path)
+    X = compiled.align(compute_features(raw_df[raw_df.columns[5:]]))
+    # Add rows around the training distribution so every cluster is exercised
+    rng = np.random.default_rng(0)
+    spread = compiled.center + rng.normal(scale=2 * compiled.scale, size=(400, X.shape[1]))
+    return np.vstack([X, spread])
+
+
+def test_layout_is_resolved_once(compiled, models):
+    assert compiled.n_classifier_features == models['best_classification_model'].n_features_in_
+    assert not compiled.includes_cluster
+
+
+def test_align_fills_missing_and_drops_extra(compiled):
+    frame = pd.DataFrame({'extra': [1.0], 'A': [0.5], 'gini': [0.2]})
+    X = compiled.align(frame)
+    assert X.shape == (1, compiled.n_features)
+    assert X[0, compiled.feature_names.index('A')] == 0.5
+    assert X[0, compiled.feature_names.index('gini')] == 0.2
+    assert X.sum() == pytest.approx(0.7)
+
+
+def test_parity_with_sklearn_on_fixture(compiled, models, fixture_matrix):
+    clusters, labels, proba = sklearn_reference(models['scaler'], models['pca'], models['kmeans_model'],
+                                                models['best_classification_model'], fixture_matrix)
+    result = compiled.predict(fixture_matrix)
+
+    assert len(np.unique(clusters)) > 1
+    np.testing.assert_array_equal(result.clusters, clusters)
+    np.testing.assert_array_equal(result.labels, labels)
+    np.testing.assert_allclose(result.proba, proba)
+    np.testing.assert_allclose(result.components, models['pca'].transform(models['scaler'].transform(fixture_matrix)), atol=1e-9)
+
+
+def test_float32_pass_agrees(compiled, models, fixture_matrix):
+    clusters, labels, _ = sklearn_reference(models['scaler'], models['pca'], models['kmeans_model'],
+                                            models['best_classification_model'], fixture_matrix)
+    result = compiled.predict(fixture_matrix.astype(np.float32))
+
+    assert result.components.dtype == np.float32
+    assert (result.clusters == clusters).mean() > 0.99
+    assert (result.labels == labels).mean() > 0.99
+
+
+def test_whitened_pca_with_cluster_column():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(400, 12)) * rng.uniform(0.5, 5, 12) + rng.normal(size=12)
+    scaler = StandardScaler().fit(X)
+    pca = PCA(n_components=4, whiten=True).fit(scaler.transform(X))
+    kmeans = KMeans(n_clusters=3, n_init=3, random_state=0).fit(pca.transform(scaler.transform(X)))
+    y = (X[:, 0] > X[:, 0].mean()).astype(int) + (kmeans.labels_ == 2)
+    X_cls = np.concatenate([scaler.transform(X), kmeans.labels_.reshape(-1, 1)], axis=1)
+    classifier = RandomForestClassifier(n_estimators=10, random_state=0).fit(X_cls, y)
+
+    compiled = CompiledPipeline(scaler, pca, kmeans, classifier, [f'f{i}' for i in range(12)],
+                                training_config={'includes_cluster': True, 'n_features': 13})
+    clusters, labels, proba = sklearn_reference(scaler, pca, kmeans, classifier, X, includes_cluster=True)
+    result = compiled.predict(X)
+
+    assert compiled.cluster_column == 12
+    np.testing.assert_array_equal(result.clusters, clusters)
+    np.testing.assert_array_equal(result.labels, labels)
+    np.testing.assert_allclose(result.proba, proba)
+
+
+@pytest.mark.filterwarnings('ignore::FutureWarning')
+def test_labels_come_from_predict_when_proba_can_disagree():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 6))
+    y = (X[:, 0] + rng.normal(scale=1.5, size=300) > 0).astype(int) + (X[:, 1] > 1)
+    scaler = StandardScaler().fit(X)
+    pca = PCA(n_components=3).fit(scaler.transform(X))
+    kmeans = KMeans(n_clusters=2, n_init=3, random_state=0).fit(pca.transform(scaler.transform(X)))
+    classifier = SVC(probability=True, random_state=0).fit(scaler.transform(X), y)
+
+    compiled = CompiledPipeline(scaler, pca, kmeans, classifier, [f'f{i}' for i in range(6)])
+    _, labels, proba = sklearn_reference(scaler, pca, kmeans, classifier, X)
+    result = compiled.predict(X)
+
+    assert (classifier.classes_[proba.argmax(axis=1)] != labels).any()
+    np.testing.assert_array_equal(result.labels, labels)
+    np.testing.assert_allclose(result.proba, proba, rtol=1e-5)
+
+
+@pytest.mark.parametrize('options', [{'with_mean': False}, {'with_std': False}])
+def test_scaler_without_centering_or_scaling(options):
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(300, 8)) * rng.uniform(0.5, 5, 8) + rng.normal(scale=3, size=8)
+    scaler = StandardScaler(**options).fit(X)
+    pca = PCA(n_components=3).fit(scaler.transform(X))
+    kmeans = KMeans(n_clusters=3, n_init=3, random_state=0).fit(pca.transform(scaler.transform(X)))
+    classifier = RandomForestClassifier(n_estimators=5, random_state=0).fit(scaler.transform(X), kmeans.labels_)
+
+    compiled = CompiledPipeline(scaler, pca, kmeans, classifier, [f'f{i}' for i in range(8)])
+    result = compiled.predict(X)
+
+    np.testing.assert_allclose(result.components, pca.transform(scaler.transform(X)), atol=1e-9)
+    np.testing.assert_array_equal(result.clusters, kmeans.predict(pca.transform(scaler.transform(X))))
+    np.testing.assert_array_equal(result.labels, classifier.predict(scaler.transform(X).astype(np.float32)))
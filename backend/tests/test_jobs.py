@@ -0,0 +1,114 @@
+import os
+import stat
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import csv_bytes, make_codon_table
+from services.jobs import DONE, EXPIRED, FAILED, QUEUED, RUNNING, JobStore, process_owner
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f'/jobs/{job_id}').json()
+        if status['status'] not in (QUEUED, RUNNING):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} still {status["status"]}')
+
+
+def test_job_returns_the_analyze_result(client):
+    upload = csv_bytes(make_codon_table(n_rows=150, seed=60))
+    submitted = client.post('/jobs', files={'file': ('big.csv', upload, 'text/csv')})
+    assert submitted.status_code == 202
+    job_id = submitted.json()['job_id']
+
+    status = wait_for_job(client, job_id)
+    assert status['status'] == DONE and status['progress'] == 1
+    result = client.get(status['result_url']).json()
+    direct = client.post('/analyze', files={'file': ('big.csv', upload, 'text/csv')}).json()
+    assert result == direct
+    # Same handle as /analyze, and paging works like /analyze
+    assert client.get(f"/results/{status['result_handle']}").json() == direct
+    page = client.get(status['result_url'], params={'offset': 10, 'limit': 5}).json()
+    assert page['detailed_results'] == direct['detailed_results'][10:15]
+    assert client.get('/health').json()['jobs']['jobs'][DONE] >= 1
+
+
+def test_unknown_and_failed_jobs(client):
+    assert client.get('/jobs/nope').status_code == 404
+    status = wait_for_job(client, client.post('/jobs', files={'file': ('bad.csv', b'a,b\n1,2\n', 'text/csv')}).json()['job_id'])
+    assert status['status'] == FAILED and status['error']['status_code'] == 400
+    assert client.get(f"/jobs/{status['job_id']}/result").status_code == 400
+
+
+def test_jobs_queued_before_a_restart_run_after_it():
+    import main
+
+    uploads = {}
+    for seed, filename in ((61, 'queued.csv'), (62, 'running.csv')):
+        job_id = main.job_store.new_id()
+        uploads[job_id] = csv_bytes(make_codon_table(n_rows=40, seed=seed))
+        with open(main.job_store.upload_path(job_id), 'wb') as f:
+            f.write(uploads[job_id])
+        main.job_store.create(job_id, filename, main.job_store.upload_path(job_id), 0, f'handle-{seed}')
+    # The second job was running in the previous process when it went away
+    interrupted = job_id
+    main.job_store._connection.execute("UPDATE jobs SET status = ?, owner = ? WHERE id = ?",
+                                       (RUNNING, process_owner(), interrupted))
+
+    with TestClient(main.app) as client:
+        for job_id, upload in uploads.items():
+            status = wait_for_job(client, job_id)
+            assert status['status'] == DONE
+            direct = client.post('/analyze', files={'file': ('t.csv', upload, 'text/csv')}).json()
+            assert client.get(status['result_url']).json()['detailed_results'] == direct['detailed_results']
+        assert main.job_store.get(interrupted)['attempts'] == 1
+
+
+def test_store_limits(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), str(tmp_path), result_ttl_seconds=60,
+                     results_max_bytes=10, max_attempts=2)
+    ids = [store.new_id() for _ in range(3)]
+    for job_id in ids:
+        open(store.upload_path(job_id), 'w').close()
+        store.create(job_id, None, store.upload_path(job_id), 0, job_id)
+        time.sleep(0.01)
+    assert store.queue_position(store.get(ids[2])) == 2
+
+    # Interrupted jobs are retried up to max_attempts
+    for attempt in range(2):
+        assert store.claim('host:1')['id'] == ids[0]
+        store._connection.execute("UPDATE jobs SET owner = ? WHERE id = ?", (process_owner(), ids[0]))
+        store.recover()
+    assert store.get(ids[0])['status'] == FAILED
+
+    # Results beyond the size bound expire oldest first, the rest after the TTL
+    for job_id in ids[1:]:
+        store.claim('host:1')
+        store.complete(job_id, b'x' * 8)
+        time.sleep(0.01)
+    assert [store.get(job_id)['status'] for job_id in ids[1:]] == [EXPIRED, DONE]
+    assert not any(name.endswith('.csv') for name in (p.name for p in tmp_path.iterdir()))
+    assert store.read_result(store.get(ids[2])) == b'x' * 8
+    assert store.purge(now=time.time() + 61) == 2  # the failed job and the last result
+    assert store.get(ids[2])['status'] == EXPIRED and store.read_result(store.get(ids[2])) is None
+    store.purge(now=time.time() + 200)
+    assert all(store.get(job_id) is None for job_id in ids)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_store_directories_must_be_private(tmp_path):
+    JobStore(str(tmp_path / 'db' / 'jobs.sqlite3'), str(tmp_path / 'jobs'), 60, 10**9)
+    assert stat.S_IMODE(os.stat(tmp_path / 'jobs').st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(tmp_path / 'db').st_mode) == 0o700
+
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        JobStore(str(tmp_path / 'db' / 'jobs.sqlite3'), str(shared), 60, 10**9)
+    with pytest.raises(PermissionError):
+        JobStore(str(shared / 'jobs.sqlite3'), str(tmp_path / 'jobs'), 60, 10**9)
@@ -0,0 +1,92 @@
+import logging
+import pickle
+import re
+
+from conftest import csv_bytes, make_codon_table, metric_sample as sample
+from services import metrics
+
+
+def test_histogram_text_format():
+    histogram = metrics.Histogram('test_seconds', 'Test histogram', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage='read')
+    text = '\n'.join(histogram.render())
+
+    assert '# TYPE test_seconds histogram' in text
+    assert sample(text, 'test_seconds_bucket', stage='read', le='0.1') == 2
+    assert sample(text, 'test_seconds_bucket', stage='read', le='1') == 3
+    assert sample(text, 'test_seconds_bucket', stage='read', le='+Inf') == 4
+    assert sample(text, 'test_seconds_count', stage='read') == 4
+    assert sample(text, 'test_seconds_sum', stage='read') == 3.65
+
+
+def test_traced_call_returns_stages_and_peak_memory():
+    def work(n):
+        with metrics.stage('features'):
+            data = bytearray(n)
+        metrics.add_rows(3)
+        return len(data)
+
+    result, trace = metrics.traced('req-1', work, 32 * 1024 * 1024)
+    trace = pickle.loads(pickle.dumps(trace))  # shipped back from a pool worker
+
+    assert result == 32 * 1024 * 1024 and trace.request_id == 'req-1'
+    assert set(trace.stages) == {'features'} and trace.rows == 3
+    if trace.peak_memory_bytes is not None:
+        assert trace.peak_memory_bytes >= 16 * 1024 * 1024
+    assert metrics.current_trace() is None
+
+
+def test_analyze_records_stage_metrics_and_request_id(client, caplog):
+    import main
+
+    main.result_cache.clear()
+    body = csv_bytes(make_codon_table(n_rows=60, seed=90, nan_fraction=0, zero_rows=0))
+    before = client.get('/metrics').text
+
+    with caplog.at_level(logging.INFO):
+        response = client.post('/analyze', files={'file': ('upload.csv', body, 'text/csv')},
+                               headers={'X-Request-ID': 'trace-me-42'})
+        cached = client.post('/analyze', files={'file': ('upload.csv', body, 'text/csv')})
+    assert response.status_code == cached.status_code == 200
+    assert response.headers['x-request-id'] == 'trace-me-42'
+    assert re.fullmatch(r'[0-9a-f]{16}', cached.headers['x-request-id'])
+    assert any(getattr(record, 'request_id', None) == 'trace-me-42' for record in caplog.records)
+    assert {getattr(record, 'request_id', None) for record in caplog.records} >= {cached.headers['x-request-id']}
+
+    total_samples = response.json()['total_samples']
+    scrape = client.get('/metrics')
+    assert scrape.headers['content-type'].startswith('text/plain')
+    text = scrape.text
+
+    def delta(name, **labels):
+        return (sample(text, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+
+    for stage in ('upload', 'read', 'features', 'transform', 'batched_model', 'assemble', 'cache', 'serialize'):
+        assert delta('codon_analysis_stage_seconds_count', route='/analyze', stage=stage) >= 1, stage
+    assert delta('codon_analysis_rows_total', route='/analyze') == total_samples
+    assert delta('codon_analyses_total', route='/analyze', source='computed') == 1
+    assert delta('codon_analyses_total', route='/analyze', source='cache') == 1
+    assert delta('codon_http_request_bytes_total', route='/analyze') >= 2 * len(body)
+    assert delta('codon_http_response_bytes_total', route='/analyze') >= 2 * len(cached.content)
+    assert delta('codon_http_request_duration_seconds_count', route='/analyze', method='POST', status='200') == 2
+    # Model passes of the micro-batcher are shared between requests
+    assert delta('codon_analysis_stage_seconds_count', route='-', stage='classify') >= 1
+
+
+def test_pool_analyses_report_peak_memory(client, monkeypatch):
+    import main
+
+    main.result_cache.clear()
+    monkeypatch.setattr(main.config, 'BATCH_MAX_UPLOAD_BYTES', 0)
+    before = client.get('/metrics').text
+    body = csv_bytes(make_codon_table(n_rows=80, seed=91, nan_fraction=0, zero_rows=0))
+    assert client.post('/analyze', files={'file': ('upload.csv', body, 'text/csv')}).status_code == 200
+    text = client.get('/metrics').text
+
+    def delta(name, **labels):
+        return (sample(text, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+
+    assert delta('codon_analysis_stage_seconds_count', route='/analyze', stage='classify') == 1
+    assert delta('codon_analysis_peak_memory_bytes_count', route='/analyze') == 1
+    assert sample(text, 'codon_analysis_pool_in_flight') == 0
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.neighbor_index import NeighborIndex, build_index, metadata_records
+
+
+def reference_metadata(n_rows):
+    return metadata_records(pd.DataFrame({
+        'SpeciesName': [f'species_{i}' for i in range(n_rows)],
+        'SpeciesID': np.arange(n_rows) + 100,
+        'Kingdom': np.array(['bct', 'vrl', 'pln'])[np.arange(n_rows) % 3],
+    }))
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'euclidean'])
+def test_blockwise_search_matches_brute_force(metric):
+    from sklearn.neighbors import NearestNeighbors
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((1000, 12)).astype(np.float32)
+    queries = rng.standard_normal((40, 12)).astype(np.float32)
+    index = NeighborIndex.from_vectors(vectors, reference_metadata(1000), metric)
+    # Blocks smaller than k, so the running top-k is merged across blocks
+    index.block_rows = 7
+
+    ids, scores = index.query(queries, k=15)
+    expected_distances, expected_ids = NearestNeighbors(n_neighbors=15, metric=metric, algorithm='brute') \
+        .fit(vectors).kneighbors(queries)
+    np.testing.assert_array_equal(ids, expected_ids)
+    expected_scores = 1 - expected_distances if metric == 'cosine' else expected_distances
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-5)
+
+    index.block_rows = 4096
+    np.testing.assert_array_equal(index.query(queries, k=15)[0], ids)
+
+
+def test_saved_index_is_mapped_and_tied_to_the_pca(tmp_path, models):
+    from services.inference import CompiledPipeline
+
+    pipeline = CompiledPipeline(models['scaler'], models['pca'], models['kmeans_model'],
+                                models['best_classification_model'], models['feature_columns'])
+    table = make_codon_table(n_rows=300, seed=3)
+    index = build_index(table, pipeline)
+    index.save(str(tmp_path))
+
+    loaded = NeighborIndex.load(str(tmp_path), pipeline=pipeline)
+    assert isinstance(loaded.vectors, np.memmap) and isinstance(loaded.metadata, np.memmap)
+    assert loaded.metric == 'cosine' and loaded.n_reference == index.n_reference
+    found = loaded.neighbors(np.asarray(index.vectors[:2]), k=3)
+    assert [row[0]['SpeciesName'] for row in found] == list(index.metadata['SpeciesName'][:2])
+    assert found[0][0]['similarity'] == pytest.approx(1.0, abs=1e-5)
+    assert set(found[0][0]) == {'rank', 'similarity', 'SpeciesName', 'SpeciesID', 'Kingdom', 'DNAtype'}
+
+    # An index made with other PCA weights is not served
+    pipeline.bias = pipeline.bias + 1.0
+    assert NeighborIndex.load(str(tmp_path), pipeline=pipeline) is None
+
+
+def test_similar_endpoint_returns_the_reference_species(client, monkeypatch):
+    assert client.post('/similar', files={'file': ('q.csv', b'a,b\n1,2\n', 'text/csv')}).status_code in (400, 503)
+
+    table = make_codon_table(n_rows=400, seed=8, nan_fraction=0.0, zero_rows=0)
+    monkeypatch.setattr(analysis, 'neighbor_index', build_index(table, analysis.compiled_pipeline))
+
+    # Scoring the whole table gives the indexed features back: every species finds itself first
+    response = client.post('/similar?k=5', files={'file': ('table.csv', csv_bytes(table), 'text/csv')})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['n_queries'] == len(body['results']) and body['k'] == 5
+    for result in body['results']:
+        top = result['neighbors'][0]
+        assert top['SpeciesID'] == result['query']['SpeciesID']
+        assert top['similarity'] == pytest.approx(1.0, abs=1e-4)
+        assert [n['rank'] for n in result['neighbors']] == [1, 2, 3, 4, 5]
+
+    assert client.post('/similar?k=0', files={'file': ('t.csv', csv_bytes(table), 'text/csv')}).status_code == 422
+    assert client.get('/health').json()['neighbor_index']['n_reference'] == analysis.neighbor_index.n_reference
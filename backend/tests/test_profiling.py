@@ -0,0 +1,123 @@
+import json
+import time
+
+import pytest
+
+from conftest import csv_bytes, make_codon_table, metric_sample
+from services import metrics, profiling
+
+TOKEN = 'test-admin-token'
+
+
+@pytest.fixture
+def admin(client, tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.config, 'ADMIN_TOKEN', TOKEN)
+    monkeypatch.setattr(main.config, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setattr(main.config, 'PROFILE_INTERVAL_SECONDS', 0.001)
+    main.result_cache.clear()
+    return main
+
+
+def upload(n_rows=120, seed=95):
+    body = csv_bytes(make_codon_table(n_rows=n_rows, seed=seed, nan_fraction=0, zero_rows=0))
+    return {'file': ('upload.csv', body, 'text/csv')}
+
+
+def test_sampler_finds_the_hot_function():
+    def busy_loop(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def work():
+        with metrics.stage('features'):
+            busy_loop(0.2)
+        with metrics.stage('assemble'):
+            return bytearray(8 * 1024 * 1024)
+
+    result, part = profiling.profiled('req-1', 0.001, work)
+    report = profiling.build_report([part], 0.001, top=5, request_id='req-1')
+
+    assert len(result) == 8 * 1024 * 1024
+    assert report['hot_spots'][0]['function'].startswith('busy_loop (')
+    assert report['stages']['features']['samples'] > report['stages']['assemble']['samples']
+    assert report['stages']['assemble']['peak_allocated_bytes'] >= 8 * 1024 * 1024
+    assert report['stages']['features']['peak_allocated_bytes'] < 1024 * 1024
+    assert report['peak_allocated_bytes'] >= 8 * 1024 * 1024
+
+
+def test_profiling_needs_the_admin_token(admin, client):
+    assert client.post('/analyze', files=upload(), headers={'X-Profile': 'report'}).status_code == 403
+    response = client.post('/analyze', files=upload(), headers={'X-Profile': 'report', 'X-Admin-Token': 'wrong'})
+    assert response.status_code == 403
+    response = client.post('/analyze', files=upload(), headers={'X-Profile': 'flame', 'X-Admin-Token': TOKEN})
+    assert response.status_code == 400
+    assert client.get('/profiles/anything').status_code == 403
+
+
+def test_profile_report_covers_the_analyze_code_path(admin, client):
+    plain = client.post('/analyze', files=upload()).json()
+    response = client.post('/analyze', files=upload(),
+                           headers={'X-Profile': 'report', 'X-Admin-Token': TOKEN, 'X-Request-ID': 'slow-upload-1'})
+    assert response.status_code == 200
+    report = response.json()
+
+    assert report['request_id'] == response.headers['x-profile-id'] == 'slow-upload-1'
+    assert report['result_handle'] == plain['result_handle']
+    assert report['input']['rows'] == 120 and report['input']['columns'] == 69
+    assert report['input']['scored_rows'] == plain['total_samples']
+    # A small upload: parsed and assembled in the API process around the shared model pass
+    assert {'read', 'features', 'transform', 'batched_model', 'assemble', 'serialize'} <= set(report['stages'])
+    assert 'spool' not in report['stages']
+    assert all(stage['peak_allocated_bytes'] >= 0 for stage in report['stages'].values())
+    assert report['peak_allocated_bytes'] > 0 and report['response_bytes'] > 0
+    assert report['hot_spots'] and report['cumulative']
+    assert report['sampler']['samples'] >= sum(stage['samples'] for stage in report['stages'].values())
+
+
+def test_large_upload_profile_covers_the_streamed_path(admin, client, monkeypatch):
+    monkeypatch.setattr(admin.config, 'BATCH_MAX_UPLOAD_BYTES', 0)
+    response = client.post('/analyze', files=upload(seed=97), headers={'X-Profile': 'report', 'X-Admin-Token': TOKEN})
+    assert response.status_code == 200
+    report = response.json()
+
+    assert {'read', 'features', 'classify', 'spool', 'serialize'} <= set(report['stages'])
+    assert 'batched_model' not in report['stages']
+    assert report['input']['rows'] == 120
+
+
+@pytest.mark.parametrize('large', [False, True])
+def test_profiled_stages_reach_the_metrics(admin, client, monkeypatch, large):
+    if large:
+        monkeypatch.setattr(admin.config, 'BATCH_MAX_UPLOAD_BYTES', 0)
+    before = client.get('/metrics').text
+    response = client.post('/analyze', files=upload(seed=98), headers={'X-Profile': 'report', 'X-Admin-Token': TOKEN})
+    assert response.status_code == 200
+    text = client.get('/metrics').text
+
+    for stage in ('read', 'features', 'serialize'):
+        count = [metric_sample(page, 'codon_analysis_stage_seconds_count', route='/analyze', stage=stage) or 0
+                 for page in (before, text)]
+        assert count[1] - count[0] == 1, stage
+
+
+def test_saved_profiles_are_private(admin, tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        profiling.save_report(str(shared), {'request_id': 'r1'}, 5)
+
+
+def test_saved_profile_keeps_the_normal_response(admin, client):
+    plain = client.post('/analyze', files=upload(seed=96)).content
+    response = client.post('/analyze', files=upload(seed=96), headers={'X-Profile': 'save', 'X-Admin-Token': TOKEN})
+    assert response.status_code == 200
+    assert json.loads(response.content) == json.loads(plain)
+
+    profile_id = response.headers['x-profile-id']
+    saved = client.get(f'/profiles/{profile_id}', headers={'X-Admin-Token': TOKEN})
+    assert saved.status_code == 200 and saved.json()['request_id'] == profile_id
+    assert client.get('/profiles/unknown', headers={'X-Admin-Token': TOKEN}).status_code == 404
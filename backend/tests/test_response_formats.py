@@ -0,0 +1,117 @@
+import importlib.util
+import io
+import json
+
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.response_formats import encode_json, iter_ndjson, negotiate
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+@pytest.fixture
+def result(client, tmp_path):
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(csv_bytes(make_codon_table(n_rows=80, seed=31, nan_fraction=0)))
+    return analysis.run_analysis(str(path))
+
+
+def assert_rows_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got.keys() == want.keys()
+        for key, value in want.items():
+            if isinstance(value, float):
+                assert got[key] == pytest.approx(value, rel=1e-12, abs=1e-15)
+            else:
+                assert got[key] == value
+
+
+def test_records_keep_the_legacy_shape(result):
+    body = json.loads(encode_json(result, handle='h'))
+    legacy_rows = jsonable_encoder(result.table.to_dict(orient='records'))
+
+    assert_rows_equal(body.pop('detailed_results'), legacy_rows)
+    assert body.pop('result_handle') == 'h'
+    assert body == json.loads(json.dumps(result.summary))
+
+
+def test_columnar_and_summary_layouts(result):
+    columnar = json.loads(encode_json(result, 'columnar'))['detailed_results']
+    records = json.loads(encode_json(result))['detailed_results']
+    assert columnar['columns'] == list(result.table.columns)
+    rebuilt = [dict(zip(columnar['columns'], values)) for values in zip(*columnar['data'].values())]
+    assert rebuilt == records
+
+    summary = json.loads(encode_json(result, 'summary'))
+    assert 'detailed_results' not in summary
+    assert summary['total_samples'] == len(result.table)
+
+
+def test_ndjson_streams_summary_then_rows(result):
+    lines = b''.join(iter_ndjson(result, chunk_rows=7)).decode().splitlines()
+    assert 'detailed_results' not in json.loads(lines[0])
+    assert [json.loads(line) for line in lines[1:]] == json.loads(encode_json(result))['detailed_results']
+
+
+def test_negotiation():
+    assert negotiate(None, None) == 'records'
+    assert negotiate(None, 'text/html, application/x-ndjson;q=0.9') == 'ndjson'
+    assert negotiate('Columnar', 'application/x-ndjson') == 'columnar'
+    with pytest.raises(analysis.AnalysisError) as excinfo:
+        negotiate('xml', None)
+    assert excinfo.value.status_code == 400
+
+
+def test_pages_through_result_handle(client):
+    import main
+
+    main.result_cache.clear()
+    body = csv_bytes(make_codon_table(n_rows=45, seed=32, nan_fraction=0))
+    full = client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).json()
+
+    first = client.post('/analyze?format=summary', files={'file': ('a.csv', body, 'text/csv')}).json()
+    handle = first['result_handle']
+    assert handle == full['result_handle'] and 'detailed_results' not in first
+
+    rows, offset = [], 0
+    while offset is not None:
+        page = client.get(f'/results/{handle}', params={'offset': offset, 'limit': 20, 'format': 'records'}).json()
+        rows.extend(page['detailed_results'])
+        offset = page['page']['next_offset']
+    assert rows == full['detailed_results']
+
+    ndjson = client.get(f'/results/{handle}', headers={'Accept': 'application/x-ndjson'})
+    assert ndjson.headers['content-type'].startswith('application/x-ndjson')
+    assert len(ndjson.text.splitlines()) == len(rows) + 1
+
+    assert client.get('/results/' + '0' * 64).status_code == 404
+    assert client.post('/analyze?format=xml', files={'file': ('a.csv', body, 'text/csv')}).status_code == 400
+
+
+@pytest.mark.skipif(not HAS_PYARROW, reason='pyarrow not installed')
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_binary_formats_round_trip(client, fmt):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    body = csv_bytes(make_codon_table(n_rows=30, seed=33, nan_fraction=0))
+    response = client.post(f'/analyze?format={fmt}', files={'file': ('a.csv', body, 'text/csv')})
+    assert response.status_code == 200
+    source = io.BytesIO(response.content)
+    table = pq.read_table(source) if fmt == 'parquet' else pa.ipc.open_stream(source).read_all()
+    summary = json.loads(table.schema.metadata[b'codon_analysis_summary'])
+    assert table.num_rows == summary['total_samples']
+    np.testing.assert_array_equal(table.column('Cluster').to_numpy(),
+                                  [row['Cluster'] for row in client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).json()['detailed_results']])
+
+
+@pytest.mark.skipif(HAS_PYARROW, reason='pyarrow installed')
+def test_binary_formats_need_pyarrow(client):
+    body = csv_bytes(make_codon_table(n_rows=10, seed=34, nan_fraction=0))
+    response = client.post('/analyze?format=parquet', files={'file': ('a.csv', body, 'text/csv')})
+    assert response.status_code == 406
@@ -0,0 +1,94 @@
+import os
+import shutil
+import stat
+
+import pytest
+
+from conftest import MODEL_DIR, csv_bytes, make_codon_table
+from services.result_cache import ResultCache, cache_key, fingerprint_files
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'  # 'a' becomes most recently used
+    cache.put('c', b'123')
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert stats['bytes'] <= 10
+    assert stats['evictions'] == 1
+    assert stats['misses'] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResultCache(max_bytes=100, disk_dir=str(tmp_path), disk_max_bytes=100).put('k', b'body')
+
+    restarted = ResultCache(max_bytes=100, disk_dir=str(tmp_path), disk_max_bytes=100)
+    assert restarted.get('k') == b'body'
+    assert restarted.stats()['disk_hits'] == 1
+    assert restarted.get('k') == b'body'
+    assert restarted.stats()['hits'] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_disk_tier_needs_a_private_directory(tmp_path):
+    ResultCache(max_bytes=100, disk_dir=str(tmp_path / 'new'), disk_max_bytes=100)
+    assert stat.S_IMODE(os.stat(tmp_path / 'new').st_mode) == 0o700
+
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        ResultCache(max_bytes=100, disk_dir=str(shared), disk_max_bytes=100)
+
+
+def test_key_depends_on_content_and_version():
+    assert cache_key(b'x', 'v1') == cache_key(b'x', 'v1')
+    assert cache_key(b'x', 'v1') != cache_key(b'x', 'v2')
+    assert cache_key(b'x', 'v1') != cache_key(b'y', 'v1')
+
+
+def test_analyze_reuses_cached_response(client):
+    import main
+
+    main.result_cache.clear()
+    body = csv_bytes(make_codon_table(n_rows=60, seed=11, nan_fraction=0))
+    before = client.get('/health').json()['result_cache']
+
+    first = client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')})
+    second = client.post('/preprocess', files={'file': ('b.csv', body, 'text/csv')})
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+    after = client.get('/health').json()['result_cache']
+    assert after['misses'] == before['misses'] + 1
+    assert after['hits'] == before['hits'] + 1
+
+
+def test_model_change_invalidates_cache(client, tmp_path, monkeypatch):
+    import main
+    from services import analysis
+
+    model_copy = tmp_path / 'models'
+    shutil.copytree(MODEL_DIR, model_copy)
+    monkeypatch.setattr(main.config, 'MODEL_DIR', str(model_copy))
+    assert analysis.load_models()
+    version = analysis.model_version
+    assert version == fingerprint_files(str(model_copy))
+
+    body = csv_bytes(make_codon_table(n_rows=60, seed=12, nan_fraction=0))
+    client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')})
+
+    path = model_copy / 'kmeans_model.pkl'
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    misses = main.result_cache.stats()['misses']
+    assert client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).status_code == 200
+
+    assert analysis.model_version != version
+    assert main.result_cache.stats()['misses'] == misses + 1
+
+    monkeypatch.undo()
+    analysis.load_models()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from services import analysis
+from services.inference import CompiledPipeline
+from services import shared_weights
+from services.shared_weights import SharedForest, compile_forest, export_bundle, flatten_forest, load_bundle
+from services.worker_pool import AnalysisPool
+
+
+@pytest.fixture
+def weights_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'weights'
+    monkeypatch.setattr(analysis.config, 'SHARED_WEIGHTS_DIR', str(directory))
+    monkeypatch.setenv('CODON_SHARED_WEIGHTS_DIR', str(directory))
+    return directory
+
+
+def classifier_inputs(models, n_rows=600, seed=0):
+    scaler = models['scaler']
+    rng = np.random.default_rng(seed)
+    raw = scaler.center_ + 2 * scaler.scale_ * rng.standard_normal((n_rows, len(scaler.center_)))
+    return ((raw - scaler.center_) / scaler.scale_).astype(np.float32)
+
+
+def test_shared_forest_matches_sklearn(models):
+    classifier = models['best_classification_model']
+    forest = SharedForest(flatten_forest(classifier), classifier.classes_, classifier.n_features_in_)
+    X = classifier_inputs(models)
+
+    # Put some features exactly on split thresholds (the <= boundary)
+    tree = classifier.estimators_[0].tree_
+    split_nodes = np.flatnonzero(tree.children_left != -1)[:20]
+    X[np.arange(20), tree.feature[split_nodes]] = tree.threshold[split_nodes].astype(np.float32)
+
+    np.testing.assert_array_equal(forest.predict_proba(X), classifier.predict_proba(X))
+    np.testing.assert_array_equal(forest.predict(X), classifier.predict(X))
+
+
+@pytest.mark.parametrize('threshold_dtype', [np.float32, np.float64])
+def test_complete_layout_returns_labels_and_proba_in_one_pass(models, threshold_dtype):
+    classifier = models['best_classification_model']
+    arrays = flatten_forest(classifier, threshold_dtype=threshold_dtype)
+    assert arrays['tree_threshold'].dtype == threshold_dtype
+    forest = SharedForest(arrays, classifier.classes_, classifier.n_features_in_)
+    assert forest.is_complete
+    # Enough rows for the per-tree traversal, in more than one chunk
+    X = classifier_inputs(models, n_rows=shared_weights.COMPLETE_CHUNK_ROWS + 500, seed=3).astype(np.float64)
+    for estimator in classifier.estimators_[:5]:
+        tree = estimator.tree_
+        split_nodes = np.flatnonzero(tree.children_left != -1)[:50]
+        rows = np.random.default_rng(len(split_nodes)).choice(len(X), len(split_nodes), replace=False)
+        X[rows, tree.feature[split_nodes]] = tree.threshold[split_nodes].astype(np.float32)
+
+    labels, proba = forest.predict_with_proba(X)
+    np.testing.assert_array_equal(proba, classifier.predict_proba(X))
+    np.testing.assert_array_equal(labels, classifier.predict(X))
+
+
+def test_uneven_trees_pad_to_the_same_predictions():
+    from sklearn.ensemble import ExtraTreesClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    rng = np.random.default_rng(5)
+    X = rng.standard_normal((3000, 6)).astype(np.float32)
+    y = np.where(X[:, 0] > 1.5, 'a', np.where(X[:, 1] * X[:, 2] > 0, 'b', 'c'))
+    stump = DecisionTreeClassifier(max_depth=1).fit(X, y)
+    forest = ExtraTreesClassifier(n_estimators=7, min_samples_leaf=20, random_state=0).fit(X, y)
+    X_new = rng.standard_normal((2500, 6)).astype(np.float32)
+
+    for classifier in (stump, forest):
+        compiled = compile_forest(classifier)
+        node_table = SharedForest(flatten_forest(classifier, complete_max_nodes=0), classifier.classes_, 6)
+        assert compiled.is_complete and not node_table.is_complete
+        for model in (compiled, node_table):
+            labels, proba = model.predict_with_proba(X_new)
+            np.testing.assert_array_equal(proba, classifier.predict_proba(X_new))
+            np.testing.assert_array_equal(labels, classifier.predict(X_new))
+
+
+def test_bundle_round_trip_is_read_only_and_written_once(models, weights_dir):
+    pipeline = CompiledPipeline(models['scaler'], models['pca'], models['kmeans_model'],
+                                models['best_classification_model'], models['feature_columns'])
+    arrays, meta = pipeline.to_arrays()
+    path = export_bundle(str(weights_dir), 'v1', arrays, meta)
+    written = os.stat(os.path.join(path, 'weights.npy')).st_mtime_ns
+    assert export_bundle(str(weights_dir), 'v1', arrays, meta) == path
+    assert os.stat(os.path.join(path, 'weights.npy')).st_mtime_ns == written
+
+    mapped, mapped_meta = load_bundle(path)
+    assert isinstance(mapped['weights'], np.memmap) and not mapped['weights'].flags.writeable
+    rebuilt = CompiledPipeline.from_arrays(mapped, mapped_meta, models['best_classification_model'])
+    X = pipeline.center + 2 * pipeline.scale * np.random.default_rng(1).standard_normal((300, pipeline.n_features))
+    expected, actual = pipeline.predict(X), rebuilt.predict(X)
+    np.testing.assert_array_equal(actual.clusters, expected.clusters)
+    np.testing.assert_array_equal(actual.proba, expected.proba)
+
+
+def test_load_models_serves_from_the_mapped_bundle(weights_dir):
+    assert analysis.load_models()
+    assert analysis.scaler is None and analysis.classifier is not None
+    assert isinstance(analysis.compiled_pipeline.classifier, SharedForest)
+    assert isinstance(analysis.compiled_pipeline.weights, np.memmap)
+    assert len(list(weights_dir.iterdir())) == 1
+
+
+def test_stale_format_bundle_is_replaced(weights_dir):
+    stale = weights_dir / analysis.current_model_version()
+    stale.mkdir(parents=True)
+    np.save(stale / 'weights.npy', np.zeros(3))
+    (stale / shared_weights.META_FILE).write_text(json.dumps({'format': shared_weights.BUNDLE_FORMAT_VERSION - 1}))
+
+    assert analysis.load_models()
+    assert isinstance(analysis.compiled_pipeline.weights, np.memmap)
+    assert shared_weights.bundle_format(str(stale)) == shared_weights.BUNDLE_FORMAT_VERSION
+    assert [path.name for path in weights_dir.iterdir()] == [stale.name]
+
+
+def test_bundles_of_other_deployments_are_kept(weights_dir):
+    other = weights_dir / 'other-version'
+    other.mkdir(parents=True)
+    (other / shared_weights.META_FILE).write_text(json.dumps({'format': shared_weights.BUNDLE_FORMAT_VERSION,
+                                                              'owner': '/srv/other/models'}))
+    own_old = weights_dir / 'old-version'
+    own_old.mkdir()
+    (own_old / shared_weights.META_FILE).write_text(json.dumps({'format': shared_weights.BUNDLE_FORMAT_VERSION,
+                                                                'owner': os.path.abspath(analysis.config.MODEL_DIR)}))
+
+    assert analysis.load_models()
+    assert sorted(path.name for path in weights_dir.iterdir()) == sorted([analysis.model_version, 'other-version'])
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_shared_weights_directory_must_be_private(weights_dir):
+    weights_dir.mkdir()
+    weights_dir.chmod(0o777)
+    # A planted bundle for the current version must not be mapped
+    planted = weights_dir / analysis.current_model_version()
+    planted.mkdir()
+    (planted / shared_weights.META_FILE).write_text(json.dumps({'format': shared_weights.BUNDLE_FORMAT_VERSION}))
+
+    assert analysis.load_models()
+    assert not isinstance(analysis.compiled_pipeline.weights, np.memmap)
+    with pytest.raises(PermissionError):
+        load_bundle(str(planted))
+
+
+@pytest.fixture
+def private_models(monkeypatch):
+    monkeypatch.setattr(analysis.config, 'SHARED_WEIGHTS', False)
+    monkeypatch.setattr(analysis.config, 'FLAT_FOREST_MAX_ROWS', 500)
+    assert analysis.load_models()
+    yield analysis.compiled_pipeline
+    monkeypatch.undo()
+    assert analysis.load_models()
+
+
+def test_private_load_picks_the_classifier_by_batch_size(models, private_models):
+    pipeline = private_models
+    assert pipeline.classifier is analysis.classifier
+    assert isinstance(pipeline.small_batch_classifier, SharedForest)
+    assert pipeline.classifier_for(500) is pipeline.small_batch_classifier
+    assert pipeline.classifier_for(501) is pipeline.classifier
+
+    scaler = models['scaler']
+    raw = scaler.center_ + 2 * scaler.scale_ * np.random.default_rng(2).standard_normal((800, len(scaler.center_)))
+    clusters = pipeline.predict(raw, classify=False).clusters
+    labels, proba = pipeline.classify(raw, clusters)
+    small_labels, small_proba = pipeline.classify(raw[:400], clusters[:400])
+    np.testing.assert_array_equal(small_proba, proba[:400])
+    np.testing.assert_array_equal(small_labels, labels[:400])
+
+
+def mapped_bundle_files():
+    from core import config
+
+    with open('/proc/self/maps') as f:
+        return sorted({line.split()[-1] for line in f if config.SHARED_WEIGHTS_DIR in line})
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='reads /proc/self/maps')
+def test_workers_map_the_same_files(client, weights_dir):
+    import main
+
+    assert analysis.load_models()
+    pool = AnalysisPool(max_workers=2, queue_depth=2, initializer=analysis.init_worker)
+    pool.start()
+
+    async def both_workers():
+        return await asyncio.gather(*(pool.run(mapped_bundle_files) for _ in range(4)))
+
+    try:
+        mapped = asyncio.run(both_workers())
+        worker_memory = [main.process_memory(pid) for pid in pool.worker_pids()]
+    finally:
+        pool.shutdown()
+
+    assert all(files and files == mapped[0] for files in mapped)
+    assert any(name.endswith('tree_value.npy') for name in mapped[0])
+    assert len(worker_memory) == 2 and all(usage.get('rss_bytes') for usage in worker_memory)
+
+
+def test_health_reports_memory(client):
+    memory = client.get('/health').json()['memory']
+    assert memory['api']['pid'] == os.getpid()
+    assert memory['shared_weights']['enabled']
+    assert memory['shared_weights']['bytes'] > 0
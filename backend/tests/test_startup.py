@@ -0,0 +1,57 @@
+import os
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from conftest import MODEL_DIR, csv_bytes, make_codon_table
+from services import analysis
+from services.model_store import load_artifact, resave_artifacts
+
+
+def test_liveness_and_readiness_after_eager_startup(client):
+    assert client.get('/health/live').json() == {'status': 'alive'}
+    ready = client.get('/health/ready')
+    assert ready.status_code == 200
+    assert ready.json()['state'] == 'ready'
+    assert ready.json()['warmup_seconds'] is not None
+
+
+def test_background_startup_serves_liveness_while_loading(monkeypatch):
+    import main
+
+    original_load = analysis.load_models
+
+    def slow_load():
+        time.sleep(0.5)
+        return original_load()
+
+    monkeypatch.setattr(main.config, 'STARTUP_MODE', 'background')
+    monkeypatch.setattr(analysis, 'load_models', slow_load)
+    body = csv_bytes(make_codon_table(n_rows=10, seed=51, nan_fraction=0))
+
+    with TestClient(main.app) as client:
+        assert client.get('/health/live').status_code == 200
+        assert client.get('/health/ready').status_code == 503
+        loading = client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')})
+        assert loading.status_code == 503 and 'Retry-After' in loading.headers
+
+        deadline = time.monotonic() + 30
+        while client.get('/health/ready').status_code != 200:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).status_code == 200
+
+
+def test_artifacts_load_memory_mapped(tmp_path):
+    import shutil
+
+    model_copy = tmp_path / 'models'
+    shutil.copytree(MODEL_DIR, model_copy)
+    assert 'kmeans_model.pkl' in resave_artifacts(str(model_copy))
+
+    kmeans = load_artifact(str(model_copy / 'kmeans_model.pkl'))
+    centers = kmeans.cluster_centers_
+    assert isinstance(centers, np.memmap) or isinstance(centers.base, np.memmap)
+    assert not centers.flags.writeable
+    np.testing.assert_array_equal(centers, load_artifact(os.path.join(MODEL_DIR, 'kmeans_model.pkl'), mmap=False).cluster_centers_)
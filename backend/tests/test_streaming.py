@@ -0,0 +1,167 @@
+import json
+import os
+import stat
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.feature_engine import compute_features, fit_reference_stats
+from services.response_formats import encode_json
+from services.result_spool import SpooledTable, TableSpooler, evict_spool_files
+
+
+@pytest.fixture
+def spool_dir(client, tmp_path, monkeypatch):
+    """Frozen feature mode (chunks are scored independently) with a private spool directory"""
+    reference = fit_reference_stats(make_codon_table(n_rows=500, seed=40).iloc[:, 5:])
+    monkeypatch.setattr(analysis, 'reference_stats', reference)
+    directory = tmp_path / 'spool'
+    monkeypatch.setattr(analysis.config, 'RESULT_SPOOL_DIR', str(directory))
+    return directory
+
+
+def write_upload(path, n_rows, seed):
+    make_codon_table(n_rows=n_rows, seed=seed, nan_fraction=0, zero_rows=3).to_csv(path, index=False)
+    return str(path)
+
+
+def test_streamed_analysis_matches_whole_file(client, tmp_path, spool_dir):
+    path = write_upload(tmp_path / 'upload.csv', 300, seed=41)
+
+    whole = analysis.run_analysis(path)
+    fractions = []
+    streamed = analysis.run_analysis_streamed(path, chunk_rows=37, progress=fractions.append)
+
+    assert isinstance(streamed.table, SpooledTable)
+    assert len(streamed.table.chunk_rows) == 9  # ceil(300 / 37)
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    pd.testing.assert_frame_equal(streamed.table.to_frame(), whole.table)
+    assert streamed.summary == whole.summary
+    assert json.loads(encode_json(streamed)) == json.loads(encode_json(whole))
+
+
+def test_batch_mode_upload_is_streamed_after_a_statistics_pass(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis.config, 'RESULT_SPOOL_DIR', str(tmp_path / 'spool'))
+    path = str(tmp_path / 'upload.csv')
+    make_codon_table(n_rows=300, seed=46, zero_rows=3).to_csv(path, index=False)
+
+    whole = analysis.run_analysis(path)
+    fractions = []
+    streamed = analysis.run_analysis_streamed(path, chunk_rows=37, progress=fractions.append)
+
+    assert isinstance(streamed.table, SpooledTable)
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    assert max(f for f in fractions if f <= 0.5) == 0.5
+    pd.testing.assert_frame_equal(streamed.table.to_frame(), whole.table, check_exact=False, rtol=1e-9)
+    assert streamed.summary == whole.summary
+    # Only the result spool is left behind, not the statistics scratch files
+    assert [p.suffix for p in (tmp_path / 'spool').iterdir()] == ['.spool']
+
+
+def test_batch_mode_rows_keep_their_own_predictions(client, tmp_path):
+    # Zero-sum rows at the top shift every later row's position
+    table = make_codon_table(n_rows=150, seed=45, zero_rows=4)
+    path = tmp_path / 'upload.csv'
+    table.to_csv(path, index=False)
+
+    result = analysis.run_analysis(str(path))
+    features = compute_features(table.iloc[:, 5:])
+    assert len(features) < len(table) - 4  # low-count rows are dropped too
+    assert list(result.table['SpeciesName']) == list(table.loc[features.index, 'SpeciesName'])
+    expected = analysis.compiled_pipeline.predict(analysis.compiled_pipeline.align(features))
+    np.testing.assert_array_equal(result.table['Cluster'], expected.clusters)
+    np.testing.assert_array_equal(result.table['Kingdom'], expected.labels)
+
+
+def test_spooled_pages_cross_chunk_boundaries(tmp_path):
+    frame = pd.DataFrame({'Cluster': range(25), 'Kingdom': ['x'] * 25})
+    spooler = TableSpooler(str(tmp_path), max_bytes=10**9)
+    for start in range(0, 25, 10):
+        spooler.append(frame.iloc[start:start + 10])
+    table = spooler.close()
+
+    assert len(table) == 25
+    pd.testing.assert_frame_equal(table.to_frame(8, 9), frame.iloc[8:17])
+    assert [len(chunk) for chunk in table.iter_chunks(8, 9)] == [2, 7]
+    assert len(table.to_frame(30)) == 0
+
+    evict_spool_files(str(tmp_path), max_bytes=0)
+    assert not table.exists()
+
+
+def test_spooled_table_keeps_columns_of_every_chunk(tmp_path):
+    # Classification failed for the first chunk only: no Kingdom columns there
+    first = pd.DataFrame({'Cluster': [0, 1], 'Classification_Error': ['failed'] * 2})
+    second = pd.DataFrame({'Cluster': [2, 3], 'Kingdom': ['bct', 'vrl'], 'Kingdom_bct_prob': [0.9, 0.2]})
+    spooler = TableSpooler(str(tmp_path), max_bytes=10**9)
+    spooler.append(first)
+    spooler.append(second)
+    table = spooler.close()
+
+    assert table.columns == ['Cluster', 'Classification_Error', 'Kingdom', 'Kingdom_bct_prob']
+    frame = table.to_frame()
+    assert list(frame.columns) == table.columns
+    assert list(frame['Kingdom'].iloc[2:]) == ['bct', 'vrl'] and frame['Kingdom'].iloc[:2].isna().all()
+    assert frame['Classification_Error'].iloc[2:].isna().all()
+    assert all(list(chunk.columns) == table.columns for chunk in table.iter_chunks(1, 2))
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_spool_directory_must_be_private(tmp_path):
+    TableSpooler(str(tmp_path / 'spool'), max_bytes=10**9).discard()
+    assert stat.S_IMODE(os.stat(tmp_path / 'spool').st_mode) == 0o700
+
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o1777)
+    with pytest.raises(PermissionError):
+        TableSpooler(str(shared), max_bytes=10**9)
+
+
+def peak_streamed_memory(path, chunk_rows):
+    tracemalloc.start()
+    try:
+        result = analysis.run_analysis_streamed(path, chunk_rows=chunk_rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def test_streamed_memory_stays_flat_as_input_grows(client, tmp_path, spool_dir):
+    small = write_upload(tmp_path / 'small.csv', 1_000, seed=42)
+    large = write_upload(tmp_path / 'large.csv', 8_000, seed=43)
+
+    peak_small, result_small = peak_streamed_memory(small, chunk_rows=250)
+    peak_large, result_large = peak_streamed_memory(large, chunk_rows=250)
+
+    assert len(result_large.table) > 7 * len(result_small.table)
+    assert peak_large < 1.5 * peak_small
+
+
+def test_large_upload_is_spooled_and_streamed(client, tmp_path, spool_dir, monkeypatch):
+    import main
+
+    main.result_cache.clear()
+    monkeypatch.setattr(main.config, 'BATCH_MAX_UPLOAD_BYTES', 0)
+    monkeypatch.setattr(main.config, 'UPLOAD_BLOCK_BYTES', 4096)
+    monkeypatch.setattr(main.config, 'STREAM_CHUNK_ROWS', 50)
+    body = csv_bytes(make_codon_table(n_rows=180, seed=44, nan_fraction=0))
+    (tmp_path / 'upload.csv').write_bytes(body)
+
+    response = client.post('/analyze', files={'file': ('big.csv', body, 'text/csv')})
+    assert response.status_code == 200
+    streamed = response.json()
+    expected = encode_json(analysis.run_analysis(str(tmp_path / 'upload.csv')), handle=streamed['result_handle'])
+    assert streamed == json.loads(expected)
+    assert len(list(spool_dir.iterdir())) == 1
+
+    # Pages come from the spool file; once it is evicted the handle expires
+    page = client.get(f"/results/{streamed['result_handle']}", params={'offset': 40, 'limit': 30}).json()
+    assert page['detailed_results'] == streamed['detailed_results'][40:70]
+    evict_spool_files(str(spool_dir), max_bytes=0)
+    assert client.get(f"/results/{streamed['result_handle']}").status_code == 404
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from conftest import csv_bytes, make_codon_table
+from services import analysis
+from services.worker_pool import AnalysisPool, PoolSaturated
+
+
+def test_full_queue_is_rejected():
+    pool = AnalysisPool(max_workers=1, queue_depth=0)
+    pool.start()
+
+    async def submit_two():
+        return await asyncio.gather(pool.run(time.sleep, 0.5), pool.run(time.sleep, 0.5), return_exceptions=True)
+
+    try:
+        results = asyncio.run(submit_two())
+    finally:
+        pool.shutdown()
+
+    assert sum(isinstance(r, PoolSaturated) for r in results) == 1
+    assert pool.stats()['rejected'] == 1
+
+
+def test_saturated_analyze_returns_429(client, monkeypatch):
+    import main
+
+    pool = AnalysisPool(max_workers=0, queue_depth=0)
+    pool.start()
+    monkeypatch.setattr(main, 'analysis_pool', pool)
+    monkeypatch.setattr(main.config, 'BATCH_MAX_UPLOAD_BYTES', 0)
+    stub_result = analysis.AnalysisResult({'status': 'success'}, pd.DataFrame({'Cluster': [0]}))
+    monkeypatch.setattr(analysis, 'run_analysis_streamed', lambda path, *args, **kwargs: time.sleep(1) or stub_result)
+    main.result_cache.clear()
+
+    results = []
+    uploads = [csv_bytes(make_codon_table(n_rows=20, seed=seed, nan_fraction=0)) for seed in (1, 2)]
+    threads = [threading.Thread(target=lambda body=body: results.append(
+        client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).status_code)) for body in uploads]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.2)
+    for thread in threads:
+        thread.join()
+    pool.shutdown()
+
+    assert sorted(results) == [200, 429]
+
+
+def test_restart_lets_queued_jobs_finish():
+    pool = AnalysisPool(max_workers=1, queue_depth=4)
+    pool.start()
+
+    async def submit_and_restart():
+        # More jobs than the executor hands to its worker up front, so some are still queued
+        jobs = [asyncio.ensure_future(pool.run(time.sleep, 0.2)) for _ in range(5)]
+        await asyncio.sleep(0.1)
+        await asyncio.to_thread(pool.restart)
+        return await asyncio.gather(*jobs, return_exceptions=True)
+
+    try:
+        results = asyncio.run(submit_and_restart())
+    finally:
+        pool.shutdown()
+
+    assert results == [None] * 5
+    assert pool.stats()['failed'] == 0
+
+
+def test_model_reload_runs_off_the_event_loop(client, monkeypatch):
+    import main
+
+    reloads = []
+
+    def load_models():
+        # asyncio.get_running_loop() only succeeds on the event loop thread
+        try:
+            asyncio.get_running_loop()
+            reloads.append('event loop')
+        except RuntimeError:
+            reloads.append('thread')
+        time.sleep(0.5)
+        monkeypatch.setattr(analysis, 'model_version', 'new')
+        return True
+
+    monkeypatch.setattr(analysis, 'current_model_version', lambda: 'new')
+    monkeypatch.setattr(analysis, 'load_models', load_models)
+    monkeypatch.setattr(main.analysis_pool, 'max_workers', 0)
+
+    status = {}
+    body = csv_bytes(make_codon_table(n_rows=20, seed=5, nan_fraction=0))
+    uploads = [threading.Thread(target=lambda i=i: status.setdefault(i, client.post(
+        '/analyze', files={'file': ('a.csv', body, 'text/csv')}).status_code)) for i in range(2)]
+    for thread in uploads:
+        thread.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    assert client.get('/health/live').status_code == 200
+    assert time.perf_counter() - started < 0.3
+    for thread in uploads:
+        thread.join()
+
+    assert reloads == ['thread']
+    assert status == {0: 200, 1: 200}
+    monkeypatch.undo()
+    analysis.load_models()
+
+
+def test_small_uploads_share_the_admission_bound(client, monkeypatch):
+    import main
+
+    pool = AnalysisPool(max_workers=0, queue_depth=0)
+    pool.start()
+    monkeypatch.setattr(main, 'analysis_pool', pool)
+    prepare_upload = analysis.prepare_upload
+    monkeypatch.setattr(analysis, 'prepare_upload', lambda path, *args: time.sleep(1) or prepare_upload(path, *args))
+    main.result_cache.clear()
+
+    results = []
+    uploads = [csv_bytes(make_codon_table(n_rows=20, seed=seed, nan_fraction=0)) for seed in (3, 4)]
+    threads = [threading.Thread(target=lambda body=body: results.append(
+        client.post('/analyze', files={'file': ('a.csv', body, 'text/csv')}).status_code)) for body in uploads]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.2)
+    for thread in threads:
+        thread.join()
+    pool.shutdown()
+
+    assert sorted(results) == [200, 429]
+    assert pool.stats()['completed'] == 1 and pool.stats()['in_flight'] == 0
+
+
+def test_health_answers_while_large_analysis_runs(client, monkeypatch):
+    import main
+
+    pool = AnalysisPool(max_workers=1, queue_depth=1, initializer=analysis.init_worker)
+    pool.start()
+    monkeypatch.setattr(main, 'analysis_pool', pool)
+    main.result_cache.clear()
+    body = csv_bytes(make_codon_table(n_rows=5000, seed=13, nan_fraction=0))
+
+    status = {}
+    worker = threading.Thread(target=lambda: status.setdefault(
+        'analyze', client.post('/analyze', files={'file': ('big.csv', body, 'text/csv')}).status_code))
+    worker.start()
+
+    health_latencies = []
+    seen_in_flight = False
+    while worker.is_alive():
+        started = time.perf_counter()
+        health = client.get('/health').json()
+        health_latencies.append(time.perf_counter() - started)
+        seen_in_flight |= health['analysis_pool']['in_flight'] == 1
+        time.sleep(0.05)
+    worker.join()
+    pool.shutdown()
+
+    assert status['analyze'] == 200
+    assert seen_in_flight
+    assert max(health_latencies) < 0.5
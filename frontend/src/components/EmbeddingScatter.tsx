@@ -0,0 +1,102 @@
+import React, { useEffect, useState } from 'react';
+import { fetchReferenceMap } from '../services/apiClient';
+import type { MapPoints, ReferenceMap, Viewport } from '../services/apiClient';
+
+const WIDTH = 640;
+const HEIGHT = 420;
+const PADDING = 24;
+const CLUSTER_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+
+interface EmbeddingScatterProps {
+  // The user's species on the same map (from POST /embedding/project)
+  uploaded?: MapPoints | null;
+}
+
+// Reference species on the precomputed PCA map; zooming in fetches the next level of detail
+const EmbeddingScatter: React.FC<EmbeddingScatterProps> = ({ uploaded }) => {
+  const [map, setMap] = useState<ReferenceMap | null>(null);
+  const [level, setLevel] = useState(0);
+  const [viewport, setViewport] = useState<Viewport | undefined>(undefined);
+  const [error, setError] = useState<string | null>(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    fetchReferenceMap(level, viewport)
+      .then((result) => {
+        if (!cancelled) {
+          setMap(result);
+          setError(null);
+        }
+      })
+      .catch((e: Error) => {
+        if (!cancelled) setError(e.message);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [level, viewport]);
+
+  if (error) return <p className="viz-description">{error}</p>;
+  if (!map) return <p className="viz-description">Loading species map...</p>;
+
+  const view = viewport ?? map.bounds;
+  const scaleX = (x: number) => PADDING + ((x - view.x_min) / (view.x_max - view.x_min || 1)) * (WIDTH - 2 * PADDING);
+  const scaleY = (y: number) => HEIGHT - PADDING - ((y - view.y_min) / (view.y_max - view.y_min || 1)) * (HEIGHT - 2 * PADDING);
+
+  const zoom = (factor: number) => {
+    const nextLevel = Math.min(Math.max(level + (factor < 1 ? 1 : -1), 0), map.n_levels - 1);
+    if (nextLevel === 0) {
+      setViewport(undefined);
+    } else {
+      const cx = (view.x_min + view.x_max) / 2;
+      const cy = (view.y_min + view.y_max) / 2;
+      const hw = ((view.x_max - view.x_min) / 2) * factor;
+      const hh = ((view.y_max - view.y_min) / 2) * factor;
+      setViewport({ x_min: cx - hw, x_max: cx + hw, y_min: cy - hh, y_max: cy + hh });
+    }
+    setLevel(nextLevel);
+  };
+
+  const { points } = map;
+  return (
+    <div>
+      <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} className="chart-image" role="img" aria-label="Species map">
+        {points.x.map((x, i) => (
+          <circle
+            key={`r${i}`}
+            cx={scaleX(x)}
+            cy={scaleY(points.y[i])}
+            r={Math.min(1.5 + Math.sqrt(points.weight?.[i] ?? 1) * 0.6, 6)}
+            fill={CLUSTER_COLORS[points.cluster[i] % CLUSTER_COLORS.length]}
+            fillOpacity={0.45}
+          />
+        ))}
+        {uploaded?.x.map((x, i) => (
+          <circle
+            key={`u${i}`}
+            cx={scaleX(x)}
+            cy={scaleY(uploaded.y[i])}
+            r={5}
+            fill={CLUSTER_COLORS[uploaded.cluster[i] % CLUSTER_COLORS.length]}
+            stroke="#000"
+            strokeWidth={1.5}
+          >
+            <title>{uploaded.SpeciesName?.[i] ?? `Species ${i + 1}`}</title>
+          </circle>
+        ))}
+        <text x={WIDTH / 2} y={HEIGHT - 4} textAnchor="middle" fontSize={12}>{map.axes[0]}</text>
+        <text x={12} y={HEIGHT / 2} textAnchor="middle" fontSize={12} transform={`rotate(-90 12 ${HEIGHT / 2})`}>{map.axes[1]}</text>
+      </svg>
+      <div style={{ display: 'flex', justifyContent: 'center', gap: '0.5rem', marginTop: '0.5rem' }}>
+        <button className="download-button" onClick={() => zoom(0.5)} disabled={level >= map.n_levels - 1}>Zoom in</button>
+        <button className="download-button" onClick={() => zoom(2)} disabled={level === 0}>Zoom out</button>
+      </div>
+      <p className="viz-description">
+        {points.x.length} of {map.n_reference} reference species shown (detail level {level + 1}/{map.n_levels})
+        {uploaded ? `; ${uploaded.x.length} uploaded species outlined` : ''}
+      </p>
+    </div>
+  );
+};
+
+export default EmbeddingScatter;
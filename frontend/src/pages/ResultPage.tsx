@@ -3,14 +3,16 @@ import { useNavigate } from 'react-router-dom';
 // import { useLocation } from 'react-router-dom';
 import { Download } from 'lucide-react';
 import '../result-page.css';
+import EmbeddingScatter from '../components/EmbeddingScatter';
+import type { MapPoints } from '../services/apiClient';
 
 import logoKDS from '../assets/images/logoKDS.png';
-import pcaScatter from '../assets/images/graph1.jpg';
 import distortionGraph from '../assets/images/graph2.jpg';
 
 const ResultPage: React.FC = () => {
   const [kingdomDistribution, setKingdomDistribution] = useState<Record<string, number> | null>(null);
   const [showClusterDetails, setShowClusterDetails] = useState(false);
+  const [uploadedPoints, setUploadedPoints] = useState<MapPoints | null>(null);
   const navigate = useNavigate();
 
   const toggleDetails = () => {
@@ -54,6 +56,10 @@ const ResultPage: React.FC = () => {
         const parsed = JSON.parse(data);
         setKingdomDistribution(parsed.kingdom_distribution || null);
       }
+      const embedding = sessionStorage.getItem('analysisEmbedding');
+      if (embedding) {
+        setUploadedPoints(JSON.parse(embedding));
+      }
     } catch (e) {
       console.error("Failed to parse sessionStorage data", e);
     }
@@ -119,12 +125,12 @@ const ResultPage: React.FC = () => {
         {/* Visualizations */}
         <div className="visualizations">
           <div className="visualization-card">
-            <h3 className="viz-title">t-SNE <span className="viz-highlight">Visualization</span></h3>
+            <h3 className="viz-title">Species <span className="viz-highlight">Map</span></h3>
             <p className="viz-description">
-            A non-linear dimensionality reduction method that reveals local data structure for cluster visualization...
+            Reference species on the first two principal components, colored by cluster, with your species outlined...
             </p>
             <div className="chart-container">
-              <img src={pcaScatter} alt="PCA Scatter Plot" className="chart-image" />
+              <EmbeddingScatter uploaded={uploadedPoints} />
             </div>
           </div>
 
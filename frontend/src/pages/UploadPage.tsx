@@ -4,6 +4,10 @@ import { Upload, FileText, BarChart3 } from 'lucide-react';
 import '../index.css';
 
 import logoKDS from '../assets/images/logoKDS.png';
+import { API_BASE_URL, projectUpload } from '../services/apiClient';
+
+// Codon usage CSV, or FASTA coding sequences (optionally gzipped) counted by the API
+const ACCEPTED_EXTENSIONS = ['.csv', '.fasta', '.fa', '.fna', '.ffn', '.fasta.gz', '.fa.gz', '.fna.gz', '.ffn.gz'];
 
 const UploadPage: React.FC = () => {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
@@ -14,10 +18,11 @@ const UploadPage: React.FC = () => {
   
 
   const handleFileSelect = (file: File) => {
-    if (file && file.type === 'text/csv') {
+    const name = file?.name.toLowerCase() ?? '';
+    if (file && (file.type === 'text/csv' || ACCEPTED_EXTENSIONS.some((extension) => name.endsWith(extension)))) {
       setSelectedFile(file);
     } else {
-      alert('Please select a valid CSV file');
+      alert('Please select a CSV or FASTA file');
     }
   };
 
@@ -53,7 +58,7 @@ const UploadPage: React.FC = () => {
 
   const handleStartAnalysis = async () => {
     if (!selectedFile) {
-      alert('Please select a CSV file first');
+      alert('Please select a CSV or FASTA file first');
       return;
     }
   
@@ -63,7 +68,7 @@ const UploadPage: React.FC = () => {
       const formData = new FormData();
       formData.append('file', selectedFile);
   
-      const response = await fetch('https://ml-codonanalysis.onrender.com/analyze', {
+      const response = await fetch(`${API_BASE_URL}/analyze`, {
         method: 'POST',
         body: formData,
       });
@@ -79,6 +84,15 @@ const UploadPage: React.FC = () => {
         kingdom_distribution: result.kingdom_distribution,
         classification_summary: result.classification_summary, 
       }));
+
+      // The species map is optional: the result page still works without it
+      sessionStorage.removeItem('analysisEmbedding');
+      try {
+        const points = await projectUpload(selectedFile);
+        sessionStorage.setItem('analysisEmbedding', JSON.stringify(points));
+      } catch (error) {
+        console.warn('Species map unavailable', error);
+      }
   
       navigate('/result');
       } catch (error) {
@@ -136,7 +150,7 @@ const UploadPage: React.FC = () => {
                 <input
                     ref={fileInputRef}
                     type="file"
-                    accept=".csv"
+                    accept={ACCEPTED_EXTENSIONS.join(',')}
                     onChange={handleFileInputChange}
                 />
                 
@@ -163,7 +177,7 @@ const UploadPage: React.FC = () => {
                         Upload CSV File
                     </p>
                     <p className="upload-placeholder-text">
-                        Click to browse or drag and drop your CSV file here
+                        Click to browse or drag and drop your CSV or FASTA file here
                     </p>
                     </div>
                 )}
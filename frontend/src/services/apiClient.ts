@@ -0,0 +1,53 @@
+export const API_BASE_URL = 'https://ml-codonanalysis.onrender.com';
+
+export interface MapPoints {
+  x: number[];
+  y: number[];
+  cluster: number[];
+  kingdom?: number[];
+  weight?: number[];
+  SpeciesName?: string[];
+}
+
+export interface ReferenceMap {
+  method: string;
+  axes: string[];
+  level: number;
+  n_levels: number;
+  bounds: { x_min: number; x_max: number; y_min: number; y_max: number };
+  kingdoms: string[];
+  n_reference: number;
+  points: MapPoints;
+}
+
+export interface Viewport {
+  x_min: number;
+  x_max: number;
+  y_min: number;
+  y_max: number;
+}
+
+// Reference species on the precomputed 2D map, thinned to one level of detail
+export async function fetchReferenceMap(level: number, viewport?: Viewport): Promise<ReferenceMap> {
+  const params = new URLSearchParams({ level: String(level) });
+  if (viewport) {
+    Object.entries(viewport).forEach(([key, value]) => params.set(key, String(value)));
+  }
+  const response = await fetch(`${API_BASE_URL}/embedding?${params.toString()}`);
+  if (!response.ok) {
+    throw new Error(`Failed to load the species map (${response.status})`);
+  }
+  return response.json();
+}
+
+// The uploaded species on the same map
+export async function projectUpload(file: File): Promise<MapPoints> {
+  const formData = new FormData();
+  formData.append('file', file);
+  const response = await fetch(`${API_BASE_URL}/embedding/project`, { method: 'POST', body: formData });
+  if (!response.ok) {
+    throw new Error(`Failed to place the uploaded species (${response.status})`);
+  }
+  const result = await response.json();
+  return result.points;
+}